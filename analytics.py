@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+A股自选股智能分析系统 - 分析查询层（DuckDB）
+===================================
+
+职责：
+1. 以只读方式挂载 SQLite 行情库（及可选的 Parquet 归档）到嵌入式 DuckDB
+2. 提供横截面筛选、聚合统计的向量化查询接口
+3. 无需独立服务，随进程创建、随进程销毁
+
+典型问题：
+- 自选股中哪些处于"多头排列"且量比 > 2？
+- 各板块的平均乖离率是多少？
+
+使用方式：
+    analytics = MarketAnalytics()
+    df = analytics.screen(ma_status='多头排列', min_volume_ratio=2)
+    df = analytics.sector_stats({'600519': '白酒', '000858': '白酒'})
+    df = analytics.query("SELECT code, COUNT(*) FROM daily GROUP BY code")
+"""
+
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+import pandas as pd
+
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+
+# 均线形态判断（与 DatabaseManager._analyze_ma_status 保持一致）
+MA_STATUS_SQL = """
+    CASE
+        WHEN close > ma5 AND ma5 > ma10 AND ma10 > ma20 AND ma20 > 0 THEN '多头排列'
+        WHEN close < ma5 AND ma5 < ma10 AND ma10 < ma20 AND ma20 > 0 THEN '空头排列'
+        WHEN close > ma5 AND ma5 > ma10 THEN '短期向好'
+        WHEN close < ma5 AND ma5 < ma10 THEN '短期走弱'
+        ELSE '震荡整理'
+    END
+"""
+
+DAILY_COLUMNS = [
+    'code', 'date', 'open', 'high', 'low', 'close', 'volume', 'amount',
+    'pct_chg', 'ma5', 'ma10', 'ma20', 'volume_ratio', 'data_source',
+]
+
+
+class MarketAnalytics:
+    """
+    DuckDB 分析查询层
+
+    数据视图：
+    - daily:  全部日线数据（SQLite 当前表 + Parquet 归档，按 code+date 去重，SQLite 优先）
+    - latest: 每只股票最新一个交易日，附带 ma_status、bias_ma5 等派生列
+
+    挂载方式：
+    1. 优先使用 DuckDB sqlite 扩展 ATTACH（READ_ONLY），查询直接下推到 SQLite 文件
+    2. 扩展不可用（离线环境无法下载）时，一次性批量读取日线表注册为 DuckDB 表
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        parquet_dir: Optional[str] = None,
+        compact_schema: Optional[bool] = None
+    ):
+        """
+        初始化分析查询层
+
+        Args:
+            db_path: SQLite 数据库路径（可选，默认从配置读取）
+            parquet_dir: Parquet 归档目录（可选，默认从配置读取，目录下 *.parquet 递归挂载）
+            compact_schema: 日线表是否为紧凑表（可选，默认从配置读取）
+        """
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("未安装 duckdb 库，请运行: pip install duckdb")
+
+        config = get_config()
+        self._db_path = Path(db_path or config.database_path).absolute()
+        self._parquet_dir = parquet_dir if parquet_dir is not None else config.analytics_parquet_dir
+        compact = config.database_compact_schema if compact_schema is None else compact_schema
+        self._daily_table = 'stock_daily_compact' if compact else 'stock_daily'
+        self._compact = compact
+
+        self._conn = duckdb.connect(database=':memory:')
+        self._attached = False
+        self._attach_sources()
+
+    def _attach_sources(self) -> None:
+        """挂载 SQLite / Parquet 数据源并创建 daily、latest 视图"""
+        if not self._db_path.exists():
+            raise FileNotFoundError(f"数据库文件不存在: {self._db_path}")
+
+        # 紧凑表的日期为 YYYYMMDD 整数
+        if self._compact:
+            date_expr = "CAST(strptime(CAST(date AS VARCHAR), '%Y%m%d') AS DATE)"
+        else:
+            date_expr = "CAST(date AS DATE)"
+        value_cols = ", ".join(c for c in DAILY_COLUMNS if c not in ('code', 'date'))
+
+        try:
+            self._conn.execute("INSTALL sqlite")
+            self._conn.execute("LOAD sqlite")
+            self._conn.execute(f"ATTACH '{self._db_path}' AS market (TYPE SQLITE, READ_ONLY)")
+            source = f"market.{self._daily_table}"
+            self._attached = True
+            logger.info(f"[Analytics] 已只读挂载 SQLite: {self._db_path}")
+        except Exception as e:
+            logger.warning(f"[Analytics] DuckDB sqlite 扩展不可用（{e}），改为批量读取 {self._daily_table}")
+            self._load_sqlite_snapshot()
+            source = "sqlite_snapshot"
+
+        sources = [
+            f"SELECT code, {date_expr} AS date, {value_cols}, 0 AS _priority FROM {source}"
+        ]
+
+        if self._parquet_dir:
+            pattern = str(Path(self._parquet_dir) / '**' / '*.parquet')
+            if list(Path(self._parquet_dir).glob('**/*.parquet')):
+                sources.append(
+                    f"SELECT code, CAST(date AS DATE) AS date, {value_cols}, 1 AS _priority "
+                    f"FROM read_parquet('{pattern}', union_by_name = true)"
+                )
+                logger.info(f"[Analytics] 已挂载 Parquet 归档: {pattern}")
+            else:
+                logger.info(f"[Analytics] Parquet 归档目录为空: {self._parquet_dir}")
+
+        self._conn.execute(f"""
+            CREATE OR REPLACE VIEW daily AS
+            SELECT * EXCLUDE (_priority) FROM ({' UNION ALL '.join(sources)})
+            QUALIFY row_number() OVER (PARTITION BY code, date ORDER BY _priority) = 1
+        """)
+
+        self._conn.execute(f"""
+            CREATE OR REPLACE VIEW latest AS
+            SELECT
+                *,
+                {MA_STATUS_SQL} AS ma_status,
+                CASE WHEN ma5 > 0 THEN (close - ma5) / ma5 * 100 END AS bias_ma5,
+                CASE WHEN ma10 > 0 THEN (close - ma10) / ma10 * 100 END AS bias_ma10,
+                CASE WHEN ma20 > 0 THEN (close - ma20) / ma20 * 100 END AS bias_ma20
+            FROM daily
+            QUALIFY row_number() OVER (PARTITION BY code ORDER BY date DESC) = 1
+        """)
+
+    def _load_sqlite_snapshot(self) -> None:
+        """扩展不可用时的降级方案：只读连接一次性读取日线表"""
+        uri = f"file:{self._db_path}?mode=ro"
+        with sqlite3.connect(uri, uri=True) as sqlite_conn:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(DAILY_COLUMNS)} FROM {self._daily_table}",
+                sqlite_conn,
+            )
+        self._conn.register('sqlite_snapshot_df', df)
+        self._conn.execute("CREATE OR REPLACE TABLE sqlite_snapshot AS SELECT * FROM sqlite_snapshot_df")
+        self._conn.unregister('sqlite_snapshot_df')
+
+    def refresh(self) -> None:
+        """刷新数据（降级模式下重新读取快照；ATTACH 模式下查询本就实时）"""
+        if not self._attached:
+            self._load_sqlite_snapshot()
+
+    def query(self, sql: str, params: Optional[List[Any]] = None) -> pd.DataFrame:
+        """
+        执行任意只读 SQL
+
+        可用视图：daily（全部日线）、latest（每只股票最新一日）
+
+        Args:
+            sql: SQL 语句（参数占位符使用 ?）
+            params: 位置参数列表
+
+        Returns:
+            查询结果 DataFrame
+        """
+        return self._conn.execute(sql, params or []).df()
+
+    def screen(
+        self,
+        ma_status: Optional[str] = None,
+        min_volume_ratio: Optional[float] = None,
+        max_bias_ma5: Optional[float] = None,
+        codes: Optional[List[str]] = None,
+        as_of: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        横截面筛选（每只股票取最新一日）
+
+        Args:
+            ma_status: 均线形态（多头排列/空头排列/短期向好/短期走弱/震荡整理）
+            min_volume_ratio: 最小量比
+            max_bias_ma5: 最大 MA5 乖离率（%），如 5 表示不追高
+            codes: 限定股票范围（如自选股列表）
+            as_of: 截止日期 'YYYY-MM-DD'（为空则取各股最新一日）
+
+        Returns:
+            符合条件的股票 DataFrame（按量比降序）
+        """
+        conditions = []
+        params: List[Any] = []
+
+        if as_of:
+            base = f"""
+                SELECT *, {MA_STATUS_SQL} AS ma_status,
+                       CASE WHEN ma5 > 0 THEN (close - ma5) / ma5 * 100 END AS bias_ma5
+                FROM daily
+                WHERE date <= CAST(? AS DATE)
+                QUALIFY row_number() OVER (PARTITION BY code ORDER BY date DESC) = 1
+            """
+            params.append(as_of)
+        else:
+            base = "SELECT * FROM latest"
+
+        if ma_status:
+            conditions.append("ma_status = ?")
+            params.append(ma_status)
+        if min_volume_ratio is not None:
+            conditions.append("volume_ratio > ?")
+            params.append(min_volume_ratio)
+        if max_bias_ma5 is not None:
+            conditions.append("bias_ma5 < ?")
+            params.append(max_bias_ma5)
+        if codes:
+            conditions.append(f"code IN ({', '.join('?' for _ in codes)})")
+            params.extend(codes)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"SELECT * FROM ({base}) {where} ORDER BY volume_ratio DESC NULLS LAST"
+        return self.query(sql, params)
+
+    def sector_stats(self, sector_map: Dict[str, str]) -> pd.DataFrame:
+        """
+        板块聚合统计（基于各股最新一日）
+
+        Args:
+            sector_map: {股票代码: 板块名称}
+
+        Returns:
+            每个板块的股票数、平均乖离率、平均量比、平均涨跌幅、多头排列占比
+        """
+        if not sector_map:
+            return pd.DataFrame()
+
+        sectors = pd.DataFrame(list(sector_map.items()), columns=['code', 'sector'])
+        self._conn.register('sector_map', sectors)
+        try:
+            return self.query("""
+                SELECT
+                    s.sector,
+                    COUNT(*) AS stocks,
+                    AVG(l.bias_ma5) AS avg_bias_ma5,
+                    AVG(l.volume_ratio) AS avg_volume_ratio,
+                    AVG(l.pct_chg) AS avg_pct_chg,
+                    AVG(CASE WHEN l.ma_status = '多头排列' THEN 1.0 ELSE 0.0 END) AS bull_ratio
+                FROM latest l
+                JOIN sector_map s USING (code)
+                GROUP BY s.sector
+                ORDER BY avg_bias_ma5 DESC
+            """)
+        finally:
+            self._conn.unregister('sector_map')
+
+    def export_parquet(self, output_dir: str, before_date: Optional[str] = None) -> int:
+        """
+        导出日线数据为 Parquet 归档（按年份分区）
+
+        Args:
+            output_dir: 输出目录
+            before_date: 仅导出该日期之前的数据 'YYYY-MM-DD'（为空导出全部）
+
+        Returns:
+            导出的行数
+        """
+        where = "WHERE date < CAST(? AS DATE)" if before_date else ""
+        params = [before_date] if before_date else []
+        count = self._conn.execute(f"SELECT COUNT(*) FROM daily {where}", params).fetchone()[0]
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        self._conn.execute(
+            f"COPY (SELECT *, year(date) AS year FROM daily {where}) "
+            f"TO '{output_dir}' (FORMAT PARQUET, PARTITION_BY (year), OVERWRITE_OR_IGNORE)",
+            params,
+        )
+        logger.info(f"[Analytics] 已导出 {count} 行到 {output_dir}")
+        return count
+
+    def close(self) -> None:
+        """关闭 DuckDB 连接"""
+        self._conn.close()
+
+
+def benchmark_screen(num_codes: int = 500, num_days: int = 250) -> Dict[str, float]:
+    """
+    对比 DuckDB 横截面筛选与 ORM 逐股循环
+
+    筛选条件：多头排列且量比 > 2（每只股票取最新一日）
+
+    Returns:
+        {'orm_seconds', 'duckdb_seconds', 'matches'}
+    """
+    import tempfile
+    from sqlalchemy import create_engine
+    from storage import DatabaseManager, StockDaily, make_benchmark_rows
+
+    rows = make_benchmark_rows(num_codes, num_days)
+    codes = sorted({r['code'] for r in rows})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = Path(tmp_dir) / 'bench.db'
+        engine = create_engine(f"sqlite:///{db_file}")
+        StockDaily.__table__.create(engine)
+        with engine.begin() as conn:
+            conn.execute(StockDaily.__table__.insert(), rows)
+        engine.dispose()
+
+        # ORM 循环：每只股票 get_latest_data + Python 判断
+        DatabaseManager.reset_instance()
+        db = DatabaseManager(f"sqlite:///{db_file}", compact_schema=False)
+        db.invalidate_cache()
+        t0 = time.perf_counter()
+        orm_matches = []
+        for code in codes:
+            latest = db.get_latest_data(code, days=1)
+            if latest and db._analyze_ma_status(latest[0]).startswith('多头排列') \
+                    and (latest[0].volume_ratio or 0) > 2:
+                orm_matches.append(code)
+        orm_seconds = time.perf_counter() - t0
+        DatabaseManager.reset_instance()
+
+        analytics = MarketAnalytics(db_path=str(db_file), parquet_dir='', compact_schema=False)
+        t0 = time.perf_counter()
+        df = analytics.screen(ma_status='多头排列', min_volume_ratio=2)
+        duckdb_seconds = time.perf_counter() - t0
+        analytics.close()
+
+    if sorted(df['code']) != sorted(orm_matches):
+        logger.warning("[Analytics] DuckDB 与 ORM 筛选结果不一致")
+
+    return {
+        'orm_seconds': orm_seconds,
+        'duckdb_seconds': duckdb_seconds,
+        'matches': len(orm_matches),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='DuckDB 分析查询工具')
+    parser.add_argument('--benchmark', action='store_true', help='对比 DuckDB 筛选与 ORM 逐股循环')
+    parser.add_argument('--sql', type=str, help='执行任意 SQL（视图: daily, latest）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.benchmark:
+        stats = benchmark_screen()
+        print("=== 横截面筛选基准测试（多头排列 且 量比>2）===")
+        print(f"命中股票数: {stats['matches']}")
+        print(f"ORM 逐股循环: {stats['orm_seconds']:.3f}s")
+        print(f"DuckDB 向量化: {stats['duckdb_seconds']:.3f}s")
+    else:
+        analytics = MarketAnalytics()
+        if args.sql:
+            print(analytics.query(args.sql).to_string())
+        else:
+            print("=== 多头排列 且 量比 > 2 ===")
+            print(analytics.screen(ma_status='多头排列', min_volume_ratio=2).to_string())
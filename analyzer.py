@@ -10,11 +10,16 @@ A股自选股智能分析系统 - AI分析层
 3. 结合技术面和消息面生成分析报告
 """
 
+import asyncio
+import contextvars
 import json
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import nullcontext
 from dataclasses import dataclass
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Callable
 
 from tenacity import (
     retry,
@@ -25,6 +30,16 @@ from tenacity import (
 )
 
 from config import get_config
+from json_stream import IncrementalJSONParser
+from llm_accounting import (
+    KIND_BATCH, KIND_SINGLE, get_llm_accounting, note_attempt, note_fallback, note_parse, note_response, note_usage
+)
+from llm_control import AIMDController, get_llm_controller, is_rate_limit_error, parse_retry_after
+from llm_hedge import RequestCancelled, get_hedge_policy
+from llm_quota import PRIORITY_SCHEDULED, QuotaExceededError, QuotaTicket, get_quota_manager
+from llm_output import ANALYSIS_SCHEMA, batch_schema, get_output_budget
+from prompt_budget import PromptSection, compact_news, estimate_tokens, fit_sections, format_report
+from prompt_cache import get_context_cache
 
 logger = logging.getLogger(__name__)
 
@@ -101,6 +116,9 @@ class AnalysisResult:
     data_sources: str = ""  # 数据来源说明
     success: bool = True
     error_message: Optional[str] = None
+    latency: Optional[float] = None  # AI 调用总耗时（秒）
+    first_verdict_latency: Optional[float] = None  # 流式模式下评分与操作建议完整到达的耗时（秒）
+    reused_from: Optional[str] = None  # 输入无实质变化时复用的上次分析时间（未调用 AI）
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -132,6 +150,9 @@ class AnalysisResult:
             'search_performed': self.search_performed,
             'success': self.success,
             'error_message': self.error_message,
+            'latency': self.latency,
+            'first_verdict_latency': self.first_verdict_latency,
+            'reused_from': self.reused_from,
         }
     
     def get_core_conclusion(self) -> str:
@@ -382,6 +403,15 @@ class GeminiAnalyzer:
 4. **检查清单可视化**：用 ✅⚠️❌ 明确显示每项检查结果
 5. **风险优先级**：舆情中的风险点要醒目标出"""
 
+    # 流式模式下的核心结论字段：两者都到达即视为"首个结论"
+    VERDICT_FIELDS = ('sentiment_score', 'operation_advice')
+    
+    # 批量模式：每只股票输出的估算 Token 数（用于限制单次请求的股票数）
+    BATCH_OUTPUT_TOKENS_PER_STOCK = 3000
+
+    # 提示词超出 Token 预算时，新闻摘要截短后保留的字符数
+    NEWS_SNIPPET_CHARS = 80
+
     def __init__(self, api_key: Optional[str] = None):
         """
         初始化 AI 分析器
@@ -398,6 +428,15 @@ class GeminiAnalyzer:
         self._using_fallback = False  # 是否正在使用备选模型
         self._use_openai = False  # 是否使用 OpenAI 兼容 API
         self._openai_client = None  # OpenAI 客户端
+        self._openai_client_kwargs: Optional[Dict[str, Any]] = None  # 创建异步客户端时复用
+        self._async_openai_client = None  # AsyncOpenAI 客户端（绑定创建时的事件循环）
+        self._async_openai_loop = None
+        self._hedge_openai_client = None  # 对冲请求专用的 OpenAI 客户端（不切换主服务商）
+        self.quota_priority = PRIORITY_SCHEDULED  # 配额排队优先级（Web 临时请求设为 PRIORITY_INTERACTIVE）
+        self.run_id: Optional[str] = None  # 调用记账的轮次 ID（由 StockAnalysisPipeline.run 设置）
+        self._gemini_structured = True  # 服务端拒绝 response_schema 时置为 False
+        self._openai_json_mode = True  # 服务端拒绝 response_format 时置为 False
+        self._openai_stream_usage = True  # 服务端拒绝 stream_options 时置为 False
         
         # 检查 Gemini API Key 是否有效（过滤占位符）
         gemini_key_valid = self._api_key and not self._api_key.startswith('your_') and len(self._api_key) > 10
@@ -429,15 +468,8 @@ class GeminiAnalyzer:
         - Moonshot 等
         """
         config = get_config()
-        
-        # 检查 OpenAI API Key 是否有效（过滤占位符）
-        openai_key_valid = (
-            config.openai_api_key and 
-            not config.openai_api_key.startswith('your_') and 
-            len(config.openai_api_key) > 10
-        )
-        
-        if not openai_key_valid:
+        client_kwargs = self._openai_client_config()
+        if client_kwargs is None:
             logger.debug("OpenAI 兼容 API 未配置或配置无效")
             return
         
@@ -449,12 +481,8 @@ class GeminiAnalyzer:
             return
         
         try:
-            # base_url 可选，不填则使用 OpenAI 官方默认地址
-            client_kwargs = {"api_key": config.openai_api_key}
-            if config.openai_base_url and config.openai_base_url.startswith('http'):
-                client_kwargs["base_url"] = config.openai_base_url
-            
             self._openai_client = OpenAI(**client_kwargs)
+            self._openai_client_kwargs = client_kwargs
             self._current_model_name = config.openai_model
             self._use_openai = True
             logger.info(f"OpenAI 兼容 API 初始化成功 (base_url: {config.openai_base_url}, model: {config.openai_model})")
@@ -471,6 +499,27 @@ class GeminiAnalyzer:
             else:
                 logger.error(f"OpenAI 兼容 API 初始化失败: {e}")
     
+    @staticmethod
+    def _openai_client_config() -> Optional[Dict[str, Any]]:
+        """OpenAI 客户端参数（API Key 未配置或为占位符时返回 None）"""
+        config = get_config()
+        
+        # 检查 OpenAI API Key 是否有效（过滤占位符）
+        openai_key_valid = (
+            config.openai_api_key and 
+            not config.openai_api_key.startswith('your_') and 
+            len(config.openai_api_key) > 10
+        )
+        if not openai_key_valid:
+            return None
+        
+        # base_url 可选，不填则使用 OpenAI 官方默认地址
+        # 关闭 SDK 内置重试：429 交由 _call_api_with_retry 处理并上报 AIMD 流控，避免 SDK 占着并发槽位静默退避
+        client_kwargs = {"api_key": config.openai_api_key, "max_retries": 0}
+        if config.openai_base_url and config.openai_base_url.startswith('http'):
+            client_kwargs["base_url"] = config.openai_base_url
+        return client_kwargs
+    
     def _init_model(self) -> None:
         """
         初始化 Gemini 模型
@@ -536,6 +585,7 @@ class GeminiAnalyzer:
             )
             self._current_model_name = fallback_model
             self._using_fallback = True
+            note_fallback()
             logger.info(f"[LLM] 备选模型 {fallback_model} 初始化成功")
             return True
         except Exception as e:
@@ -546,47 +596,303 @@ class GeminiAnalyzer:
         """检查分析器是否可用"""
         return self._model is not None or self._openai_client is not None
     
-    def _call_openai_api(self, prompt: str, generation_config: dict) -> str:
+    def _llm_controller(self, provider: str) -> Optional[AIMDController]:
+        """获取服务商共享的自适应并发控制器（LLM_MAX_CONCURRENCY=0 时关闭，返回 None）"""
+        if get_config().llm_max_concurrency <= 0:
+            return None
+        return get_llm_controller(provider)
+    
+    @staticmethod
+    def _fixed_request_delay() -> float:
+        """关闭自适应并发控制时，沿用固定的请求前延时（防止连续请求触发限流）"""
+        config = get_config()
+        if config.llm_max_concurrency <= 0 and config.gemini_request_delay > 0:
+            logger.debug(f"[LLM] 请求前等待 {config.gemini_request_delay:.1f} 秒...")
+            return config.gemini_request_delay
+        return 0.0
+    
+    def _wait_request_delay(self) -> None:
+        """请求前固定延时（仅在关闭自适应并发控制时生效）"""
+        delay = self._fixed_request_delay()
+        if delay > 0:
+            time.sleep(delay)
+    
+    @staticmethod
+    def _retry_delay(attempt: int, rate_limited: bool, controller: Optional[AIMDController]) -> float:
+        """
+        重试前等待时间
+        
+        限流由控制器按 Retry-After 冷却（此处不再等待），其余错误指数退避：5, 10, 20, 40...，最大 60 秒
+        """
+        if attempt == 0 or (rate_limited and controller):
+            return 0.0
+        return min(get_config().gemini_retry_delay * (2 ** (attempt - 1)), 60)
+    
+    @staticmethod
+    def _sleep(delay: float, cancel: Optional[threading.Event] = None) -> None:
+        """重试前等待（cancel 置位时提前结束）"""
+        if cancel is not None:
+            cancel.wait(delay)
+        else:
+            time.sleep(delay)
+    
+    @staticmethod
+    def _check_cancelled(cancel: Optional[threading.Event]) -> None:
+        """对冲请求中落败的一方停止重试与读取"""
+        if cancel is not None and cancel.is_set():
+            raise RequestCancelled("对冲请求已由另一方返回结果，取消本次请求")
+    
+    def _report_failure(self, controller: Optional[AIMDController], error: Exception) -> bool:
+        """
+        向控制器反馈失败结果
+        
+        Returns:
+            是否为限流错误（限流时控制器已按 Retry-After 设置冷却）
+        """
+        is_rate_limit = is_rate_limit_error(error)
+        if controller is not None:
+            if is_rate_limit:
+                controller.on_rate_limit(parse_retry_after(error))
+            else:
+                controller.on_error()
+        return is_rate_limit
+    
+    def _begin_attempt(self, provider: str, model: str, prompt: str) -> Optional[QuotaTicket]:
+        """发起一次请求前：记账并按进程内统一配额排队（未配置配额时返回 None）"""
+        tokens = estimate_tokens(self.SYSTEM_PROMPT) + estimate_tokens(prompt)
+        note_attempt(provider, model, tokens)
+        quota = get_quota_manager()
+        if not quota.enabled:
+            return None
+        return quota.acquire(model, tokens, self.quota_priority)
+    
+    async def _begin_attempt_async(self, provider: str, model: str, prompt: str) -> Optional[QuotaTicket]:
+        """_begin_attempt 的协程版本"""
+        tokens = estimate_tokens(self.SYSTEM_PROMPT) + estimate_tokens(prompt)
+        note_attempt(provider, model, tokens)
+        quota = get_quota_manager()
+        if not quota.enabled:
+            return None
+        return await quota.acquire_async(model, tokens, self.quota_priority)
+    
+    @staticmethod
+    def _end_attempt(ticket: Optional[QuotaTicket], response_text: str) -> None:
+        """请求成功返回后：记账并补记配额的输出 Token"""
+        note_response(response_text)
+        if ticket is not None and response_text:
+            get_quota_manager().commit(ticket, estimate_tokens(response_text))
+    
+    def _openai_request(self, prompt: str, generation_config: dict) -> Dict[str, Any]:
+        """OpenAI 兼容 API 的请求参数（同步/异步客户端共用）"""
+        request = {
+            'model': self._current_model_name,
+            'messages': [
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            'temperature': generation_config.get('temperature', 0.7),
+            'max_tokens': generation_config.get('max_output_tokens', 8192),
+        }
+        # JSON 模式只支持顶层对象（批量分析输出数组，不启用）
+        schema = generation_config.get('response_schema') or {}
+        if (
+            self._openai_json_mode
+            and generation_config.get('response_mime_type') == 'application/json'
+            and schema.get('type') != 'ARRAY'
+        ):
+            request['response_format'] = {"type": "json_object"}
+        return request
+    
+    def _gemini_config(self, generation_config: dict) -> dict:
+        """Gemini 生成配置（服务端不支持结构化输出时去掉相关字段）"""
+        if self._gemini_structured:
+            return generation_config
+        return {k: v for k, v in generation_config.items() if k not in ('response_mime_type', 'response_schema')}
+    
+    def _structured_config(self, schema: Dict[str, Any], stream: bool = False) -> Dict[str, Any]:
+        """
+        结构化输出相关的生成配置
+        
+        流式模式只声明 JSON 输出、不附带 Schema：
+        Gemini 按 Schema 输出时字段按字母序排列，评分与操作建议将不再最先到达
+        """
+        if not get_config().llm_structured_output:
+            return {}
+        extra = {'response_mime_type': 'application/json'}
+        if not stream:
+            extra['response_schema'] = schema
+        return extra
+    
+    def _check_structured_support(self, provider: str, error: Exception) -> None:
+        """服务端因结构化输出、流式用量、上下文缓存相关参数报错时关闭或重建（后续重试不再携带）"""
+        error_str = str(error).lower()
+        if provider == 'openai' and self._openai_stream_usage and 'stream_options' in error_str:
+            self._openai_stream_usage = False
+            logger.warning(f"[OpenAI] 当前服务不支持 stream_options，流式请求不再统计缓存命中: {str(error)[:100]}")
+        if provider == 'gemini' and 'cachedcontent' in error_str.replace('_', '').replace(' ', ''):
+            # 缓存已过期或被删除：下次请求重新上传
+            get_context_cache().invalidate(self._current_model_name or '', self.SYSTEM_PROMPT)
+        if provider == 'gemini' and self._gemini_structured and (
+            'response_schema' in error_str or 'response_mime_type' in error_str
+        ):
+            self._gemini_structured = False
+            logger.warning(f"[Gemini] 当前模型不支持结构化输出，已关闭: {str(error)[:100]}")
+        elif provider == 'openai' and self._openai_json_mode and 'response_format' in error_str:
+            self._openai_json_mode = False
+            logger.warning(f"[OpenAI] 当前服务不支持 JSON 模式，已关闭: {str(error)[:100]}")
+    
+    def _openai_stream_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """流式请求参数：末尾片段附带 usage，用于统计前缀缓存命中（服务端不支持时不携带）"""
+        request = dict(request, stream=True)
+        if self._openai_stream_usage:
+            request['stream_options'] = {"include_usage": True}
+        return request
+    
+    def _gemini_request_model(self):
+        """
+        Gemini 请求使用的模型
+        
+        启用上下文缓存时返回引用缓存系统提示词的模型（每轮分析只上传一次），不支持缓存时返回普通模型
+        """
+        if get_config().llm_context_cache and self._current_model_name:
+            cached_model = get_context_cache().gemini_model(self._current_model_name, self.SYSTEM_PROMPT)
+            if cached_model is not None:
+                return cached_model
+        return self._model
+    
+    @staticmethod
+    def _record_cache_usage(provider: str, response, start_time: float) -> None:
+        """记录响应中的 Token 用量与缓存命中 Token（不含用量信息的响应/片段忽略）"""
+        try:
+            get_context_cache().record(provider, response, time.time() - start_time)
+            note_usage(response)
+        except Exception as e:
+            logger.debug(f"[{provider}] 读取用量信息失败: {e}")
+    
+    def _generate_openai(
+        self,
+        prompt: str,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> str:
+        """发起一次 OpenAI 兼容 API 请求（传入 stream_parser 时流式接收，cancel 置位后停止读取）"""
+        request = self._openai_request(prompt, generation_config)
+        start_time = time.time()
+        if stream_parser is None:
+            response = self._openai_client.chat.completions.create(**request)
+            self._record_cache_usage('openai', response, start_time)
+            if response and response.choices:
+                return response.choices[0].message.content or ''
+            return ''
+        
+        stream_parser.reset()
+        stream = self._openai_client.chat.completions.create(**self._openai_stream_request(request))
+        try:
+            for chunk in stream:
+                self._check_cancelled(cancel)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    stream_parser.feed(chunk.choices[0].delta.content)
+                self._record_cache_usage('openai', chunk, start_time)
+        finally:
+            stream.close()
+        return stream_parser.text
+    
+    def _generate_gemini(
+        self,
+        prompt: str,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> str:
+        """发起一次 Gemini 请求（传入 stream_parser 时流式接收，cancel 置位后停止读取）"""
+        generation_config = self._gemini_config(generation_config)
+        model = self._gemini_request_model()
+        start_time = time.time()
+        if stream_parser is None:
+            response = model.generate_content(
+                prompt,
+                generation_config=generation_config,
+                request_options={"timeout": 120}
+            )
+            self._record_cache_usage('gemini', response, start_time)
+            return response.text if response else ''
+        
+        stream_parser.reset()
+        response = model.generate_content(
+            prompt,
+            generation_config=generation_config,
+            request_options={"timeout": 120},
+            stream=True
+        )
+        for chunk in response:
+            self._check_cancelled(cancel)
+            stream_parser.feed(self._chunk_text(chunk))
+        self._record_cache_usage('gemini', response, start_time)
+        return stream_parser.text
+    
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """Gemini 流式片段的文本（结束片段等不含文本时返回空串）"""
+        try:
+            return chunk.text
+        except ValueError:
+            return ''
+    
+    def _call_openai_api(
+        self,
+        prompt: str,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> str:
         """
         调用 OpenAI 兼容 API
         
         Args:
             prompt: 提示词
             generation_config: 生成配置
+            stream_parser: 增量解析器（传入时流式接收响应）
+            cancel: 取消标记（对冲请求中落败时置位，不再重试）
             
         Returns:
             响应文本
         """
         config = get_config()
         max_retries = config.gemini_max_retries
-        base_delay = config.gemini_retry_delay
+        controller = self._llm_controller('openai')
+        last_rate_limited = False
         
         for attempt in range(max_retries):
             try:
-                if attempt > 0:
-                    delay = base_delay * (2 ** (attempt - 1))
-                    delay = min(delay, 60)
+                # 限流后的等待由控制器按 Retry-After 冷却，其余错误指数退避
+                delay = self._retry_delay(attempt, last_rate_limited, controller)
+                if delay > 0:
                     logger.info(f"[OpenAI] 第 {attempt + 1} 次重试，等待 {delay:.1f} 秒...")
-                    time.sleep(delay)
+                    self._sleep(delay, cancel)
                 
-                response = self._openai_client.chat.completions.create(
-                    model=self._current_model_name,
-                    messages=[
-                        {"role": "system", "content": self.SYSTEM_PROMPT},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=generation_config.get('temperature', 0.7),
-                    max_tokens=generation_config.get('max_output_tokens', 8192),
-                )
+                # 已落败的请求不再占用配额与记账
+                self._check_cancelled(cancel)
+                ticket = self._begin_attempt('openai', get_config().openai_model, prompt)
+                with controller.slot() if controller else nullcontext():
+                    self._check_cancelled(cancel)
+                    start_time = time.time()
+                    response_text = self._generate_openai(prompt, generation_config, stream_parser, cancel)
+                self._end_attempt(ticket, response_text)
                 
-                if response and response.choices and response.choices[0].message.content:
-                    return response.choices[0].message.content
+                if response_text:
+                    if controller:
+                        controller.on_success(time.time() - start_time)
+                    return response_text
                 else:
                     raise ValueError("OpenAI API 返回空响应")
                     
+            except (RequestCancelled, QuotaExceededError):
+                raise
             except Exception as e:
                 error_str = str(e)
-                is_rate_limit = '429' in error_str or 'rate' in error_str.lower() or 'quota' in error_str.lower()
+                is_rate_limit = last_rate_limited = self._report_failure(controller, e)
+                self._check_structured_support('openai', e)
                 
                 if is_rate_limit:
                     logger.warning(f"[OpenAI] API 限流，第 {attempt + 1}/{max_retries} 次尝试: {error_str[:100]}")
@@ -598,7 +904,13 @@ class GeminiAnalyzer:
         
         raise Exception("OpenAI API 调用失败，已达最大重试次数")
     
-    def _call_api_with_retry(self, prompt: str, generation_config: dict) -> str:
+    def _call_api_with_retry(
+        self,
+        prompt: str,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> str:
         """
         调用 AI API，带有重试和模型切换机制
         
@@ -612,88 +924,540 @@ class GeminiAnalyzer:
         Args:
             prompt: 提示词
             generation_config: 生成配置
+            stream_parser: 增量解析器（传入时流式接收响应，字段完成即回调）
+            cancel: 取消标记（对冲请求中落败时置位，不再重试或切换）
             
         Returns:
             响应文本
         """
         # 如果已经在使用 OpenAI 模式，直接调用 OpenAI
         if self._use_openai:
-            return self._call_openai_api(prompt, generation_config)
+            return self._call_openai_api(prompt, generation_config, stream_parser, cancel)
         
         config = get_config()
         max_retries = config.gemini_max_retries
-        base_delay = config.gemini_retry_delay
         
         last_error = None
         tried_fallback = getattr(self, '_using_fallback', False)
+        controller = self._llm_controller('gemini')
+        last_rate_limited = False
         
         for attempt in range(max_retries):
             try:
-                # 请求前增加延时（防止请求过快触发限流）
-                if attempt > 0:
-                    delay = base_delay * (2 ** (attempt - 1))  # 指数退避: 5, 10, 20, 40...
-                    delay = min(delay, 60)  # 最大60秒
+                # 重试前延时：限流由控制器按 Retry-After 冷却，其余错误指数退避
+                delay = self._retry_delay(attempt, last_rate_limited, controller)
+                if delay > 0:
                     logger.info(f"[Gemini] 第 {attempt + 1} 次重试，等待 {delay:.1f} 秒...")
-                    time.sleep(delay)
+                    self._sleep(delay, cancel)
                 
-                response = self._model.generate_content(
-                    prompt,
-                    generation_config=generation_config,
-                    request_options={"timeout": 120}
-                )
+                # 已落败的请求不再占用配额与记账
+                self._check_cancelled(cancel)
+                ticket = self._begin_attempt('gemini', self._current_model_name, prompt)
+                with controller.slot() if controller else nullcontext():
+                    self._check_cancelled(cancel)
+                    start_time = time.time()
+                    response_text = self._generate_gemini(prompt, generation_config, stream_parser, cancel)
+                self._end_attempt(ticket, response_text)
                 
-                if response and response.text:
-                    return response.text
+                if response_text:
+                    if controller:
+                        controller.on_success(time.time() - start_time)
+                    return response_text
                 else:
                     raise ValueError("Gemini 返回空响应")
                     
+            except RequestCancelled:
+                raise
+            except QuotaExceededError as e:
+                # 今日配额已用尽：不再重试，直接尝试备选 API
+                logger.warning(f"[Gemini] {e}")
+                last_error = e
+                break
             except Exception as e:
                 last_error = e
-                error_str = str(e)
+                last_rate_limited, tried_fallback = self._handle_gemini_failure(
+                    e, attempt, max_retries, controller, tried_fallback, cancel
+                )
+        
+        # 对冲中已落败：不切换到 OpenAI（_ensure_openai_fallback 会修改分析器的服务商状态，影响后续股票）
+        self._check_cancelled(cancel)
+        
+        # Gemini 所有重试都失败，尝试 OpenAI 兼容 API
+        if self._ensure_openai_fallback():
+            try:
+                return self._call_openai_api(prompt, generation_config, stream_parser, cancel)
+            except Exception as openai_error:
+                logger.error(f"[OpenAI] 备选 API 也失败: {openai_error}")
+                raise last_error or openai_error
+        
+        # 所有方式都失败
+        raise last_error or Exception("所有 AI API 调用失败，已达最大重试次数")
+    
+    def _handle_gemini_failure(
+        self,
+        error: Exception,
+        attempt: int,
+        max_retries: int,
+        controller: Optional[AIMDController],
+        tried_fallback: bool,
+        cancel: Optional[threading.Event] = None
+    ) -> Tuple[bool, bool]:
+        """
+        处理一次 Gemini 调用失败：反馈控制器、记录日志，限流过半时切换备选模型
+        
+        对冲中已落败（cancel 已置位）时抛出 RequestCancelled，不切换模型（模型为分析器共享状态）
+        
+        Returns:
+            (是否为限流错误, 是否已切换过备选模型)
+        """
+        error_str = str(error)
+        
+        # 检查是否是 429 限流错误（同时反馈给并发控制器）
+        is_rate_limit = self._report_failure(controller, error)
+        self._check_structured_support('gemini', error)
+        
+        if is_rate_limit:
+            logger.warning(f"[Gemini] API 限流 (429)，第 {attempt + 1}/{max_retries} 次尝试: {error_str[:100]}")
+            
+            # 如果已经重试了一半次数且还没切换过备选模型，尝试切换
+            if attempt >= max_retries // 2 and not tried_fallback:
+                self._check_cancelled(cancel)
+                if self._switch_to_fallback_model():
+                    tried_fallback = True
+                    logger.info("[Gemini] 已切换到备选模型，继续重试")
+                else:
+                    logger.warning("[Gemini] 切换备选模型失败，继续使用当前模型重试")
+        else:
+            # 非限流错误，记录并继续重试
+            logger.warning(f"[Gemini] API 调用失败，第 {attempt + 1}/{max_retries} 次尝试: {error_str[:100]}")
+        
+        return is_rate_limit, tried_fallback
+    
+    def _ensure_openai_fallback(self) -> bool:
+        """Gemini 所有重试失败后，确认 OpenAI 兼容 API 可用（未初始化时尝试懒加载）"""
+        if self._openai_client:
+            logger.warning("[Gemini] 所有重试失败，切换到 OpenAI 兼容 API")
+            note_fallback()
+            return True
+        config = get_config()
+        if config.openai_api_key and config.openai_base_url:
+            logger.warning("[Gemini] 所有重试失败，尝试初始化 OpenAI 兼容 API")
+            self._init_openai_fallback()
+        if self._openai_client is None:
+            return False
+        note_fallback()
+        return True
+    
+    # ========== 异步调用路径（LLM_ASYNC=true） ==========
+    
+    def _get_async_openai_client(self):
+        """
+        获取 AsyncOpenAI 客户端
+        
+        连接池绑定创建时的事件循环，同一轮分析内的所有请求复用；
+        事件循环变化（如下一次定时任务）时重新创建
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_openai_client is None or self._async_openai_loop is not loop:
+            from openai import AsyncOpenAI
+            self._async_openai_client = AsyncOpenAI(**(self._openai_client_kwargs or {}))
+            self._async_openai_loop = loop
+        return self._async_openai_client
+    
+    async def _generate_openai_async(
+        self,
+        client,
+        prompt: str,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None
+    ) -> str:
+        """_generate_openai 的协程版本"""
+        request = self._openai_request(prompt, generation_config)
+        start_time = time.time()
+        if stream_parser is None:
+            response = await client.chat.completions.create(**request)
+            self._record_cache_usage('openai', response, start_time)
+            if response and response.choices:
+                return response.choices[0].message.content or ''
+            return ''
+        
+        stream_parser.reset()
+        async for chunk in await client.chat.completions.create(**self._openai_stream_request(request)):
+            if chunk.choices and chunk.choices[0].delta.content:
+                stream_parser.feed(chunk.choices[0].delta.content)
+            self._record_cache_usage('openai', chunk, start_time)
+        return stream_parser.text
+    
+    async def _generate_gemini_async(
+        self,
+        prompt: str,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None
+    ) -> str:
+        """_generate_gemini 的协程版本"""
+        generation_config = self._gemini_config(generation_config)
+        model = self._gemini_request_model()
+        start_time = time.time()
+        if stream_parser is None:
+            response = await model.generate_content_async(
+                prompt,
+                generation_config=generation_config,
+                request_options={"timeout": 120}
+            )
+            self._record_cache_usage('gemini', response, start_time)
+            return response.text if response else ''
+        
+        stream_parser.reset()
+        response = await model.generate_content_async(
+            prompt,
+            generation_config=generation_config,
+            request_options={"timeout": 120},
+            stream=True
+        )
+        async for chunk in response:
+            stream_parser.feed(self._chunk_text(chunk))
+        self._record_cache_usage('gemini', response, start_time)
+        return stream_parser.text
+    
+    async def _call_openai_api_async(
+        self,
+        prompt: str,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None
+    ) -> str:
+        """_call_openai_api 的协程版本（AsyncOpenAI，等待响应时不占用线程）"""
+        config = get_config()
+        max_retries = config.gemini_max_retries
+        controller = self._llm_controller('openai')
+        client = self._get_async_openai_client()
+        last_rate_limited = False
+        
+        for attempt in range(max_retries):
+            try:
+                delay = self._retry_delay(attempt, last_rate_limited, controller)
+                if delay > 0:
+                    logger.info(f"[OpenAI] 第 {attempt + 1} 次重试，等待 {delay:.1f} 秒...")
+                    await asyncio.sleep(delay)
                 
-                # 检查是否是 429 限流错误
-                is_rate_limit = '429' in error_str or 'quota' in error_str.lower() or 'rate' in error_str.lower()
+                ticket = await self._begin_attempt_async('openai', get_config().openai_model, prompt)
+                async with controller.async_slot() if controller else nullcontext():
+                    start_time = time.time()
+                    response_text = await self._generate_openai_async(
+                        client, prompt, generation_config, stream_parser
+                    )
+                self._end_attempt(ticket, response_text)
                 
-                if is_rate_limit:
-                    logger.warning(f"[Gemini] API 限流 (429)，第 {attempt + 1}/{max_retries} 次尝试: {error_str[:100]}")
+                if response_text:
+                    if controller:
+                        controller.on_success(time.time() - start_time)
+                    return response_text
+                else:
+                    raise ValueError("OpenAI API 返回空响应")
                     
-                    # 如果已经重试了一半次数且还没切换过备选模型，尝试切换
-                    if attempt >= max_retries // 2 and not tried_fallback:
-                        if self._switch_to_fallback_model():
-                            tried_fallback = True
-                            logger.info("[Gemini] 已切换到备选模型，继续重试")
-                        else:
-                            logger.warning("[Gemini] 切换备选模型失败，继续使用当前模型重试")
+            except QuotaExceededError:
+                raise
+            except Exception as e:
+                error_str = str(e)
+                is_rate_limit = last_rate_limited = self._report_failure(controller, e)
+                self._check_structured_support('openai', e)
+                
+                if is_rate_limit:
+                    logger.warning(f"[OpenAI] API 限流，第 {attempt + 1}/{max_retries} 次尝试: {error_str[:100]}")
                 else:
-                    # 非限流错误，记录并继续重试
-                    logger.warning(f"[Gemini] API 调用失败，第 {attempt + 1}/{max_retries} 次尝试: {error_str[:100]}")
+                    logger.warning(f"[OpenAI] API 调用失败，第 {attempt + 1}/{max_retries} 次尝试: {error_str[:100]}")
+                
+                if attempt == max_retries - 1:
+                    raise
         
-        # Gemini 所有重试都失败，尝试 OpenAI 兼容 API
-        if self._openai_client:
-            logger.warning("[Gemini] 所有重试失败，切换到 OpenAI 兼容 API")
+        raise Exception("OpenAI API 调用失败，已达最大重试次数")
+    
+    async def _call_api_with_retry_async(
+        self,
+        prompt: str,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None
+    ) -> str:
+        """_call_api_with_retry 的协程版本（Gemini generate_content_async / AsyncOpenAI）"""
+        if self._use_openai:
+            return await self._call_openai_api_async(prompt, generation_config, stream_parser)
+        
+        config = get_config()
+        max_retries = config.gemini_max_retries
+        
+        last_error = None
+        tried_fallback = getattr(self, '_using_fallback', False)
+        controller = self._llm_controller('gemini')
+        last_rate_limited = False
+        
+        for attempt in range(max_retries):
             try:
-                return self._call_openai_api(prompt, generation_config)
+                delay = self._retry_delay(attempt, last_rate_limited, controller)
+                if delay > 0:
+                    logger.info(f"[Gemini] 第 {attempt + 1} 次重试，等待 {delay:.1f} 秒...")
+                    await asyncio.sleep(delay)
+                
+                ticket = await self._begin_attempt_async('gemini', self._current_model_name, prompt)
+                async with controller.async_slot() if controller else nullcontext():
+                    start_time = time.time()
+                    response_text = await self._generate_gemini_async(prompt, generation_config, stream_parser)
+                self._end_attempt(ticket, response_text)
+                
+                if response_text:
+                    if controller:
+                        controller.on_success(time.time() - start_time)
+                    return response_text
+                else:
+                    raise ValueError("Gemini 返回空响应")
+                    
+            except QuotaExceededError as e:
+                logger.warning(f"[Gemini] {e}")
+                last_error = e
+                break
+            except Exception as e:
+                last_error = e
+                last_rate_limited, tried_fallback = self._handle_gemini_failure(
+                    e, attempt, max_retries, controller, tried_fallback
+                )
+        
+        if self._ensure_openai_fallback():
+            try:
+                return await self._call_openai_api_async(prompt, generation_config, stream_parser)
             except Exception as openai_error:
                 logger.error(f"[OpenAI] 备选 API 也失败: {openai_error}")
                 raise last_error or openai_error
-        elif config.openai_api_key and config.openai_base_url:
-            # 尝试懒加载初始化 OpenAI
-            logger.warning("[Gemini] 所有重试失败，尝试初始化 OpenAI 兼容 API")
-            self._init_openai_fallback()
-            if self._openai_client:
-                try:
-                    return self._call_openai_api(prompt, generation_config)
-                except Exception as openai_error:
-                    logger.error(f"[OpenAI] 备选 API 也失败: {openai_error}")
-                    raise last_error or openai_error
         
-        # 所有方式都失败
         raise last_error or Exception("所有 AI API 调用失败，已达最大重试次数")
     
+    # ========== 对冲请求（LLM_HEDGE=true） ==========
+    
+    def _hedge_enabled(self) -> bool:
+        """主服务商为 Gemini 且配置了 OpenAI 兼容 API 时才可对冲"""
+        if not get_config().llm_hedge or self._use_openai or self._model is None:
+            return False
+        if self._openai_client_kwargs is None:
+            self._openai_client_kwargs = self._openai_client_config()
+        return self._openai_client_kwargs is not None
+    
+    def _hedge_request(self, prompt: str, generation_config: dict) -> Dict[str, Any]:
+        """对冲请求参数（使用 OPENAI_MODEL，不切换主服务商）"""
+        return dict(self._openai_request(prompt, generation_config), model=get_config().openai_model)
+    
+    def _call_hedge(self, prompt: str, generation_config: dict, cancel: threading.Event) -> str:
+        """向 OpenAI 兼容 API 发起一次对冲请求（不重试，整包接收）"""
+        if self._hedge_openai_client is None:
+            from openai import OpenAI
+            self._hedge_openai_client = OpenAI(**self._openai_client_kwargs)
+        controller = self._llm_controller('openai')
+        self._check_cancelled(cancel)
+        ticket = self._begin_attempt('openai', get_config().openai_model, prompt)
+        with controller.slot() if controller else nullcontext():
+            self._check_cancelled(cancel)
+            start_time = time.time()
+            try:
+                response = self._hedge_openai_client.chat.completions.create(
+                    **self._hedge_request(prompt, generation_config)
+                )
+            except Exception as e:
+                self._report_failure(controller, e)
+                raise
+        if controller:
+            controller.on_success(time.time() - start_time)
+        self._record_cache_usage('openai', response, start_time)
+        if response and response.choices and response.choices[0].message.content:
+            self._end_attempt(ticket, response.choices[0].message.content)
+            return response.choices[0].message.content
+        raise ValueError("对冲请求返回空响应")
+    
+    def _call_with_hedge(
+        self,
+        prompt: str,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None
+    ) -> str:
+        """
+        调用 AI API，主模型超过对冲等待时间未返回时并行请求备选模型
+        
+        先返回可解析 JSON 的一方胜出，另一方被取消；都无法解析时返回先到的响应，都失败时抛出主模型的异常。
+        未开启 LLM_HEDGE 或无备选服务商时等同于 _call_api_with_retry
+        """
+        if not self._hedge_enabled():
+            return self._call_api_with_retry(prompt, generation_config, stream_parser)
+        
+        policy = get_hedge_policy()
+        cancels = {'primary': threading.Event(), 'hedge': threading.Event()}
+        live = threading.Event()
+        live.set()
+        primary_parser = self._attempt_parser(stream_parser, live)
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='llm_hedge')
+        start_time = time.time()
+        try:
+            # 子线程沿用当前调用的记账上下文
+            primary = executor.submit(
+                contextvars.copy_context().run,
+                self._call_api_with_retry, prompt, generation_config, primary_parser, cancels['primary']
+            )
+            delay = policy.delay()
+            done, _ = wait([primary], timeout=delay)
+            if done or not policy.try_acquire():
+                response_text = primary.result()
+                policy.record_primary(time.time() - start_time)
+                self._adopt_attempt(stream_parser, primary_parser, response_text, notify=False)
+                return response_text
+            
+            # 对冲开始后主模型的字段只缓存，胜出方确定后再转发
+            live.clear()
+            logger.info(f"[LLM对冲] 主模型 {delay:.1f}s 未返回，并行请求备选模型 {get_config().openai_model}")
+            hedge = executor.submit(
+                contextvars.copy_context().run, self._call_hedge, prompt, generation_config, cancels['hedge']
+            )
+            pending = {primary: 'primary', hedge: 'hedge'}
+            errors: Dict[str, Exception] = {}
+            unparsed: Optional[str] = None
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    source = pending.pop(future)
+                    try:
+                        response_text = future.result()
+                    except Exception as e:
+                        errors[source] = e
+                        continue
+                    if source == 'primary':
+                        policy.record_primary(time.time() - start_time)
+                    if self._decode_json(response_text)[1] == 'failed':
+                        unparsed = unparsed or response_text
+                        continue
+                    for other in pending.values():
+                        cancels[other].set()
+                    if 'primary' in pending.values():
+                        # 落败的主模型按取消时的已用时间记为样本
+                        policy.record_primary(time.time() - start_time)
+                    self._adopt_attempt(stream_parser, primary_parser if source == 'primary' else None, response_text)
+                    policy.record_outcome(source, cancelled=bool(pending))
+                    logger.info(f"[LLM对冲] {'备选模型' if source == 'hedge' else '主模型'}先返回结果，"
+                                f"耗时 {time.time() - start_time:.1f}s")
+                    return response_text
+            
+            policy.record_outcome(None)
+            if unparsed is not None:
+                return unparsed
+            raise errors.get('primary') or errors['hedge']
+        finally:
+            executor.shutdown(wait=False)
+    
+    @staticmethod
+    def _attempt_parser(
+        stream_parser: Optional[IncrementalJSONParser],
+        live: threading.Event
+    ) -> Optional[IncrementalJSONParser]:
+        """对冲时主模型请求使用的独立解析器：live 置位期间字段实时同步给 stream_parser，之后只缓存"""
+        if stream_parser is None:
+            return None
+        parser = IncrementalJSONParser()
+        parser.on_field = lambda key, value: stream_parser.adopt(parser) if live.is_set() else None
+        return parser
+    
+    @staticmethod
+    def _adopt_attempt(
+        stream_parser: Optional[IncrementalJSONParser],
+        parser: Optional[IncrementalJSONParser],
+        response_text: str,
+        notify: bool = True
+    ) -> None:
+        """把胜出请求的字段同步给调用方的解析器（非流式的对冲请求按完整响应解析）"""
+        if stream_parser is None:
+            return
+        if parser is None:
+            parser = IncrementalJSONParser()
+            parser.feed(response_text)
+        stream_parser.adopt(parser, notify=notify)
+    
+    async def _call_hedge_async(self, prompt: str, generation_config: dict) -> str:
+        """_call_hedge 的协程版本（落败时任务被取消，连接随之关闭）"""
+        client = self._get_async_openai_client()
+        controller = self._llm_controller('openai')
+        ticket = await self._begin_attempt_async('openai', get_config().openai_model, prompt)
+        async with controller.async_slot() if controller else nullcontext():
+            start_time = time.time()
+            try:
+                response = await client.chat.completions.create(**self._hedge_request(prompt, generation_config))
+            except Exception as e:
+                self._report_failure(controller, e)
+                raise
+        if controller:
+            controller.on_success(time.time() - start_time)
+        self._record_cache_usage('openai', response, start_time)
+        if response and response.choices and response.choices[0].message.content:
+            self._end_attempt(ticket, response.choices[0].message.content)
+            return response.choices[0].message.content
+        raise ValueError("对冲请求返回空响应")
+    
+    async def _call_with_hedge_async(
+        self,
+        prompt: str,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None
+    ) -> str:
+        """_call_with_hedge 的协程版本"""
+        if not self._hedge_enabled():
+            return await self._call_api_with_retry_async(prompt, generation_config, stream_parser)
+        
+        policy = get_hedge_policy()
+        live = threading.Event()
+        live.set()
+        primary_parser = self._attempt_parser(stream_parser, live)
+        start_time = time.time()
+        primary = asyncio.ensure_future(self._call_api_with_retry_async(prompt, generation_config, primary_parser))
+        pending = {primary: 'primary'}
+        try:
+            delay = policy.delay()
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not policy.try_acquire():
+                response_text = await primary
+                policy.record_primary(time.time() - start_time)
+                self._adopt_attempt(stream_parser, primary_parser, response_text, notify=False)
+                return response_text
+            
+            live.clear()
+            logger.info(f"[LLM对冲] 主模型 {delay:.1f}s 未返回，并行请求备选模型 {get_config().openai_model}")
+            pending[asyncio.ensure_future(self._call_hedge_async(prompt, generation_config))] = 'hedge'
+            errors: Dict[str, BaseException] = {}
+            unparsed: Optional[str] = None
+            while pending:
+                done, _ = await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    source = pending.pop(task)
+                    if task.exception() is not None:
+                        errors[source] = task.exception()
+                        continue
+                    response_text = task.result()
+                    if source == 'primary':
+                        policy.record_primary(time.time() - start_time)
+                    if self._decode_json(response_text)[1] == 'failed':
+                        unparsed = unparsed or response_text
+                        continue
+                    if 'primary' in pending.values():
+                        policy.record_primary(time.time() - start_time)
+                    self._adopt_attempt(stream_parser, primary_parser if source == 'primary' else None, response_text)
+                    policy.record_outcome(source, cancelled=bool(pending))
+                    logger.info(f"[LLM对冲] {'备选模型' if source == 'hedge' else '主模型'}先返回结果，"
+                                f"耗时 {time.time() - start_time:.1f}s")
+                    return response_text
+            
+            policy.record_outcome(None)
+            if unparsed is not None:
+                return unparsed
+            raise errors.get('primary') or errors['hedge']
+        finally:
+            # 落败或未完成的一方直接取消
+            for task in pending:
+                task.cancel()
+    
     def analyze(
         self, 
         context: Dict[str, Any],
-        news_context: Optional[str] = None
+        news_context: Optional[str] = None,
+        on_partial: Optional[Callable[[str, Dict[str, Any]], None]] = None
     ) -> AnalysisResult:
         """
         分析单只股票
@@ -707,109 +1471,228 @@ class GeminiAnalyzer:
         Args:
             context: 从 storage.get_analysis_context() 获取的上下文数据
             news_context: 预先搜索的新闻内容（可选）
+            on_partial: 流式模式（LLM_STREAMING=true）下每完成一个顶层字段回调一次，
+                        参数为 (股票代码, 已完成的字段字典)，可据此提前使用评分与操作建议
             
         Returns:
             AnalysisResult 对象
         """
         code = context.get('code', 'Unknown')
-        config = get_config()
         
-        # 请求前增加延时（防止连续请求触发限流）
-        request_delay = config.gemini_request_delay
-        if request_delay > 0:
-            logger.debug(f"[LLM] 请求前等待 {request_delay:.1f} 秒...")
-            time.sleep(request_delay)
+        # 请求前增加延时（仅在关闭自适应并发控制时生效）
+        self._wait_request_delay()
         
-        # 优先从上下文获取股票名称（由 main.py 传入）
-        name = context.get('stock_name')
-        if not name or name.startswith('股票'):
-            # 备选：从 realtime 中获取
-            if 'realtime' in context and context['realtime'].get('name'):
-                name = context['realtime']['name']
-            else:
-                # 最后从映射表获取
-                name = STOCK_NAME_MAP.get(code, f'股票{code}')
+        name = self._resolve_name(context)
         
         # 如果模型不可用，返回默认结果
         if not self.is_available():
-            return AnalysisResult(
-                code=code,
-                name=name,
-                sentiment_score=50,
-                trend_prediction='震荡',
-                operation_advice='持有',
-                confidence_level='低',
-                analysis_summary='AI 分析功能未启用（未配置 API Key）',
-                risk_warning='请配置 Gemini API Key 后重试',
-                success=False,
-                error_message='Gemini API Key 未配置',
-            )
+            return self._unavailable_result(code, name)
         
         try:
-            # 格式化输入（包含技术面数据和新闻）
-            prompt = self._format_prompt(context, name, news_context)
-            
-            # 获取模型名称
-            model_name = getattr(self, '_current_model_name', None)
-            if not model_name:
-                model_name = getattr(self._model, '_model_name', 'unknown')
-                if hasattr(self._model, 'model_name'):
-                    model_name = self._model.model_name
-            
-            logger.info(f"========== AI 分析 {name}({code}) ==========")
-            logger.info(f"[LLM配置] 模型: {model_name}")
-            logger.info(f"[LLM配置] Prompt 长度: {len(prompt)} 字符")
-            logger.info(f"[LLM配置] 是否包含新闻: {'是' if news_context else '否'}")
+            prompt, generation_config = self._prepare_request(context, code, name, news_context)
             
-            # 记录完整 prompt 到日志（INFO级别记录摘要，DEBUG记录完整）
-            prompt_preview = prompt[:500] + "..." if len(prompt) > 500 else prompt
-            logger.info(f"[LLM Prompt 预览]\n{prompt_preview}")
-            logger.debug(f"=== 完整 Prompt ({len(prompt)}字符) ===\n{prompt}\n=== End Prompt ===")
+            stream_parser = self._make_stream_parser(code, on_partial)
             
-            # 设置生成配置
-            generation_config = {
-                "temperature": 0.7,
-                "max_output_tokens": 8192,
-            }
-            
-            logger.info(f"[LLM调用] 开始调用 Gemini API (temperature={generation_config['temperature']}, max_tokens={generation_config['max_output_tokens']})...")
-            
-            # 使用带重试的 API 调用
-            start_time = time.time()
-            response_text = self._call_api_with_retry(prompt, generation_config)
-            elapsed = time.time() - start_time
-            
-            # 记录响应信息
-            logger.info(f"[LLM返回] Gemini API 响应成功, 耗时 {elapsed:.2f}s, 响应长度 {len(response_text)} 字符")
-            
-            # 记录响应预览（INFO级别）和完整响应（DEBUG级别）
-            response_preview = response_text[:300] + "..." if len(response_text) > 300 else response_text
-            logger.info(f"[LLM返回 预览]\n{response_preview}")
-            logger.debug(f"=== Gemini 完整响应 ({len(response_text)}字符) ===\n{response_text}\n=== End Response ===")
-            
-            # 解析响应
-            result = self._parse_response(response_text, code, name)
-            result.raw_response = response_text
-            result.search_performed = bool(news_context)
-            
-            logger.info(f"[LLM解析] {name}({code}) 分析完成: {result.trend_prediction}, 评分 {result.sentiment_score}")
+            # 使用带重试的 API 调用（Token、耗时、重试与解析结果计入调用记账）
+            with get_llm_accounting().track(code, KIND_SINGLE, self.run_id):
+                start_time = time.monotonic()
+                response_text = self._call_with_hedge(prompt, generation_config, stream_parser)
+                return self._finish_analysis(
+                    response_text, code, name, news_context, start_time, generation_config, stream_parser
+                )
             
-            return result
+        except Exception as e:
+            logger.error(f"AI 分析 {name}({code}) 失败: {e}")
+            return self._error_result(code, name, e)
+    
+    async def analyze_async(
+        self,
+        context: Dict[str, Any],
+        news_context: Optional[str] = None,
+        on_partial: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ) -> AnalysisResult:
+        """
+        分析单只股票（协程版本）
+        
+        流程与 analyze() 相同，等待 AI 响应时让出事件循环：
+        多只股票可在同一事件循环上并发请求，复用 HTTP 连接，不占用工作线程
+        """
+        code = context.get('code', 'Unknown')
+        
+        delay = self._fixed_request_delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        name = self._resolve_name(context)
+        
+        if not self.is_available():
+            return self._unavailable_result(code, name)
+        
+        try:
+            prompt, generation_config = self._prepare_request(context, code, name, news_context)
+            stream_parser = self._make_stream_parser(code, on_partial)
+            with get_llm_accounting().track(code, KIND_SINGLE, self.run_id):
+                start_time = time.monotonic()
+                response_text = await self._call_with_hedge_async(prompt, generation_config, stream_parser)
+                return self._finish_analysis(
+                    response_text, code, name, news_context, start_time, generation_config, stream_parser
+                )
             
         except Exception as e:
             logger.error(f"AI 分析 {name}({code}) 失败: {e}")
-            return AnalysisResult(
-                code=code,
-                name=name,
-                sentiment_score=50,
-                trend_prediction='震荡',
-                operation_advice='持有',
-                confidence_level='低',
-                analysis_summary=f'分析过程出错: {str(e)[:100]}',
-                risk_warning='分析失败，请稍后重试或手动分析',
-                success=False,
-                error_message=str(e),
-            )
+            return self._error_result(code, name, e)
+    
+    def _prepare_request(
+        self,
+        context: Dict[str, Any],
+        code: str,
+        name: str,
+        news_context: Optional[str]
+    ) -> Tuple[str, dict]:
+        """格式化输入（包含技术面数据和新闻）并记录请求日志，返回 (prompt, generation_config)"""
+        prompt = self._format_prompt(context, name, news_context)
+        
+        # 获取模型名称
+        model_name = getattr(self, '_current_model_name', None)
+        if not model_name:
+            model_name = getattr(self._model, '_model_name', 'unknown')
+            if hasattr(self._model, 'model_name'):
+                model_name = self._model.model_name
+        
+        logger.info(f"========== AI 分析 {name}({code}) ==========")
+        logger.info(f"[LLM配置] 模型: {model_name}")
+        logger.info(f"[LLM配置] Prompt 长度: {len(prompt)} 字符, 估算 {estimate_tokens(prompt)} Token")
+        logger.info(f"[LLM配置] 是否包含新闻: {'是' if news_context else '否'}")
+        
+        # 记录完整 prompt 到日志（INFO级别记录摘要，DEBUG记录完整）
+        prompt_preview = prompt[:500] + "..." if len(prompt) > 500 else prompt
+        logger.info(f"[LLM Prompt 预览]\n{prompt_preview}")
+        logger.debug(f"=== 完整 Prompt ({len(prompt)}字符) ===\n{prompt}\n=== End Prompt ===")
+        
+        # 设置生成配置（输出上限按近期实际输出长度自适应，结构化输出省去代码块与修复解析）
+        config = get_config()
+        generation_config = {
+            "temperature": 0.7,
+            "max_output_tokens": self._output_token_limit('single', config.llm_max_output_tokens),
+            **self._structured_config(ANALYSIS_SCHEMA, stream=config.llm_streaming),
+        }
+        
+        logger.info(f"[LLM调用] 开始调用 Gemini API (temperature={generation_config['temperature']}, max_tokens={generation_config['max_output_tokens']})...")
+        return prompt, generation_config
+    
+    @staticmethod
+    def _output_token_limit(kind: str, ceiling: int, default: Optional[int] = None) -> int:
+        """本次请求的 max_output_tokens（关闭自适应时固定为上限）"""
+        if not get_config().llm_adaptive_output_tokens:
+            return ceiling
+        return get_output_budget().limit(kind, default=default or ceiling, ceiling=ceiling)
+    
+    def _make_stream_parser(
+        self,
+        code: str,
+        on_partial: Optional[Callable[[str, Dict[str, Any]], None]]
+    ) -> Optional[IncrementalJSONParser]:
+        """流式模式下创建增量解析器（未开启 LLM_STREAMING 时返回 None，整包接收）"""
+        if not get_config().llm_streaming:
+            return None
+        
+        parser = IncrementalJSONParser()
+        
+        def on_field(key: str, value: Any) -> None:
+            if on_partial is None:
+                return
+            try:
+                on_partial(code, dict(parser.fields))
+            except Exception as e:
+                logger.warning(f"[{code}] 流式结果回调失败: {e}")
+        
+        parser.on_field = on_field
+        return parser
+    
+    def _finish_analysis(
+        self,
+        response_text: str,
+        code: str,
+        name: str,
+        news_context: Optional[str],
+        start_time: float,
+        generation_config: dict,
+        stream_parser: Optional[IncrementalJSONParser] = None
+    ) -> AnalysisResult:
+        """记录响应日志并解析为 AnalysisResult（含总耗时与流式首个结论耗时）"""
+        elapsed = time.monotonic() - start_time
+        first_verdict = None
+        if stream_parser is not None and all(f in stream_parser.field_times for f in self.VERDICT_FIELDS):
+            first_verdict = max(stream_parser.field_times[f] for f in self.VERDICT_FIELDS) - start_time
+        
+        # 记录响应信息
+        logger.info(f"[LLM返回] Gemini API 响应成功, 耗时 {elapsed:.2f}s, 响应长度 {len(response_text)} 字符")
+        if first_verdict is not None:
+            logger.info(f"[LLM返回] 首个结论（评分+操作建议）耗时 {first_verdict:.2f}s")
+        
+        # 记录响应预览（INFO级别）和完整响应（DEBUG级别）
+        response_preview = response_text[:300] + "..." if len(response_text) > 300 else response_text
+        logger.info(f"[LLM返回 预览]\n{response_preview}")
+        logger.debug(f"=== Gemini 完整响应 ({len(response_text)}字符) ===\n{response_text}\n=== End Response ===")
+        
+        # 解析响应，并记录输出长度与解析结果（用于自适应输出上限与解析失败率）
+        data, outcome = self._decode_json(response_text)
+        result = self._result_from_decoded(data, response_text, code, name)
+        self._record_output('single', response_text, outcome, generation_config['max_output_tokens'])
+        note_parse(outcome)
+        result.raw_response = response_text
+        result.search_performed = bool(news_context)
+        result.latency = elapsed
+        result.first_verdict_latency = first_verdict
+        
+        logger.info(f"[LLM解析] {name}({code}) 分析完成: {result.trend_prediction}, 评分 {result.sentiment_score}")
+        
+        return result
+    
+    def _resolve_name(self, context: Dict[str, Any]) -> str:
+        """获取股票名称：上下文（由 main.py 传入）> 实时行情 > 映射表"""
+        code = context.get('code', 'Unknown')
+        name = context.get('stock_name')
+        if not name or name.startswith('股票'):
+            # 备选：从 realtime 中获取
+            if 'realtime' in context and context['realtime'].get('name'):
+                name = context['realtime']['name']
+            else:
+                # 最后从映射表获取
+                name = STOCK_NAME_MAP.get(code, f'股票{code}')
+        return name
+    
+    @staticmethod
+    def _unavailable_result(code: str, name: str) -> AnalysisResult:
+        """模型不可用时的默认结果"""
+        return AnalysisResult(
+            code=code,
+            name=name,
+            sentiment_score=50,
+            trend_prediction='震荡',
+            operation_advice='持有',
+            confidence_level='低',
+            analysis_summary='AI 分析功能未启用（未配置 API Key）',
+            risk_warning='请配置 Gemini API Key 后重试',
+            success=False,
+            error_message='Gemini API Key 未配置',
+        )
+    
+    @staticmethod
+    def _error_result(code: str, name: str, error: Exception) -> AnalysisResult:
+        """分析失败时的默认结果"""
+        return AnalysisResult(
+            code=code,
+            name=name,
+            sentiment_score=50,
+            trend_prediction='震荡',
+            operation_advice='持有',
+            confidence_level='低',
+            analysis_summary=f'分析过程出错: {str(error)[:100]}',
+            risk_warning='分析失败，请稍后重试或手动分析',
+            success=False,
+            error_message=str(error),
+        )
     
     def _format_prompt(
         self, 
@@ -828,18 +1711,86 @@ class GeminiAnalyzer:
             news_context: 预先搜索的新闻内容
         """
         code = context.get('code', 'Unknown')
+        stock_name = self._display_name(context, name)
         
-        # 优先使用上下文中的股票名称（从 realtime_quote 获取）
+        # ========== 构建决策仪表盘格式的输入 ==========
+        prompt = "# 决策仪表盘分析请求\n\n" + self._format_stock_data(
+            context, stock_name, news_context, log_sections=True
+        )
+        
+        # 明确的输出要求
+        prompt += f"""
+---
+
+## ✅ 分析任务
+
+请为 **{stock_name}({code})** 生成【决策仪表盘】，严格按照 JSON 格式输出。
+
+### 重点关注（必须明确回答）：
+1. ❓ 是否满足 MA5>MA10>MA20 多头排列？
+2. ❓ 当前乖离率是否在安全范围内（<5%）？—— 超过5%必须标注"严禁追高"
+3. ❓ 量能是否配合（缩量回调/放量突破）？
+4. ❓ 筹码结构是否健康？
+5. ❓ 消息面有无重大利空？（减持、处罚、业绩变脸等）
+
+### 决策仪表盘要求：
+- **核心结论**：一句话说清该买/该卖/该等
+- **持仓分类建议**：空仓者怎么做 vs 持仓者怎么做
+- **具体狙击点位**：买入价、止损价、目标价（精确到分）
+- **检查清单**：每项用 ✅/⚠️/❌ 标记
+
+请输出完整的 JSON 格式决策仪表盘。"""
+        
+        return prompt
+    
+    def _display_name(self, context: Dict[str, Any], name: str) -> str:
+        """提示词中展示的股票名称（优先使用上下文中的名称，从 realtime_quote 获取）"""
+        code = context.get('code', 'Unknown')
         stock_name = context.get('stock_name', name)
         if not stock_name or stock_name == f'股票{code}':
             stock_name = STOCK_NAME_MAP.get(code, f'股票{code}')
-            
+        return stock_name
+    
+    def _format_stock_data(
+        self,
+        context: Dict[str, Any],
+        stock_name: str,
+        news_context: Optional[str] = None,
+        log_sections: bool = False
+    ) -> str:
+        """
+        格式化单只股票的数据部分（技术面、实时行情、筹码、趋势、指标、舆情）
+        
+        单股提示词与批量提示词共用，不含输出要求。
+        超出 LLM_PROMPT_TOKEN_BUDGET 时按价值从低到高精简或省略段落（基础信息、技术面、趋势预判始终保留）
+        
+        Args:
+            log_sections: 是否输出各段 Token 数
+        """
+        budget = get_config().llm_prompt_token_budget
+        text, report = fit_sections(self._stock_data_sections(context, stock_name, news_context), budget)
+        if log_sections:
+            logger.info(f"[Prompt] {stock_name}({context.get('code', 'Unknown')}) 数据部分 "
+                        f"{format_report(report, budget)}")
+        return text
+    
+    def _stock_data_sections(
+        self,
+        context: Dict[str, Any],
+        stock_name: str,
+        news_context: Optional[str] = None
+    ) -> List[PromptSection]:
+        """
+        将数据部分拆分为段落，并为可裁剪的段落设置降级步骤
+        
+        降级顺序（价值从低到高）：量价变化 → 新闻摘要截短 → 动量指标 → 新闻仅保留标题
+        → 筹码分布 → 省略新闻 → 实时行情
+        """
+        code = context.get('code', 'Unknown')
         today = context.get('today', {})
+        sections: List[PromptSection] = []
         
-        # ========== 构建决策仪表盘格式的输入 ==========
-        prompt = f"""# 决策仪表盘分析请求
-
-## 📊 股票基础信息
+        text = f"""## 📊 股票基础信息
 | 项目 | 数据 |
 |------|------|
 | 股票代码 | **{code}** |
@@ -869,11 +1820,12 @@ class GeminiAnalyzer:
 | MA20 | {today.get('ma20', 'N/A')} | 中期趋势线 |
 | 均线形态 | {context.get('ma_status', '未知')} | 多头/空头/缠绕 |
 """
+        sections.append(PromptSection('基础与技术面', text))
         
         # 添加实时行情数据（量比、换手率等）
         if 'realtime' in context:
             rt = context['realtime']
-            prompt += f"""
+            text = f"""
 ### 实时行情增强数据
 | 指标 | 数值 | 解读 |
 |------|------|------|
@@ -886,12 +1838,13 @@ class GeminiAnalyzer:
 | 流通市值 | {self._format_amount(rt.get('circ_mv'))} | |
 | 60日涨跌幅 | {rt.get('change_60d', 'N/A')}% | 中期表现 |
 """
+            sections.append(PromptSection('实时行情', text, degrade=[(80, '')]))
         
         # 添加筹码分布数据
         if 'chip' in context:
             chip = context['chip']
             profit_ratio = chip.get('profit_ratio', 0)
-            prompt += f"""
+            text = f"""
 ### 筹码分布数据（效率指标）
 | 指标 | 数值 | 健康标准 |
 |------|------|----------|
@@ -901,12 +1854,13 @@ class GeminiAnalyzer:
 | 70%筹码集中度 | {chip.get('concentration_70', 0):.2%} | |
 | 筹码状态 | {chip.get('chip_status', '未知')} | |
 """
+            sections.append(PromptSection('筹码分布', text, degrade=[(60, '')]))
         
         # 添加趋势分析结果（基于交易理念的预判）
         if 'trend_analysis' in context:
             trend = context['trend_analysis']
             bias_warning = "🚨 超过5%，严禁追高！" if trend.get('bias_ma5', 0) > 5 else "✅ 安全范围"
-            prompt += f"""
+            text = f"""
 ### 趋势分析预判（基于交易理念）
 | 指标 | 数值 | 判定 |
 |------|------|------|
@@ -926,62 +1880,63 @@ class GeminiAnalyzer:
 **风险因素**：
 {chr(10).join('- ' + r for r in trend.get('risk_factors', ['无'])) if trend.get('risk_factors') else '- 无'}
 """
+            sections.append(PromptSection('趋势预判', text))
+        
+        # 添加动量/波动指标
+        if 'indicators' in context:
+            ind = context['indicators']
+            desc = ind.get('desc', {})
+            text = f"""
+### 动量与波动指标
+| 指标 | 数值 | 状态 |
+|------|------|------|
+| MACD (DIF/DEA/柱) | {ind.get('macd_dif', 'N/A')} / {ind.get('macd_dea', 'N/A')} / {ind.get('macd_hist', 'N/A')} | {desc.get('macd', '')} |
+| RSI (6/12) | {ind.get('rsi6', 'N/A')} / {ind.get('rsi12', 'N/A')} | {desc.get('rsi', '')} |
+| KDJ (K/D/J) | {ind.get('kdj_k', 'N/A')} / {ind.get('kdj_d', 'N/A')} / {ind.get('kdj_j', 'N/A')} | {desc.get('kdj', '')} |
+| BOLL (上/中/下) | {ind.get('boll_upper', 'N/A')} / {ind.get('boll_mid', 'N/A')} / {ind.get('boll_lower', 'N/A')} | {desc.get('boll', '')} |
+| ATR(14) | {ind.get('atr14', 'N/A')} | 日均真实波幅，可用于设置止损距离 |
+"""
+            sections.append(PromptSection('动量指标', text, degrade=[(50, '')]))
         
         # 添加昨日对比数据
         if 'yesterday' in context:
             volume_change = context.get('volume_change_ratio', 'N/A')
-            prompt += f"""
+            text = f"""
 ### 量价变化
 - 成交量较昨日变化：{volume_change}倍
 - 价格较昨日变化：{context.get('price_change_ratio', 'N/A')}%
 """
+            sections.append(PromptSection('量价变化', text, degrade=[(40, '')]))
         
-        # 添加新闻搜索结果（重点区域）
-        prompt += """
+        # 添加新闻搜索结果（重点区域，多次搜索间重复的新闻只保留一次）
+        header = """
 ---
 
 ## 📰 舆情情报
 """
         if news_context:
-            prompt += f"""
+            intro = f"""
 以下是 **{stock_name}({code})** 近7日的新闻搜索结果，请重点提取：
 1. 🚨 **风险警报**：减持、处罚、利空
 2. 🎯 **利好催化**：业绩、合同、政策
 3. 📊 **业绩预期**：年报预告、业绩快报
-
-```
-{news_context}
-```
 """
+            block = "\n```\n{}\n```\n"
+            sections.append(PromptSection(
+                '舆情情报',
+                header + intro + block.format(compact_news(news_context)),
+                degrade=[
+                    (45, header + intro + block.format(compact_news(news_context, snippet_chars=self.NEWS_SNIPPET_CHARS))),
+                    (55, header + intro + block.format(compact_news(news_context, titles_only=True))),
+                    (70, header + "\n新闻内容因篇幅限制已省略。请主要依据技术面数据进行分析。\n"),
+                ],
+            ))
         else:
-            prompt += """
+            sections.append(PromptSection('舆情情报', header + """
 未搜索到该股票近期的相关新闻。请主要依据技术面数据进行分析。
-"""
-        
-        # 明确的输出要求
-        prompt += f"""
----
-
-## ✅ 分析任务
-
-请为 **{stock_name}({code})** 生成【决策仪表盘】，严格按照 JSON 格式输出。
-
-### 重点关注（必须明确回答）：
-1. ❓ 是否满足 MA5>MA10>MA20 多头排列？
-2. ❓ 当前乖离率是否在安全范围内（<5%）？—— 超过5%必须标注"严禁追高"
-3. ❓ 量能是否配合（缩量回调/放量突破）？
-4. ❓ 筹码结构是否健康？
-5. ❓ 消息面有无重大利空？（减持、处罚、业绩变脸等）
-
-### 决策仪表盘要求：
-- **核心结论**：一句话说清该买/该卖/该等
-- **持仓分类建议**：空仓者怎么做 vs 持仓者怎么做
-- **具体狙击点位**：买入价、止损价、目标价（精确到分）
-- **检查清单**：每项用 ✅/⚠️/❌ 标记
-
-请输出完整的 JSON 格式决策仪表盘。"""
+"""))
         
-        return prompt
+        return sections
     
     def _format_volume(self, volume: Optional[float]) -> str:
         """格式化成交量显示"""
@@ -1017,75 +1972,124 @@ class GeminiAnalyzer:
         尝试从响应中提取 JSON 格式的分析结果，包含 dashboard 字段
         如果解析失败，尝试智能提取或返回默认结果
         """
+        data, _ = self._decode_json(response_text)
+        return self._result_from_decoded(data, response_text, code, name)
+    
+    def _decode_json(self, response_text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        从响应中解析决策仪表盘 JSON 对象
+        
+        依次尝试：
+        1. 整段直接解析（结构化输出时响应本身即 JSON）
+        2. 去除 markdown 代码块标记后截取首尾大括号之间的内容
+        3. 修复常见格式问题（注释、尾随逗号、布尔值大小写）后再解析
+        
+        Returns:
+            (解析出的对象，失败时为 None, 解析结果：direct/extracted/repaired/failed)
+        """
         try:
-            # 清理响应文本：移除 markdown 代码块标记
-            cleaned_text = response_text
-            if '```json' in cleaned_text:
-                cleaned_text = cleaned_text.replace('```json', '').replace('```', '')
-            elif '```' in cleaned_text:
-                cleaned_text = cleaned_text.replace('```', '')
-            
-            # 尝试找到 JSON 内容
-            json_start = cleaned_text.find('{')
-            json_end = cleaned_text.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = cleaned_text[json_start:json_end]
-                
-                # 尝试修复常见的 JSON 问题
-                json_str = self._fix_json_string(json_str)
-                
-                data = json.loads(json_str)
-                
-                # 提取 dashboard 数据
-                dashboard = data.get('dashboard', None)
-                
-                # 解析所有字段，使用默认值防止缺失
-                return AnalysisResult(
-                    code=code,
-                    name=name,
-                    # 核心指标
-                    sentiment_score=int(data.get('sentiment_score', 50)),
-                    trend_prediction=data.get('trend_prediction', '震荡'),
-                    operation_advice=data.get('operation_advice', '持有'),
-                    confidence_level=data.get('confidence_level', '中'),
-                    # 决策仪表盘
-                    dashboard=dashboard,
-                    # 走势分析
-                    trend_analysis=data.get('trend_analysis', ''),
-                    short_term_outlook=data.get('short_term_outlook', ''),
-                    medium_term_outlook=data.get('medium_term_outlook', ''),
-                    # 技术面
-                    technical_analysis=data.get('technical_analysis', ''),
-                    ma_analysis=data.get('ma_analysis', ''),
-                    volume_analysis=data.get('volume_analysis', ''),
-                    pattern_analysis=data.get('pattern_analysis', ''),
-                    # 基本面
-                    fundamental_analysis=data.get('fundamental_analysis', ''),
-                    sector_position=data.get('sector_position', ''),
-                    company_highlights=data.get('company_highlights', ''),
-                    # 情绪面/消息面
-                    news_summary=data.get('news_summary', ''),
-                    market_sentiment=data.get('market_sentiment', ''),
-                    hot_topics=data.get('hot_topics', ''),
-                    # 综合
-                    analysis_summary=data.get('analysis_summary', '分析完成'),
-                    key_points=data.get('key_points', ''),
-                    risk_warning=data.get('risk_warning', ''),
-                    buy_reason=data.get('buy_reason', ''),
-                    # 元数据
-                    search_performed=data.get('search_performed', False),
-                    data_sources=data.get('data_sources', '技术面数据'),
-                    success=True,
-                )
-            else:
-                # 没有找到 JSON，尝试从纯文本中提取信息
-                logger.warning(f"无法从响应中提取 JSON，使用原始文本分析")
-                return self._parse_text_response(response_text, code, name)
-                
+            data = json.loads(response_text)
+            if isinstance(data, dict):
+                return data, 'direct'
+        except json.JSONDecodeError:
+            pass
+        
+        # 清理响应文本：移除 markdown 代码块标记
+        cleaned_text = response_text
+        if '```json' in cleaned_text:
+            cleaned_text = cleaned_text.replace('```json', '').replace('```', '')
+        elif '```' in cleaned_text:
+            cleaned_text = cleaned_text.replace('```', '')
+        
+        # 尝试找到 JSON 内容
+        json_start = cleaned_text.find('{')
+        json_end = cleaned_text.rfind('}') + 1
+        if json_start < 0 or json_end <= json_start:
+            logger.warning(f"无法从响应中提取 JSON，使用原始文本分析")
+            return None, 'failed'
+        json_str = cleaned_text[json_start:json_end]
+        
+        try:
+            return json.loads(json_str), 'extracted'
+        except json.JSONDecodeError:
+            pass
+        
+        # 尝试修复常见的 JSON 问题
+        try:
+            return json.loads(self._fix_json_string(json_str)), 'repaired'
         except json.JSONDecodeError as e:
             logger.warning(f"JSON 解析失败: {e}，尝试从文本提取")
-            return self._parse_text_response(response_text, code, name)
+            return None, 'failed'
+    
+    def _result_from_decoded(
+        self,
+        data: Optional[Dict[str, Any]],
+        response_text: str,
+        code: str,
+        name: str
+    ) -> AnalysisResult:
+        """由 _decode_json 的结果构建 AnalysisResult（解析失败时从纯文本中提取信息）"""
+        if isinstance(data, dict):
+            return self._result_from_data(data, code, name)
+        return self._parse_text_response(response_text, code, name)
+    
+    def _record_output(self, kind: str, response_text: str, outcome: str, max_output_tokens: int) -> None:
+        """
+        记录输出长度与解析结果
+        
+        解析失败且输出接近上限时视为被截断，自适应预算随即放宽
+        """
+        budget = get_output_budget()
+        tokens = self._estimate_tokens(response_text)
+        truncated = outcome == 'failed' and tokens >= max_output_tokens * 0.8
+        if truncated:
+            logger.warning(f"[LLM] 响应疑似达到输出上限 {max_output_tokens} 被截断，后续请求将放宽上限")
+        budget.record(kind, tokens, max_output_tokens, truncated)
+        budget.record_parse(kind, outcome)
+    
+    def _result_from_data(self, data: Dict[str, Any], code: str, name: str) -> AnalysisResult:
+        """由解析后的决策仪表盘 JSON 构建 AnalysisResult（单股与批量解析共用）"""
+        # 提取 dashboard 数据
+        dashboard = data.get('dashboard', None)
+        
+        # 解析所有字段，使用默认值防止缺失
+        return AnalysisResult(
+            code=code,
+            name=name,
+            # 核心指标
+            sentiment_score=int(data.get('sentiment_score', 50)),
+            trend_prediction=data.get('trend_prediction', '震荡'),
+            operation_advice=data.get('operation_advice', '持有'),
+            confidence_level=data.get('confidence_level', '中'),
+            # 决策仪表盘
+            dashboard=dashboard,
+            # 走势分析
+            trend_analysis=data.get('trend_analysis', ''),
+            short_term_outlook=data.get('short_term_outlook', ''),
+            medium_term_outlook=data.get('medium_term_outlook', ''),
+            # 技术面
+            technical_analysis=data.get('technical_analysis', ''),
+            ma_analysis=data.get('ma_analysis', ''),
+            volume_analysis=data.get('volume_analysis', ''),
+            pattern_analysis=data.get('pattern_analysis', ''),
+            # 基本面
+            fundamental_analysis=data.get('fundamental_analysis', ''),
+            sector_position=data.get('sector_position', ''),
+            company_highlights=data.get('company_highlights', ''),
+            # 情绪面/消息面
+            news_summary=data.get('news_summary', ''),
+            market_sentiment=data.get('market_sentiment', ''),
+            hot_topics=data.get('hot_topics', ''),
+            # 综合
+            analysis_summary=data.get('analysis_summary', '分析完成'),
+            key_points=data.get('key_points', ''),
+            risk_warning=data.get('risk_warning', ''),
+            buy_reason=data.get('buy_reason', ''),
+            # 元数据
+            search_performed=data.get('search_performed', False),
+            data_sources=data.get('data_sources', '技术面数据'),
+            success=True,
+        )
     
     def _fix_json_string(self, json_str: str) -> str:
         """修复常见的 JSON 格式问题"""
@@ -1154,31 +2158,293 @@ class GeminiAnalyzer:
     def batch_analyze(
         self, 
         contexts: List[Dict[str, Any]],
-        delay_between: float = 2.0
+        news_contexts: Optional[List[Optional[str]]] = None,
+        max_batch_size: Optional[int] = None
     ) -> List[AnalysisResult]:
         """
         批量分析多只股票
         
-        注意：为避免 API 速率限制，每次分析之间会有延迟
+        按输入 Token 预算将多只股票打包为一次请求（系统提示词与请求间隔只发生一次），
+        要求模型输出 JSON 数组后逐只拆分为 AnalysisResult；
+        数组中缺失或无法解析的股票回退为单股请求。
         
         Args:
             contexts: 上下文数据列表
-            delay_between: 每次分析之间的延迟（秒）
+            news_contexts: 与 contexts 一一对应的新闻内容（可选）
+            max_batch_size: 单次请求最多包含的股票数（默认读取 LLM_BATCH_SIZE，<=1 表示逐只请求）
             
         Returns:
-            AnalysisResult 列表
+            AnalysisResult 列表（与 contexts 顺序一致）
         """
-        results = []
+        config = get_config()
+        news_contexts = news_contexts or [None] * len(contexts)
+        batch_size = max_batch_size or config.llm_batch_size
         
-        for i, context in enumerate(contexts):
-            if i > 0:
-                logger.debug(f"等待 {delay_between} 秒后继续...")
-                time.sleep(delay_between)
+        if batch_size <= 1 or not self.is_available():
+            return [self.analyze(context, news) for context, news in zip(contexts, news_contexts)]
+        
+        results: List[Optional[AnalysisResult]] = [None] * len(contexts)
+        batches = self._pack_batches(contexts, news_contexts, batch_size)
+        logger.info(f"[LLM批量] {len(contexts)} 只股票打包为 {len(batches)} 次请求")
+        
+        for indices in batches:
+            if len(indices) == 1:
+                i = indices[0]
+                results[i] = self.analyze(contexts[i], news_contexts[i])
+                continue
             
-            result = self.analyze(context)
-            results.append(result)
+            parsed = self._analyze_packed([contexts[i] for i in indices], [news_contexts[i] for i in indices])
+            for i, result in zip(indices, parsed):
+                if result is None:
+                    code = contexts[i].get('code', 'Unknown')
+                    logger.warning(f"[LLM批量] {code} 未能从批量响应中解析，回退为单股请求")
+                    result = self.analyze(contexts[i], news_contexts[i])
+                results[i] = result
         
         return results
+    
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """粗略估算 Token 数：中文约 1 字 1 Token，其余约 4 字符 1 Token"""
+        return estimate_tokens(text)
+    
+    def _pack_batches(
+        self,
+        contexts: List[Dict[str, Any]],
+        news_contexts: List[Optional[str]],
+        batch_size: int
+    ) -> List[List[int]]:
+        """
+        按顺序贪心打包：股票数不超过 batch_size 与输出 Token 上限，数据部分不超过输入 Token 预算
+        
+        Returns:
+            每次请求包含的 contexts 下标列表
+        """
+        config = get_config()
+        budget = config.llm_batch_token_budget - self._estimate_tokens(self.SYSTEM_PROMPT)
+        per_stock = self._batch_tokens_per_stock()
+        max_stocks = min(batch_size, max(1, config.llm_batch_max_output_tokens // per_stock))
+        
+        batches: List[List[int]] = []
+        current: List[int] = []
+        used = 0
+        for i, (context, news) in enumerate(zip(contexts, news_contexts)):
+            name = self._display_name(context, self._resolve_name(context))
+            tokens = self._estimate_tokens(self._format_stock_data(context, name, news))
+            if current and (len(current) >= max_stocks or used + tokens > budget):
+                batches.append(current)
+                current, used = [], 0
+            current.append(i)
+            used += tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _batch_tokens_per_stock(self) -> int:
+        """批量模式下每只股票的预计输出 Token（近期实际输出的 P95，样本不足时使用默认估算）"""
+        if not get_config().llm_adaptive_output_tokens:
+            return self.BATCH_OUTPUT_TOKENS_PER_STOCK
+        return max(get_output_budget().typical('batch', self.BATCH_OUTPUT_TOKENS_PER_STOCK), 1)
+    
+    def _format_batch_prompt(
+        self,
+        contexts: List[Dict[str, Any]],
+        news_contexts: List[Optional[str]]
+    ) -> str:
+        """格式化多股票批量提示词（各股数据部分与单股一致，输出要求改为 JSON 数组）"""
+        total = len(contexts)
+        stocks = []
+        prompt = f"# 批量决策仪表盘分析请求（共 {total} 只股票）\n"
+        for i, (context, news) in enumerate(zip(contexts, news_contexts), 1):
+            code = context.get('code', 'Unknown')
+            stock_name = self._display_name(context, self._resolve_name(context))
+            stocks.append(f"{stock_name}({code})")
+            prompt += f"\n---\n\n# 【第 {i}/{total} 只】{stock_name}({code})\n\n"
+            prompt += self._format_stock_data(context, stock_name, news)
+        
+        prompt += f"""
+---
+
+## ✅ 分析任务
+
+请分别为以上 {total} 只股票（{'、'.join(stocks)}）生成【决策仪表盘】，各股票独立分析、互不引用。
+
+### 输出格式（必须严格遵守）：
+- 只输出一个 JSON 数组，数组长度为 {total}，顺序与输入顺序一致
+- 每个元素是一份完整的决策仪表盘 JSON（字段与系统提示中的格式相同），并额外包含 `"code": "股票代码"` 字段
+- 每只股票都必须明确回答：多头排列、乖离率是否安全（超过5%标注"严禁追高"）、量能配合、筹码结构、重大利空
+- 狙击点位精确到分，检查清单每项用 ✅/⚠️/❌ 标记
+
+请输出 JSON 数组。"""
+        return prompt
+    
+    def _analyze_packed(
+        self,
+        contexts: List[Dict[str, Any]],
+        news_contexts: List[Optional[str]]
+    ) -> List[Optional[AnalysisResult]]:
+        """
+        发送一次批量请求并拆分结果
+        
+        Returns:
+            与 contexts 一一对应的结果，解析失败的位置为 None（由调用方回退为单股请求）
+        """
+        config = get_config()
+        codes = [context.get('code', 'Unknown') for context in contexts]
+        
+        self._wait_request_delay()
+        
+        prompt = self._format_batch_prompt(contexts, news_contexts)
+        per_stock_limit = self._output_token_limit(
+            'batch', ceiling=config.llm_max_output_tokens, default=self.BATCH_OUTPUT_TOKENS_PER_STOCK * 2
+        )
+        generation_config = {
+            "temperature": 0.7,
+            "max_output_tokens": min(config.llm_batch_max_output_tokens, per_stock_limit * len(contexts)),
+            **self._structured_config(batch_schema()),
+        }
+        
+        logger.info(f"========== AI 批量分析 {', '.join(codes)} ==========")
+        logger.info(f"[LLM配置] 模型: {self._current_model_name}, Prompt 长度: {len(prompt)} 字符, "
+                    f"估算 {self._estimate_tokens(prompt)} Token")
+        logger.debug(f"=== 完整批量 Prompt ({len(prompt)}字符) ===\n{prompt}\n=== End Prompt ===")
+        
+        try:
+            with get_llm_accounting().track(codes[0], KIND_BATCH, self.run_id, codes=codes):
+                start_time = time.time()
+                response_text = self._call_api_with_retry(prompt, generation_config)
+                elapsed = time.time() - start_time
+                logger.info(f"[LLM返回] 批量响应成功, 耗时 {elapsed:.2f}s, 响应长度 {len(response_text)} 字符")
+                logger.debug(f"=== 批量完整响应 ({len(response_text)}字符) ===\n{response_text}\n=== End Response ===")
+                results = self._parse_batch_response(response_text, contexts)
+                self._record_batch_output(response_text, codes, results, generation_config['max_output_tokens'])
+        except Exception as e:
+            logger.error(f"[LLM批量] 请求失败: {e}，全部回退为单股请求")
+            return [None] * len(contexts)
+        
+        for context, news, result in zip(contexts, news_contexts, results):
+            if result is not None:
+                result.search_performed = bool(news)
+        parsed = sum(1 for r in results if r is not None)
+        logger.info(f"[LLM批量] 成功解析 {parsed}/{len(contexts)} 只股票")
+        return results
+    
+    def _record_batch_output(
+        self,
+        response_text: str,
+        codes: List[str],
+        results: List[Optional[AnalysisResult]],
+        max_output_tokens: int
+    ) -> None:
+        """按股票记录批量响应的输出长度与解析结果（每股样本 = 单个数组元素的 Token 数）"""
+        budget = get_output_budget()
+        missing = sum(1 for r in results if r is None)
+        truncated = missing > 0 and self._estimate_tokens(response_text) >= max_output_tokens * 0.8
+        if truncated:
+            logger.warning(f"[LLM批量] 响应疑似达到输出上限 {max_output_tokens} 被截断，后续请求将放宽上限")
+        per_stock_limit = max_output_tokens // max(len(results), 1)
+        for code, result in zip(codes, results):
+            if result is None:
+                budget.record_parse('batch', 'failed')
+                note_parse('failed', code)
+                if truncated:
+                    budget.record('batch', 0, per_stock_limit, truncated=True)
+                continue
+            outcome = 'direct' if response_text.lstrip().startswith('[') else 'extracted'
+            budget.record('batch', self._estimate_tokens(result.raw_response or ''), per_stock_limit)
+            budget.record_parse('batch', outcome)
+            note_parse(outcome, code)
+    
+    def _parse_batch_response(
+        self,
+        response_text: str,
+        contexts: List[Dict[str, Any]]
+    ) -> List[Optional[AnalysisResult]]:
+        """
+        解析批量响应中的 JSON 数组
+        
+        数组元素逐个解析：单个元素格式错误不影响其他股票。
+        优先按 code 字段匹配股票；元素缺少 code 且数量与输入一致时按顺序匹配。
+        """
+        codes = [str(context.get('code', 'Unknown')) for context in contexts]
+        results: List[Optional[AnalysisResult]] = [None] * len(contexts)
+        
+        cleaned_text = response_text.replace('```json', '').replace('```', '')
+        elements = self._split_json_array(cleaned_text)
+        
+        for position, element in enumerate(elements):
+            try:
+                data = json.loads(element)
+            except json.JSONDecodeError:
+                try:
+                    data = json.loads(self._fix_json_string(element))
+                except json.JSONDecodeError as e:
+                    logger.warning(f"[LLM批量] 第 {position + 1} 个元素 JSON 解析失败: {e}")
+                    continue
+            if not isinstance(data, dict):
+                continue
+            
+            code = str(data.get('code', '')).strip()
+            if code in codes:
+                index = codes.index(code)
+            elif not code and len(elements) == len(contexts):
+                index = position
+            else:
+                logger.warning(f"[LLM批量] 无法匹配返回的股票代码: {code or '缺失'}")
+                continue
+            if results[index] is not None:
+                continue
+            
+            try:
+                result = self._result_from_data(data, codes[index], self._resolve_name(contexts[index]))
+            except (TypeError, ValueError) as e:
+                logger.warning(f"[LLM批量] {codes[index]} 字段解析失败: {e}")
+                continue
+            result.raw_response = element
+            results[index] = result
+        
+        return results
+    
+    @staticmethod
+    def _split_json_array(text: str) -> List[str]:
+        """
+        将文本中的 JSON 数组按顶层元素拆分为对象字符串（跳过字符串内的括号）
+        
+        数组被截断时保留已完整的元素。
+        """
+        start = text.find('[')
+        if start < 0:
+            return []
+        
+        elements = []
+        depth = 0
+        in_string = False
+        escaped = False
+        element_start = -1
+        for i in range(start + 1, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+            if ch == '"':
+                in_string = True
+            elif ch in '{[':
+                if depth == 0 and ch == '{':
+                    element_start = i
+                depth += 1
+            elif ch in '}]':
+                if depth == 0:
+                    break  # 数组结束
+                depth -= 1
+                if depth == 0 and element_start >= 0:
+                    elements.append(text[element_start:i + 1])
+                    element_start = -1
+        return elements
 
 
 # 便捷函数
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+趋势信号回测 - 向量化历史回放
+===================================
+
+职责：
+1. 在全部历史日线上回放 StockTrendAnalyzer 的趋势/乖离率/量能规则
+2. 按买入信号类别统计命中率、远期收益与持有期最大回撤
+3. 按股票分块处理，全表回测耗时秒级
+
+实现要点：
+- 每只股票的历史右对齐为 (股票数 × 交易日) 矩阵
+- StockTrendAnalyzer.evaluate_matrix() 一次算出每一天的信号（等价于逐日调用 analyze()）
+- 远期收益与回撤通过矩阵平移/滑动窗口计算，无逐日 Python 循环
+
+使用方式：
+    python backtest.py                  # 回测数据库全部股票
+    python backtest.py --codes 600519   # 指定股票
+    python backtest.py --synthetic 2000 # 模拟数据基准测试
+"""
+
+import logging
+import time
+import warnings
+from typing import Optional, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from indicators import panel_to_matrix
+from stock_analyzer import StockTrendAnalyzer, BuySignal
+
+logger = logging.getLogger(__name__)
+
+
+# 默认持有期（交易日）
+DEFAULT_HORIZONS = (5, 10, 20)
+
+# 信号方向：+1 预期上涨，-1 预期下跌，0 中性（不计算命中率）
+SIGNAL_DIRECTION = {
+    BuySignal.STRONG_BUY: 1,
+    BuySignal.BUY: 1,
+    BuySignal.HOLD: 1,
+    BuySignal.WAIT: 0,
+    BuySignal.SELL: -1,
+    BuySignal.STRONG_SELL: -1,
+}
+
+
+class SignalBacktester:
+    """
+    买入信号回测器
+
+    统计口径（信号日收盘价买入，持有 h 个交易日）：
+    - 远期收益：close[t+h] / close[t] - 1
+    - 命中率：看多信号远期收益 > 0、看空信号远期收益 < 0 的比例
+    - 最大回撤：持有期内最低价相对买入价的最大跌幅（多头视角）
+    """
+
+    def __init__(
+        self,
+        horizons: Sequence[int] = DEFAULT_HORIZONS,
+        chunk_size: int = 500,
+        analyzer: Optional[StockTrendAnalyzer] = None
+    ):
+        """
+        初始化回测器
+
+        Args:
+            horizons: 持有期列表（交易日）
+            chunk_size: 每批处理的股票数（控制内存占用）
+            analyzer: 趋势分析器（可选，便于调整阈值参数后回测）
+        """
+        self.horizons = tuple(sorted(horizons))
+        self.chunk_size = chunk_size
+        self.analyzer = analyzer or StockTrendAnalyzer()
+
+    def run(self, panel: pd.DataFrame) -> pd.DataFrame:
+        """
+        执行回测
+
+        Args:
+            panel: 多股票长表，包含 code, date, close, high, low, volume 列
+
+        Returns:
+            按信号类别汇总的 DataFrame（索引为信号名称）：
+            signals, 以及每个持有期的 avg_ret_{h}d, hit_rate_{h}d, avg_mdd_{h}d
+        """
+        num_signals = len(self.analyzer.SIGNAL_ORDER)
+        totals: Dict[str, np.ndarray] = {'signals': np.zeros(num_signals)}
+        for h in self.horizons:
+            for key in ('count', 'ret_sum', 'hit', 'hit_count', 'mdd_sum'):
+                totals[f'{key}_{h}'] = np.zeros(num_signals)
+
+        codes = panel['code'].astype(str).unique()
+        for start in range(0, len(codes), self.chunk_size):
+            chunk_codes = codes[start:start + self.chunk_size]
+            chunk = panel[panel['code'].astype(str).isin(chunk_codes)]
+            self._accumulate(chunk, totals)
+
+        return self._summarize(totals)
+
+    def _accumulate(self, panel: pd.DataFrame, totals: Dict[str, np.ndarray]) -> None:
+        """回测一批股票并累加统计量"""
+        _, _, mats = panel_to_matrix(panel, ['close', 'high', 'low', 'volume'])
+        close, low = mats['close'], mats['low']
+        bar_count = np.cumsum(~np.isnan(close), axis=1)
+
+        ev = self.analyzer.evaluate_matrix(close, mats['high'], mats['volume'], bar_count)
+        signal_idx = np.where(ev['valid'] & ~np.isnan(close), ev['signal_idx'], -1)
+
+        direction = np.array([SIGNAL_DIRECTION[s] for s in self.analyzer.SIGNAL_ORDER])
+        num_signals = len(direction)
+        width = close.shape[1]
+
+        totals['signals'] += np.bincount(signal_idx[signal_idx >= 0], minlength=num_signals)
+
+        for h in self.horizons:
+            if width <= h:
+                continue
+
+            with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                base = close[:, :-h]
+                forward = close[:, h:] / base - 1
+                # 持有期 [t+1, t+h] 内的最低价
+                future_low = np.nanmin(
+                    np.lib.stride_tricks.sliding_window_view(low[:, 1:], h, axis=1), axis=-1
+                )
+                drawdown = np.minimum(future_low / base - 1, 0)
+
+            sig = signal_idx[:, :-h]
+            mask = (sig >= 0) & ~np.isnan(forward)
+            s = sig[mask]
+            ret = forward[mask]
+            dd = np.nan_to_num(drawdown[mask])
+
+            totals[f'count_{h}'] += np.bincount(s, minlength=num_signals)
+            totals[f'ret_sum_{h}'] += np.bincount(s, weights=ret, minlength=num_signals)
+            totals[f'mdd_sum_{h}'] += np.bincount(s, weights=dd, minlength=num_signals)
+
+            sig_dir = direction[s]
+            directional = sig_dir != 0
+            hit = (np.sign(ret) == sig_dir) & directional
+            totals[f'hit_{h}'] += np.bincount(s, weights=hit, minlength=num_signals)
+            totals[f'hit_count_{h}'] += np.bincount(s, weights=directional, minlength=num_signals)
+
+    def _summarize(self, totals: Dict[str, np.ndarray]) -> pd.DataFrame:
+        """汇总统计量为报表"""
+        report = pd.DataFrame(index=[s.value for s in self.analyzer.SIGNAL_ORDER])
+        report['signals'] = totals['signals'].astype(int)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for h in self.horizons:
+                count = totals[f'count_{h}']
+                report[f'avg_ret_{h}d'] = totals[f'ret_sum_{h}'] / count * 100
+                report[f'hit_rate_{h}d'] = totals[f'hit_{h}'] / totals[f'hit_count_{h}'] * 100
+                report[f'avg_mdd_{h}d'] = totals[f'mdd_sum_{h}'] / count * 100
+        return report.round(2)
+
+    @staticmethod
+    def format_report(report: pd.DataFrame) -> str:
+        """格式化回测报表"""
+        lines = ["=== 趋势信号回测（收益/命中率/回撤单位 %）==="]
+        lines.append(report.to_string())
+        return "\n".join(lines)
+
+
+def load_history(codes: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    从数据库读取日线历史（一次批量查询）
+
+    Args:
+        codes: 股票代码列表（为空读取全部）
+
+    Returns:
+        包含 code, date, close, high, low, volume 列的长表
+    """
+    from sqlalchemy import select
+    from storage import get_db
+
+    db = get_db()
+    model = db.daily_model
+    stmt = select(model.code, model.date, model.close, model.high, model.low, model.volume)
+    if codes:
+        stmt = stmt.where(model.code.in_(codes))
+
+    with db.get_session() as session:
+        rows = session.execute(stmt).all()
+    return pd.DataFrame(rows, columns=['code', 'date', 'close', 'high', 'low', 'volume'])
+
+
+def check_signal_parity(panel: pd.DataFrame, samples: int = 200, seed: int = 0) -> List[str]:
+    """
+    抽样校验回测信号与逐日 analyze() 一致
+
+    Returns:
+        不一致项描述列表（为空表示一致）
+    """
+    analyzer = StockTrendAnalyzer()
+    codes, counts, mats = panel_to_matrix(panel, ['close', 'high', 'volume'])
+    bar_count = np.cumsum(~np.isnan(mats['close']), axis=1)
+    ev = analyzer.evaluate_matrix(mats['close'], mats['high'], mats['volume'], bar_count)
+
+    rng = np.random.default_rng(seed)
+    groups = {code: group.sort_values('date') for code, group in panel.groupby(panel['code'].astype(str))}
+    width = mats['close'].shape[1]
+    mismatches = []
+
+    for _ in range(samples):
+        i = int(rng.integers(len(codes)))
+        if counts[i] < 20:
+            continue
+        offset = int(rng.integers(19, counts[i]))
+        col = width - counts[i] + offset
+        expected = analyzer.analyze(groups[codes[i]].iloc[:offset + 1], codes[i])
+        actual_signal = analyzer.SIGNAL_ORDER[ev['signal_idx'][i, col]]
+        actual_score = int(ev['score'][i, col])
+        if expected.buy_signal != actual_signal or expected.signal_score != actual_score:
+            mismatches.append(
+                f"{codes[i]}@{offset}: {expected.buy_signal.value}/{expected.signal_score} "
+                f"!= {actual_signal.value}/{actual_score}"
+            )
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='趋势信号回测')
+    parser.add_argument('--codes', type=str, help='股票代码，逗号分隔（默认全部）')
+    parser.add_argument('--horizons', type=str, default='5,10,20', help='持有期（交易日），逗号分隔')
+    parser.add_argument('--synthetic', type=int, metavar='N', help='使用 N 只模拟股票（含逐日一致性抽检）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    horizons = [int(h) for h in args.horizons.split(',')]
+
+    if args.synthetic:
+        from stock_analyzer import make_synthetic_panel
+        panel = make_synthetic_panel(num_codes=args.synthetic, num_days=750)
+        mismatches = check_signal_parity(panel)
+        print(f"逐日一致性抽检: {'通过' if not mismatches else f'{len(mismatches)} 处不一致'}")
+        for item in mismatches[:10]:
+            print(f"  {item}")
+    else:
+        codes = args.codes.split(',') if args.codes else None
+        start = time.perf_counter()
+        panel = load_history(codes)
+        print(f"读取 {len(panel)} 行，耗时 {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    report = SignalBacktester(horizons=horizons).run(panel)
+    elapsed = time.perf_counter() - start
+
+    print(SignalBacktester.format_report(report))
+    print(f"\n回测 {panel['code'].nunique()} 只股票 / {len(panel)} 行，耗时 {elapsed:.2f}s")
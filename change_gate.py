@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+变更门控 - 无实质变化时复用上次 AI 分析
+===================================
+
+职责：
+1. 从增强上下文与情报文本提取"输入指纹"：价格、均线排列、买入信号、量比档位、筹码状态、新闻集合哈希
+2. 与上次 AI 分析时保存的指纹比较，变化均低于阈值时复用上次结论（标记 reused_from），跳过 LLM 调用
+3. 统计检查次数与节省的 LLM 调用次数
+
+判定规则（任一满足即视为有实质变化，需重新分析）：
+- 距上次分析超过 ANALYSIS_REUSE_MAX_AGE_HOURS
+- 价格相对上次分析变化超过 ANALYSIS_REUSE_PRICE_PCT（%）
+- 均线排列、买入信号、量比档位、筹码状态任一改变
+- 新闻标题集合改变
+
+说明：
+- 复用时不更新基准指纹，避免小幅变化逐日累积却始终不触发重新分析
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from dataclasses import fields
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from analyzer import AnalysisResult
+
+logger = logging.getLogger(__name__)
+
+
+# 情报报告中的条目标题行："  1. 标题 [日期]"
+_NEWS_TITLE_PATTERN = re.compile(r'^\s*\d+\.\s+(.+?)(?:\s\[[^\]]*\])?\s*$')
+
+
+def volume_ratio_band(volume_ratio: Optional[float]) -> Optional[str]:
+    """量比档位（与 StockAnalysisPipeline._describe_volume_ratio 的分档一致）"""
+    if volume_ratio is None:
+        return None
+    if volume_ratio < 0.5:
+        return "极度萎缩"
+    elif volume_ratio < 0.8:
+        return "明显萎缩"
+    elif volume_ratio < 1.2:
+        return "正常"
+    elif volume_ratio < 2:
+        return "温和放量"
+    elif volume_ratio < 3:
+        return "明显放量"
+    else:
+        return "巨量"
+
+
+def news_hash(news_context: Optional[str]) -> Optional[str]:
+    """
+    新闻集合哈希：只取条目标题（去除日期），排序去重后哈希
+
+    搜索服务商、摘要截断、条目顺序的变化不影响结果
+    """
+    if not news_context:
+        return None
+    titles = set()
+    for line in news_context.splitlines():
+        match = _NEWS_TITLE_PATTERN.match(line)
+        if match:
+            titles.add(match.group(1).strip())
+    return hashlib.sha1('\n'.join(sorted(titles)).encode('utf-8')).hexdigest()
+
+
+def build_fingerprint(context: Dict[str, Any], news_context: Optional[str]) -> Dict[str, Any]:
+    """
+    提取 AI 分析输入的指纹
+
+    Args:
+        context: StockAnalysisPipeline 增强后的分析上下文
+        news_context: 情报搜索结果文本
+    """
+    realtime = context.get('realtime') or {}
+    today = context.get('today') or {}
+    trend = context.get('trend_analysis') or {}
+    chip = context.get('chip') or {}
+
+    volume_ratio = realtime.get('volume_ratio')
+    if volume_ratio is None:
+        volume_ratio = today.get('volume_ratio')
+
+    return {
+        'price': realtime.get('price') or today.get('close'),
+        'ma_alignment': trend.get('ma_alignment') or context.get('ma_status'),
+        'buy_signal': trend.get('buy_signal'),
+        'volume_band': volume_ratio_band(volume_ratio),
+        'chip_status': chip.get('chip_status'),
+        'news_hash': news_hash(news_context),
+    }
+
+
+def compare_fingerprints(
+    previous: Dict[str, Any],
+    current: Dict[str, Any],
+    price_pct: float
+) -> List[str]:
+    """
+    比较两次输入指纹
+
+    Returns:
+        实质变化的描述列表（为空表示可复用）
+    """
+    changes = []
+    old_price, new_price = previous.get('price'), current.get('price')
+    if not old_price or not new_price:
+        changes.append("价格缺失")
+    else:
+        move = abs(new_price / old_price - 1) * 100
+        if move > price_pct:
+            changes.append(f"价格变化 {move:.2f}%")
+
+    labels = {
+        'ma_alignment': '均线排列',
+        'buy_signal': '买入信号',
+        'volume_band': '量比档位',
+        'chip_status': '筹码状态',
+        'news_hash': '新闻',
+    }
+    for key, label in labels.items():
+        if previous.get(key) != current.get(key):
+            changes.append(f"{label}变化")
+    return changes
+
+
+class ChangeGate:
+    """
+    AI 分析变更门控
+
+    使用方式：
+        gate = ChangeGate(db, price_pct=2.0, max_age_hours=72)
+        result = gate.check(code, context, news_context)   # 可复用时返回上次结论
+        if result is None:
+            result = analyzer.analyze(context, news_context)
+            gate.remember(code, context, news_context, result)
+    """
+
+    def __init__(self, db, price_pct: float = 2.0, max_age_hours: float = 72.0):
+        """
+        Args:
+            db: DatabaseManager（保存上次分析的指纹与结论）
+            price_pct: 价格变化阈值（%）
+            max_age_hours: 上次分析的最长复用时间（小时）
+        """
+        self.db = db
+        self.price_pct = price_pct
+        self.max_age_hours = max_age_hours
+        self._checked = 0
+        self._reused = 0
+        self._lock = threading.Lock()
+
+    def check(
+        self,
+        code: str,
+        context: Dict[str, Any],
+        news_context: Optional[str]
+    ) -> Optional[AnalysisResult]:
+        """
+        判断是否可复用上次分析
+
+        Returns:
+            可复用时返回带 reused_from 标记的上次结论，否则 None
+        """
+        with self._lock:
+            self._checked += 1
+
+        snapshot = self.db.get_analysis_snapshot(code)
+        if snapshot is None:
+            return None
+
+        age_hours = (datetime.now() - snapshot['analyzed_at']).total_seconds() / 3600
+        if age_hours > self.max_age_hours:
+            logger.info(f"[{code}] 上次分析已超过 {self.max_age_hours:.0f} 小时，重新分析")
+            return None
+
+        changes = compare_fingerprints(snapshot['fingerprint'], build_fingerprint(context, news_context), self.price_pct)
+        if changes:
+            logger.info(f"[{code}] 输入有实质变化（{'、'.join(changes)}），重新分析")
+            return None
+
+        try:
+            result = result_from_dict(snapshot['result'])
+        except (TypeError, ValueError) as e:
+            logger.warning(f"[{code}] 上次分析结果无法还原，重新分析: {e}")
+            return None
+
+        result.reused_from = snapshot['analyzed_at'].strftime('%Y-%m-%d %H:%M')
+        with self._lock:
+            self._reused += 1
+        logger.info(f"[{code}] 输入无实质变化，复用 {result.reused_from} 的分析结论，跳过 LLM 调用")
+        return result
+
+    def remember(
+        self,
+        code: str,
+        context: Dict[str, Any],
+        news_context: Optional[str],
+        result: AnalysisResult
+    ) -> None:
+        """保存本次 AI 分析的输入指纹与结论（失败或复用的结果不保存）"""
+        if not result.success or result.reused_from:
+            return
+        try:
+            self.db.save_analysis_snapshot(
+                code,
+                fingerprint=build_fingerprint(context, news_context),
+                result=result.to_dict(),
+            )
+        except Exception as e:
+            logger.warning(f"[{code}] 保存分析快照失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """检查次数与节省的 LLM 调用次数"""
+        with self._lock:
+            return {
+                'checked': self._checked,
+                'reused': self._reused,
+                'reuse_rate': self._reused / self._checked if self._checked else 0.0,
+            }
+
+
+def result_from_dict(data: Dict[str, Any]) -> AnalysisResult:
+    """由 AnalysisResult.to_dict() 的结果还原（忽略未知字段）"""
+    names = {f.name for f in fields(AnalysisResult)}
+    return AnalysisResult(**{k: v for k, v in data.items() if k in names})
+
+
+if __name__ == "__main__":
+    previous = {
+        'price': 100.0, 'ma_alignment': '多头排列', 'buy_signal': '买入',
+        'volume_band': '正常', 'chip_status': '健康', 'news_hash': news_hash("  1. 标题A [2026-01-01]"),
+    }
+    current = dict(previous, price=101.5, news_hash=news_hash("  1. 标题A"))
+    print(json.dumps(compare_fingerprints(previous, current, 2.0), ensure_ascii=False))
+    print(json.dumps(compare_fingerprints(previous, dict(current, price=103.0, volume_band='温和放量'), 2.0),
+                     ensure_ascii=False))
@@ -54,10 +54,58 @@ class Config:
     openai_base_url: Optional[str] = None  # 如: https://api.openai.com/v1
     openai_model: str = "gpt-4o-mini"  # OpenAI 兼容模型名称
     
+    # LLM 自适应并发（AIMD）：成功时加性增加并发，限流时减半并按 Retry-After 暂停
+    llm_max_concurrency: int = 4  # 并发上限的最大值（0 表示关闭，改用固定的 gemini_request_delay）
+    llm_initial_concurrency: int = 1  # 初始并发上限
+    llm_async: bool = False  # 异步分析：AI 请求在单个事件循环上并发，不占用工作线程
+    llm_streaming: bool = False  # 流式接收 AI 响应，字段完成即增量解析（评分/操作建议可提前使用）
+    llm_structured_output: bool = True  # 结构化输出：Gemini response_schema / OpenAI JSON 模式
+    llm_max_output_tokens: int = 8192  # 单股分析的最大输出 Token（自适应预算的上限）
+    llm_adaptive_output_tokens: bool = True  # 按实际输出长度自适应设置 max_output_tokens
+    llm_prompt_token_budget: int = 3000  # 每只股票数据部分的输入 Token 预算（0 表示不裁剪）
+    llm_context_cache: bool = True  # 系统提示词上下文缓存（Gemini CachedContent，每轮分析上传一次）
+    llm_context_cache_ttl: int = 3600  # Gemini 上下文缓存有效期（秒）
+    
+    # 对冲请求：Gemini 超过等待时间未返回时，并行向 OpenAI 兼容 API 发起同一请求，取先返回的结果
+    llm_hedge: bool = False
+    llm_hedge_percentile: float = 90.0  # 等待时间取 Gemini 近期耗时的分位数
+    llm_hedge_delay: float = 30.0  # 耗时样本不足时的等待时间（秒）
+    llm_hedge_max_per_run: int = 5  # 每轮分析最多发起的对冲请求数（0 表示不限制）
+    
+    # LLM 配额：进程内所有 AI 调用（定时分析、大盘复盘、Web 任务）按模型共用，0 表示不限制
+    llm_quota_rpm: int = 0  # 每分钟请求数
+    llm_quota_tpm: int = 0  # 每分钟 Token（输入按估算，输出在响应后补记）
+    llm_quota_rpd: int = 0  # 每日请求数（用量写入数据库，重启后仍有效）
+    llm_quota_tpd: int = 0  # 每日 Token
+    
+    # LLM 调用记账：每次调用的 Token、耗时、重试、备选切换与解析结果写入数据库（llm_call_log）
+    llm_accounting_persist: bool = True
+    
+    # 变更门控：价格、均线、量比、筹码、新闻均无实质变化时复用上次 AI 结论
+    analysis_reuse_enabled: bool = False
+    analysis_reuse_price_pct: float = 2.0  # 价格变化阈值（%），超过即重新分析
+    analysis_reuse_max_age_hours: float = 72.0  # 上次分析的最长复用时间（小时）
+    
+    # 批量分析：多只股票合并为一次请求（1 表示关闭，逐只请求）
+    llm_batch_size: int = 1  # 每次请求最多包含的股票数
+    llm_batch_token_budget: int = 30000  # 每次请求的输入 Token 预算（估算值）
+    llm_batch_max_output_tokens: int = 32768  # 批量请求的最大输出 Token
+    
     # === 搜索引擎配置（支持多 Key 负载均衡）===
     bocha_api_keys: List[str] = field(default_factory=list)  # Bocha API Keys
     tavily_api_keys: List[str] = field(default_factory=list)  # Tavily API Keys
     serpapi_keys: List[str] = field(default_factory=list)  # SerpAPI Keys
+    search_timeout: float = 10.0  # 搜索请求读取超时（秒）
+    search_pool_size: int = 10  # 每个搜索引擎的 HTTP 连接池大小（应不小于 MAX_WORKERS）
+    bocha_monthly_quota: int = 0  # 每个 Bocha Key 的月度请求额度（0 不限制，按量付费）
+    tavily_monthly_quota: int = 1000  # 每个 Tavily Key 的月度请求额度（免费版 1000）
+    serpapi_monthly_quota: int = 100  # 每个 SerpAPI Key 的月度请求额度（免费版 100）
+    search_hedge: bool = True  # 首选搜索引擎超时未返回时并行请求第二快的搜索引擎
+    search_hedge_delay: float = 3.0  # 首选搜索引擎没有耗时样本时的对冲等待时间（秒）
+    search_cache_enabled: bool = True  # 搜索结果缓存（写入数据库，相同查询合并为一次请求）
+    search_cache_ttl_latest: int = 3600  # 最新消息 / 个股与大盘新闻的缓存有效期（秒）
+    search_cache_ttl_risk: int = 21600  # 风险排查的缓存有效期（秒）
+    search_cache_ttl_earnings: int = 86400  # 业绩预期的缓存有效期（秒）
     
     # === 通知配置（可同时配置多个，全部推送）===
     
@@ -94,6 +142,9 @@ class Config:
     
     # === 数据库配置 ===
     database_path: str = "./data/stock_analysis.db"
+    database_compact_schema: bool = False  # 使用紧凑日线表（WITHOUT ROWID，按 code+date 聚簇）
+    db_cache_size: int = 256  # 近期数据 LRU 缓存容量（股票数，0 表示关闭）
+    analytics_parquet_dir: str = ""  # DuckDB 分析层挂载的 Parquet 归档目录（为空不挂载）
     
     # === 日志配置 ===
     log_dir: str = "./logs"  # 日志文件目录
@@ -103,6 +154,11 @@ class Config:
     max_workers: int = 3  # 低并发防封禁
     debug: bool = False
     
+    # === 全市场选股配置（--screen）===
+    screener_top_k: int = 10      # 进入搜索 + AI 分析的候选数量
+    screener_workers: int = 0     # 指标计算进程数（0 表示 CPU 核数）
+    screener_backfill: int = 0    # 缺少历史的股票中按成交额补拉日线的数量上限（0 不补拉）
+    
     # === 定时任务配置 ===
     schedule_enabled: bool = False            # 是否启用定时任务
     schedule_time: str = "18:00"              # 每日推送时间（HH:MM 格式）
@@ -194,9 +250,45 @@ class Config:
             openai_api_key=os.getenv('OPENAI_API_KEY'),
             openai_base_url=os.getenv('OPENAI_BASE_URL'),
             openai_model=os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
+            llm_max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '4')),
+            llm_initial_concurrency=int(os.getenv('LLM_INITIAL_CONCURRENCY', '1')),
+            llm_async=os.getenv('LLM_ASYNC', 'false').lower() == 'true',
+            llm_streaming=os.getenv('LLM_STREAMING', 'false').lower() == 'true',
+            llm_structured_output=os.getenv('LLM_STRUCTURED_OUTPUT', 'true').lower() == 'true',
+            llm_max_output_tokens=int(os.getenv('LLM_MAX_OUTPUT_TOKENS', '8192')),
+            llm_adaptive_output_tokens=os.getenv('LLM_ADAPTIVE_OUTPUT_TOKENS', 'true').lower() == 'true',
+            llm_prompt_token_budget=int(os.getenv('LLM_PROMPT_TOKEN_BUDGET', '3000')),
+            llm_context_cache=os.getenv('LLM_CONTEXT_CACHE', 'true').lower() == 'true',
+            llm_context_cache_ttl=int(os.getenv('LLM_CONTEXT_CACHE_TTL', '3600')),
+            llm_hedge=os.getenv('LLM_HEDGE', 'false').lower() == 'true',
+            llm_hedge_percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', '90')),
+            llm_hedge_delay=float(os.getenv('LLM_HEDGE_DELAY', '30')),
+            llm_hedge_max_per_run=int(os.getenv('LLM_HEDGE_MAX_PER_RUN', '5')),
+            llm_quota_rpm=int(os.getenv('LLM_QUOTA_RPM', '0')),
+            llm_quota_tpm=int(os.getenv('LLM_QUOTA_TPM', '0')),
+            llm_quota_rpd=int(os.getenv('LLM_QUOTA_RPD', '0')),
+            llm_quota_tpd=int(os.getenv('LLM_QUOTA_TPD', '0')),
+            llm_accounting_persist=os.getenv('LLM_ACCOUNTING_PERSIST', 'true').lower() == 'true',
+            analysis_reuse_enabled=os.getenv('ANALYSIS_REUSE_ENABLED', 'false').lower() == 'true',
+            analysis_reuse_price_pct=float(os.getenv('ANALYSIS_REUSE_PRICE_PCT', '2.0')),
+            analysis_reuse_max_age_hours=float(os.getenv('ANALYSIS_REUSE_MAX_AGE_HOURS', '72')),
+            llm_batch_size=int(os.getenv('LLM_BATCH_SIZE', '1')),
+            llm_batch_token_budget=int(os.getenv('LLM_BATCH_TOKEN_BUDGET', '30000')),
+            llm_batch_max_output_tokens=int(os.getenv('LLM_BATCH_MAX_OUTPUT_TOKENS', '32768')),
             bocha_api_keys=bocha_api_keys,
             tavily_api_keys=tavily_api_keys,
             serpapi_keys=serpapi_keys,
+            search_timeout=float(os.getenv('SEARCH_TIMEOUT', '10')),
+            search_pool_size=int(os.getenv('SEARCH_POOL_SIZE', '10')),
+            bocha_monthly_quota=int(os.getenv('BOCHA_MONTHLY_QUOTA', '0')),
+            tavily_monthly_quota=int(os.getenv('TAVILY_MONTHLY_QUOTA', '1000')),
+            serpapi_monthly_quota=int(os.getenv('SERPAPI_MONTHLY_QUOTA', '100')),
+            search_hedge=os.getenv('SEARCH_HEDGE', 'true').lower() == 'true',
+            search_hedge_delay=float(os.getenv('SEARCH_HEDGE_DELAY', '3')),
+            search_cache_enabled=os.getenv('SEARCH_CACHE_ENABLED', 'true').lower() == 'true',
+            search_cache_ttl_latest=int(os.getenv('SEARCH_CACHE_TTL_LATEST', '3600')),
+            search_cache_ttl_risk=int(os.getenv('SEARCH_CACHE_TTL_RISK', '21600')),
+            search_cache_ttl_earnings=int(os.getenv('SEARCH_CACHE_TTL_EARNINGS', '86400')),
             wechat_webhook_url=os.getenv('WECHAT_WEBHOOK_URL'),
             feishu_webhook_url=os.getenv('FEISHU_WEBHOOK_URL'),
             telegram_bot_token=os.getenv('TELEGRAM_BOT_TOKEN'),
@@ -212,10 +304,16 @@ class Config:
             feishu_max_bytes=int(os.getenv('FEISHU_MAX_BYTES', '20000')),
             wechat_max_bytes=int(os.getenv('WECHAT_MAX_BYTES', '4000')),
             database_path=os.getenv('DATABASE_PATH', './data/stock_analysis.db'),
+            database_compact_schema=os.getenv('DATABASE_COMPACT_SCHEMA', 'false').lower() == 'true',
+            db_cache_size=int(os.getenv('DB_CACHE_SIZE', '256')),
+            analytics_parquet_dir=os.getenv('ANALYTICS_PARQUET_DIR', ''),
             log_dir=os.getenv('LOG_DIR', './logs'),
             log_level=os.getenv('LOG_LEVEL', 'INFO'),
             max_workers=int(os.getenv('MAX_WORKERS', '3')),
             debug=os.getenv('DEBUG', 'false').lower() == 'true',
+            screener_top_k=int(os.getenv('SCREENER_TOP_K', '10')),
+            screener_workers=int(os.getenv('SCREENER_WORKERS', '0')),
+            screener_backfill=int(os.getenv('SCREENER_BACKFILL', '0')),
             schedule_enabled=os.getenv('SCHEDULE_ENABLED', 'false').lower() == 'true',
             schedule_time=os.getenv('SCHEDULE_TIME', '18:00'),
             market_review_enabled=os.getenv('MARKET_REVIEW_ENABLED', 'true').lower() == 'true',
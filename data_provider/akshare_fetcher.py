@@ -22,7 +22,7 @@ import logging
 import random
 import time
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import date, datetime, time as dt_time, timedelta
 from typing import Optional, Dict, Any
 
 import pandas as pd
@@ -188,6 +188,15 @@ _realtime_cache: Dict[str, Any] = {
     'ttl': 60  # 60秒缓存有效期
 }
 
+# 交易日历缓存（ak.tool_trade_date_hist_sina，按自然日刷新）
+_trade_calendar_cache: Dict[str, Any] = {
+    'dates': None,
+    'day': None,
+}
+
+# A 股开盘时间（此前的快照仍为上一交易日行情）
+MARKET_OPEN_TIME = dt_time(9, 30)
+
 # ETF 实时行情缓存
 _etf_realtime_cache: Dict[str, Any] = {
     'data': None,
@@ -571,52 +580,101 @@ class AkshareFetcher(BaseFetcher):
         else:
             return self._get_stock_realtime_quote(stock_code)
     
-    def _get_stock_realtime_quote(self, stock_code: str) -> Optional[RealtimeQuote]:
+    def get_market_snapshot(self) -> pd.DataFrame:
         """
-        获取普通 A 股实时行情数据
+        获取全部 A 股实时行情快照
         
-        数据来源：ak.stock_zh_a_spot_em()
-        包含：量比、换手率、市盈率、市净率、总市值、流通市值等
+        数据来源：ak.stock_zh_a_spot_em()（约 5000 只，60 秒缓存，个股实时行情与全市场选股共用）
+        
+        Returns:
+            原始快照 DataFrame（中文列名），获取失败返回空 DataFrame
         """
         import akshare as ak
         
-        try:
-            # 检查缓存
-            current_time = time.time()
-            if (_realtime_cache['data'] is not None and 
-                current_time - _realtime_cache['timestamp'] < _realtime_cache['ttl']):
-                df = _realtime_cache['data']
-                logger.debug(f"[缓存命中] 使用缓存的A股实时行情数据")
-            else:
-                last_error: Optional[Exception] = None
-                df = None
-                for attempt in range(1, 3):
-                    try:
-                        # 防封禁策略
-                        self._set_random_user_agent()
-                        self._enforce_rate_limit()
+        # 检查缓存
+        current_time = time.time()
+        if (_realtime_cache['data'] is not None and 
+            current_time - _realtime_cache['timestamp'] < _realtime_cache['ttl']):
+            df = _realtime_cache['data']
+            logger.debug(f"[缓存命中] 使用缓存的A股实时行情数据")
+        else:
+            last_error: Optional[Exception] = None
+            df = None
+            for attempt in range(1, 3):
+                try:
+                    # 防封禁策略
+                    self._set_random_user_agent()
+                    self._enforce_rate_limit()
 
-                        logger.info(f"[API调用] ak.stock_zh_a_spot_em() 获取A股实时行情... (attempt {attempt}/2)")
-                        import time as _time
-                        api_start = _time.time()
+                    logger.info(f"[API调用] ak.stock_zh_a_spot_em() 获取A股实时行情... (attempt {attempt}/2)")
+                    import time as _time
+                    api_start = _time.time()
 
-                        df = ak.stock_zh_a_spot_em()
+                    df = ak.stock_zh_a_spot_em()
 
-                        api_elapsed = _time.time() - api_start
-                        logger.info(f"[API返回] ak.stock_zh_a_spot_em 成功: 返回 {len(df)} 只股票, 耗时 {api_elapsed:.2f}s")
-                        break
-                    except Exception as e:
-                        last_error = e
-                        logger.warning(f"[API错误] ak.stock_zh_a_spot_em 获取失败 (attempt {attempt}/2): {e}")
-                        time.sleep(min(2 ** attempt, 5))
-
-                # 更新缓存：成功缓存数据；失败也缓存空数据，避免同一轮任务对同一接口反复请求
-                if df is None:
-                    logger.error(f"[API错误] ak.stock_zh_a_spot_em 最终失败: {last_error}")
-                    df = pd.DataFrame()
-                _realtime_cache['data'] = df
-                _realtime_cache['timestamp'] = current_time
+                    api_elapsed = _time.time() - api_start
+                    logger.info(f"[API返回] ak.stock_zh_a_spot_em 成功: 返回 {len(df)} 只股票, 耗时 {api_elapsed:.2f}s")
+                    break
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"[API错误] ak.stock_zh_a_spot_em 获取失败 (attempt {attempt}/2): {e}")
+                    time.sleep(min(2 ** attempt, 5))
 
+            # 更新缓存：成功缓存数据；失败也缓存空数据，避免同一轮任务对同一接口反复请求
+            if df is None:
+                logger.error(f"[API错误] ak.stock_zh_a_spot_em 最终失败: {last_error}")
+                df = pd.DataFrame()
+            _realtime_cache['data'] = df
+            _realtime_cache['timestamp'] = current_time
+        
+        return df
+    
+    def get_latest_trade_date(self, now: Optional[datetime] = None) -> date:
+        """
+        获取实时快照对应的交易日（最近一个已开盘的交易日）
+        
+        周末、节假日返回上一交易日；交易日开盘前返回前一交易日。
+        交易日历获取失败时按工作日估算（不识别节假日）。
+        """
+        now = now or datetime.now()
+        latest = now.date() if now.time() >= MARKET_OPEN_TIME else now.date() - timedelta(days=1)
+        
+        trade_dates = self._get_trade_dates(now.date())
+        if trade_dates:
+            candidates = [d for d in trade_dates if d <= latest]
+            if candidates:
+                return max(candidates)
+        
+        while latest.weekday() >= 5:
+            latest -= timedelta(days=1)
+        return latest
+    
+    def _get_trade_dates(self, today: date) -> Optional[list]:
+        """交易日历（每个自然日最多请求一次，失败返回 None）"""
+        if _trade_calendar_cache['day'] == today:
+            return _trade_calendar_cache['dates']
+        
+        dates = None
+        try:
+            import akshare as ak
+            calendar = ak.tool_trade_date_hist_sina()
+            dates = [pd.Timestamp(d).date() for d in calendar['trade_date']]
+        except Exception as e:
+            logger.warning(f"[API错误] ak.tool_trade_date_hist_sina 获取交易日历失败，按工作日估算: {e}")
+        _trade_calendar_cache['dates'] = dates
+        _trade_calendar_cache['day'] = today
+        return dates
+    
+    def _get_stock_realtime_quote(self, stock_code: str) -> Optional[RealtimeQuote]:
+        """
+        获取普通 A 股实时行情数据
+        
+        数据来源：ak.stock_zh_a_spot_em()
+        包含：量比、换手率、市盈率、市净率、总市值、流通市值等
+        """
+        try:
+            df = self.get_market_snapshot()
+            
             if df is None or df.empty:
                 logger.warning(f"[实时行情] A股实时行情数据为空，跳过 {stock_code}")
                 return None
@@ -30,6 +30,8 @@ from tenacity import (
     retry_if_exception_type,
 )
 
+from rolling import STORED_MA_WINDOWS, add_moving_averages, volume_ratios
+
 # 配置日志
 logger = logging.getLogger(__name__)
 
@@ -190,20 +192,16 @@ class BaseFetcher(ABC):
         计算技术指标
         
         计算指标：
-        - MA5, MA10, MA20: 移动平均线
-        - Volume_Ratio: 量比（今日成交量 / 5日平均成交量）
-        """
-        df = df.copy()
+        - MA5, MA10, MA20: 移动平均线（rolling 模块，前 N-1 日为空值）
+        - Volume_Ratio: 量比（今日成交量 / 5日平均成交量，前 5 日为空值）
         
-        # 移动平均线
-        df['ma5'] = df['close'].rolling(window=5, min_periods=1).mean()
-        df['ma10'] = df['close'].rolling(window=10, min_periods=1).mean()
-        df['ma20'] = df['close'].rolling(window=20, min_periods=1).mean()
+        本次拉取窗口内预热不足的位置由 DatabaseManager.save_daily_data 用库中历史补齐
+        """
+        # 移动平均线（严格预热：窗口未满为空值，与趋势分析语义一致）
+        df = add_moving_averages(df, STORED_MA_WINDOWS)
         
-        # 量比：当日成交量 / 5日平均成交量
-        avg_volume_5 = df['volume'].rolling(window=5, min_periods=1).mean()
-        df['volume_ratio'] = df['volume'] / avg_volume_5.shift(1)
-        df['volume_ratio'] = df['volume_ratio'].fillna(1.0)
+        # 量比：当日成交量 / 前 5 日平均成交量（前 5 日不足时为空值，入库时用库中历史补齐）
+        df['volume_ratio'] = volume_ratios(df['volume'].to_numpy(dtype=float), 5)
         
         # 保留2位小数
         for col in ['ma5', 'ma10', 'ma20', 'volume_ratio']:
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+增量 JSON 解析 - 流式 LLM 响应
+===================================
+
+职责：
+1. 按片段接收模型流式输出，逐字符跟踪 JSON 结构（字符串、转义、嵌套深度）
+2. 顶层对象的每个字段一旦完整即解析出来，不必等待整个响应结束
+3. 忽略 JSON 之前的 markdown 代码块标记等前导文本
+
+使用方式：
+    parser = IncrementalJSONParser(on_field=lambda key, value: print(key, value))
+    for chunk in stream:
+        parser.feed(chunk)
+    parser.fields  # 已完成的顶层字段
+
+说明：
+- 仅增量解析顶层字段；字段值（含嵌套对象）整体完成后才回调
+- 单个字段无法解析时跳过（最终仍以完整响应的解析结果为准）
+"""
+
+import json
+import logging
+import time
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJSONParser:
+    """顶层 JSON 对象的增量解析器"""
+
+    def __init__(self, on_field: Optional[Callable[[str, Any], None]] = None):
+        """
+        Args:
+            on_field: 顶层字段完成时的回调 (key, value)
+        """
+        self.on_field = on_field
+        self.reset()
+
+    def reset(self) -> None:
+        """清空状态（重试重新开始接收时调用）"""
+        self.fields: Dict[str, Any] = {}
+        self.field_times: Dict[str, float] = {}  # 字段完成时刻（time.monotonic）
+        self.complete = False
+        self.text = ''  # 已接收的完整文本
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        接收一个片段
+
+        Returns:
+            本次新完成的顶层字段 [(key, value), ...]
+        """
+        if not chunk:
+            return []
+        self.text += chunk
+        if self.complete:
+            return []
+
+        text = self.text
+        completed = []
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif self._depth == 0:
+                if ch == '{':
+                    self._depth = 1
+                    self._member_start = i + 1
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.extend(self._close_member(text, i))
+                    self.complete = True
+                    i += 1
+                    break
+            elif ch == ',' and self._depth == 1:
+                completed.extend(self._close_member(text, i))
+                self._member_start = i + 1
+            i += 1
+        self._pos = i
+
+        now = time.monotonic()
+        for key, value in completed:
+            self.fields[key] = value
+            self.field_times[key] = now
+            if self.on_field:
+                self.on_field(key, value)
+        return completed
+
+    def adopt(self, other: 'IncrementalJSONParser', notify: bool = True) -> None:
+        """
+        采用另一个解析器的结果（对冲时各请求使用独立解析器，只把胜出方的字段同步过来）
+
+        Args:
+            other: 来源解析器
+            notify: 是否以最新完成的字段回调一次 on_field（回调方拿到的是完整的字段集合）
+        """
+        self.fields = dict(other.fields)
+        self.field_times = dict(other.field_times)
+        self.complete = other.complete
+        self.text = other.text
+        self._pos = other._pos
+        self._depth = other._depth
+        self._in_string = other._in_string
+        self._escape = other._escape
+        self._member_start = other._member_start
+        if notify and self.on_field and self.fields:
+            key = next(reversed(self.fields))
+            self.on_field(key, self.fields[key])
+
+    def _close_member(self, text: str, end: int) -> List[Tuple[str, Any]]:
+        """解析 [member_start, end) 之间的一个 "key": value 成员"""
+        member = text[self._member_start:end].strip()
+        if not member:
+            return []
+        try:
+            parsed = json.loads('{' + member + '}')
+        except json.JSONDecodeError:
+            logger.debug(f"增量解析跳过无法解析的字段: {member[:50]}")
+            return []
+        return list(parsed.items())
+
+
+if __name__ == "__main__":
+    sample = '```json\n{"sentiment_score": 72, "operation_advice": "持有", "dashboard": {"a": [1, "}"]}, "x": "a\\"b"}\n```'
+    parser = IncrementalJSONParser(on_field=lambda k, v: print(f"字段完成: {k} = {v!r}"))
+    for start in range(0, len(sample), 7):
+        parser.feed(sample[start:start + 7])
+    print(f"完成: {parser.complete}, 字段: {list(parser.fields)}")
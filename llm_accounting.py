@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+LLM 调用记账 - 按股票 / 轮次 / 模型统计 Token 与耗时
+===================================
+
+职责：
+1. 记录每次逻辑调用（单股分析、批量分析、大盘复盘）的输入/输出 Token、耗时、尝试次数、
+   备选切换次数与解析结果
+2. Token 优先取响应中的 usage（Gemini usage_metadata / OpenAI usage），无用量信息时按文本估算
+3. 每次调用写入数据库（llm_call_log），按股票、轮次、模型汇总，找出成本与耗时的主要来源
+4. 一轮分析结束时输出汇总
+
+使用方式：
+    accounting = get_llm_accounting()
+    run_id = accounting.start_run()
+    with accounting.track('600519', run_id=run_id) as call:
+        ...                                   # 调用链内部通过 note_* 函数上报
+        call.parse_outcome = 'direct'
+    summary = accounting.finish_run(run_id)
+
+说明：
+- 当前调用通过 contextvars 传递：同一线程 / 协程任务内的重试、备选切换自动归入该调用；
+  提交到线程池的子任务（对冲请求）需以 contextvars.copy_context().run 提交
+- 未处于 track() 内时 note_* 为空操作
+"""
+
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Iterator
+
+from prompt_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# 调用类型
+KIND_SINGLE = 'single'  # 单股分析
+KIND_BATCH = 'batch'    # 多股打包请求（Token 与耗时按股票均摊）
+KIND_MARKET = 'market'  # 大盘复盘
+
+# 内存中保留的轮次数（每轮结束时汇总并释放）
+_MAX_RUNS = 8
+
+
+@dataclass
+class LLMCall:
+    """一次逻辑调用的记账（含其中的全部重试、备选切换与对冲请求）"""
+    code: str
+    kind: str = KIND_SINGLE
+    run_id: str = ''
+    provider: str = ''
+    model: str = ''
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    tokens_estimated: bool = False
+    latency: float = 0.0
+    attempts: int = 0
+    fallbacks: int = 0
+    parse_outcome: str = ''  # direct / extracted / repaired / failed，未解析为空
+    success: bool = False
+    error: str = ''
+    created_at: datetime = field(default_factory=datetime.now)
+    stock_outcomes: Dict[str, str] = field(default_factory=dict, repr=False)  # 批量调用各股票的解析结果
+    # 调用过程中的中间量（不写入数据库）
+    _usage_input: int = field(default=0, repr=False)
+    _usage_output: int = field(default=0, repr=False)
+    _has_usage: bool = field(default=False, repr=False)
+    _estimated_input: int = field(default=0, repr=False)
+    _estimated_output: int = field(default=0, repr=False)
+    _pending_input: int = field(default=0, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """数据库字段（不含中间量）"""
+        return {
+            f.name: getattr(self, f.name) for f in fields(self)
+            if not f.name.startswith('_') and f.name != 'stock_outcomes'
+        }
+
+    def split(self, codes: List[str]) -> List['LLMCall']:
+        """批量调用按股票均摊 Token（耗时为整次请求的耗时）"""
+        n = max(len(codes), 1)
+        calls = []
+        for code in codes:
+            outcome = self.stock_outcomes.get(code, self.parse_outcome)
+            calls.append(LLMCall(
+                code=code, kind=self.kind, run_id=self.run_id, provider=self.provider, model=self.model,
+                input_tokens=self.input_tokens // n, output_tokens=self.output_tokens // n,
+                cached_tokens=self.cached_tokens // n, tokens_estimated=self.tokens_estimated,
+                latency=self.latency, attempts=self.attempts, fallbacks=self.fallbacks,
+                parse_outcome=outcome, success=self.success and outcome != 'failed', error=self.error,
+                created_at=self.created_at,
+            ))
+        return calls
+
+
+_current_call: contextvars.ContextVar = contextvars.ContextVar('llm_current_call', default=None)
+
+
+def current_call() -> Optional[LLMCall]:
+    """当前线程 / 协程任务所属的调用（不在 track() 内时为 None）"""
+    return _current_call.get()
+
+
+def note_attempt(provider: str, model: str, prompt_tokens: int = 0) -> None:
+    """发起一次请求（首次或重试）"""
+    call = _current_call.get()
+    if call is None:
+        return
+    with call._lock:
+        call.attempts += 1
+        call.provider = provider
+        call.model = model or call.model
+        call._pending_input = prompt_tokens
+
+
+def note_response(response_text: str) -> None:
+    """请求成功返回（按文本估算 Token，响应不含 usage 时使用）"""
+    call = _current_call.get()
+    if call is None or not response_text:
+        return
+    with call._lock:
+        call._estimated_input += call._pending_input
+        call._estimated_output += estimate_tokens(response_text)
+        call._pending_input = 0
+
+
+def note_usage(response) -> None:
+    """
+    累加响应中的实际 Token 用量（流式响应中不含 usage 的片段忽略）
+
+    - Gemini: usage_metadata.prompt_token_count / candidates_token_count / cached_content_token_count
+    - OpenAI: usage.prompt_tokens / completion_tokens / prompt_tokens_details.cached_tokens
+    """
+    call = _current_call.get()
+    if call is None or response is None:
+        return
+    from prompt_cache import usage_tokens
+    usage = usage_tokens(response)
+    if usage is None:
+        return
+    metadata = getattr(response, 'usage_metadata', None)
+    if metadata is not None and getattr(metadata, 'prompt_token_count', None):
+        output = getattr(metadata, 'candidates_token_count', 0) or 0
+    else:
+        output = getattr(getattr(response, 'usage', None), 'completion_tokens', 0) or 0
+    with call._lock:
+        call._has_usage = True
+        call._usage_input += usage[0]
+        call.cached_tokens += usage[1]
+        call._usage_output += int(output)
+
+
+def note_parse(outcome: str, code: Optional[str] = None) -> None:
+    """
+    记录解析结果
+
+    Args:
+        outcome: direct / extracted / repaired / failed
+        code: 批量调用中的股票代码（单股调用为空）
+    """
+    call = _current_call.get()
+    if call is None:
+        return
+    with call._lock:
+        if code is None:
+            call.parse_outcome = outcome
+        else:
+            call.stock_outcomes[code] = outcome
+
+
+def note_fallback() -> None:
+    """切换到备选模型或备选服务商"""
+    call = _current_call.get()
+    if call is None:
+        return
+    with call._lock:
+        call.fallbacks += 1
+
+
+class LLMAccounting:
+    """LLM 调用记账：内存中按轮次保留明细，逐条写入数据库"""
+
+    def __init__(self, db=None):
+        """
+        Args:
+            db: DatabaseManager（为空时只在内存中统计）
+        """
+        self.db = db
+        self._runs: Dict[str, List[LLMCall]] = {}
+        self._lock = threading.Lock()
+
+    def start_run(self) -> str:
+        """开始新一轮分析，返回轮次 ID"""
+        run_id = datetime.now().strftime('%Y%m%d_%H%M%S_') + uuid.uuid4().hex[:6]
+        with self._lock:
+            self._runs[run_id] = []
+            while len(self._runs) > _MAX_RUNS:
+                self._runs.pop(next(iter(self._runs)))
+        return run_id
+
+    @contextmanager
+    def track(self, code: str, kind: str = KIND_SINGLE, run_id: Optional[str] = None,
+              codes: Optional[List[str]] = None) -> Iterator[LLMCall]:
+        """
+        记账一次逻辑调用（调用链内的 note_* 上报归入该调用）
+
+        Args:
+            code: 股票代码（大盘复盘为 'market'）
+            kind: KIND_SINGLE / KIND_BATCH / KIND_MARKET
+            run_id: 轮次 ID（Web 等临时请求为空）
+            codes: 批量调用包含的股票（记录时按股票均摊）
+        """
+        call = LLMCall(code=code, kind=kind, run_id=run_id or '')
+        token = _current_call.set(call)
+        start = time.monotonic()
+        try:
+            yield call
+            call.success = call.parse_outcome != 'failed'
+        except Exception as e:
+            call.error = str(e)[:200]
+            raise
+        finally:
+            _current_call.reset(token)
+            call.latency = time.monotonic() - start
+            self._finalize(call)
+            self.record(call.split(codes) if codes else [call])
+
+    @staticmethod
+    def _finalize(call: LLMCall) -> None:
+        """确定 Token 数：有 usage 时用实际值，否则用估算值"""
+        if call._has_usage:
+            call.input_tokens = call._usage_input
+            call.output_tokens = call._usage_output
+        else:
+            call.input_tokens = call._estimated_input
+            call.output_tokens = call._estimated_output
+            call.tokens_estimated = call.attempts > 0
+
+    def record(self, calls: List[LLMCall]) -> None:
+        """保存调用记录（未发起任何请求的调用不记录）"""
+        calls = [c for c in calls if c.attempts > 0]
+        if not calls:
+            return
+        with self._lock:
+            for call in calls:
+                if call.run_id in self._runs:
+                    self._runs[call.run_id].append(call)
+        if self.db is None:
+            return
+        try:
+            self.db.save_llm_calls([c.to_dict() for c in calls])
+        except Exception as e:
+            logger.debug(f"[LLM记账] 保存调用记录失败: {e}")
+
+    def finish_run(self, run_id: str) -> Dict[str, Any]:
+        """结束一轮分析：返回汇总并释放该轮明细"""
+        with self._lock:
+            calls = self._runs.pop(run_id, [])
+        return summarize(calls)
+
+
+def summarize(calls: List[LLMCall], top: int = 5) -> Dict[str, Any]:
+    """
+    汇总调用记录
+
+    Returns:
+        {'total': {...}, 'models': {模型: {...}}, 'top_tokens': [(代码, Token)], 'top_latency': [(代码, 耗时)]}
+    """
+    def new_bucket() -> Dict[str, Any]:
+        return {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cached_tokens': 0,
+                'latency': 0.0, 'retries': 0, 'fallbacks': 0, 'parse_failures': 0, 'errors': 0}
+
+    total = new_bucket()
+    models: Dict[str, Dict[str, Any]] = defaultdict(new_bucket)
+    stocks: Dict[str, Dict[str, Any]] = defaultdict(new_bucket)
+    for call in calls:
+        for bucket in (total, models[call.model or call.provider], stocks[call.code]):
+            bucket['calls'] += 1
+            bucket['input_tokens'] += call.input_tokens
+            bucket['output_tokens'] += call.output_tokens
+            bucket['cached_tokens'] += call.cached_tokens
+            bucket['latency'] += call.latency
+            bucket['retries'] += max(call.attempts - 1, 0)
+            bucket['fallbacks'] += call.fallbacks
+            bucket['parse_failures'] += call.parse_outcome == 'failed'
+            bucket['errors'] += bool(call.error)
+
+    def ranking(key) -> List[tuple]:
+        ranked = sorted(stocks.items(), key=lambda item: key(item[1]), reverse=True)
+        return [(code, key(bucket)) for code, bucket in ranked[:top]]
+
+    return {
+        'total': total,
+        'models': dict(models),
+        'top_tokens': ranking(lambda b: b['input_tokens'] + b['output_tokens']),
+        'top_latency': ranking(lambda b: b['latency']),
+        'estimated': any(call.tokens_estimated for call in calls),
+    }
+
+
+_llm_accounting: Optional[LLMAccounting] = None
+_llm_accounting_lock = threading.Lock()
+
+
+def get_llm_accounting() -> LLMAccounting:
+    """进程内共享的调用记账（首次调用时按配置创建）"""
+    global _llm_accounting
+    with _llm_accounting_lock:
+        if _llm_accounting is None:
+            from config import get_config
+            db = None
+            if get_config().llm_accounting_persist:
+                from storage import get_db
+                db = get_db()
+            _llm_accounting = LLMAccounting(db=db)
+        return _llm_accounting
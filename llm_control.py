@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+LLM 调用流控 - AIMD 自适应并发
+===================================
+
+职责：
+1. 替代固定的请求前 sleep：按调用结果自适应调整同时进行的 LLM 请求数
+2. 调用成功时并发上限加性增加，遇到限流（429）时乘性减半
+3. 识别 Retry-After 提示（HTTP 头 / Gemini RetryInfo），在提示时间内暂停发起新请求
+4. 按服务商（gemini / openai）进程内共享，所有 GeminiAnalyzer 实例共用同一控制器
+
+使用方式：
+    controller = get_llm_controller('gemini')
+    with controller.slot():
+        response = call_api()
+    # 协程中使用 async with controller.async_slot()
+    # 失败时调用 controller.on_rate_limit(retry_after) / controller.on_error()
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional, Dict, Any, Iterator, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+
+# 吞吐量统计窗口（秒）
+THROUGHPUT_WINDOW = 60.0
+
+# 异步等待名额时的轮询间隔（秒）
+ASYNC_POLL_INTERVAL = 0.05
+
+# 错误信息中的重试提示（Gemini RetryInfo / 常见报错文本）
+_RETRY_HINT_PATTERNS = [
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+(?:\.\d+)?)', re.IGNORECASE),
+    re.compile(r'retry[- ]after[:\s]+(\d+(?:\.\d+)?)', re.IGNORECASE),
+    re.compile(r'retry in\s+(\d+(?:\.\d+)?)\s*s', re.IGNORECASE),
+]
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    判断异常是否为限流错误
+
+    优先使用结构化信息（HTTP 状态码、异常类型），无法判断时再匹配错误文本
+    """
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    response = getattr(error, 'response', None)
+    if status is None and response is not None:
+        status = getattr(response, 'status_code', None)
+    if status == 429:
+        return True
+    if type(error).__name__ in ('RateLimitError', 'ResourceExhausted', 'TooManyRequests'):
+        return True
+
+    text = str(error).lower()
+    return '429' in text or 'quota' in text or 'rate limit' in text or 'resource exhausted' in text
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """
+    从限流异常中提取建议的等待时间（秒）
+
+    依次尝试：
+    1. HTTP 响应头 retry-after-ms / retry-after（OpenAI 兼容 API）
+    2. 异常文本中的 RetryInfo（Gemini）或 "retry in Xs" 提示
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000
+            if headers.get('retry-after'):
+                return float(headers['retry-after'])
+        except (TypeError, ValueError):
+            pass  # HTTP 日期格式等，忽略
+
+    text = str(error)
+    for pattern in _RETRY_HINT_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class AIMDController:
+    """
+    AIMD（加性增、乘性减）并发控制器
+
+    - 并发上限 limit 为浮点数，实际可同时进行 floor(limit) 个请求
+    - 每次成功：limit += increase / limit（约每一"轮"并发请求成功后 +1）
+    - 每次限流：limit *= decrease_factor，并在 Retry-After（或默认冷却时间）内暂停发起新请求
+    - 同一冷却期内的多次限流只减一次，避免并发请求同时失败导致上限骤降
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_limit: int = 4,
+        initial_limit: float = 1.0,
+        min_limit: float = 1.0,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        default_cooldown: float = 5.0
+    ):
+        """
+        初始化控制器
+
+        Args:
+            name: 服务商名称（用于日志）
+            max_limit: 并发上限的最大值
+            initial_limit: 初始并发上限
+            min_limit: 并发上限的最小值
+            increase: 加性增加步长
+            decrease_factor: 乘性减少系数
+            default_cooldown: 限流且无 Retry-After 提示时的暂停时间（秒）
+        """
+        self.name = name
+        self.max_limit = max(float(max_limit), min_limit)
+        self.min_limit = min_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.default_cooldown = default_cooldown
+
+        self._limit = min(max(float(initial_limit), min_limit), self.max_limit)
+        self._in_flight = 0
+        self._resume_at = 0.0
+        self._cond = threading.Condition()
+
+        # 指标
+        self._successes = 0
+        self._rate_limited = 0
+        self._errors = 0
+        self._latency_total = 0.0
+        self._completions: deque = deque()
+
+    @property
+    def limit(self) -> float:
+        """当前并发上限"""
+        return self._limit
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[None]:
+        """
+        占用一个并发名额（冷却期内或名额已满时阻塞等待）
+
+        仅负责占位与释放；调用结果需通过 on_success/on_rate_limit/on_error 反馈
+        """
+        self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, timeout: Optional[float] = None) -> None:
+        """等待并占用一个并发名额"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait_cooldown = self._resume_at - now
+                if wait_cooldown <= 0 and self._in_flight < max(int(self._limit), 1):
+                    self._in_flight += 1
+                    return
+                if deadline is not None and now >= deadline:
+                    raise TimeoutError(f"[{self.name}] 等待 LLM 并发名额超时")
+
+                wait = wait_cooldown if wait_cooldown > 0 else None
+                if deadline is not None:
+                    wait = min(wait or deadline - now, deadline - now)
+                if wait_cooldown > 0:
+                    logger.debug(f"[{self.name}] 限流冷却中，等待 {wait_cooldown:.1f} 秒")
+                self._cond.wait(wait)
+
+    @asynccontextmanager
+    async def async_slot(self) -> AsyncIterator[None]:
+        """slot() 的协程版本：等待名额时让出事件循环，不阻塞线程"""
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire_async(self) -> None:
+        """
+        协程方式等待并占用一个并发名额
+
+        与线程共用同一份计数；冷却期内按剩余冷却时间休眠，名额已满时短间隔轮询
+        """
+        while True:
+            with self._cond:
+                wait_cooldown = self._resume_at - time.monotonic()
+                if wait_cooldown <= 0 and self._in_flight < max(int(self._limit), 1):
+                    self._in_flight += 1
+                    return
+            await asyncio.sleep(wait_cooldown if wait_cooldown > 0 else ASYNC_POLL_INTERVAL)
+
+    def release(self) -> None:
+        """释放并发名额"""
+        with self._cond:
+            self._in_flight = max(self._in_flight - 1, 0)
+            self._cond.notify_all()
+
+    def on_success(self, latency: float = 0.0) -> None:
+        """调用成功：加性增加并发上限"""
+        with self._cond:
+            self._successes += 1
+            self._latency_total += latency
+            self._record_completion()
+            old = self._limit
+            self._limit = min(self._limit + self.increase / self._limit, self.max_limit)
+            if int(self._limit) > int(old):
+                logger.info(f"[{self.name}] LLM 并发上限提升至 {int(self._limit)}")
+            self._cond.notify_all()
+
+    def on_rate_limit(self, retry_after: Optional[float] = None) -> float:
+        """
+        遇到限流：乘性减少并发上限，并暂停发起新请求
+
+        Args:
+            retry_after: 服务端建议的等待时间（秒），为空使用默认冷却时间
+
+        Returns:
+            本次设定的冷却时间（秒）
+        """
+        cooldown = retry_after if retry_after is not None and retry_after > 0 else self.default_cooldown
+        with self._cond:
+            self._rate_limited += 1
+            now = time.monotonic()
+            if now >= self._resume_at:
+                # 冷却期外的首次限流才减少上限
+                self._limit = max(self._limit * self.decrease_factor, self.min_limit)
+                logger.warning(f"[{self.name}] LLM 限流，并发上限降至 {self._limit:.1f}，暂停 {cooldown:.1f} 秒")
+            self._resume_at = max(self._resume_at, now + cooldown)
+            self._cond.notify_all()
+        return cooldown
+
+    def on_error(self) -> None:
+        """非限流错误：只计数，不调整并发上限"""
+        with self._cond:
+            self._errors += 1
+
+    def _record_completion(self) -> None:
+        now = time.monotonic()
+        self._completions.append(now)
+        while self._completions and now - self._completions[0] > THROUGHPUT_WINDOW:
+            self._completions.popleft()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """当前并发上限、进行中请求数与吞吐量等指标"""
+        with self._cond:
+            now = time.monotonic()
+            recent = sum(1 for t in self._completions if now - t <= THROUGHPUT_WINDOW)
+            return {
+                'name': self.name,
+                'limit': round(self._limit, 2),
+                'in_flight': self._in_flight,
+                'successes': self._successes,
+                'rate_limited': self._rate_limited,
+                'errors': self._errors,
+                'throughput_per_min': recent * 60.0 / THROUGHPUT_WINDOW,
+                'avg_latency': self._latency_total / self._successes if self._successes else 0.0,
+                'cooldown_remaining': max(self._resume_at - now, 0.0),
+            }
+
+
+# 进程内按服务商共享的控制器
+_controllers: Dict[str, AIMDController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_llm_controller(name: str) -> AIMDController:
+    """
+    获取服务商对应的共享控制器（首次调用时按配置创建）
+
+    Args:
+        name: 服务商名称，如 'gemini'、'openai'
+    """
+    with _controllers_lock:
+        controller = _controllers.get(name)
+        if controller is None:
+            from config import get_config
+            config = get_config()
+            controller = AIMDController(
+                name=name,
+                max_limit=max(config.llm_max_concurrency, 1),
+                initial_limit=config.llm_initial_concurrency,
+                default_cooldown=config.gemini_retry_delay,
+            )
+            _controllers[name] = controller
+        return controller
+
+
+def get_all_stats() -> Dict[str, Dict[str, Any]]:
+    """全部已创建控制器的指标"""
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    return {c.name: c.get_stats() for c in controllers}
+
+
+def reset_controllers() -> None:
+    """清空共享控制器（主要用于测试）"""
+    with _controllers_lock:
+        _controllers.clear()
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description='AIMD 并发控制模拟')
+    parser.add_argument('--calls', type=int, default=100, help='模拟调用次数')
+    parser.add_argument('--rpm', type=int, default=300, help='模拟服务端每分钟配额')
+    parser.add_argument('--latency', type=float, default=0.5, help='模拟单次调用耗时（秒）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    controller = AIMDController('simulated', max_limit=16, default_cooldown=1.0)
+    window: deque = deque()
+    window_lock = threading.Lock()
+
+    def fake_call(_):
+        with controller.slot():
+            with window_lock:
+                now = time.monotonic()
+                while window and now - window[0] > 60:
+                    window.popleft()
+                limited = len(window) >= args.rpm
+                if not limited:
+                    window.append(now)
+            if limited:
+                controller.on_rate_limit(retry_after=1.0)
+                return False
+            start = time.monotonic()
+            time.sleep(args.latency * random.uniform(0.5, 1.5))
+            controller.on_success(time.monotonic() - start)
+            return True
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        ok = sum(executor.map(fake_call, range(args.calls)))
+    elapsed = time.monotonic() - start
+    print(f"成功 {ok}/{args.calls}，耗时 {elapsed:.1f}s，指标: {controller.get_stats()}")
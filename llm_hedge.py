@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+对冲请求 - 主模型响应过慢时并行请求备选模型
+===================================
+
+职责：
+1. 统计主模型（Gemini，含重试）的完整调用耗时，按分位数给出对冲等待时间
+2. 主模型超过等待时间仍未返回时，向 OpenAI 兼容 API 发起同一请求，先得到可解析结果的一方胜出
+3. 限制每轮分析的对冲请求次数（重复请求的额外花费上限）
+4. 统计对冲次数与胜出方
+
+使用方式：
+    policy = get_hedge_policy()
+    delay = policy.delay()               # 主模型请求发出后等待的时间
+    if policy.try_acquire():             # 本轮对冲次数未用完
+        ...                              # 发起对冲请求
+    policy.record_outcome('hedge')
+    policy.reset_run()                   # 每轮分析开始时调用
+
+说明：
+- 未胜出的一方会被取消：协程路径直接取消任务（关闭连接）；
+  线程路径在重试间隔、流式读取时检查取消标记，已发出的非流式请求只能等待其结束后丢弃
+"""
+
+import threading
+from collections import deque
+from typing import Optional, Dict, Any
+
+import numpy as np
+
+
+class RequestCancelled(Exception):
+    """对冲中落败的请求被取消"""
+
+
+class HedgePolicy:
+    """
+    对冲等待时间与次数预算
+
+    - 主模型完成耗时样本不足 min_samples 时使用 default_delay
+    - 之后取最近 window 次耗时的 percentile 分位数，不低于 min_delay
+    """
+
+    def __init__(
+        self,
+        percentile: float = 90.0,
+        default_delay: float = 30.0,
+        min_delay: float = 3.0,
+        max_per_run: int = 5,
+        window: int = 50,
+        min_samples: int = 5
+    ):
+        """
+        Args:
+            percentile: 对冲等待时间取主模型耗时的分位数
+            default_delay: 样本不足时的等待时间（秒）
+            min_delay: 等待时间下限（秒）
+            max_per_run: 每轮分析最多发起的对冲请求数（<= 0 表示不限制）
+        """
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_per_run = max_per_run
+        self.min_samples = min_samples
+        self._latencies: deque = deque(maxlen=window)
+        self._hedged = 0  # 本轮已发起的对冲数
+        self._outcomes: Dict[str, int] = {'primary': 0, 'hedge': 0, 'none': 0}
+        self._cancelled = 0
+        self._lock = threading.Lock()
+
+    def record_primary(self, latency: float) -> None:
+        """
+        记录一次主模型调用（含重试）的耗时
+
+        主模型落败被取消时传入取消时的已用时间（真实耗时不低于该值）；
+        若只记录完成的调用，慢样本恰好在对冲胜出时缺失，分位数会逐轮偏低、对冲越来越激进
+        """
+        with self._lock:
+            self._latencies.append(latency)
+
+    def delay(self) -> float:
+        """主模型请求发出后，等待多久仍未返回即发起对冲（秒）"""
+        with self._lock:
+            samples = list(self._latencies)
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        return max(float(np.percentile(samples, self.percentile)), self.min_delay)
+
+    def try_acquire(self) -> bool:
+        """占用一次对冲名额（本轮已达上限时返回 False）"""
+        with self._lock:
+            if 0 < self.max_per_run <= self._hedged:
+                return False
+            self._hedged += 1
+            return True
+
+    def record_outcome(self, winner: Optional[str], cancelled: bool = False) -> None:
+        """
+        记录一次对冲的结果
+
+        Args:
+            winner: 'primary' / 'hedge'，两者都未得到可解析结果时为 None
+            cancelled: 另一方是否因落败被取消
+        """
+        with self._lock:
+            self._outcomes[winner or 'none'] += 1
+            if cancelled:
+                self._cancelled += 1
+
+    def reset_run(self) -> None:
+        """新一轮分析开始：重置对冲次数预算（耗时样本保留）"""
+        with self._lock:
+            self._hedged = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """本进程的对冲统计"""
+        with self._lock:
+            outcomes = dict(self._outcomes)
+            hedged, cancelled = self._hedged, self._cancelled
+        return {
+            'hedged_this_run': hedged,
+            'max_per_run': self.max_per_run,
+            'primary_wins': outcomes['primary'],
+            'hedge_wins': outcomes['hedge'],
+            'both_failed': outcomes['none'],
+            'cancelled': cancelled,
+            'delay': self.delay(),
+        }
+
+
+_hedge_policy: Optional[HedgePolicy] = None
+_hedge_policy_lock = threading.Lock()
+
+
+def get_hedge_policy() -> HedgePolicy:
+    """进程内共享的对冲策略（首次调用时按配置创建）"""
+    global _hedge_policy
+    with _hedge_policy_lock:
+        if _hedge_policy is None:
+            from config import get_config
+            config = get_config()
+            _hedge_policy = HedgePolicy(
+                percentile=config.llm_hedge_percentile,
+                default_delay=config.llm_hedge_delay,
+                max_per_run=config.llm_hedge_max_per_run,
+            )
+        return _hedge_policy
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+LLM 结构化输出 - 响应 Schema 与输出 Token 预算
+===================================
+
+职责：
+1. 定义决策仪表盘的响应 Schema（Gemini response_schema；OpenAI 兼容 API 使用 JSON 模式）
+2. 按请求类型统计实际输出 Token，自适应设置 max_output_tokens（不再每次都预留 8192）
+3. 统计响应解析结果（直接解析 / 提取 / 修复 / 失败），输出解析失败率
+
+请求类型：
+- single: 单股分析（整份决策仪表盘）
+- batch:  批量分析中的每只股票（请求上限 = 每股上限 × 股票数）
+
+使用方式：
+    budget = get_output_budget()
+    max_tokens = budget.limit('single', default=8192, ceiling=8192)
+    budget.record('single', tokens=2100, limit=max_tokens, truncated=False)
+    budget.record_parse('single', 'direct')
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+
+# ========== 响应 Schema（OpenAPI 子集，Gemini response_schema 格式） ==========
+
+_STRING = {'type': 'STRING'}
+_NUMBER = {'type': 'NUMBER', 'nullable': True}
+_STRING_LIST = {'type': 'ARRAY', 'items': _STRING}
+
+
+def _object(properties: Dict[str, Any], required: Optional[List[str]] = None) -> Dict[str, Any]:
+    """OBJECT 类型 Schema（默认全部字段必填）"""
+    return {
+        'type': 'OBJECT',
+        'properties': properties,
+        'required': list(properties) if required is None else required,
+    }
+
+
+DASHBOARD_SCHEMA = _object({
+    'core_conclusion': _object({
+        'one_sentence': _STRING,
+        'signal_type': _STRING,
+        'time_sensitivity': _STRING,
+        'position_advice': _object({'no_position': _STRING, 'has_position': _STRING}),
+    }),
+    'data_perspective': _object({
+        'trend_status': _object({
+            'ma_alignment': _STRING,
+            'is_bullish': {'type': 'BOOLEAN'},
+            'trend_score': _NUMBER,
+        }),
+        'price_position': _object({
+            'current_price': _NUMBER,
+            'ma5': _NUMBER,
+            'ma10': _NUMBER,
+            'ma20': _NUMBER,
+            'bias_ma5': _NUMBER,
+            'bias_status': _STRING,
+            'support_level': _NUMBER,
+            'resistance_level': _NUMBER,
+        }),
+        'volume_analysis': _object({
+            'volume_ratio': _NUMBER,
+            'volume_status': _STRING,
+            'turnover_rate': _NUMBER,
+            'volume_meaning': _STRING,
+        }),
+        'chip_structure': _object({
+            'profit_ratio': _NUMBER,
+            'avg_cost': _NUMBER,
+            'concentration': _NUMBER,
+            'chip_health': _STRING,
+        }),
+    }),
+    'intelligence': _object({
+        'latest_news': _STRING,
+        'risk_alerts': _STRING_LIST,
+        'positive_catalysts': _STRING_LIST,
+        'earnings_outlook': _STRING,
+        'sentiment_summary': _STRING,
+    }),
+    'battle_plan': _object({
+        'sniper_points': _object({
+            'ideal_buy': _STRING,
+            'secondary_buy': _STRING,
+            'stop_loss': _STRING,
+            'take_profit': _STRING,
+        }),
+        'position_strategy': _object({
+            'suggested_position': _STRING,
+            'entry_plan': _STRING,
+            'risk_control': _STRING,
+        }),
+        'action_checklist': _STRING_LIST,
+    }),
+})
+
+# 与系统提示词中的决策仪表盘 JSON 一致（核心结论字段在前）
+_TEXT_FIELDS = [
+    'analysis_summary', 'key_points', 'risk_warning', 'buy_reason',
+    'trend_analysis', 'short_term_outlook', 'medium_term_outlook',
+    'technical_analysis', 'ma_analysis', 'volume_analysis', 'pattern_analysis',
+    'fundamental_analysis', 'sector_position', 'company_highlights',
+    'news_summary', 'market_sentiment', 'hot_topics', 'data_sources',
+]
+
+ANALYSIS_SCHEMA = _object(
+    {
+        'sentiment_score': {'type': 'INTEGER'},
+        'trend_prediction': _STRING,
+        'operation_advice': _STRING,
+        'confidence_level': _STRING,
+        'dashboard': DASHBOARD_SCHEMA,
+        **{field: _STRING for field in _TEXT_FIELDS},
+        'search_performed': {'type': 'BOOLEAN'},
+    },
+    required=['sentiment_score', 'trend_prediction', 'operation_advice', 'confidence_level',
+              'dashboard', 'analysis_summary'],
+)
+
+
+def batch_schema() -> Dict[str, Any]:
+    """批量分析的响应 Schema：决策仪表盘数组，每个元素额外包含 code 字段"""
+    item = dict(ANALYSIS_SCHEMA)
+    item['properties'] = {'code': _STRING, **ANALYSIS_SCHEMA['properties']}
+    item['required'] = ['code'] + ANALYSIS_SCHEMA['required']
+    return {'type': 'ARRAY', 'items': item}
+
+
+# ========== 输出 Token 预算与解析统计 ==========
+
+# 解析结果：direct 整段即 JSON，extracted 去除代码块后提取，repaired 修复后解析，failed 回退文本解析
+PARSE_OUTCOMES = ('direct', 'extracted', 'repaired', 'failed')
+
+
+class OutputBudget:
+    """
+    按请求类型自适应的输出 Token 上限
+
+    - 样本不足 min_samples 时使用默认值
+    - 之后取最近 window 次输出 Token 的 P95 × headroom（按 256 取整），并限制在 [floor, ceiling]
+    - 响应被截断时记录为 2 倍上限的样本，下次请求随即放宽
+    """
+
+    def __init__(
+        self,
+        window: int = 50,
+        min_samples: int = 5,
+        headroom: float = 1.3,
+        floor: int = 1024
+    ):
+        self.window = window
+        self.min_samples = min_samples
+        self.headroom = headroom
+        self.floor = floor
+        self._samples: Dict[str, deque] = {}
+        self._truncated: Dict[str, int] = {}
+        self._parse: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, tokens: int, limit: int, truncated: bool = False) -> None:
+        """
+        记录一次响应的输出 Token 数
+
+        Args:
+            kind: 请求类型
+            tokens: 输出 Token 数（估算）
+            limit: 本次请求的 max_output_tokens
+            truncated: 是否因达到上限被截断
+        """
+        with self._lock:
+            samples = self._samples.setdefault(kind, deque(maxlen=self.window))
+            if truncated:
+                self._truncated[kind] = self._truncated.get(kind, 0) + 1
+                samples.append(limit * 2)
+            else:
+                samples.append(tokens)
+
+    def typical(self, kind: str, default: int) -> int:
+        """最近输出 Token 的 P95（样本不足时返回 default）"""
+        with self._lock:
+            samples = list(self._samples.get(kind, ()))
+        if len(samples) < self.min_samples:
+            return default
+        return int(np.percentile(samples, 95))
+
+    def limit(self, kind: str, default: int, ceiling: int) -> int:
+        """本次请求应设置的 max_output_tokens"""
+        typical = self.typical(kind, default=-1)
+        if typical < 0:
+            return min(default, ceiling)
+        limit = math.ceil(typical * self.headroom / 256) * 256
+        return int(min(max(limit, self.floor), ceiling))
+
+    def record_parse(self, kind: str, outcome: str) -> None:
+        """记录一次响应解析结果（PARSE_OUTCOMES 之一）"""
+        with self._lock:
+            counts = self._parse.setdefault(kind, dict.fromkeys(PARSE_OUTCOMES, 0))
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def parse_failure_rate(self, kind: str) -> float:
+        """解析失败（回退为文本解析）的比例"""
+        with self._lock:
+            counts = dict(self._parse.get(kind, {}))
+        total = sum(counts.values())
+        return counts.get('failed', 0) / total if total else 0.0
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各请求类型的输出 Token 与解析统计"""
+        with self._lock:
+            kinds = sorted(set(self._samples) | set(self._parse))
+            snapshot = {
+                kind: (list(self._samples.get(kind, ())), dict(self._parse.get(kind, {})),
+                       self._truncated.get(kind, 0))
+                for kind in kinds
+            }
+        stats = {}
+        for kind, (samples, parse, truncated) in snapshot.items():
+            total = sum(parse.values())
+            stats[kind] = {
+                'samples': len(samples),
+                'p95_tokens': int(np.percentile(samples, 95)) if samples else 0,
+                'truncated': truncated,
+                'parsed': total,
+                'parse_outcomes': parse,
+                'parse_failure_rate': parse.get('failed', 0) / total if total else 0.0,
+            }
+        return stats
+
+
+_output_budget = OutputBudget()
+
+
+def get_output_budget() -> OutputBudget:
+    """进程内共享的输出预算统计"""
+    return _output_budget
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+LLM 配额管理 - 进程内统一的 RPM/TPM/每日上限
+===================================
+
+职责：
+1. 按模型统计最近一分钟与当天的请求数、Token 数，执行 RPM / TPM / 每日请求数 / 每日 Token 上限
+2. 超出分钟配额时排队等待，不直接失败；按优先级放行（定时任务优先于 Web 临时请求），同优先级先到先得
+3. 每日用量写入数据库（llm_usage_daily），放行时在数据库中原子占用当日额度：
+   进程重启后每日上限仍然有效，Web 服务与定时任务等多个进程合计也不会超出
+4. 每日上限用尽时抛出 QuotaExceededError（等待到次日没有意义），由调用方切换备选模型或放弃
+
+与 llm_control 的分工：
+- llm_control.AIMDController 按服务端反馈（429）自适应调整并发
+- QuotaManager 按已知配额主动限速，所有 GeminiAnalyzer 实例（定时分析、大盘复盘、Web 任务）共用
+
+使用方式：
+    quota = get_quota_manager()
+    ticket = quota.acquire('gemini-2.5-flash', tokens=3000, priority=PRIORITY_SCHEDULED)
+    response = call_api()
+    quota.commit(ticket, output_tokens=1500)
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 优先级（数值越小越先放行）
+PRIORITY_SCHEDULED = 0    # 定时任务 / 命令行分析 / 大盘复盘
+PRIORITY_INTERACTIVE = 1  # Web 单股分析等临时请求
+
+# 异步等待配额时的最长轮询间隔（秒）
+ASYNC_POLL_INTERVAL = 0.2
+
+
+class QuotaExceededError(Exception):
+    """每日配额已用尽"""
+
+
+@dataclass
+class QuotaTicket:
+    """一次已放行的调用（commit 时补记输出 Token）"""
+    model: str
+    day: date
+    tokens: int
+    waited: float
+
+
+class _ModelUsage:
+    """单个模型的用量窗口"""
+
+    def __init__(self):
+        self.minute: deque = deque()  # (时刻, Token 数)
+        self.minute_tokens = 0
+        self.day: Optional[date] = None
+        self.day_requests = 0
+        self.day_tokens = 0
+        self.waiters: list = []  # 排队中的 (优先级, 序号)
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.rejected = 0
+
+    def prune(self, now: float) -> None:
+        while self.minute and now - self.minute[0][0] >= 60:
+            self.minute_tokens -= self.minute.popleft()[1]
+
+
+class QuotaManager:
+    """
+    按模型的请求配额管理
+
+    上限为 0 表示不限制；单次请求的 Token 超过 TPM 时，分钟窗口为空即放行（避免永远无法执行）
+    """
+
+    def __init__(
+        self,
+        rpm: int = 0,
+        tpm: int = 0,
+        rpd: int = 0,
+        tpd: int = 0,
+        db=None
+    ):
+        """
+        Args:
+            rpm: 每分钟请求数上限
+            tpm: 每分钟 Token 上限
+            rpd: 每日请求数上限
+            tpd: 每日 Token 上限
+            db: DatabaseManager（持久化每日用量，为空时只在内存中统计）
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.rpd = rpd
+        self.tpd = tpd
+        self.db = db
+        self._models: Dict[str, _ModelUsage] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._persist_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """是否配置了任一上限"""
+        return any(limit > 0 for limit in (self.rpm, self.tpm, self.rpd, self.tpd))
+
+    @property
+    def _shared_daily(self) -> bool:
+        """每日上限按数据库中的多进程合计判断"""
+        return self.db is not None and (self.rpd > 0 or self.tpd > 0)
+
+    # ========== 放行判断 ==========
+
+    def _usage(self, model: str) -> _ModelUsage:
+        """模型用量（跨日时从数据库加载当天已用量）；需持有 _cond"""
+        usage = self._models.setdefault(model, _ModelUsage())
+        today = date.today()
+        if usage.day != today:
+            usage.day = today
+            usage.day_requests, usage.day_tokens = self._load_day(today, model)
+        return usage
+
+    def _load_day(self, day: date, model: str) -> Tuple[int, int]:
+        if self.db is None:
+            return 0, 0
+        try:
+            return self.db.get_llm_usage(day, model)
+        except Exception as e:
+            logger.warning(f"[配额] 读取 {model} 当日用量失败，按 0 计算: {e}")
+            return 0, 0
+
+    def _check_daily(self, model: str, usage: _ModelUsage, tokens: int) -> None:
+        """每日上限已用尽时抛出 QuotaExceededError；需持有 _cond"""
+        if self.rpd > 0 and usage.day_requests >= self.rpd:
+            usage.rejected += 1
+            raise QuotaExceededError(f"{model} 今日请求数已达上限 {self.rpd}")
+        if self.tpd > 0 and usage.day_tokens > 0 and usage.day_tokens + tokens > self.tpd:
+            usage.rejected += 1
+            raise QuotaExceededError(f"{model} 今日 Token 已达上限 {self.tpd}")
+
+    def _reserve_day(self, model: str, usage: _ModelUsage, tokens: int) -> None:
+        """
+        在数据库中占用当日额度，并以数据库中的合计刷新当日用量；需持有 _cond
+
+        Raises:
+            QuotaExceededError: 其他进程已用完当日额度
+        """
+        try:
+            reserved, usage.day_requests, usage.day_tokens = self.db.reserve_llm_usage(
+                usage.day, model, tokens=tokens, max_requests=self.rpd, max_tokens=self.tpd
+            )
+        except Exception as e:
+            logger.warning(f"[配额] 占用 {model} 当日额度失败，按进程内用量放行: {e}")
+            usage.day_requests += 1
+            usage.day_tokens += tokens
+            return
+        if not reserved:
+            self._check_daily(model, usage, tokens)
+            usage.rejected += 1
+            raise QuotaExceededError(f"{model} 今日额度已用尽")
+
+    def _minute_wait(self, usage: _ModelUsage, tokens: int, now: float) -> float:
+        """分钟窗口还需等待的秒数（0 表示可放行）；需持有 _cond"""
+        usage.prune(now)
+        wait = 0.0
+        if self.rpm > 0 and len(usage.minute) >= self.rpm:
+            wait = max(wait, usage.minute[len(usage.minute) - self.rpm][0] + 60 - now)
+        if self.tpm > 0 and usage.minute and usage.minute_tokens + tokens > self.tpm:
+            # 等到足够多的 Token 移出窗口
+            excess = usage.minute_tokens + tokens - self.tpm
+            freed = 0
+            for ts, used in usage.minute:
+                freed += used
+                if freed >= excess:
+                    wait = max(wait, ts + 60 - now)
+                    break
+        return max(wait, 0.0)
+
+    def _try_admit(self, model: str, tokens: int, waiter: Tuple[int, int]) -> Optional[float]:
+        """
+        排在队首且分钟配额足够时放行
+
+        Returns:
+            None 表示已放行；否则为建议的等待秒数（排在他人之后时为轮询间隔）
+        """
+        usage = self._usage(model)
+        self._check_daily(model, usage, tokens)
+        if min(usage.waiters) != waiter:
+            return ASYNC_POLL_INTERVAL
+        now = time.monotonic()
+        wait = self._minute_wait(usage, tokens, now)
+        if wait > 0:
+            return wait
+        if self._shared_daily:
+            self._reserve_day(model, usage, tokens)
+        else:
+            usage.day_requests += 1
+            usage.day_tokens += tokens
+        usage.waiters.remove(waiter)
+        usage.minute.append((now, tokens))
+        usage.minute_tokens += tokens
+        return None
+
+    def _enqueue(self, model: str, priority: int) -> Tuple[int, int]:
+        waiter = (priority, next(self._seq))
+        self._usage(model).waiters.append(waiter)
+        return waiter
+
+    def _dequeue(self, model: str, waiter: Tuple[int, int]) -> None:
+        usage = self._models.get(model)
+        if usage is not None and waiter in usage.waiters:
+            usage.waiters.remove(waiter)
+        self._cond.notify_all()
+
+    def _admitted(self, model: str, tokens: int, start: float) -> QuotaTicket:
+        """放行后的记账与持久化"""
+        waited = time.monotonic() - start
+        with self._cond:
+            usage = self._models[model]
+            day = usage.day
+            if waited > 0.01:
+                usage.waited += 1
+                usage.wait_seconds += waited
+            self._cond.notify_all()
+        if waited > 1:
+            logger.info(f"[配额] {model} 排队 {waited:.1f}s 后放行")
+        if not self._shared_daily:
+            self._persist(day, model, requests=1, tokens=tokens)
+        return QuotaTicket(model=model, day=day, tokens=tokens, waited=waited)
+
+    # ========== 对外接口 ==========
+
+    def acquire(self, model: str, tokens: int = 0, priority: int = PRIORITY_SCHEDULED) -> QuotaTicket:
+        """
+        等待直到配额允许发起请求（排队，不因分钟配额失败）
+
+        Args:
+            model: 模型名称
+            tokens: 预计输入 Token
+            priority: PRIORITY_SCHEDULED / PRIORITY_INTERACTIVE
+
+        Raises:
+            QuotaExceededError: 每日上限已用尽
+        """
+        start = time.monotonic()
+        with self._cond:
+            waiter = self._enqueue(model, priority)
+            try:
+                while True:
+                    wait = self._try_admit(model, tokens, waiter)
+                    if wait is None:
+                        break
+                    self._cond.wait(wait)
+            except BaseException:
+                self._dequeue(model, waiter)
+                raise
+        return self._admitted(model, tokens, start)
+
+    async def acquire_async(
+        self,
+        model: str,
+        tokens: int = 0,
+        priority: int = PRIORITY_SCHEDULED
+    ) -> QuotaTicket:
+        """acquire() 的协程版本：等待时让出事件循环"""
+        start = time.monotonic()
+        with self._cond:
+            waiter = self._enqueue(model, priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_admit(model, tokens, waiter)
+                if wait is None:
+                    break
+                await asyncio.sleep(min(wait, ASYNC_POLL_INTERVAL))
+        except BaseException:
+            with self._cond:
+                self._dequeue(model, waiter)
+            raise
+        return self._admitted(model, tokens, start)
+
+    def commit(self, ticket: QuotaTicket, output_tokens: int = 0) -> None:
+        """补记请求完成后的输出 Token（计入当天与分钟窗口的最新一条）"""
+        if output_tokens <= 0:
+            return
+        with self._cond:
+            usage = self._models.get(ticket.model)
+            if usage is None:
+                return
+            if usage.day == ticket.day:
+                usage.day_tokens += output_tokens
+            if usage.minute:
+                ts, used = usage.minute[-1]
+                usage.minute[-1] = (ts, used + output_tokens)
+                usage.minute_tokens += output_tokens
+        self._persist(ticket.day, ticket.model, tokens=output_tokens)
+
+    def _persist(self, day: date, model: str, requests: int = 0, tokens: int = 0) -> None:
+        if self.db is None:
+            return
+        with self._persist_lock:
+            try:
+                self.db.add_llm_usage(day, model, requests=requests, tokens=tokens)
+            except Exception as e:
+                logger.debug(f"[配额] 保存 {model} 用量失败: {e}")
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各模型的分钟 / 当日用量与排队情况"""
+        now = time.monotonic()
+        stats = {}
+        with self._cond:
+            for model, usage in self._models.items():
+                usage.prune(now)
+                stats[model] = {
+                    'minute_requests': len(usage.minute),
+                    'minute_tokens': usage.minute_tokens,
+                    'day_requests': usage.day_requests,
+                    'day_tokens': usage.day_tokens,
+                    'queued': len(usage.waiters),
+                    'waited': usage.waited,
+                    'wait_seconds': usage.wait_seconds,
+                    'rejected': usage.rejected,
+                }
+        return stats
+
+
+_quota_manager: Optional[QuotaManager] = None
+_quota_manager_lock = threading.Lock()
+
+
+def get_quota_manager() -> QuotaManager:
+    """进程内共享的配额管理器（首次调用时按配置创建）"""
+    global _quota_manager
+    with _quota_manager_lock:
+        if _quota_manager is None:
+            from config import get_config
+            config = get_config()
+            db = None
+            if any(limit > 0 for limit in (config.llm_quota_rpd, config.llm_quota_tpd)):
+                from storage import get_db
+                db = get_db()
+            _quota_manager = QuotaManager(
+                rpm=config.llm_quota_rpm,
+                tpm=config.llm_quota_tpm,
+                rpd=config.llm_quota_rpd,
+                tpd=config.llm_quota_tpd,
+                db=db,
+            )
+        return _quota_manager
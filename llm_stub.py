@@ -0,0 +1,488 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+本地 LLM 替身服务 - OpenAI 兼容接口，用于离线压测
+===================================
+
+职责：
+1. 提供 OpenAI chat-completions 协议（POST /v1/chat/completions），返回符合 ANALYSIS_SCHEMA 的决策仪表盘 JSON
+2. 识别单股 / 批量提示词，批量请求按股票返回 JSON 数组（含 code 字段）
+3. 可配置响应耗时分布、429 限流注入（随机注入 / 每分钟配额）、500 错误注入与流式输出（SSE）
+4. 返回 usage（含模拟的前缀缓存命中 Token），GET /stats 查看请求统计
+
+使用方式：
+    # 启动替身服务
+    python llm_stub.py --port 8900 --latency 1.5 --latency-dist lognormal --rpm 60
+
+    # 让分析流程指向替身服务（不配置 GEMINI_API_KEY 即使用 OpenAI 兼容 API）
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=sk-local-stub OPENAI_MODEL=stub python main.py
+
+    # 内置压测：启动替身服务并用 GeminiAnalyzer 并发分析 N 只模拟股票，输出吞吐与流控指标
+    python llm_stub.py --bench 50 --workers 8 --rpm 120
+
+说明：
+- 仅依赖标准库（http.server），不访问任何外部服务
+- 响应内容为随机生成的占位结论，只用于验证并发、重试、解析流程，不具备分析意义
+"""
+
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List, Tuple
+
+from llm_output import ANALYSIS_SCHEMA
+from prompt_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# 提示词中的股票标识：单股 "请为 **名称(代码)**"，批量 "【第 i/n 只】名称(代码)"
+_SINGLE_PATTERN = re.compile(r'请为 \*\*(.+?)\((\w+)\)\*\*')
+_BATCH_PATTERN = re.compile(r'【第 \d+/\d+ 只】(.+?)\((\w+)\)')
+
+# 前缀缓存的最小长度与粒度（与 OpenAI 自动前缀缓存一致）
+_CACHE_MIN_TOKENS = 1024
+_CACHE_BLOCK_TOKENS = 128
+
+_ADVICES = ['买入', '加仓', '持有', '观望', '减仓', '卖出']
+_TRENDS = ['强烈看多', '看多', '震荡', '看空', '强烈看空']
+
+
+# ========== 响应内容 ==========
+
+def _sample_value(schema: Dict[str, Any], key: str, rng: random.Random) -> Any:
+    """按 Schema 生成占位值（字段顺序与 Schema 一致，核心结论字段在前）"""
+    kind = schema.get('type')
+    if kind == 'OBJECT':
+        return {k: _sample_value(v, k, rng) for k, v in schema.get('properties', {}).items()}
+    if kind == 'ARRAY':
+        return [_sample_value(schema['items'], key, rng) for _ in range(2)]
+    if kind == 'INTEGER':
+        return rng.randint(0, 100)
+    if kind == 'NUMBER':
+        return round(rng.uniform(1, 100), 2)
+    if kind == 'BOOLEAN':
+        return rng.random() < 0.5
+    return f"[替身] {key}"
+
+
+def make_analysis(code: str, name: str, rng: random.Random) -> Dict[str, Any]:
+    """生成一份符合 ANALYSIS_SCHEMA 的决策仪表盘"""
+    data = _sample_value(ANALYSIS_SCHEMA, '', rng)
+    score = data['sentiment_score']
+    data['operation_advice'] = _ADVICES[min(int((100 - score) / 100 * len(_ADVICES)), len(_ADVICES) - 1)]
+    data['trend_prediction'] = _TRENDS[min(int((100 - score) / 100 * len(_TRENDS)), len(_TRENDS) - 1)]
+    data['confidence_level'] = rng.choice(['高', '中', '低'])
+    data['analysis_summary'] = f"[替身] {name}({code}) 占位结论，评分 {score}"
+    data['search_performed'] = False
+    return data
+
+
+def make_response_content(prompt: str, rng: random.Random) -> str:
+    """根据提示词生成响应文本（批量提示词返回数组）"""
+    batch = _BATCH_PATTERN.findall(prompt)
+    if batch:
+        items = [dict(code=code, **make_analysis(code, name, rng)) for name, code in batch]
+        return json.dumps(items, ensure_ascii=False)
+    match = _SINGLE_PATTERN.search(prompt)
+    name, code = match.groups() if match else ('未知', 'Unknown')
+    return json.dumps(make_analysis(code, name, rng), ensure_ascii=False)
+
+
+# ========== 替身服务 ==========
+
+class StubBehavior:
+    """
+    替身服务的行为配置与统计
+
+    耗时分布（latency 为均值，秒）：
+    - fixed:       恒定
+    - uniform:     [0, 2 × latency] 均匀分布
+    - exponential: 指数分布（长尾）
+    - lognormal:   对数正态分布（sigma 控制长尾程度）
+    """
+
+    def __init__(
+        self,
+        latency: float = 1.0,
+        latency_dist: str = 'lognormal',
+        sigma: float = 0.5,
+        error_rate: float = 0.0,
+        server_error_rate: float = 0.0,
+        rpm: int = 0,
+        retry_after: float = 2.0,
+        chunk_chars: int = 40,
+        seed: Optional[int] = None
+    ):
+        """
+        Args:
+            latency: 平均响应耗时（秒）
+            latency_dist: 耗时分布（fixed / uniform / exponential / lognormal）
+            sigma: 对数正态分布的 sigma
+            error_rate: 随机注入 429 的概率
+            server_error_rate: 随机注入 500 的概率
+            rpm: 每分钟请求配额（超出返回 429，0 表示不限制）
+            retry_after: 429 响应的 Retry-After（秒）
+            chunk_chars: 流式响应每个片段的字符数
+            seed: 随机种子
+        """
+        self.latency = latency
+        self.latency_dist = latency_dist
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.chunk_chars = max(chunk_chars, 1)
+        self._rng = random.Random(seed)
+        self._window: deque = deque()
+        self._prefixes = set()
+        self._stats = {'requests': 0, 'ok': 0, 'rate_limited': 0, 'server_errors': 0, 'streamed': 0, 'in_flight': 0}
+        self._max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def sample_latency(self) -> float:
+        """按配置的分布抽取一次响应耗时"""
+        with self._lock:
+            rng = self._rng
+            if self.latency_dist == 'fixed':
+                return self.latency
+            if self.latency_dist == 'uniform':
+                return rng.uniform(0, 2 * self.latency)
+            if self.latency_dist == 'exponential':
+                return rng.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+            # 对数正态：均值为 latency
+            mu = -self.sigma ** 2 / 2
+            return self.latency * rng.lognormvariate(mu, self.sigma)
+
+    def admit(self) -> Optional[int]:
+        """
+        判断请求是否放行
+
+        Returns:
+            None 放行；否则为应返回的错误状态码（429 / 500）
+        """
+        with self._lock:
+            self._stats['requests'] += 1
+            now = time.monotonic()
+            while self._window and now - self._window[0] > 60:
+                self._window.popleft()
+            if self.rpm > 0 and len(self._window) >= self.rpm:
+                self._stats['rate_limited'] += 1
+                return 429
+            if self._rng.random() < self.error_rate:
+                self._stats['rate_limited'] += 1
+                return 429
+            if self._rng.random() < self.server_error_rate:
+                self._stats['server_errors'] += 1
+                return 500
+            self._window.append(now)
+            self._stats['in_flight'] += 1
+            self._max_in_flight = max(self._max_in_flight, self._stats['in_flight'])
+            return None
+
+    def finish(self, streamed: bool) -> None:
+        """请求处理完成"""
+        with self._lock:
+            self._stats['in_flight'] -= 1
+            self._stats['ok'] += 1
+            if streamed:
+                self._stats['streamed'] += 1
+
+    def content(self, prompt: str) -> str:
+        """生成响应文本"""
+        with self._lock:
+            seed = self._rng.random()
+        return make_response_content(prompt, random.Random(seed))
+
+    def usage(self, messages: List[Dict[str, Any]], completion: str) -> Dict[str, Any]:
+        """
+        模拟 usage：系统消息与此前请求相同且足够长时，计为前缀缓存命中（按 128 Token 取整）
+        """
+        system = ''.join(str(m.get('content', '')) for m in messages if m.get('role') == 'system')
+        prompt_tokens = sum(estimate_tokens(str(m.get('content', ''))) for m in messages)
+        system_tokens = estimate_tokens(system)
+        digest = hashlib.sha1(system.encode('utf-8')).hexdigest()
+        with self._lock:
+            hit = digest in self._prefixes
+            self._prefixes.add(digest)
+        cached = 0
+        if hit and system_tokens >= _CACHE_MIN_TOKENS:
+            cached = system_tokens // _CACHE_BLOCK_TOKENS * _CACHE_BLOCK_TOKENS
+        completion_tokens = estimate_tokens(completion)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': cached},
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """请求统计"""
+        with self._lock:
+            return dict(self._stats, max_in_flight=self._max_in_flight)
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """OpenAI chat-completions 协议的请求处理器"""
+
+    behavior: StubBehavior = None  # type: ignore
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:
+        """GET /stats 请求统计；GET /v1/models 模型列表"""
+        if self.path.rstrip('/').endswith('/stats'):
+            self._send_json(200, self.behavior.get_stats())
+        elif self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'stub', 'object': 'model', 'owned_by': 'local'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self) -> None:
+        """POST /v1/chat/completions"""
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': {'message': 'invalid JSON body', 'type': 'invalid_request_error'}})
+            return
+
+        status = self.behavior.admit()
+        if status == 429:
+            self._send_json(
+                429,
+                {'error': {'message': 'Rate limit reached (stub)', 'type': 'rate_limit_exceeded'}},
+                headers={'retry-after': f"{self.behavior.retry_after:g}"},
+            )
+            return
+        if status == 500:
+            self._send_json(500, {'error': {'message': 'Internal error (stub)', 'type': 'server_error'}})
+            return
+
+        stream = bool(body.get('stream'))
+        try:
+            messages = body.get('messages') or []
+            prompt = ''.join(str(m.get('content', '')) for m in messages if m.get('role') == 'user')
+            content = self.behavior.content(prompt)
+            usage = self.behavior.usage(messages, content)
+            model = body.get('model') or 'stub'
+            latency = self.behavior.sample_latency()
+            if stream:
+                include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+                self._send_stream(model, content, usage if include_usage else None, latency)
+            else:
+                time.sleep(latency)
+                self._send_json(200, {
+                    'id': f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': content},
+                        'finish_reason': 'stop',
+                    }],
+                    'usage': usage,
+                })
+        finally:
+            self.behavior.finish(stream)
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model: str, content: str, usage: Optional[Dict[str, Any]], latency: float) -> None:
+        """SSE 流式响应：首个片段前等待 latency 的一半，其余时间均摊到各片段"""
+        chunks = [content[i:i + self.behavior.chunk_chars] for i in range(0, len(content), self.behavior.chunk_chars)]
+        interval = latency / 2 / max(len(chunks), 1)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(choices: List[Dict[str, Any]], extra: Optional[Dict[str, Any]] = None) -> None:
+            payload = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                       'model': model, 'choices': choices, **(extra or {})}
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            time.sleep(latency / 2)
+            event([{'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}])
+            for chunk in chunks:
+                event([{'index': 0, 'delta': {'content': chunk}, 'finish_reason': None}])
+                time.sleep(interval)
+            event([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+            if usage is not None:
+                event([], {'usage': usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("[LLM替身] 客户端提前断开流式连接")
+
+    def log_message(self, fmt: str, *args) -> None:
+        """使用 logging 输出访问日志"""
+        logger.debug(f"[LLM替身] {self.address_string()} - {fmt % args}")
+
+
+class StubServer:
+    """
+    LLM 替身服务
+
+    使用方式：
+        server = StubServer(StubBehavior(latency=0.5, rpm=60), port=0)
+        server.start_background()
+        print(server.base_url)  # http://127.0.0.1:xxxxx/v1
+        server.stop()
+    """
+
+    def __init__(self, behavior: StubBehavior, host: str = '127.0.0.1', port: int = 8900):
+        handler = type('BoundStubRequestHandler', (StubRequestHandler,), {'behavior': behavior})
+        self.behavior = behavior
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """填入 OPENAI_BASE_URL 的地址"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def run(self) -> None:
+        """前台运行（阻塞）"""
+        logger.info(f"[LLM替身] 服务已启动: {self.base_url}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def start_background(self) -> None:
+        """后台线程运行"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='llm_stub', daemon=True)
+        self._thread.start()
+        logger.info(f"[LLM替身] 服务已在后台启动: {self.base_url}")
+
+    def stop(self) -> None:
+        """停止服务"""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _synthetic_context(index: int) -> Tuple[Dict[str, Any], str]:
+    """压测用的模拟股票上下文"""
+    code = f"{600000 + index:06d}"
+    close = round(10 + index % 50, 2)
+    context = {
+        'code': code,
+        'stock_name': f"模拟{index}",
+        'date': time.strftime('%Y-%m-%d'),
+        'today': {'close': close, 'open': close, 'high': close * 1.02, 'low': close * 0.98, 'pct_chg': 0.5,
+                  'ma5': close, 'ma10': close * 0.99, 'ma20': close * 0.97},
+        'ma_status': '多头排列',
+    }
+    news = f"  1. 模拟{index} 经营情况公告 [{time.strftime('%Y-%m-%d')}]\n     替身压测使用的模拟新闻摘要"
+    return context, news
+
+
+def run_benchmark(server: StubServer, count: int, workers: int) -> None:
+    """
+    用 GeminiAnalyzer（OpenAI 兼容模式）并发分析 count 只模拟股票，输出吞吐、耗时与流控指标
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from analyzer import GeminiAnalyzer
+    from config import get_config
+    from llm_control import get_all_stats
+    from prompt_cache import get_context_cache
+
+    config = get_config()
+    config.gemini_api_key = None
+    config.openai_api_key = 'sk-local-stub-key'
+    config.openai_base_url = server.base_url
+    config.openai_model = 'stub'
+    analyzer = GeminiAnalyzer()
+
+    items = [_synthetic_context(i) for i in range(count)]
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda item: analyzer.analyze(item[0], item[1]), items))
+    elapsed = time.monotonic() - start
+
+    ok = sum(1 for r in results if r.success)
+    latencies = sorted(r.latency for r in results if r.success and r.latency is not None)
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    print(f"\n压测完成: 成功 {ok}/{count}，耗时 {elapsed:.1f}s，吞吐 {ok / elapsed * 60:.1f} 只/分钟，"
+          f"单股耗时 P50 {p50:.2f}s / P95 {p95:.2f}s")
+    print(f"替身服务: {server.behavior.get_stats()}")
+    for name, stats in get_all_stats().items():
+        print(f"LLM 流控[{name}]: {stats}")
+    for provider, stats in get_context_cache().get_stats().items():
+        print(f"LLM 提示词缓存[{provider}]: {stats}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='本地 OpenAI 兼容 LLM 替身服务（离线压测）')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8900, help='监听端口（0 表示随机）')
+    parser.add_argument('--latency', type=float, default=1.0, help='平均响应耗时（秒）')
+    parser.add_argument('--latency-dist', type=str, default='lognormal',
+                        choices=['fixed', 'uniform', 'exponential', 'lognormal'], help='响应耗时分布')
+    parser.add_argument('--sigma', type=float, default=0.5, help='对数正态分布的 sigma（越大长尾越明显）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机注入 429 的概率')
+    parser.add_argument('--server-error-rate', type=float, default=0.0, help='随机注入 500 的概率')
+    parser.add_argument('--rpm', type=int, default=0, help='每分钟请求配额，超出返回 429（0 表示不限制）')
+    parser.add_argument('--retry-after', type=float, default=2.0, help='429 响应的 Retry-After（秒）')
+    parser.add_argument('--chunk-chars', type=int, default=40, help='流式响应每个片段的字符数')
+    parser.add_argument('--seed', type=int, help='随机种子')
+    parser.add_argument('--bench', type=int, metavar='N', help='启动后用 GeminiAnalyzer 并发分析 N 只模拟股票')
+    parser.add_argument('--workers', type=int, default=8, help='压测并发线程数')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    stub = StubServer(
+        StubBehavior(
+            latency=args.latency,
+            latency_dist=args.latency_dist,
+            sigma=args.sigma,
+            error_rate=args.error_rate,
+            server_error_rate=args.server_error_rate,
+            rpm=args.rpm,
+            retry_after=args.retry_after,
+            chunk_chars=args.chunk_chars,
+            seed=args.seed,
+        ),
+        host=args.host,
+        port=0 if args.bench and args.port == 8900 else args.port,
+    )
+    if args.bench:
+        stub.start_background()
+        try:
+            run_benchmark(stub, args.bench, args.workers)
+        finally:
+            stub.stop()
+    else:
+        stub.run()
@@ -31,6 +31,7 @@ if os.getenv("GITHUB_ACTIONS") != "true":
     pass
 
 import argparse
+import asyncio
 import logging
 import sys
 import time
@@ -38,7 +39,7 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, date, timezone, timedelta
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from feishu_doc import FeishuDocManager
 
 from config import get_config, Config
@@ -46,10 +47,18 @@ from storage import get_db, DatabaseManager
 from data_provider import DataFetcherManager
 from data_provider.akshare_fetcher import AkshareFetcher, RealtimeQuote, ChipDistribution
 from analyzer import GeminiAnalyzer, AnalysisResult, STOCK_NAME_MAP
+from change_gate import ChangeGate
 from notification import NotificationService, NotificationChannel, send_daily_report
 from search_service import SearchService, SearchResponse
 from enums import ReportType
-from stock_analyzer import StockTrendAnalyzer, TrendAnalysisResult
+from stock_analyzer import StockTrendAnalyzer, TrendAnalysisResult, TrendState
+from indicators import IndicatorEngine, LOOKBACK_BARS, describe_indicators
+from llm_control import get_all_stats
+from llm_accounting import get_llm_accounting
+from llm_hedge import get_hedge_policy
+from llm_quota import get_quota_manager
+from llm_output import get_output_budget
+from prompt_cache import get_context_cache
 from market_analyzer import MarketAnalyzer
 
 # 配置日志格式
@@ -135,7 +144,8 @@ class StockAnalysisPipeline:
     def __init__(
         self,
         config: Optional[Config] = None,
-        max_workers: Optional[int] = None
+        max_workers: Optional[int] = None,
+        on_partial: Optional[Callable[[str, Dict[str, Any]], None]] = None
     ):
         """
         初始化调度器
@@ -143,18 +153,31 @@ class StockAnalysisPipeline:
         Args:
             config: 配置对象（可选，默认使用全局配置）
             max_workers: 最大并发线程数（可选，默认从配置读取）
+            on_partial: 流式模式下 AI 结果字段到达时的回调 (股票代码, 已完成字段)，
+                        用于在完整报告生成前提前展示评分与操作建议（如 Web 任务状态）
         """
         self.config = config or get_config()
         self.max_workers = max_workers or self.config.max_workers
+        self.on_partial = on_partial
         
         # 初始化各模块
         self.db = get_db()
         self.fetcher_manager = DataFetcherManager()
         self.akshare_fetcher = AkshareFetcher()  # 用于获取增强数据（量比、筹码等）
         self.trend_analyzer = StockTrendAnalyzer()  # 趋势分析器
+        self.indicator_engine = IndicatorEngine()  # 技术指标（MACD/RSI/KDJ/BOLL/ATR）
         self.analyzer = GeminiAnalyzer()
         self.notifier = NotificationService()
         
+        # 变更门控：输入无实质变化时复用上次 AI 结论
+        self.change_gate: Optional[ChangeGate] = None
+        if self.config.analysis_reuse_enabled:
+            self.change_gate = ChangeGate(
+                self.db,
+                price_pct=self.config.analysis_reuse_price_pct,
+                max_age_hours=self.config.analysis_reuse_max_age_hours,
+            )
+        
         # 初始化搜索服务
         self.search_service = SearchService(
             bocha_keys=self.config.bocha_api_keys,
@@ -233,6 +256,58 @@ class StockAnalysisPipeline:
         Returns:
             AnalysisResult 或 None（如果分析失败）
         """
+        prepared = self.prepare_analysis(code)
+        if prepared is None:
+            return None
+        
+        # Step 7: 调用 AI 分析（传入增强的上下文和新闻）；输入无实质变化时复用上次结论
+        enhanced_context, news_context = prepared
+        reused = self._reuse_previous(code, enhanced_context, news_context)
+        if reused is not None:
+            return reused
+        
+        result = self.analyzer.analyze(enhanced_context, news_context=news_context, on_partial=self.on_partial)
+        self._remember_analysis(code, enhanced_context, news_context, result)
+        return result
+    
+    def _reuse_previous(
+        self,
+        code: str,
+        enhanced_context: Dict[str, Any],
+        news_context: Optional[str]
+    ) -> Optional[AnalysisResult]:
+        """变更门控：输入相对上次分析无实质变化时返回上次结论（未启用时返回 None）"""
+        if self.change_gate is None:
+            return None
+        try:
+            return self.change_gate.check(code, enhanced_context, news_context)
+        except Exception as e:
+            logger.warning(f"[{code}] 变更门控检查失败，照常分析: {e}")
+            return None
+    
+    def _remember_analysis(
+        self,
+        code: str,
+        enhanced_context: Dict[str, Any],
+        news_context: Optional[str],
+        result: Optional[AnalysisResult]
+    ) -> None:
+        """保存本次 AI 分析的输入指纹，供下次变更门控比较"""
+        if self.change_gate is not None and result is not None:
+            self.change_gate.remember(code, enhanced_context, news_context, result)
+    
+    def prepare_analysis(self, code: str) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+        """
+        准备单只股票的 AI 分析输入（analyze_stock 的第 1-6 步）
+        
+        与 AI 调用分离，便于批量模式先并发准备多只股票，再合并为少量请求
+        
+        Args:
+            code: 股票代码
+            
+        Returns:
+            (增强上下文, 新闻内容)，无法获取上下文时返回 None
+        """
         try:
             # 获取股票名称（优先从实时行情获取真实名称）
             stock_name = STOCK_NAME_MAP.get(code, '')
@@ -264,22 +339,23 @@ class StockAnalysisPipeline:
             except Exception as e:
                 logger.warning(f"[{code}] 获取筹码分布失败: {e}")
             
-            # Step 3: 趋势分析（基于交易理念）
+            # Step 3: 趋势分析（基于交易理念，增量状态）
             trend_result: Optional[TrendAnalysisResult] = None
             try:
-                # 获取历史数据进行趋势分析
-                context = self.db.get_analysis_context(code)
-                if context and 'raw_data' in context:
-                    import pandas as pd
-                    raw_data = context['raw_data']
-                    if isinstance(raw_data, list) and len(raw_data) > 0:
-                        df = pd.DataFrame(raw_data)
-                        trend_result = self.trend_analyzer.analyze(df, code)
-                        logger.info(f"[{code}] 趋势分析: {trend_result.trend_status.value}, "
-                                  f"买入信号={trend_result.buy_signal.value}, 评分={trend_result.signal_score}")
+                trend_result = self._analyze_trend(code)
+                if trend_result:
+                    logger.info(f"[{code}] 趋势分析: {trend_result.trend_status.value}, "
+                              f"买入信号={trend_result.buy_signal.value}, 评分={trend_result.signal_score}")
             except Exception as e:
                 logger.warning(f"[{code}] 趋势分析失败: {e}")
             
+            # Step 3.5: 技术指标（MACD/RSI/KDJ/BOLL/ATR）
+            indicators: Optional[Dict[str, Any]] = None
+            try:
+                indicators = self._calculate_indicators(code)
+            except Exception as e:
+                logger.warning(f"[{code}] 技术指标计算失败: {e}")
+            
             # Step 4: 多维度情报搜索（最新消息+风险排查+业绩预期）
             news_context = None
             if self.search_service.is_available:
@@ -316,31 +392,95 @@ class StockAnalysisPipeline:
                 realtime_quote, 
                 chip_data, 
                 trend_result,
-                stock_name  # 传入股票名称
+                stock_name,  # 传入股票名称
+                indicators=indicators,
             )
             
-            # Step 7: 调用 AI 分析（传入增强的上下文和新闻）
-            result = self.analyzer.analyze(enhanced_context, news_context=news_context)
-            
-            return result
+            return enhanced_context, news_context
             
         except Exception as e:
             logger.error(f"[{code}] 分析失败: {e}")
             logger.exception(f"[{code}] 详细错误信息:")
             return None
     
+    def _analyze_trend(self, code: str) -> Optional[TrendAnalysisResult]:
+        """
+        基于增量状态的趋势分析
+        
+        1. 读取持久化的 TrendState；不存在，或上一根已收盘 K 线的收盘价与数据库不一致
+           （历史 K 线被改写，如除权后的前复权价格）时，用最近 SEED_BARS 根 K 线冷启动
+        2. 只推送状态最新日期及之后的 K 线（同日数据覆盖，新日期追加）
+        3. 保存状态并生成 TrendAnalysisResult
+        
+        Args:
+            code: 股票代码
+            
+        Returns:
+            TrendAnalysisResult，无数据时返回 None
+        """
+        state = None
+        state_data = self.db.get_trend_state(code)
+        if state_data:
+            state = TrendState.from_dict(state_data)
+            # 从上一根已收盘 K 线读起：首行用于校验，其余为最新日期及之后的 K 线
+            check_date = state.prev_date or state.last_date
+            bars = self.db.get_data_range(code, date.fromisoformat(check_date), date.today())
+            if not bars or not state.matches(bars[0].date, bars[0].close):
+                logger.info(f"[{code}] 历史 K 线已变化（如除权复权），趋势状态冷启动")
+                state = None
+            else:
+                bars = bars[1:]
+        
+        if state is None:
+            state = TrendState(code)
+            bars = list(reversed(self.db.get_latest_data(code, days=TrendState.SEED_BARS)))
+        
+        if not bars and state.bar_count == 0:
+            return None
+        
+        for bar in bars:
+            state.update(bar.date, bar.close, bar.high, bar.low, bar.volume)
+        
+        if bars:
+            self.db.save_trend_state(code, date.fromisoformat(state.last_date), state.to_dict())
+        
+        return self.trend_analyzer.analyze_state(state)
+    
+    def _calculate_indicators(self, code: str) -> Optional[Dict[str, Any]]:
+        """
+        计算最新技术指标（按 代码+最新日期 缓存，重复分析同一股票不重复计算）
+        
+        Args:
+            code: 股票代码
+            
+        Returns:
+            指标字典（含解读文本 'desc'），无数据时返回 None
+        """
+        import pandas as pd
+        
+        bars = self.db.get_latest_data(code, days=LOOKBACK_BARS)
+        if not bars:
+            return None
+        
+        df = pd.DataFrame([bar.to_dict() for bar in bars])
+        values = self.indicator_engine.latest_for(code, df)
+        if values is None:
+            return None
+        return dict(values, desc=describe_indicators(values))
+    
     def _enhance_context(
         self,
         context: Dict[str, Any],
         realtime_quote: Optional[RealtimeQuote],
         chip_data: Optional[ChipDistribution],
         trend_result: Optional[TrendAnalysisResult],
-        stock_name: str = ""
+        stock_name: str = "",
+        indicators: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         增强分析上下文
         
-        将实时行情、筹码分布、趋势分析结果、股票名称添加到上下文中
+        将实时行情、筹码分布、趋势分析结果、技术指标、股票名称添加到上下文中
         
         Args:
             context: 原始上下文
@@ -348,6 +488,7 @@ class StockAnalysisPipeline:
             chip_data: 筹码分布数据
             trend_result: 趋势分析结果
             stock_name: 股票名称
+            indicators: 技术指标（MACD/RSI/KDJ/BOLL/ATR）
             
         Returns:
             增强后的上下文
@@ -402,6 +543,10 @@ class StockAnalysisPipeline:
                 'risk_factors': trend_result.risk_factors,
             }
         
+        # 添加技术指标
+        if indicators:
+            enhanced['indicators'] = indicators
+        
         return enhanced
     
     def _describe_volume_ratio(self, volume_ratio: float) -> str:
@@ -468,30 +613,7 @@ class StockAnalysisPipeline:
             result = self.analyze_stock(code)
             
             if result:
-                logger.info(
-                    f"[{code}] 分析完成: {result.operation_advice}, "
-                    f"评分 {result.sentiment_score}"
-                )
-                
-                # 单股推送模式（#55）：每分析完一只股票立即推送
-                if single_stock_notify and self.notifier.is_available():
-                    try:
-                        # 根据报告类型选择生成方法
-                        if report_type == ReportType.FULL:
-                            # 完整报告：使用决策仪表盘格式
-                            report_content = self.notifier.generate_dashboard_report([result])
-                            logger.info(f"[{code}] 使用完整报告格式")
-                        else:
-                            # 精简报告：使用单股报告格式（默认）
-                            report_content = self.notifier.generate_single_stock_report(result)
-                            logger.info(f"[{code}] 使用精简报告格式")
-                        
-                        if self.notifier.send(report_content):
-                            logger.info(f"[{code}] 单股推送成功")
-                        else:
-                            logger.warning(f"[{code}] 单股推送失败")
-                    except Exception as e:
-                        logger.error(f"[{code}] 单股推送异常: {e}")
+                self._on_result(result, single_stock_notify, report_type)
             
             return result
             
@@ -500,6 +622,146 @@ class StockAnalysisPipeline:
             logger.exception(f"[{code}] 处理过程发生未知异常: {e}")
             return None
     
+    def _on_result(
+        self,
+        result: AnalysisResult,
+        single_stock_notify: bool = False,
+        report_type: ReportType = ReportType.SIMPLE
+    ) -> None:
+        """记录单只股票分析结果，单股推送模式（#55）下立即推送"""
+        code = result.code
+        logger.info(
+            f"[{code}] 分析完成: {result.operation_advice}, "
+            f"评分 {result.sentiment_score}"
+        )
+        
+        # 单股推送模式（#55）：每分析完一只股票立即推送
+        if single_stock_notify and self.notifier.is_available():
+            try:
+                # 根据报告类型选择生成方法
+                if report_type == ReportType.FULL:
+                    # 完整报告：使用决策仪表盘格式
+                    report_content = self.notifier.generate_dashboard_report([result])
+                    logger.info(f"[{code}] 使用完整报告格式")
+                else:
+                    # 精简报告：使用单股报告格式（默认）
+                    report_content = self.notifier.generate_single_stock_report(result)
+                    logger.info(f"[{code}] 使用精简报告格式")
+                
+                if self.notifier.send(report_content):
+                    logger.info(f"[{code}] 单股推送成功")
+                else:
+                    logger.warning(f"[{code}] 单股推送失败")
+            except Exception as e:
+                logger.error(f"[{code}] 单股推送异常: {e}")
+    
+    def prepare_single_stock(self, code: str) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+        """
+        批量模式下的单股准备流程：获取并保存数据 + 准备 AI 分析输入（不调用 AI）
+        
+        此方法会被线程池调用，需要处理好异常
+        """
+        logger.info(f"========== 开始准备 {code} ==========")
+        try:
+            success, error = self.fetch_and_save_stock_data(code)
+            if not success:
+                logger.warning(f"[{code}] 数据获取失败: {error}")
+                # 即使获取失败，也尝试用已有数据分析
+            return self.prepare_analysis(code)
+        except Exception as e:
+            logger.exception(f"[{code}] 准备过程发生未知异常: {e}")
+            return None
+    
+    def _run_batched(self, stock_codes: List[str], single_stock_notify: bool) -> List[AnalysisResult]:
+        """
+        批量分析模式（LLM_BATCH_SIZE > 1）
+        
+        1. 线程池并发获取数据、搜索情报、构建上下文
+        2. 按 Token 预算将多只股票合并为少量 AI 请求
+        """
+        prepared: Dict[str, Tuple[Dict[str, Any], Optional[str]]] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_code = {
+                executor.submit(self.prepare_single_stock, code): code
+                for code in stock_codes
+            }
+            for future in as_completed(future_to_code):
+                code = future_to_code[future]
+                try:
+                    item = future.result()
+                    if item:
+                        prepared[code] = item
+                except Exception as e:
+                    logger.error(f"[{code}] 任务执行失败: {e}")
+        
+        # 变更门控：可复用的股票不进入批量请求
+        by_code: Dict[str, AnalysisResult] = {}
+        ordered = []
+        for code in stock_codes:
+            if code not in prepared:
+                continue
+            reused = self._reuse_previous(code, *prepared[code])
+            if reused is not None:
+                by_code[code] = reused
+            else:
+                ordered.append((code, prepared[code]))
+        
+        if ordered:
+            analyzed = self.analyzer.batch_analyze(
+                [context for _, (context, _) in ordered],
+                news_contexts=[news for _, (_, news) in ordered],
+            )
+            for (code, (context, news)), result in zip(ordered, analyzed):
+                self._remember_analysis(code, context, news, result)
+                by_code[code] = result
+        
+        results = [by_code[code] for code in stock_codes if code in by_code]
+        for result in results:
+            self._on_result(result, single_stock_notify)
+        return results
+    
+    def _run_async(self, stock_codes: List[str], single_stock_notify: bool) -> List[AnalysisResult]:
+        """
+        异步分析模式（LLM_ASYNC=true）
+        
+        数据获取与情报搜索仍在线程池中执行（阻塞 I/O），
+        AI 请求在同一事件循环上并发等待，不再每个请求占用一个工作线程
+        """
+        return asyncio.run(self._analyze_all_async(stock_codes, single_stock_notify))
+    
+    async def _analyze_all_async(self, stock_codes: List[str], single_stock_notify: bool) -> List[AnalysisResult]:
+        """并发处理全部股票：准备阶段交给线程池，AI 分析在事件循环上 await"""
+        loop = asyncio.get_running_loop()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            async def process(code: str) -> Optional[AnalysisResult]:
+                try:
+                    prepared = await loop.run_in_executor(executor, self.prepare_single_stock, code)
+                    if prepared is None:
+                        return None
+                    enhanced_context, news_context = prepared
+                    # 复用判断与快照保存读写数据库（同步 SQLAlchemy），放回线程池，不阻塞事件循环上的 AI 请求
+                    result = await loop.run_in_executor(
+                        executor, self._reuse_previous, code, enhanced_context, news_context
+                    )
+                    if result is None:
+                        result = await self.analyzer.analyze_async(
+                            enhanced_context, news_context=news_context, on_partial=self.on_partial
+                        )
+                        await loop.run_in_executor(
+                            executor, self._remember_analysis, code, enhanced_context, news_context, result
+                        )
+                    # 单股推送为阻塞网络请求，放回线程池
+                    await loop.run_in_executor(executor, self._on_result, result, single_stock_notify)
+                    return result
+                except Exception as e:
+                    logger.error(f"[{code}] 任务执行失败: {e}")
+                    return None
+            
+            results = await asyncio.gather(*(process(code) for code in stock_codes))
+        
+        return [result for result in results if result]
+    
     def run(
         self, 
         stock_codes: Optional[List[str]] = None,
@@ -545,29 +807,48 @@ class StockAnalysisPipeline:
         
         results: List[AnalysisResult] = []
         
-        # 使用线程池并发处理
-        # 注意：max_workers 设置较低（默认3）以避免触发反爬
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # 提交任务
-            future_to_code = {
-                executor.submit(
-                    self.process_single_stock, 
-                    code, 
-                    skip_analysis=dry_run,
-                    single_stock_notify=single_stock_notify and send_notification
-                ): code
-                for code in stock_codes
-            }
-            
-            # 收集结果
-            for future in as_completed(future_to_code):
-                code = future_to_code[future]
-                try:
-                    result = future.result()
-                    if result:
-                        results.append(result)
-                except Exception as e:
-                    logger.error(f"[{code}] 任务执行失败: {e}")
+        if not dry_run and self.search_service.is_available:
+            self._log_search_forecast(len(stock_codes))
+        
+        # 对冲请求的次数预算按轮计算
+        if self.config.llm_hedge:
+            get_hedge_policy().reset_run()
+        
+        # 调用记账按轮汇总
+        run_id = get_llm_accounting().start_run()
+        self.analyzer.run_id = run_id
+        
+        # 批量模式：先并发准备全部股票，再合并为少量 AI 请求
+        if not dry_run and self.config.llm_batch_size > 1:
+            logger.info(f"已启用 AI 批量分析：每次请求最多 {self.config.llm_batch_size} 只股票")
+            results = self._run_batched(stock_codes, single_stock_notify and send_notification)
+        elif not dry_run and self.config.llm_async:
+            logger.info("已启用异步 AI 分析：AI 请求在事件循环上并发，不占用工作线程")
+            results = self._run_async(stock_codes, single_stock_notify and send_notification)
+        else:
+            # 使用线程池并发处理
+            # 注意：max_workers 设置较低（默认3）以避免触发反爬
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # 提交任务
+                future_to_code = {
+                    executor.submit(
+                        self.process_single_stock, 
+                        code, 
+                        skip_analysis=dry_run,
+                        single_stock_notify=single_stock_notify and send_notification
+                    ): code
+                    for code in stock_codes
+                }
+                
+                # 收集结果
+                for future in as_completed(future_to_code):
+                    code = future_to_code[future]
+                    try:
+                        result = future.result()
+                        if result:
+                            results.append(result)
+                    except Exception as e:
+                        logger.error(f"[{code}] 任务执行失败: {e}")
         
         # 统计
         elapsed_time = time.time() - start_time
@@ -584,6 +865,74 @@ class StockAnalysisPipeline:
         logger.info(f"===== 分析完成 =====")
         logger.info(f"成功: {success_count}, 失败: {fail_count}, 耗时: {elapsed_time:.2f} 秒")
         
+        cache_stats = self.db.get_cache_stats()
+        logger.info(
+            f"近期数据缓存: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']} "
+            f"(命中率 {cache_stats['hit_rate']:.1%}，缓存 {cache_stats['size']}/{cache_stats['capacity']} 只)"
+        )
+        
+        for name, stats in get_all_stats().items():
+            logger.info(
+                f"LLM 流控[{name}]: 并发上限 {stats['limit']}，成功 {stats['successes']}，"
+                f"限流 {stats['rate_limited']}，吞吐 {stats['throughput_per_min']:.1f} 次/分钟，"
+                f"平均耗时 {stats['avg_latency']:.1f}s"
+            )
+        
+        if self.change_gate is not None:
+            gate_stats = self.change_gate.get_stats()
+            logger.info(
+                f"变更门控: 检查 {gate_stats['checked']} 只，复用上次结论 {gate_stats['reused']} 只"
+                f"（节省 {gate_stats['reused']} 次 LLM 调用）"
+            )
+        
+        for kind, stats in get_output_budget().get_stats().items():
+            logger.info(
+                f"LLM 输出[{kind}]: 解析 {stats['parsed']} 次，失败率 {stats['parse_failure_rate']:.1%} "
+                f"{stats['parse_outcomes']}，输出 P95 {stats['p95_tokens']} Token，截断 {stats['truncated']} 次"
+            )
+        
+        context_cache = get_context_cache()
+        for provider, stats in context_cache.get_stats().items():
+            logger.info(
+                f"LLM 提示词缓存[{provider}]: 命中 {stats['hits']}/{stats['requests']} 次，"
+                f"缓存输入 {stats['cached_tokens']}/{stats['prompt_tokens']} Token ({stats['cached_ratio']:.1%})，"
+                f"估算节省耗时 {stats['saved_latency']:.1f}s"
+            )
+        
+        if self.config.llm_hedge:
+            hedge_stats = get_hedge_policy().get_stats()
+            logger.info(
+                f"LLM 对冲: 本轮 {hedge_stats['hedged_this_run']}/{hedge_stats['max_per_run'] or '不限'} 次，"
+                f"累计主模型胜出 {hedge_stats['primary_wins']}、备选胜出 {hedge_stats['hedge_wins']}，"
+                f"当前等待时间 {hedge_stats['delay']:.1f}s"
+            )
+        
+        self._log_llm_accounting(run_id)
+        
+        quota = get_quota_manager()
+        if quota.enabled:
+            for model, stats in quota.get_stats().items():
+                logger.info(
+                    f"LLM 配额[{model}]: 今日 {stats['day_requests']} 次 / {stats['day_tokens']} Token，"
+                    f"排队 {stats['waited']} 次共 {stats['wait_seconds']:.1f}s，超出每日上限 {stats['rejected']} 次"
+                )
+        
+        if self.config.search_cache_enabled and self.search_service.is_available:
+            from search_cache import get_search_cache
+            cache_stats = get_search_cache().get_stats()
+            logger.info(
+                f"搜索缓存: 命中 {cache_stats['hits']} 次，合并相同查询 {cache_stats['coalesced']} 次，"
+                f"实际搜索 {cache_stats['misses']} 次"
+            )
+        
+        if self.search_service.is_available:
+            for name, stats in self.search_service.get_provider_stats().items():
+                latency = '-' if stats['latency'] is None else f"{stats['latency']:.2f}s"
+                logger.info(
+                    f"搜索路由[{name}]: 平均耗时 {latency}，错误率 {stats['error_rate']:.0%}，"
+                    f"请求 {stats['requests']} 次，被对冲 {stats['hedged']} 次，对冲胜出 {stats['hedge_wins']} 次"
+                )
+        
         # 发送通知（单股推送模式下跳过汇总推送，避免重复）
         if results and send_notification and not dry_run:
             if single_stock_notify:
@@ -595,6 +944,46 @@ class StockAnalysisPipeline:
         
         return results
     
+    def _log_search_forecast(self, stock_count: int) -> None:
+        """输出本轮各搜索引擎的预计请求数与剩余额度（额度不足时提前告警）"""
+        forecast = self.search_service.forecast_quota(
+            stock_count, market_review=self.config.market_review_enabled
+        )
+        total = forecast.pop('_total')
+        for name, item in forecast.items():
+            remaining = '不限' if item['remaining'] is None else item['remaining']
+            logger.info(
+                f"搜索额度[{name}]: 本轮预计 {item['planned']} 次，本月剩余 {remaining}，"
+                f"可用 Key {item['available_keys']} 个"
+                + ("，本轮将用尽" if item['exhausted'] else "")
+            )
+        if total['uncovered']:
+            logger.warning(
+                f"搜索额度不足：本轮预计 {total['planned']} 次搜索中 {total['uncovered']} 次无可用额度，"
+                f"相关股票将缺少新闻情报"
+            )
+    
+    def _log_llm_accounting(self, run_id: str) -> None:
+        """输出本轮 LLM 调用的 Token、耗时汇总（按模型，以及 Token / 耗时最高的股票）"""
+        summary = get_llm_accounting().finish_run(run_id)
+        total = summary['total']
+        if not total['calls']:
+            return
+        
+        estimated = '（含估算）' if summary['estimated'] else ''
+        logger.info(
+            f"LLM 用量: {total['calls']} 次调用，输入 {total['input_tokens']} / 输出 {total['output_tokens']} Token{estimated}，"
+            f"累计耗时 {total['latency']:.1f}s，重试 {total['retries']} 次，备选切换 {total['fallbacks']} 次，"
+            f"解析失败 {total['parse_failures']} 次"
+        )
+        for model, stats in summary['models'].items():
+            logger.info(
+                f"LLM 用量[{model}]: {stats['calls']} 次，输入 {stats['input_tokens']} / 输出 {stats['output_tokens']} Token，"
+                f"平均耗时 {stats['latency'] / stats['calls']:.1f}s"
+            )
+        logger.info("LLM Token 最多: " + ", ".join(f"{code}({tokens})" for code, tokens in summary['top_tokens']))
+        logger.info("LLM 耗时最长: " + ", ".join(f"{code}({latency:.1f}s)" for code, latency in summary['top_latency']))
+    
     def _send_notifications(self, results: List[AnalysisResult], skip_push: bool = False) -> None:
         """
         发送分析结果通知
@@ -674,6 +1063,7 @@ def parse_arguments() -> argparse.Namespace:
   python main.py --single-notify    # 启用单股推送模式（每分析完一只立即推送）
   python main.py --schedule         # 启用定时任务模式
   python main.py --market-review    # 仅运行大盘复盘
+  python main.py --screen --top-k 5 # 全市场筛选，仅分析评分前 5 只
         '''
     )
     
@@ -732,6 +1122,19 @@ def parse_arguments() -> argparse.Namespace:
         help='跳过大盘复盘分析'
     )
     
+    parser.add_argument(
+        '--screen',
+        action='store_true',
+        help='全市场选股模式：按趋势评分筛选全部 A 股，仅分析 Top-K 候选'
+    )
+    
+    parser.add_argument(
+        '--top-k',
+        type=int,
+        default=None,
+        help='全市场选股的候选数量（默认使用配置值）'
+    )
+    
     parser.add_argument(
         '--webui',
         action='store_true',
@@ -887,6 +1290,9 @@ def run_full_analysis(
         
     except Exception as e:
         logger.exception(f"分析流程执行失败: {e}")
+    finally:
+        # 个股分析与大盘复盘都结束后再删除本轮上传的上下文缓存（大盘复盘同样会上传）
+        get_context_cache().release()
 
 
 def main() -> int:
@@ -965,7 +1371,10 @@ def main() -> int:
             if config.gemini_api_key:
                 analyzer = GeminiAnalyzer(api_key=config.gemini_api_key)
             
-            run_market_review(notifier, analyzer, search_service)
+            try:
+                run_market_review(notifier, analyzer, search_service)
+            finally:
+                get_context_cache().release()
             return 0
         
         # 模式2: 定时任务模式
@@ -985,7 +1394,25 @@ def main() -> int:
             )
             return 0
         
-        # 模式3: 正常单次运行
+        # 模式3: 全市场选股（筛选 Top-K 后进入完整分析流程）
+        if args.screen:
+            logger.info("模式: 全市场选股")
+            from screener import MarketScreener
+            
+            screener = MarketScreener(
+                top_k=args.top_k or config.screener_top_k,
+                workers=config.screener_workers,
+                max_backfill=config.screener_backfill
+            )
+            candidates = screener.screen()
+            if candidates.empty:
+                logger.error("全市场选股未产生候选，程序退出")
+                return 1
+            logger.info("\n" + MarketScreener.format_report(candidates))
+            run_full_analysis(config, args, candidates['code'].tolist())
+            return 0
+        
+        # 模式4: 正常单次运行
         run_full_analysis(config, args, stock_codes)
         
         logger.info("\n程序执行完成")
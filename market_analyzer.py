@@ -20,6 +20,7 @@ import akshare as ak
 import pandas as pd
 
 from config import get_config
+from llm_accounting import KIND_MARKET, get_llm_accounting
 from search_service import SearchService
 
 logger = logging.getLogger(__name__)
@@ -350,17 +351,10 @@ class MarketAnalyzer:
                 'max_output_tokens': 2048,
             }
             
-            # 根据 analyzer 使用的 API 类型调用
-            if self.analyzer._use_openai:
-                # 使用 OpenAI 兼容 API
-                review = self.analyzer._call_openai_api(prompt, generation_config)
-            else:
-                # 使用 Gemini API
-                response = self.analyzer._model.generate_content(
-                    prompt,
-                    generation_config=generation_config,
-                )
-                review = response.text.strip() if response and response.text else None
+            # 经由 analyzer 的重试与配额（Gemini 失败时自动切换 OpenAI 兼容 API）
+            with get_llm_accounting().track('market', KIND_MARKET, self.analyzer.run_id):
+                review = self.analyzer._call_api_with_retry(prompt, generation_config)
+            review = review.strip() if review else None
             
             if review:
                 logger.info(f"[大盘] 复盘报告生成成功，长度: {len(review)} 字符")
@@ -385,6 +385,8 @@ class NotificationService:
                 ])
             
             # 数据来源说明
+            if getattr(result, 'reused_from', None):
+                report_lines.append(f"*♻️ 行情与消息面无实质变化，沿用 {result.reused_from} 的分析结论*")
             if hasattr(result, 'search_performed') and result.search_performed:
                 report_lines.append(f"*🔍 已执行联网搜索*")
             if hasattr(result, 'data_sources') and result.data_sources:
@@ -929,6 +931,8 @@ class NotificationService:
             f"> {report_date} | 评分: **{result.sentiment_score}** | {result.trend_prediction}",
             "",
         ]
+        if getattr(result, 'reused_from', None):
+            lines.extend([f"> ♻️ 无实质变化，沿用 {result.reused_from} 的分析结论", ""])
         
         # 核心决策（一句话）
         one_sentence = core.get('one_sentence', result.analysis_summary) if core else result.analysis_summary
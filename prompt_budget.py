@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+提示词预算 - Token 估算、新闻去重与分段裁剪
+===================================
+
+职责：
+1. 估算文本 Token 数（中文约 1 字 1 Token，其余约 4 字符 1 Token）
+2. 情报文本去重：同一新闻在"最新消息/风险排查/业绩预期"等多次搜索中重复出现时只保留一次
+3. 按段落优先级裁剪提示词数据部分：超出预算时依次应用价值最低的降级步骤（精简或删除段落）
+4. 输出每段的 Token 数，便于观察输入成本
+
+使用方式：
+    sections = [
+        PromptSection('基础信息', text),                                  # 无降级步骤 = 必须保留
+        PromptSection('动量指标', text, degrade=[(50, '')]),               # 优先级 50 时删除
+        PromptSection('舆情情报', text, degrade=[(45, short), (70, '')]),  # 先精简，再删除
+    ]
+    text, report = fit_sections(sections, budget=4000)
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 Token 数：中文约 1 字 1 Token，其余约 4 字符 1 Token"""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii) // 4
+
+
+# ========== 情报文本去重与精简 ==========
+
+# format_intel_report 的条目行："  1. 标题 [日期]"，其后缩进行为摘要
+_ITEM_PATTERN = re.compile(r'^(\s*)\d+\.\s+(.*)$')
+_DATE_SUFFIX = re.compile(r'\s\[[^\]]*\]\s*$')
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def _normalize(text: str) -> str:
+    """去除日期后缀、标点与空白，用于判断重复"""
+    return _NON_WORD.sub('', _DATE_SUFFIX.sub('', text)).lower()
+
+
+def compact_news(
+    news_context: str,
+    snippet_chars: Optional[int] = None,
+    titles_only: bool = False
+) -> str:
+    """
+    情报文本去重与精简
+
+    - 标题或摘要（归一化后）与前面条目相同的条目整条删除，各分类内重新编号
+    - snippet_chars: 摘要保留的最大字符数
+    - titles_only: 只保留标题（删除全部摘要）
+
+    Args:
+        news_context: SearchService.format_intel_report() 生成的文本
+
+    Returns:
+        精简后的文本（非条目行原样保留）
+    """
+    seen_titles = set()
+    seen_snippets = set()
+    output: List[str] = []
+    number = 0
+    removed = 0
+    skipping = False
+    category_at: Optional[int] = None  # 当前分类标题在 output 中的位置
+
+    def close_category() -> None:
+        # 分类下的条目全部重复时，连同分类标题一起删除
+        if category_at is not None and number == 0 and removed > 0:
+            del output[category_at:]
+
+    for line in news_context.splitlines():
+        match = _ITEM_PATTERN.match(line)
+        if match:
+            indent, title = match.groups()
+            key = _normalize(title)
+            skipping = bool(key) and key in seen_titles
+            if skipping:
+                removed += 1
+                continue
+            seen_titles.add(key)
+            number += 1
+            output.append(f"{indent}{number}. {title}")
+            continue
+
+        if line.startswith((' ', '\t')) and line.strip() and output:
+            # 条目摘要行
+            if skipping:
+                continue
+            snippet = line.strip()
+            key = _normalize(snippet)
+            if key and key in seen_snippets:
+                # 摘要与前面条目重复：删除摘要及其标题
+                output.pop()
+                number -= 1
+                removed += 1
+                skipping = True
+                continue
+            seen_snippets.add(key)
+            if titles_only:
+                continue
+            if snippet_chars is not None and len(snippet) > snippet_chars:
+                indent = line[:len(line) - len(line.lstrip())]
+                line = f"{indent}{snippet[:snippet_chars].rstrip('.')}..."
+            output.append(line)
+            continue
+
+        # 分类标题、空行等：新分类重新编号
+        skipping = False
+        if line.strip():
+            close_category()
+            category_at, number, removed = len(output), 0, 0
+        output.append(line)
+
+    close_category()
+    return '\n'.join(output)
+
+
+# ========== 分段裁剪 ==========
+
+@dataclass
+class PromptSection:
+    """提示词中的一个段落"""
+    name: str
+    text: str
+    # 降级步骤 [(优先级, 降级后的文本)]：超出预算时按优先级从低到高依次应用，文本为空表示删除该段
+    degrade: List[Tuple[int, str]] = field(default_factory=list)
+
+
+def fit_sections(
+    sections: List[PromptSection],
+    budget: int
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    将各段落裁剪到 Token 预算之内
+
+    Args:
+        sections: 按输出顺序排列的段落
+        budget: Token 预算（<= 0 表示不限制）
+
+    Returns:
+        (拼接后的文本, 每段的 {'name', 'tokens', 'original_tokens', 'action'} 列表)
+        action 为 None（原样）、'compacted'（精简）或 'dropped'（删除）
+    """
+    texts = [section.text for section in sections]
+    tokens = [estimate_tokens(text) for text in texts]
+    original = list(tokens)
+    actions: List[Optional[str]] = [None] * len(sections)
+
+    if budget > 0 and sum(tokens) > budget:
+        steps = sorted(
+            (priority, index, order, text)
+            for index, section in enumerate(sections)
+            for order, (priority, text) in enumerate(section.degrade)
+        )
+        for _, index, _, text in steps:
+            if sum(tokens) <= budget:
+                break
+            new_tokens = estimate_tokens(text)
+            if new_tokens >= tokens[index] and text:
+                continue
+            texts[index] = text
+            tokens[index] = new_tokens
+            actions[index] = 'compacted' if text else 'dropped'
+
+    report = [
+        {'name': section.name, 'tokens': tokens[i], 'original_tokens': original[i], 'action': actions[i]}
+        for i, section in enumerate(sections)
+    ]
+    return ''.join(texts), report
+
+
+def format_report(report: List[Dict[str, Any]], budget: int) -> str:
+    """段落 Token 统计的单行摘要"""
+    parts = []
+    for item in report:
+        if item['action'] == 'dropped':
+            parts.append(f"{item['name']} {item['original_tokens']}→省略")
+        elif item['action'] == 'compacted':
+            parts.append(f"{item['name']} {item['original_tokens']}→{item['tokens']}")
+        elif item['tokens']:
+            parts.append(f"{item['name']} {item['tokens']}")
+    total = sum(item['tokens'] for item in report)
+    budget_text = f"预算 {budget}" if budget > 0 else "不限"
+    return f"{total} Token（{budget_text}）: " + " | ".join(parts)
+
+
+if __name__ == "__main__":
+    sample = """【贵州茅台 情报搜索结果】
+
+📰 最新消息 (来源: Tavily):
+  1. 贵州茅台发布三季度报告 [2026-10-15]
+     公司前三季度营业收入同比增长，净利润稳步提升，经营现金流良好...
+  2. 茅台酒批价企稳回升
+     近期飞天茅台批价小幅回升，渠道库存处于合理水平...
+
+⚠️ 风险排查 (来源: Tavily):
+  1. 贵州茅台发布三季度报告
+     公司前三季度营业收入同比增长，净利润稳步提升，经营现金流良好...
+  2. 白酒板块估值回落
+     受消费复苏不及预期影响，白酒板块整体估值回落...
+"""
+    compacted = compact_news(sample)
+    print(compacted)
+    print(f"\n去重前 {estimate_tokens(sample)} Token，去重后 {estimate_tokens(compacted)} Token，"
+          f"仅标题 {estimate_tokens(compact_news(sample, titles_only=True))} Token")
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+提示词前缀缓存 - 静态系统提示词只处理一次
+===================================
+
+职责：
+1. Gemini：将 SYSTEM_PROMPT 上传为 CachedContent（显式上下文缓存），同一轮分析的所有请求引用同一份缓存
+2. OpenAI 兼容 API：系统提示词固定作为首条消息，由服务端自动前缀缓存（OpenAI / DeepSeek / 通义千问等）
+3. 从响应的 usage 中读取命中缓存的输入 Token，统计节省的 Token 与耗时
+4. 不支持缓存的模型或服务（提示词过短、模型不支持、未安装 SDK 等）自动退回普通请求，只告警一次
+
+使用方式：
+    cache = get_context_cache()
+    model = cache.gemini_model(model_name, system_prompt)  # 不可用时返回 None，使用普通模型
+    cache.record('gemini', response, latency)
+    cache.release()  # 一轮分析（个股 + 大盘复盘）结束后删除已上传的缓存
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 缓存到期前提前重建的时间（秒），避免请求途中缓存失效
+_RENEW_MARGIN = 60.0
+
+
+def usage_tokens(response) -> Optional[Tuple[int, int]]:
+    """
+    从响应中读取输入 Token 数与其中命中缓存的 Token 数
+
+    - Gemini: usage_metadata.prompt_token_count / cached_content_token_count
+    - OpenAI: usage.prompt_tokens / prompt_tokens_details.cached_tokens（DeepSeek 为 prompt_cache_hit_tokens）
+
+    Returns:
+        (输入 Token, 缓存命中 Token)，响应不含用量信息时返回 None
+    """
+    metadata = getattr(response, 'usage_metadata', None)
+    if metadata is not None and getattr(metadata, 'prompt_token_count', None):
+        return metadata.prompt_token_count, getattr(metadata, 'cached_content_token_count', 0) or 0
+
+    usage = getattr(response, 'usage', None)
+    if usage is not None and getattr(usage, 'prompt_tokens', None):
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', None) if details is not None else None
+        if cached is None:
+            cached = getattr(usage, 'prompt_cache_hit_tokens', None)
+        return usage.prompt_tokens, cached or 0
+    return None
+
+
+class ContextCache:
+    """
+    进程内共享的提示词缓存管理与统计
+
+    Gemini 缓存按 (模型, 系统提示词哈希) 创建一次；创建失败的组合记入不支持列表，之后直接使用普通请求
+    """
+
+    def __init__(self, ttl_seconds: int = 3600):
+        """
+        Args:
+            ttl_seconds: Gemini 缓存的有效期（秒），应覆盖一轮分析的耗时
+        """
+        self.ttl_seconds = ttl_seconds
+        self._gemini: Dict[Tuple[str, str], Tuple[Any, Any, float]] = {}  # key -> (CachedContent, 模型, 到期时刻)
+        self._unsupported = set()
+        self._invalidated = set()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    # ========== Gemini 显式缓存 ==========
+
+    @staticmethod
+    def _key(model_name: str, system_prompt: str) -> Tuple[str, str]:
+        return model_name, hashlib.sha1(system_prompt.encode('utf-8')).hexdigest()
+
+    def gemini_model(self, model_name: str, system_prompt: str):
+        """
+        获取引用缓存系统提示词的 GenerativeModel（首次调用时上传）
+
+        Returns:
+            GenerativeModel；当前模型不支持缓存时返回 None
+        """
+        key = self._key(model_name, system_prompt)
+        with self._lock:
+            if key in self._unsupported:
+                return None
+            entry = self._gemini.get(key)
+            if entry is not None and time.monotonic() < entry[2] - _RENEW_MARGIN:
+                return entry[1]
+
+            # 持锁创建：并发的首批请求只上传一次
+            try:
+                import google.generativeai as genai
+                from google.generativeai import caching
+
+                cached = caching.CachedContent.create(
+                    model=model_name if model_name.startswith('models/') else f'models/{model_name}',
+                    display_name='stock-analysis-system-prompt',
+                    system_instruction=system_prompt,
+                    ttl=timedelta(seconds=self.ttl_seconds),
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+            except Exception as e:
+                self._unsupported.add(key)
+                self._gemini.pop(key, None)
+                logger.warning(f"[Gemini] 模型 {model_name} 无法使用上下文缓存，改为普通请求: {str(e)[:120]}")
+                return None
+
+            self._gemini[key] = (cached, model, time.monotonic() + self.ttl_seconds)
+            logger.info(f"[Gemini] 系统提示词已上传为上下文缓存 (模型: {model_name}, "
+                        f"有效期 {self.ttl_seconds} 秒)")
+            return model
+
+    def invalidate(self, model_name: str, system_prompt: str) -> None:
+        """
+        缓存已失效（过期或被删除）时丢弃，下次请求重新上传
+
+        同一组合再次失效时视为不支持，之后使用普通请求
+        """
+        key = self._key(model_name, system_prompt)
+        with self._lock:
+            self._gemini.pop(key, None)
+            if key in self._invalidated:
+                self._unsupported.add(key)
+                logger.warning(f"[Gemini] 模型 {model_name} 的上下文缓存多次失效，改为普通请求")
+            self._invalidated.add(key)
+
+    def release(self) -> None:
+        """删除本进程上传的全部 Gemini 缓存（一轮分析结束时调用，避免按时长计费的存储费用）"""
+        with self._lock:
+            entries = list(self._gemini.values())
+            self._gemini.clear()
+        for cached, _, _ in entries:
+            try:
+                cached.delete()
+            except Exception as e:
+                logger.debug(f"[Gemini] 删除上下文缓存失败（将按有效期自动过期）: {e}")
+
+    # ========== 命中统计 ==========
+
+    def record(self, provider: str, response, latency: float) -> None:
+        """
+        记录一次响应的输入 Token 与缓存命中情况
+
+        Args:
+            provider: 服务商（gemini / openai）
+            response: SDK 响应对象（流式响应需在迭代结束后传入）
+            latency: 本次请求耗时（秒）
+        """
+        usage = usage_tokens(response)
+        if usage is None:
+            return
+        prompt_tokens, cached_tokens = usage
+        hit = cached_tokens > 0
+        with self._lock:
+            stats = self._stats.setdefault(provider, {
+                'requests': 0, 'hits': 0, 'prompt_tokens': 0, 'cached_tokens': 0,
+                'hit_latency': 0.0, 'miss_latency': 0.0,
+            })
+            stats['requests'] += 1
+            stats['prompt_tokens'] += prompt_tokens
+            stats['cached_tokens'] += cached_tokens
+            if hit:
+                stats['hits'] += 1
+                stats['hit_latency'] += latency
+            else:
+                stats['miss_latency'] += latency
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各服务商的缓存命中统计
+
+        saved_latency 为估算值：(未命中平均耗时 - 命中平均耗时) × 命中次数，两类样本都有时才计算
+        """
+        with self._lock:
+            snapshot = {provider: dict(stats) for provider, stats in self._stats.items()}
+        result = {}
+        for provider, stats in snapshot.items():
+            hits, misses = stats['hits'], stats['requests'] - stats['hits']
+            saved_latency = 0.0
+            if hits and misses:
+                saved_latency = max(stats['miss_latency'] / misses - stats['hit_latency'] / hits, 0.0) * hits
+            result[provider] = {
+                'requests': int(stats['requests']),
+                'hits': int(hits),
+                'prompt_tokens': int(stats['prompt_tokens']),
+                'cached_tokens': int(stats['cached_tokens']),
+                'cached_ratio': stats['cached_tokens'] / stats['prompt_tokens'] if stats['prompt_tokens'] else 0.0,
+                'saved_latency': saved_latency,
+            }
+        return result
+
+
+_context_cache: Optional[ContextCache] = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> ContextCache:
+    """进程内共享的提示词缓存（首次调用时按配置创建）"""
+    global _context_cache
+    with _context_cache_lock:
+        if _context_cache is None:
+            from config import get_config
+            _context_cache = ContextCache(ttl_seconds=get_config().llm_context_cache_ttl)
+        return _context_cache
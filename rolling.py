@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+滚动窗口计算内核 - 均线与窗口聚合
+===================================
+
+职责：
+1. 统一定义滚动窗口的预热语义：窗口未满或窗口内含缺失值时结果为 NaN
+2. 提供一维（单只股票）与二维（右对齐多股票矩阵）通用的窗口聚合
+3. add_moving_averages 补齐已有的 ma{N} 列：非空值直接复用，仅补算窗口已满的空值位置
+
+调用方：
+- BaseFetcher._calculate_indicators：计算 ma5/ma10/ma20（入库、提示词展示，保留 2 位小数）
+- DatabaseManager.save_daily_data：拼接库中更早的收盘价，补齐本次拉取窗口内的预热空值
+- StockTrendAnalyzer.analyze / evaluate_matrix：由 close 全精度独立计算 MA5~MA60，
+  不读取入库的均线列（四舍五入后会改变阈值附近的判断）
+- indicators.compute_matrix：BOLL 中轨按 close 计算；同一矩阵上已算好的 ma20 可传入复用
+"""
+
+import warnings
+from typing import Optional, Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+# 系统使用的均线周期（ma60 仅趋势分析使用，不入库）
+MA_WINDOWS = (5, 10, 20, 60)
+
+# 入库/数据源输出的均线周期
+STORED_MA_WINDOWS = (5, 10, 20)
+
+
+def ma_column(window: int) -> str:
+    """均线列名（小写，与数据库字段一致）"""
+    return f"ma{window}"
+
+
+def rolling_apply(
+    values: np.ndarray,
+    window: int,
+    func,
+    min_periods: Optional[int] = None
+) -> np.ndarray:
+    """
+    沿最后一维滚动窗口聚合（结果与输入同形状，前 window-1 个位置为 NaN）
+
+    Args:
+        values: 一维序列或 (股票数 × 交易日) 矩阵
+        window: 窗口长度
+        func: 形如 np.mean(view, axis=-1) 的聚合函数
+        min_periods: 为空时窗口内任一值缺失即为 NaN；否则使用 nan 聚合（至少 min_periods 个有效值）
+    """
+    values = np.asarray(values, dtype=float)
+    pad_shape = values.shape[:-1] + (window - 1,)
+    padded = np.concatenate([np.full(pad_shape, np.nan), values], axis=-1)
+    view = np.lib.stride_tricks.sliding_window_view(padded, window, axis=-1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        out = func(view, axis=-1)
+        if min_periods is not None:
+            out = np.where(np.sum(~np.isnan(view), axis=-1) >= min_periods, out, np.nan)
+    return out
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """严格预热的滚动均值（与 pandas rolling(window).mean() 一致）"""
+    return rolling_apply(values, window, np.mean)
+
+
+def volume_ratios(volume: np.ndarray, window: int = 5) -> np.ndarray:
+    """量比：当日成交量 / 前 window 日平均成交量（前 window 日不足时为 NaN）"""
+    volume = np.asarray(volume, dtype=float)
+    avg = rolling_mean(volume, window)
+    prev_avg = np.concatenate([np.full(volume.shape[:-1] + (1,), np.nan), avg[..., :-1]], axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return volume / prev_avg
+
+
+def full_window_mask(values: np.ndarray, window: int) -> np.ndarray:
+    """窗口内 window 个值均有效的位置（即严格预热语义下有结果的位置）"""
+    valid = ~np.isnan(np.asarray(values, dtype=float))
+    cs = np.cumsum(valid, axis=-1)
+    pad_shape = cs.shape[:-1] + (window,)
+    shifted = np.concatenate([np.zeros(pad_shape, dtype=cs.dtype), cs], axis=-1)[..., :cs.shape[-1]]
+    return (cs - shifted) >= window
+
+
+def fill_rolling_mean(values: np.ndarray, window: int, existing: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    复用已有均线，仅在缺失位置补算
+
+    已有列遵循同一预热语义（非 NaN 即为满窗口均值），
+    因此只要满窗口位置都有值即可直接使用，无需重新计算。
+    """
+    if existing is None:
+        return rolling_mean(values, window)
+    existing = np.asarray(existing, dtype=float)
+    missing = np.isnan(existing) & full_window_mask(values, window)
+    if not missing.any():
+        return existing
+    return np.where(missing, rolling_mean(values, window), existing)
+
+
+def moving_averages(
+    close: np.ndarray,
+    windows: Sequence[int] = MA_WINDOWS,
+    existing: Optional[Dict[int, np.ndarray]] = None
+) -> Dict[int, np.ndarray]:
+    """
+    计算一组均线（一维或矩阵）
+
+    Args:
+        close: 收盘价序列或矩阵
+        windows: 均线周期
+        existing: 已有的均线 {周期: 数组}，存在时复用
+
+    Returns:
+        {周期: 与 close 同形状的均线数组}
+    """
+    existing = existing or {}
+    return {w: fill_rolling_mean(close, w, existing.get(w)) for w in windows}
+
+
+def add_moving_averages(df: pd.DataFrame, windows: Sequence[int] = MA_WINDOWS) -> pd.DataFrame:
+    """
+    为按日期升序的单只股票 DataFrame 补齐 ma{N} 列
+
+    已存在的均线列直接复用（仅补算缺失位置），不存在的列按严格预热语义计算。
+
+    Returns:
+        追加/补齐均线列的新 DataFrame
+    """
+    df = df.copy()
+    close = df['close'].to_numpy(dtype=float)
+    existing = {w: df[ma_column(w)].to_numpy(dtype=float) for w in windows if ma_column(w) in df.columns}
+    for w, ma in moving_averages(close, windows, existing).items():
+        df[ma_column(w)] = ma
+    return df
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+全市场选股 - 多进程共享内存筛选
+===================================
+
+职责：
+1. 以全市场实时快照（约 5000 只 A 股）叠加数据库历史日线，构建当日最新 K 线
+2. 在全部股票上执行 StockTrendAnalyzer 趋势规则与 MACD/RSI 指标计算
+3. 按信号评分排序，只把 Top-K 候选交给后续搜索 + LLM 分析
+
+实现要点：
+- 各股最近 WINDOW 个交易日右对齐为 (股票数 × 窗口) 矩阵，一次性写入共享内存
+- 进程池按行分块，子进程通过共享内存名直接挂载矩阵（零拷贝），仅回传最后一列结果
+- 股票数较少或 workers=1 时在当前进程内计算，避免进程启动开销
+
+使用方式：
+    python main.py --screen               # 全市场筛选后分析 Top-K
+    python screener.py                    # 仅输出筛选结果
+    python screener.py --synthetic 5000   # 模拟数据基准测试
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from multiprocessing import shared_memory
+from typing import Optional, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from indicators import panel_to_matrix, compute_matrix, LOOKBACK_BARS
+from stock_analyzer import StockTrendAnalyzer
+
+logger = logging.getLogger(__name__)
+
+
+# 矩阵窗口：同时满足趋势规则（MA60）与指标回看长度
+WINDOW = max(StockTrendAnalyzer.BATCH_WINDOW, LOOKBACK_BARS)
+
+# 共享内存中的矩阵顺序
+MATRIX_COLUMNS = ['close', 'high', 'low', 'volume']
+
+# 趋势分析所需的最少 K 线数（与 analyze() 一致）
+MIN_BARS = 20
+
+# 低于该股票数时不启用进程池
+PARALLEL_THRESHOLD = 1000
+
+# 快照列名映射（ak.stock_zh_a_spot_em）
+SNAPSHOT_COLUMNS = {
+    '代码': 'code',
+    '名称': 'name',
+    '最新价': 'close',
+    '最高': 'high',
+    '最低': 'low',
+    '成交量': 'volume',
+    '成交额': 'amount',
+    '涨跌幅': 'change_pct',
+}
+
+
+def _evaluate_rows(
+    close: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    volume: np.ndarray,
+    counts: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    计算一批股票最新一日的趋势评分与指标
+
+    Returns:
+        {字段名: 长度为股票数的数组}
+    """
+    width = close.shape[1]
+    bar_count = counts[:, None] - (width - 1 - np.arange(width))[None, :]
+    ev = StockTrendAnalyzer().evaluate_matrix(close, high, volume, bar_count)
+    ind = compute_matrix(close, high, low, ma20=ev['ma20'])
+
+    out = {key: ev[key][:, -1].copy() for key in
+           ('score', 'signal_idx', 'trend_idx', 'volume_idx', 'price', 'bias_ma5', 'volume_ratio')}
+    for key in ('rsi6', 'macd_hist', 'kdj_j'):
+        out[key] = ind[key][:, -1].copy()
+    return out
+
+
+def _screen_chunk(
+    shm_name: str,
+    shape: Tuple[int, int, int],
+    start: int,
+    stop: int,
+    counts: np.ndarray
+) -> Tuple[int, Dict[str, np.ndarray]]:
+    """进程池任务：挂载共享内存矩阵并计算 [start, stop) 行"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        result = _evaluate_rows(*(block[k, start:stop] for k in range(len(MATRIX_COLUMNS))), counts)
+        # 释放对共享缓冲区的引用后才能关闭
+        del block
+        return start, result
+    finally:
+        shm.close()
+
+
+class MarketScreener:
+    """
+    全市场趋势选股器
+
+    筛选流程：
+    1. 获取全市场快照，剔除 ST、停牌（无成交）股票
+    2. 读取数据库历史日线，以快照价格作为当日 K 线追加/覆盖
+    3. 多进程计算趋势评分与指标，按评分降序、乖离率升序排序取 Top-K
+    """
+
+    def __init__(
+        self,
+        top_k: int = 10,
+        workers: int = 0,
+        max_backfill: int = 0
+    ):
+        """
+        初始化选股器
+
+        Args:
+            top_k: 输出候选数量
+            workers: 进程数（0 表示 CPU 核数）
+            max_backfill: 缺少历史的股票中，按成交额补拉日线的最大数量（0 不补拉）
+        """
+        self.top_k = top_k
+        self.workers = workers or os.cpu_count() or 1
+        self.max_backfill = max_backfill
+        self.last_stats: Dict[str, float] = {}
+
+    def load_snapshot(self) -> pd.DataFrame:
+        """获取全市场快照并标准化列名（失败返回空 DataFrame）"""
+        from data_provider.akshare_fetcher import AkshareFetcher
+
+        raw = AkshareFetcher().get_market_snapshot()
+        if raw is None or raw.empty:
+            return pd.DataFrame()
+
+        snapshot = raw[[c for c in SNAPSHOT_COLUMNS if c in raw.columns]].rename(columns=SNAPSHOT_COLUMNS)
+        snapshot['code'] = snapshot['code'].astype(str)
+        for column in ('close', 'high', 'low', 'volume', 'amount', 'change_pct'):
+            if column in snapshot.columns:
+                snapshot[column] = pd.to_numeric(snapshot[column], errors='coerce')
+        return snapshot
+
+    @staticmethod
+    def prefilter(snapshot: pd.DataFrame) -> pd.DataFrame:
+        """剔除 ST / 退市整理 / 停牌股票"""
+        mask = (snapshot['close'] > 0) & (snapshot['volume'] > 0)
+        if 'name' in snapshot.columns:
+            mask &= ~snapshot['name'].astype(str).str.contains('ST|退', regex=True)
+        return snapshot[mask.fillna(False)].reset_index(drop=True)
+
+    def backfill(self, codes: List[str], days: int = WINDOW + 30) -> int:
+        """
+        为缺少历史的股票补拉日线并入库（受数据源流控限制，耗时较长）
+
+        Returns:
+            成功补拉的股票数
+        """
+        from data_provider import DataFetcherManager
+        from storage import get_db
+
+        db = get_db()
+        manager = DataFetcherManager()
+        success = 0
+        for code in codes:
+            try:
+                df, source_name = manager.get_daily_data(code, days=days)
+                if df is not None and not df.empty:
+                    db.save_daily_data(df, code, source_name)
+                    success += 1
+            except Exception as e:
+                logger.warning(f"[{code}] 补拉历史日线失败: {e}")
+        logger.info(f"补拉历史日线: {success}/{len(codes)} 只成功")
+        return success
+
+    @staticmethod
+    def latest_trade_date() -> date:
+        """快照行情对应的交易日（非交易日、开盘前为上一交易日）"""
+        from data_provider.akshare_fetcher import AkshareFetcher
+
+        return AkshareFetcher().get_latest_trade_date()
+
+    @staticmethod
+    def merge_today(history: pd.DataFrame, snapshot: pd.DataFrame, trade_date: Optional[date] = None) -> pd.DataFrame:
+        """
+        以快照行情作为 trade_date 当日的 K 线合并到历史（同日数据以快照为准）
+
+        trade_date 须为快照对应的交易日：非交易日的快照仍是上一交易日行情，按自然日记作新 K 线
+        会多出一根重复 K 线并使全部滚动窗口错位。无成交（停牌）或无价格的股票不追加 K 线。
+        """
+        today_bar = snapshot[['code', 'close', 'high', 'low', 'volume']].copy()
+        today_bar = today_bar[(today_bar['volume'] > 0) & today_bar['close'].notna()]
+        today_bar['date'] = pd.Timestamp(trade_date or date.today())
+
+        history = history[['code', 'date', 'close', 'high', 'low', 'volume']].copy()
+        history['code'] = history['code'].astype(str)
+        history['date'] = pd.to_datetime(history['date'])
+
+        panel = pd.concat([history, today_bar], ignore_index=True)
+        return panel.drop_duplicates(['code', 'date'], keep='last')
+
+    def rank(self, panel: pd.DataFrame) -> pd.DataFrame:
+        """
+        对多股票长表计算最新一日的评分并排序
+
+        Args:
+            panel: 包含 code, date, close, high, low, volume 列的长表
+
+        Returns:
+            全部有效股票的结果（按评分降序），列：code, score, signal, trend, volume_status,
+            price, bias_ma5, volume_ratio, rsi6, macd_hist, kdj_j
+        """
+        start_time = time.perf_counter()
+        codes, counts, mats = panel_to_matrix(panel, MATRIX_COLUMNS, window=WINDOW)
+        valid = counts >= MIN_BARS
+        codes, counts = codes[valid], counts[valid]
+        n = len(codes)
+        if n == 0:
+            return pd.DataFrame()
+
+        if self.workers <= 1 or n < PARALLEL_THRESHOLD:
+            result = _evaluate_rows(*(mats[c][valid] for c in MATRIX_COLUMNS), counts)
+            mode = "单进程"
+        else:
+            result = self._rank_parallel(mats, valid, counts)
+            mode = f"{self.workers} 进程"
+
+        analyzer = StockTrendAnalyzer
+        report = pd.DataFrame({
+            'code': codes,
+            'score': result['score'].astype(int),
+            'signal': [analyzer.SIGNAL_ORDER[i].value for i in result['signal_idx']],
+            'trend': [analyzer.TREND_ORDER[i].value for i in result['trend_idx']],
+            'volume_status': [analyzer.VOLUME_ORDER[i].value for i in result['volume_idx']],
+            'price': result['price'],
+            'bias_ma5': result['bias_ma5'],
+            'volume_ratio': result['volume_ratio'],
+            'rsi6': result['rsi6'],
+            'macd_hist': result['macd_hist'],
+            'kdj_j': result['kdj_j'],
+        })
+        report['_abs_bias'] = report['bias_ma5'].abs()
+        report = report.sort_values(['score', '_abs_bias'], ascending=[False, True], kind='mergesort')
+        report = report.drop(columns='_abs_bias').reset_index(drop=True)
+
+        elapsed = time.perf_counter() - start_time
+        self.last_stats = {'codes': n, 'skipped': int((~valid).sum()), 'elapsed': elapsed}
+        logger.info(f"全市场评分完成: {n} 只股票（{mode}），数据不足跳过 {int((~valid).sum())} 只，"
+                    f"耗时 {elapsed:.2f}s")
+        return report
+
+    def _rank_parallel(
+        self,
+        mats: Dict[str, np.ndarray],
+        valid: np.ndarray,
+        counts: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        """将矩阵写入共享内存，按行分块交给进程池计算"""
+        n = int(valid.sum())
+        shape = (len(MATRIX_COLUMNS), n, WINDOW)
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+        try:
+            block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            for k, column in enumerate(MATRIX_COLUMNS):
+                block[k] = mats[column][valid]
+            del block
+
+            bounds = np.linspace(0, n, self.workers * 2 + 1, dtype=int)
+            parts: Dict[int, Dict[str, np.ndarray]] = {}
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = [
+                    executor.submit(_screen_chunk, shm.name, shape, int(lo), int(hi), counts[lo:hi])
+                    for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo
+                ]
+                for future in futures:
+                    start, part = future.result()
+                    parts[start] = part
+        finally:
+            shm.close()
+            shm.unlink()
+
+        ordered = [parts[k] for k in sorted(parts)]
+        return {key: np.concatenate([p[key] for p in ordered]) for key in ordered[0]}
+
+    def screen(self) -> pd.DataFrame:
+        """
+        执行全市场筛选
+
+        Returns:
+            Top-K 候选 DataFrame（附带 name, change_pct），快照获取失败返回空 DataFrame
+        """
+        from backtest import load_history
+
+        snapshot = self.load_snapshot()
+        if snapshot.empty:
+            logger.error("全市场快照获取失败，无法筛选")
+            return pd.DataFrame()
+        snapshot = self.prefilter(snapshot)
+        logger.info(f"全市场快照: 可交易股票 {len(snapshot)} 只")
+
+        codes = snapshot['code'].tolist()
+        history = load_history(codes)
+        missing = snapshot[~snapshot['code'].isin(set(history['code'].astype(str)))]
+        if not missing.empty:
+            logger.warning(f"{len(missing)} 只股票缺少历史日线，将不参与筛选")
+            if self.max_backfill > 0:
+                order = missing.sort_values('amount', ascending=False) if 'amount' in missing else missing
+                if self.backfill(order['code'].head(self.max_backfill).tolist()):
+                    history = load_history(codes)
+
+        trade_date = self.latest_trade_date()
+        logger.info(f"快照行情按交易日 {trade_date} 合并")
+        panel = self.merge_today(history, snapshot, trade_date)
+        ranked = self.rank(panel)
+        if ranked.empty:
+            return ranked
+
+        extra = snapshot.set_index('code')[[c for c in ('name', 'change_pct') if c in snapshot.columns]]
+        top = ranked.head(self.top_k).join(extra, on='code')
+        return top
+
+    @staticmethod
+    def format_report(report: pd.DataFrame) -> str:
+        """格式化筛选结果"""
+        lines = [f"=== 全市场趋势筛选 Top {len(report)} ==="]
+        if not report.empty:
+            lines.append(report.round(2).to_string(index=False))
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='全市场趋势选股')
+    parser.add_argument('--top-k', type=int, default=10, help='输出候选数量')
+    parser.add_argument('--workers', type=int, default=0, help='进程数（0 表示 CPU 核数）')
+    parser.add_argument('--synthetic', type=int, metavar='N', help='使用 N 只模拟股票进行基准测试')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    screener = MarketScreener(top_k=args.top_k, workers=args.workers)
+
+    if args.synthetic:
+        from stock_analyzer import make_synthetic_panel
+        panel = make_synthetic_panel(num_codes=args.synthetic, num_days=250)
+
+        serial_elapsed = time.perf_counter()
+        serial = MarketScreener(workers=1).rank(panel)
+        serial_elapsed = time.perf_counter() - serial_elapsed
+
+        parallel_elapsed = time.perf_counter()
+        parallel = screener.rank(panel)
+        parallel_elapsed = time.perf_counter() - parallel_elapsed
+
+        same = serial.equals(parallel)
+        print(MarketScreener.format_report(parallel.head(args.top_k)))
+        print(f"\n{len(parallel)} 只股票: 单进程 {serial_elapsed:.2f}s, "
+              f"{screener.workers} 进程 {parallel_elapsed:.2f}s, 结果一致: {'是' if same else '否'}")
+    else:
+        print(MarketScreener.format_report(screener.screen()))
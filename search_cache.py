@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+搜索结果缓存 - 持久化 TTL 缓存 + 相同查询合并
+===================================
+
+职责：
+1. 按（规范化查询, 结果条数）缓存成功的搜索结果，与具体搜索引擎无关
+2. 按搜索维度设置有效期：最新消息较短，风险排查居中，业绩预期较长
+3. 缓存写入数据库（search_cache），进程重启、Web 重新触发分析时仍可命中
+4. 并发的相同查询只发起一次请求，其余调用等待并共享结果（single-flight）
+5. 命中缓存时不调用搜索引擎，不消耗 API Key 配额
+
+使用方式：
+    cache = get_search_cache()
+    response = cache.get_or_fetch(query, max_results, 'latest_news', lambda: provider.search(query, max_results))
+    if response.from_cache:
+        ...  # 未调用搜索引擎
+
+说明：
+- 只缓存成功且有结果的响应，失败或空结果下次重新搜索
+- 相同查询的跟随者最多等待 wait_timeout 秒，超时后自行搜索
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from dataclasses import asdict, replace
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Callable, Tuple
+
+from search_service import (
+    DIMENSION_EARNINGS,
+    DIMENSION_LATEST,
+    DIMENSION_RISK,
+    SearchResponse,
+    SearchResult,
+)
+
+logger = logging.getLogger(__name__)
+
+# 内存中最多保留的条目数（超出时丢弃最早写入的条目，数据库中仍保留）
+_MAX_MEMORY_ENTRIES = 512
+
+_PUNCTUATION = re.compile(r'[\s,，。、;；:：!！?？"“”\'‘’()（）\[\]【】|]+')
+
+
+def normalize_query(query: str) -> str:
+    """
+    规范化查询：全角转半角、统一大小写、去除标点，词项去重后排序
+
+    搜索引擎按词项匹配，词序与重复不影响结果，规范化后可合并仅写法不同的查询
+    """
+    text = unicodedata.normalize('NFKC', query).casefold()
+    terms = sorted(set(term for term in _PUNCTUATION.split(text) if term))
+    return ' '.join(terms)
+
+
+def _to_dict(response: SearchResponse) -> Dict[str, Any]:
+    data = asdict(response)
+    data.pop('from_cache', None)
+    return data
+
+
+def _from_dict(data: Dict[str, Any]) -> SearchResponse:
+    results = [SearchResult(**item) for item in data.get('results', [])]
+    return SearchResponse(**{**data, 'results': results, 'from_cache': True})
+
+
+class _Flight:
+    """进行中的一次搜索"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response: Optional[SearchResponse] = None
+
+
+class SearchCache:
+    """
+    搜索结果缓存（内存 + 数据库两级）
+
+    键为 sha1(规范化查询 + 结果条数)；db 为空时只在内存中缓存
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, int]] = None,
+        db=None,
+        wait_timeout: float = 30.0
+    ):
+        """
+        Args:
+            ttls: 各搜索维度的有效期（秒），未列出的维度使用最新消息的有效期
+            db: DatabaseManager（持久化缓存）
+            wait_timeout: 相同查询的跟随者最长等待时间（秒）
+        """
+        self.ttls = {
+            DIMENSION_LATEST: 3600,
+            DIMENSION_RISK: 6 * 3600,
+            DIMENSION_EARNINGS: 24 * 3600,
+            **(ttls or {}),
+        }
+        self.db = db
+        self.wait_timeout = wait_timeout
+        self._memory: Dict[str, Tuple[SearchResponse, datetime]] = {}
+        self._inflight: Dict[str, _Flight] = {}
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+        self._lock = threading.Lock()
+        self._purge()
+
+    @staticmethod
+    def make_key(query: str, max_results: int) -> str:
+        return hashlib.sha1(f"{normalize_query(query)}|{max_results}".encode('utf-8')).hexdigest()
+
+    def ttl(self, dimension: str) -> int:
+        return self.ttls.get(dimension, self.ttls[DIMENSION_LATEST])
+
+    # ========== 读写 ==========
+
+    def get(self, key: str) -> Optional[SearchResponse]:
+        """读取未过期的缓存（内存未命中时读数据库）"""
+        now = datetime.now()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    return entry[0]
+                del self._memory[key]
+
+        if self.db is None:
+            return None
+        try:
+            stored = self.db.get_search_cache(key)
+        except Exception as e:
+            logger.debug(f"[搜索缓存] 读取失败: {e}")
+            return None
+        if stored is None:
+            return None
+        data, expires_at = stored
+        try:
+            response = _from_dict(data)
+        except (TypeError, ValueError) as e:
+            logger.debug(f"[搜索缓存] 缓存内容无法解析: {e}")
+            return None
+        self._remember(key, response, expires_at)
+        return response
+
+    def put(self, key: str, query: str, dimension: str, response: SearchResponse) -> None:
+        """写入缓存（只缓存成功且有结果的响应）"""
+        if not response.success or not response.results:
+            return
+        expires_at = datetime.now() + timedelta(seconds=self.ttl(dimension))
+        cached = replace(response, from_cache=True)
+        self._remember(key, cached, expires_at)
+        if self.db is None:
+            return
+        try:
+            self.db.save_search_cache(key, normalize_query(query), dimension, _to_dict(response), expires_at)
+        except Exception as e:
+            logger.debug(f"[搜索缓存] 保存失败: {e}")
+
+    def _remember(self, key: str, response: SearchResponse, expires_at: datetime) -> None:
+        with self._lock:
+            self._memory[key] = (response, expires_at)
+            while len(self._memory) > _MAX_MEMORY_ENTRIES:
+                self._memory.pop(next(iter(self._memory)))
+
+    def _purge(self) -> None:
+        """清理数据库中已过期的缓存"""
+        if self.db is None:
+            return
+        try:
+            deleted = self.db.purge_search_cache()
+            if deleted:
+                logger.debug(f"[搜索缓存] 清理过期缓存 {deleted} 条")
+        except Exception as e:
+            logger.debug(f"[搜索缓存] 清理过期缓存失败: {e}")
+
+    # ========== 对外接口 ==========
+
+    def get_or_fetch(
+        self,
+        query: str,
+        max_results: int,
+        dimension: str,
+        fetch: Callable[[], SearchResponse]
+    ) -> SearchResponse:
+        """
+        命中缓存时直接返回（from_cache=True），否则调用 fetch 搜索并写入缓存
+
+        并发的相同查询只有第一个调用 fetch，其余等待其结果
+        """
+        key = self.make_key(query, max_results)
+        cached = self.get(key)
+        if cached is not None:
+            self._count('hits')
+            logger.info(f"[搜索缓存] 命中 '{query}'")
+            return cached
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            if flight.event.wait(self.wait_timeout) and flight.response is not None:
+                self._count('coalesced')
+                logger.info(f"[搜索缓存] 合并相同查询 '{query}'")
+                return replace(flight.response, from_cache=True)
+            self._count('misses')
+            return fetch()
+
+        try:
+            # 成为发起者前可能已有其他调用完成并写入缓存
+            cached = self.get(key)
+            if cached is not None:
+                self._count('hits')
+                flight.response = cached
+                return cached
+            self._count('misses')
+            response = fetch()
+            flight.response = response
+            self.put(key, query, dimension, response)
+            return response
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """命中 / 未命中 / 合并次数"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._memory))
+
+
+_search_cache: Optional[SearchCache] = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """进程内共享的搜索缓存（首次调用时按配置创建）"""
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            from config import get_config
+            from storage import get_db
+            config = get_config()
+            try:
+                db = get_db()
+            except Exception as e:
+                logger.warning(f"[搜索缓存] 数据库不可用，仅在内存中缓存: {e}")
+                db = None
+            _search_cache = SearchCache(
+                ttls={
+                    DIMENSION_LATEST: config.search_cache_ttl_latest,
+                    DIMENSION_RISK: config.search_cache_ttl_risk,
+                    DIMENSION_EARNINGS: config.search_cache_ttl_earnings,
+                },
+                db=db,
+            )
+        return _search_cache
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+搜索配额 - 按 Key、按月持久化的用量统计与 Key 调度
+===================================
+
+职责：
+1. 按（搜索引擎, Key, 月份）统计请求数与错误数，写入数据库（search_key_usage），重启后不丢失；
+   选中 Key 时在数据库中原子占用一次请求，Web 服务与定时任务等多个进程合计也不会超出月度额度
+2. 选择 Key 时优先使用剩余额度最多的 Key（无月度额度时使用本月用得最少的 Key）
+3. 服务端返回额度用尽（Tavily 432/433、SerpAPI "run out of searches"、博查余额不足）时
+   标记该 Key 已用尽，直到额度重置前不再使用（重启后仍然跳过）
+4. 提供剩余额度，供 SearchService 在每轮分析开始前预估各搜索引擎的额度是否够用
+
+使用方式：
+    quota = get_search_key_quota('Tavily', monthly_limit=1000)
+    quota.add_keys(api_keys)
+    key = quota.acquire()          # 选择 Key 并计入一次请求
+    quota.record_error(key)        # 或 quota.mark_exhausted(key)
+
+说明：
+- 数据库中只保存 Key 的哈希，不保存明文
+- 月度额度按自然月重置（Tavily 免费版按自然月重置；SerpAPI 按订阅日重置，按自然月计算偏保守）
+- 请求在发起时计数（失败的请求通常同样计费，按发起计数偏保守）
+"""
+
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+# 连续错误达到该次数的 Key 暂时跳过（成功一次减一）
+MAX_KEY_ERRORS = 3
+
+# 无月度额度的搜索引擎（如按量付费的博查）余额不足时，暂停使用该 Key 的时长
+EXHAUSTED_RETRY_HOURS = 24
+
+
+def hash_key(api_key: str) -> str:
+    """Key 的哈希（数据库与日志中用于区分 Key）"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+def current_period(now: Optional[datetime] = None) -> str:
+    """当前额度周期（自然月，如 2026-01）"""
+    return (now or datetime.now()).strftime('%Y-%m')
+
+
+def next_period_start(now: Optional[datetime] = None) -> datetime:
+    """下一个额度周期的开始时间（下月 1 日零点）"""
+    now = now or datetime.now()
+    if now.month == 12:
+        return datetime(now.year + 1, 1, 1)
+    return datetime(now.year, now.month + 1, 1)
+
+
+class _KeyState:
+    """单个 Key 在当前周期的用量"""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.key_hash = hash_key(api_key)
+        self.requests = 0
+        self.errors = 0  # 本周期累计错误数（持久化）
+        self.recent_errors = 0  # 近期错误计数（仅内存，用于暂时跳过）
+        self.exhausted_until: Optional[datetime] = None
+
+    def exhausted(self, now: datetime) -> bool:
+        return self.exhausted_until is not None and self.exhausted_until > now
+
+
+class SearchKeyQuota:
+    """
+    单个搜索引擎的 Key 配额（进程内所有 SearchService 共用）
+
+    monthly_limit 为每个 Key 的月度请求上限，0 表示不限制
+    """
+
+    def __init__(self, provider: str, monthly_limit: int = 0, db=None):
+        """
+        Args:
+            provider: 搜索引擎名称
+            monthly_limit: 每个 Key 的月度请求上限（0 不限制）
+            db: DatabaseManager（持久化用量，为空时只在内存中统计）
+        """
+        self.provider = provider
+        self.monthly_limit = monthly_limit
+        self.db = db
+        self._keys: Dict[str, _KeyState] = {}
+        self._period = current_period()
+        self._lock = threading.Lock()
+
+    def add_keys(self, api_keys: List[str]) -> None:
+        """登记 Key（已登记的忽略），并加载本周期已用量"""
+        with self._lock:
+            new_keys = [key for key in api_keys if key and key not in self._keys]
+            for key in new_keys:
+                self._keys[key] = _KeyState(key)
+            if new_keys:
+                self._load([self._keys[key] for key in new_keys])
+
+    # ========== 周期与持久化 ==========
+
+    def _load(self, states: List[_KeyState]) -> None:
+        """从数据库加载本周期用量；需持有 _lock"""
+        if self.db is None:
+            return
+        try:
+            stored = self.db.get_search_key_usage(self.provider, self._period)
+        except Exception as e:
+            logger.warning(f"[{self.provider}] 读取 Key 用量失败，按 0 计算: {e}")
+            return
+        for state in states:
+            record = stored.get(state.key_hash)
+            if record is not None:
+                state.requests = record['requests']
+                state.errors = record['errors']
+                state.exhausted_until = record['exhausted_until']
+
+    def _roll_period(self) -> None:
+        """跨月时清零用量（已用尽标记按各自的到期时间失效）；需持有 _lock"""
+        period = current_period()
+        if period == self._period:
+            return
+        self._period = period
+        for state in self._keys.values():
+            state.requests = 0
+            state.errors = 0
+            state.recent_errors = 0
+        self._load(list(self._keys.values()))
+
+    def _reserve(self, state: _KeyState) -> bool:
+        """
+        在数据库中占用该 Key 的一次请求，并以数据库中的用量刷新状态；需持有 _lock
+
+        Returns:
+            是否占用成功（其他进程已用满额度或已标记用尽时为 False）
+        """
+        if self.db is None:
+            state.requests += 1
+            return True
+        try:
+            reserved, record = self.db.reserve_search_key_usage(
+                self.provider, state.key_hash, self._period, max_requests=self.monthly_limit
+            )
+        except Exception as e:
+            logger.debug(f"[{self.provider}] 占用 Key 额度失败，按进程内用量计数: {e}")
+            state.requests += 1
+            return True
+        state.requests = record['requests']
+        state.errors = record['errors']
+        state.exhausted_until = record['exhausted_until']
+        return reserved
+
+    def _persist(self, state: _KeyState, requests: int = 0, errors: int = 0,
+                 exhausted_until: Optional[datetime] = None) -> None:
+        if self.db is None:
+            return
+        try:
+            self.db.add_search_key_usage(
+                self.provider, state.key_hash, self._period,
+                requests=requests, errors=errors, exhausted_until=exhausted_until,
+            )
+        except Exception as e:
+            logger.debug(f"[{self.provider}] 保存 Key 用量失败: {e}")
+
+    # ========== Key 选择 ==========
+
+    def _remaining(self, state: _KeyState) -> Optional[int]:
+        if self.monthly_limit <= 0:
+            return None
+        return max(self.monthly_limit - state.requests, 0)
+
+    def _usable(self, state: _KeyState, now: datetime) -> bool:
+        return not state.exhausted(now) and self._remaining(state) != 0
+
+    def acquire(self) -> Optional[str]:
+        """
+        选择 Key 并计入一次请求
+
+        策略：跳过已用尽与近期错误过多的 Key，在其余 Key 中选剩余额度最多的（不限额度时选本月用得最少的）；
+        全部因错误被跳过时清零错误计数后重选。选中后在数据库中占用额度，
+        其他进程已用满或标记用尽时同步用量并改选下一个 Key
+
+        Returns:
+            API Key；全部 Key 额度已用尽时返回 None
+        """
+        with self._lock:
+            self._roll_period()
+            now = datetime.now()
+            rejected = set()
+            while True:
+                usable = [
+                    state for state in self._keys.values()
+                    if state.api_key not in rejected and self._usable(state, now)
+                ]
+                if not usable:
+                    return None
+                healthy = [state for state in usable if state.recent_errors < MAX_KEY_ERRORS]
+                if not healthy:
+                    logger.warning(f"[{self.provider}] 所有 API Key 都有错误记录，重置错误计数")
+                    for state in usable:
+                        state.recent_errors = 0
+                    healthy = usable
+                if self.monthly_limit > 0:
+                    chosen = max(healthy, key=lambda s: self.monthly_limit - s.requests)
+                else:
+                    chosen = min(healthy, key=lambda s: s.requests)
+                if self._reserve(chosen):
+                    return chosen.api_key
+                rejected.add(chosen.api_key)
+
+    def has_budget(self) -> bool:
+        """是否还有可用的 Key（未用尽且有剩余额度）"""
+        with self._lock:
+            self._roll_period()
+            now = datetime.now()
+            return any(self._usable(state, now) for state in self._keys.values())
+
+    # ========== 结果上报 ==========
+
+    def record_success(self, api_key: str) -> None:
+        """请求成功（近期错误计数减一）"""
+        with self._lock:
+            state = self._keys.get(api_key)
+            if state is not None and state.recent_errors > 0:
+                state.recent_errors -= 1
+
+    def record_error(self, api_key: str) -> None:
+        """请求失败"""
+        with self._lock:
+            state = self._keys.get(api_key)
+            if state is None:
+                return
+            state.errors += 1
+            state.recent_errors += 1
+            self._persist(state, errors=1)
+        logger.warning(f"[{self.provider}] API Key {state.key_hash[:8]} 错误计数: {state.recent_errors}")
+
+    def mark_exhausted(self, api_key: str) -> None:
+        """服务端返回额度用尽：额度重置前不再使用该 Key"""
+        with self._lock:
+            state = self._keys.get(api_key)
+            if state is None:
+                return
+            now = datetime.now()
+            if self.monthly_limit > 0:
+                state.exhausted_until = next_period_start(now)
+            else:
+                state.exhausted_until = now + timedelta(hours=EXHAUSTED_RETRY_HOURS)
+            state.errors += 1
+            self._persist(state, errors=1, exhausted_until=state.exhausted_until)
+        logger.warning(
+            f"[{self.provider}] API Key {state.key_hash[:8]} 额度已用尽，"
+            f"{state.exhausted_until:%Y-%m-%d %H:%M} 前不再使用"
+        )
+
+    # ========== 统计 ==========
+
+    def remaining(self) -> Optional[int]:
+        """全部可用 Key 的剩余额度之和（不限额度时为 None，全部用尽时为 0）"""
+        with self._lock:
+            self._roll_period()
+            now = datetime.now()
+            usable = [state for state in self._keys.values() if self._usable(state, now)]
+            if usable and self.monthly_limit <= 0:
+                return None
+            return sum(self._remaining(state) for state in usable)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """本周期各 Key 的用量（Key 以哈希前缀表示）"""
+        with self._lock:
+            self._roll_period()
+            now = datetime.now()
+            keys = [
+                {
+                    'key': state.key_hash[:8],
+                    'requests': state.requests,
+                    'errors': state.errors,
+                    'remaining': self._remaining(state),
+                    'exhausted_until': state.exhausted_until if state.exhausted(now) else None,
+                }
+                for state in self._keys.values()
+            ]
+        return {
+            'period': self._period,
+            'monthly_limit': self.monthly_limit,
+            'requests': sum(k['requests'] for k in keys),
+            'available_keys': sum(1 for k in keys if k['exhausted_until'] is None and k['remaining'] != 0),
+            'keys': keys,
+        }
+
+
+_key_quotas: Dict[str, SearchKeyQuota] = {}
+_key_quotas_lock = threading.Lock()
+
+
+def get_search_key_quota(provider: str, monthly_limit: int = 0) -> SearchKeyQuota:
+    """进程内共享的搜索引擎 Key 配额（每个搜索引擎一个，首次调用时创建）"""
+    with _key_quotas_lock:
+        quota = _key_quotas.get(provider)
+        if quota is None:
+            from storage import get_db
+            try:
+                db = get_db()
+            except Exception as e:
+                logger.warning(f"[{provider}] 数据库不可用，Key 用量仅在内存中统计: {e}")
+                db = None
+            quota = _key_quotas[provider] = SearchKeyQuota(provider, monthly_limit=monthly_limit, db=db)
+        else:
+            quota.monthly_limit = monthly_limit
+        return quota
+
+
+def reset_search_key_quotas() -> None:
+    """清空进程内的 Key 配额（用于测试）"""
+    with _key_quotas_lock:
+        _key_quotas.clear()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+搜索路由 - 按搜索引擎近期耗时与错误率排序，超时对冲
+===================================
+
+职责：
+1. 按搜索引擎统计成功请求耗时的指数加权平均（EWMA）与波动，以及错误率的 EWMA
+2. 按"期望得到成功结果的耗时"（平均耗时 / 成功率）对搜索引擎排序，最快的优先
+3. 给出对冲等待时间：平均耗时 + 4 倍波动（同 TCP 重传超时的估算方式），
+   首选搜索引擎超过该时间未返回时，SearchService 并行请求排名第二的搜索引擎
+4. 统计各搜索引擎的请求数、错误数、对冲次数与胜出次数
+
+使用方式：
+    router = get_search_router()
+    for name in router.rank(['Bocha', 'Tavily', 'SerpAPI']):
+        ...
+    router.record('Bocha', latency=0.8, success=True)
+    deadline = router.deadline('Bocha')
+
+说明：
+- 没有样本的搜索引擎按 default_latency 估算，排名相同时保持配置的优先级顺序
+- 统计在进程内共享（定时分析、大盘复盘、Web 任务），重启后重新积累
+"""
+
+import threading
+from typing import Optional, List, Dict, Any
+
+# 排序时成功率的下限（避免全部失败的搜索引擎期望耗时为无穷大）
+_MIN_SUCCESS_RATE = 0.1
+
+
+class _ProviderStats:
+    """单个搜索引擎的 EWMA 统计"""
+
+    def __init__(self):
+        self.latency: Optional[float] = None  # 成功请求耗时的 EWMA（秒）
+        self.latency_dev = 0.0  # 耗时波动的 EWMA（秒）
+        self.error_rate = 0.0  # 错误率的 EWMA
+        self.requests = 0
+        self.errors = 0
+        self.hedged = 0  # 作为首选被对冲的次数
+        self.hedge_wins = 0  # 作为对冲方胜出的次数
+
+
+class SearchRouter:
+    """
+    按 EWMA 耗时与错误率给搜索引擎排序，并给出对冲等待时间
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        beta: float = 0.25,
+        default_latency: float = 2.0,
+        default_deadline: float = 3.0,
+        min_deadline: float = 1.0,
+        max_deadline: float = 10.0
+    ):
+        """
+        Args:
+            alpha: 耗时与错误率 EWMA 的平滑系数（越大越偏向最近的请求）
+            beta: 耗时波动 EWMA 的平滑系数
+            default_latency: 没有样本时按此耗时排序（秒）
+            default_deadline: 首选搜索引擎没有样本时的对冲等待时间（秒）
+            min_deadline: 对冲等待时间下限（秒）
+            max_deadline: 对冲等待时间上限（秒，一般取搜索读取超时）
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.default_latency = default_latency
+        self.default_deadline = default_deadline
+        self.min_deadline = min_deadline
+        self.max_deadline = max_deadline
+        self._stats: Dict[str, _ProviderStats] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> _ProviderStats:
+        """需持有 _lock"""
+        return self._stats.setdefault(name, _ProviderStats())
+
+    def record(self, name: str, latency: float, success: bool) -> None:
+        """记录一次搜索请求（失败请求只计入错误率，不计入耗时）"""
+        with self._lock:
+            stats = self._get(name)
+            stats.requests += 1
+            stats.error_rate += self.alpha * ((0.0 if success else 1.0) - stats.error_rate)
+            if not success:
+                stats.errors += 1
+                return
+            if stats.latency is None:
+                stats.latency = latency
+                stats.latency_dev = latency / 2
+            else:
+                stats.latency_dev += self.beta * (abs(latency - stats.latency) - stats.latency_dev)
+                stats.latency += self.alpha * (latency - stats.latency)
+
+    def record_hedge(self, primary: str, winner: Optional[str]) -> None:
+        """
+        记录一次对冲
+
+        Args:
+            primary: 被对冲的首选搜索引擎
+            winner: 先返回可用结果的搜索引擎（都失败时为 None）
+        """
+        with self._lock:
+            self._get(primary).hedged += 1
+            if winner is not None and winner != primary:
+                self._get(winner).hedge_wins += 1
+
+    def expected_cost(self, name: str) -> float:
+        """期望得到成功结果的耗时：平均耗时 / 成功率（秒）"""
+        with self._lock:
+            stats = self._get(name)
+            latency = self.default_latency if stats.latency is None else stats.latency
+            return latency / max(1.0 - stats.error_rate, _MIN_SUCCESS_RATE)
+
+    def rank(self, names: List[str]) -> List[str]:
+        """按期望耗时从低到高排序（相同时保持原顺序）"""
+        costs = {name: self.expected_cost(name) for name in names}
+        return sorted(names, key=lambda name: costs[name])
+
+    def deadline(self, name: str) -> float:
+        """首选搜索引擎等待多久仍未返回即发起对冲（秒）"""
+        with self._lock:
+            stats = self._get(name)
+            if stats.latency is None:
+                return self.default_deadline
+            estimate = stats.latency + 4 * stats.latency_dev
+        return min(max(estimate, self.min_deadline), self.max_deadline)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各搜索引擎的耗时、错误率、对冲统计（按当前排名排序）"""
+        with self._lock:
+            names = list(self._stats)
+        stats = {}
+        for name in self.rank(names):
+            with self._lock:
+                item = self._stats[name]
+                stats[name] = {
+                    'latency': item.latency,
+                    'error_rate': item.error_rate,
+                    'requests': item.requests,
+                    'errors': item.errors,
+                    'hedged': item.hedged,
+                    'hedge_wins': item.hedge_wins,
+                }
+            stats[name]['deadline'] = self.deadline(name)
+        return stats
+
+
+_search_router: Optional[SearchRouter] = None
+_search_router_lock = threading.Lock()
+
+
+def get_search_router() -> SearchRouter:
+    """进程内共享的搜索路由（首次调用时按配置创建）"""
+    global _search_router
+    with _search_router_lock:
+        if _search_router is None:
+            from config import get_config
+            config = get_config()
+            _search_router = SearchRouter(
+                default_deadline=config.search_hedge_delay,
+                max_deadline=config.search_timeout,
+            )
+        return _search_router
@@ -6,19 +6,28 @@ A股自选股智能分析系统 - 搜索服务模块
 
 职责：
 1. 提供统一的新闻搜索接口
-2. 支持 Tavily 和 SerpAPI 两种搜索引擎
-3. 多 Key 负载均衡和故障转移
-4. 搜索结果缓存和格式化
+2. 支持 Bocha、Tavily 和 SerpAPI 三种搜索引擎
+3. 多 Key 负载均衡和故障转移（search_quota 按 Key、按月持久化用量，优先使用剩余额度最多的 Key）
+4. 搜索结果缓存（search_cache，按维度 TTL、相同查询合并）和格式化
+5. 每个搜索引擎复用一个带连接池的 HTTP 会话（keep-alive，省去每次搜索的 DNS/TCP/TLS 建连）
+6. 按近期耗时与错误率选择搜索引擎（search_routing），首选超时未返回时并行请求第二快的搜索引擎
 """
 
 import logging
 import random
+import threading
 import time
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from itertools import cycle
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from search_quota import SearchKeyQuota, get_search_key_quota
+from search_routing import get_search_router
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +56,8 @@ class SearchResponse:
     success: bool = True
     error_message: Optional[str] = None
     search_time: float = 0.0  # 搜索耗时（秒）
+    from_cache: bool = False  # 来自搜索缓存（未调用搜索引擎）
+    quota_exhausted: bool = False  # 服务端返回额度用尽（该 Key 在额度重置前不再使用）
     
     def to_context(self, max_results: int = 5) -> str:
         """将搜索结果转换为可用于 AI 分析的上下文"""
@@ -60,22 +71,58 @@ class SearchResponse:
         return "\n".join(lines)
 
 
+# 搜索维度（决定搜索缓存的有效期）
+DIMENSION_LATEST = 'latest_news'
+DIMENSION_RISK = 'risk_check'
+DIMENSION_EARNINGS = 'earnings'
+DIMENSION_NEWS = 'news'  # search_stock_news / search_stock_events（含大盘新闻），有效期同最新消息
+
+# HTTP 会话默认参数
+DEFAULT_POOL_SIZE = 10  # 每个搜索引擎的连接池大小（应不小于并发线程数）
+DEFAULT_TIMEOUT = 10.0  # 读取超时（秒）
+CONNECT_TIMEOUT = 5.0  # 建连超时（秒）
+
+
 class BaseSearchProvider(ABC):
     """搜索引擎基类"""
     
-    def __init__(self, api_keys: List[str], name: str):
+    # API 地址（可通过 base_url 参数覆盖，如指向本地替身服务）
+    DEFAULT_BASE_URL = ''
+    
+    # 每个 Key 的月度请求额度（0 表示不限制，如按量付费）
+    DEFAULT_MONTHLY_QUOTA = 0
+    
+    def __init__(
+        self,
+        api_keys: List[str],
+        name: str,
+        base_url: Optional[str] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        monthly_quota: Optional[int] = None
+    ):
         """
         初始化搜索引擎
         
         Args:
             api_keys: API Key 列表（支持多个 key 负载均衡）
             name: 搜索引擎名称
+            base_url: API 地址（默认 DEFAULT_BASE_URL）
+            timeout: 读取超时（秒）
+            pool_size: 连接池大小
+            monthly_quota: 每个 Key 的月度请求额度（默认 DEFAULT_MONTHLY_QUOTA）
         """
         self._api_keys = api_keys
         self._name = name
-        self._key_cycle = cycle(api_keys) if api_keys else None
-        self._key_usage: Dict[str, int] = {key: 0 for key in api_keys}
-        self._key_errors: Dict[str, int] = {key: 0 for key in api_keys}
+        self._quota = get_search_key_quota(
+            name, self.DEFAULT_MONTHLY_QUOTA if monthly_quota is None else monthly_quota
+        )
+        self._quota.add_keys(api_keys)
+        self.base_url = (base_url or self.DEFAULT_BASE_URL).rstrip('/')
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
     
     @property
     def name(self) -> str:
@@ -83,41 +130,61 @@ class BaseSearchProvider(ABC):
     
     @property
     def is_available(self) -> bool:
-        """检查是否有可用的 API Key"""
-        return bool(self._api_keys)
+        """检查是否有可用的 API Key（已配置且本月额度未用尽）"""
+        return bool(self._api_keys) and self._quota.has_budget()
+    
+    @property
+    def quota(self) -> SearchKeyQuota:
+        """Key 配额（进程内同名搜索引擎共用）"""
+        return self._quota
     
     def _get_next_key(self) -> Optional[str]:
         """
-        获取下一个可用的 API Key（负载均衡）
+        获取下一个可用的 API Key（负载均衡），并计入一次请求
         
-        策略：轮询 + 跳过错误过多的 key
+        策略：剩余额度最多优先 + 跳过已用尽与错误过多的 key（见 SearchKeyQuota.acquire）
         """
-        if not self._key_cycle:
-            return None
-        
-        # 最多尝试所有 key
-        for _ in range(len(self._api_keys)):
-            key = next(self._key_cycle)
-            # 跳过错误次数过多的 key（超过 3 次）
-            if self._key_errors.get(key, 0) < 3:
-                return key
-        
-        # 所有 key 都有问题，重置错误计数并返回第一个
-        logger.warning(f"[{self._name}] 所有 API Key 都有错误记录，重置错误计数")
-        self._key_errors = {key: 0 for key in self._api_keys}
-        return self._api_keys[0] if self._api_keys else None
+        return self._quota.acquire()
     
     def _record_success(self, key: str) -> None:
         """记录成功使用"""
-        self._key_usage[key] = self._key_usage.get(key, 0) + 1
-        # 成功后减少错误计数
-        if key in self._key_errors and self._key_errors[key] > 0:
-            self._key_errors[key] -= 1
+        self._quota.record_success(key)
+    
+    def _record_error(self, key: str, quota_exhausted: bool = False) -> None:
+        """记录错误（额度用尽时在重置前不再使用该 key）"""
+        if quota_exhausted:
+            self._quota.mark_exhausted(key)
+        else:
+            self._quota.record_error(key)
+    
+    @property
+    def session(self) -> requests.Session:
+        """
+        带连接池的 HTTP 会话（首次使用时创建，分析线程共用）
+        
+        连接池满时不阻塞（临时新建连接，用完即关），重试由多 Key / 多引擎故障转移处理
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+    
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """通过连接池发送请求（默认超时：建连 CONNECT_TIMEOUT 秒，读取 timeout 秒）"""
+        kwargs.setdefault('timeout', (CONNECT_TIMEOUT, self.timeout))
+        return self.session.request(method, f"{self.base_url}{path}", **kwargs)
     
-    def _record_error(self, key: str) -> None:
-        """记录错误"""
-        self._key_errors[key] = self._key_errors.get(key, 0) + 1
-        logger.warning(f"[{self._name}] API Key {key[:8]}... 错误计数: {self._key_errors[key]}")
+    def close(self) -> None:
+        """关闭 HTTP 会话（释放连接池）"""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
     
     @abstractmethod
     def _do_search(self, query: str, api_key: str, max_results: int) -> SearchResponse:
@@ -142,7 +209,8 @@ class BaseSearchProvider(ABC):
                 results=[],
                 provider=self._name,
                 success=False,
-                error_message=f"{self._name} 未配置 API Key"
+                error_message=f"{self._name} 所有 API Key 额度已用尽" if self._api_keys
+                else f"{self._name} 未配置 API Key"
             )
         
         start_time = time.time()
@@ -154,7 +222,7 @@ class BaseSearchProvider(ABC):
                 self._record_success(api_key)
                 logger.info(f"[{self._name}] 搜索 '{query}' 成功，返回 {len(response.results)} 条结果，耗时 {response.search_time:.2f}s")
             else:
-                self._record_error(api_key)
+                self._record_error(api_key, quota_exhausted=response.quota_exhausted)
             
             return response
             
@@ -184,34 +252,42 @@ class TavilySearchProvider(BaseSearchProvider):
     文档：https://docs.tavily.com/
     """
     
-    def __init__(self, api_keys: List[str]):
-        super().__init__(api_keys, "Tavily")
+    DEFAULT_BASE_URL = 'https://api.tavily.com'
+    DEFAULT_MONTHLY_QUOTA = 1000
+    
+    def __init__(self, api_keys: List[str], **kwargs):
+        super().__init__(api_keys, "Tavily", **kwargs)
     
     def _do_search(self, query: str, api_key: str, max_results: int) -> SearchResponse:
-        """执行 Tavily 搜索"""
+        """执行 Tavily 搜索（直接调用 REST API，复用连接池）"""
         try:
-            from tavily import TavilyClient
-        except ImportError:
-            return SearchResponse(
-                query=query,
-                results=[],
-                provider=self.name,
-                success=False,
-                error_message="tavily-python 未安装，请运行: pip install tavily-python"
-            )
-        
-        try:
-            client = TavilyClient(api_key=api_key)
-            
             # 执行搜索（优化：使用advanced深度、限制最近7天）
-            response = client.search(
-                query=query,
-                search_depth="advanced",  # advanced 获取更多结果
-                max_results=max_results,
-                include_answer=False,
-                include_raw_content=False,
-                days=7,  # 只搜索最近7天的内容
-            )
+            http_response = self._request('POST', '/search', headers={
+                'Authorization': f'Bearer {api_key}',
+                'Content-Type': 'application/json',
+            }, json={
+                "query": query,
+                "search_depth": "advanced",  # advanced 获取更多结果
+                "max_results": max_results,
+                "include_answer": False,
+                "include_raw_content": False,
+                "days": 7,  # 只搜索最近7天的内容
+            })
+            if http_response.status_code in (432, 433):
+                # 432 套餐额度用尽，433 按量付费额度用尽
+                return SearchResponse(
+                    query=query,
+                    results=[],
+                    provider=self.name,
+                    success=False,
+                    error_message=f"API 配额已用尽: HTTP {http_response.status_code}: {http_response.text[:200]}",
+                    quota_exhausted=True,
+                )
+            if http_response.status_code != 200:
+                # 429 请求过快
+                reason = 'rate limit, ' if http_response.status_code == 429 else ''
+                raise RuntimeError(f"{reason}HTTP {http_response.status_code}: {http_response.text[:200]}")
+            response = http_response.json()
             
             # 记录原始响应到日志
             logger.info(f"[Tavily] 搜索完成，query='{query}', 返回 {len(response.get('results', []))} 条结果")
@@ -273,32 +349,35 @@ class SerpAPISearchProvider(BaseSearchProvider):
     文档：https://serpapi.com/
     """
     
-    def __init__(self, api_keys: List[str]):
-        super().__init__(api_keys, "SerpAPI")
+    DEFAULT_BASE_URL = 'https://serpapi.com'
+    DEFAULT_MONTHLY_QUOTA = 100
+    
+    def __init__(self, api_keys: List[str], **kwargs):
+        super().__init__(api_keys, "SerpAPI", **kwargs)
     
     def _do_search(self, query: str, api_key: str, max_results: int) -> SearchResponse:
-        """执行 SerpAPI 搜索"""
-        try:
-            from serpapi import GoogleSearch
-        except ImportError:
-            return SearchResponse(
-                query=query,
-                results=[],
-                provider=self.name,
-                success=False,
-                error_message="google-search-results 未安装，请运行: pip install google-search-results"
-            )
-        
+        """执行 SerpAPI 搜索（直接调用 REST API，复用连接池）"""
         try:
             # 使用百度搜索（对中文股票新闻更友好）
             params = {
                 "engine": "baidu",  # 使用百度搜索
                 "q": query,
                 "api_key": api_key,
+                "output": "json",
             }
             
-            search = GoogleSearch(params)
-            response = search.get_dict()
+            response = self._request('GET', '/search.json', params=params).json()
+            if response.get('error'):
+                if 'run out of searches' in response['error'].lower():
+                    return SearchResponse(
+                        query=query,
+                        results=[],
+                        provider=self.name,
+                        success=False,
+                        error_message=f"API 配额已用尽: {response['error']}",
+                        quota_exhausted=True,
+                    )
+                raise RuntimeError(response['error'])
             
             # 记录原始响应到日志
             logger.debug(f"[SerpAPI] 原始响应 keys: {response.keys()}")
@@ -357,26 +436,14 @@ class BochaSearchProvider(BaseSearchProvider):
     文档：https://bocha-ai.feishu.cn/wiki/RXEOw02rFiwzGSkd9mUcqoeAnNK
     """
     
-    def __init__(self, api_keys: List[str]):
-        super().__init__(api_keys, "Bocha")
+    DEFAULT_BASE_URL = 'https://api.bocha.cn'
+    
+    def __init__(self, api_keys: List[str], **kwargs):
+        super().__init__(api_keys, "Bocha", **kwargs)
     
     def _do_search(self, query: str, api_key: str, max_results: int) -> SearchResponse:
         """执行博查搜索"""
         try:
-            import requests
-        except ImportError:
-            return SearchResponse(
-                query=query,
-                results=[],
-                provider=self.name,
-                success=False,
-                error_message="requests 未安装，请运行: pip install requests"
-            )
-        
-        try:
-            # API 端点
-            url = "https://api.bocha.cn/v1/web-search"
-            
             # 请求头
             headers = {
                 'Authorization': f'Bearer {api_key}',
@@ -392,7 +459,7 @@ class BochaSearchProvider(BaseSearchProvider):
             }
             
             # 执行搜索
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
+            response = self._request('POST', '/v1/web-search', headers=headers, json=payload)
             
             # 检查HTTP状态码
             if response.status_code != 200:
@@ -425,7 +492,8 @@ class BochaSearchProvider(BaseSearchProvider):
                     results=[],
                     provider=self.name,
                     success=False,
-                    error_message=error_msg
+                    error_message=error_msg,
+                    quota_exhausted=response.status_code == 403
                 )
             
             # 解析响应
@@ -536,7 +604,7 @@ class SearchService:
     
     功能：
     1. 管理多个搜索引擎
-    2. 自动故障转移
+    2. 按近期耗时与错误率选择搜索引擎，超时对冲，自动故障转移
     3. 结果聚合和格式化
     """
     
@@ -545,6 +613,8 @@ class SearchService:
         bocha_keys: Optional[List[str]] = None,
         tavily_keys: Optional[List[str]] = None,
         serpapi_keys: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+        pool_size: Optional[int] = None,
     ):
         """
         初始化搜索服务
@@ -553,23 +623,43 @@ class SearchService:
             bocha_keys: 博查搜索 API Key 列表
             tavily_keys: Tavily API Key 列表
             serpapi_keys: SerpAPI Key 列表
+            timeout: 搜索请求读取超时（秒，默认读取 SEARCH_TIMEOUT）
+            pool_size: 每个搜索引擎的连接池大小（默认读取 SEARCH_POOL_SIZE）
         """
+        from config import get_config
+        config = get_config()
+        self._cache = None
+        if config.search_cache_enabled:
+            from search_cache import get_search_cache
+            self._cache = get_search_cache()
+        self._router = get_search_router()
+        self._hedge = config.search_hedge
+        http_options = {
+            'timeout': timeout or config.search_timeout,
+            'pool_size': pool_size or config.search_pool_size,
+        }
         self._providers: List[BaseSearchProvider] = []
         
         # 初始化搜索引擎（按优先级排序）
         # 1. Bocha 优先（中文搜索优化，AI摘要）
         if bocha_keys:
-            self._providers.append(BochaSearchProvider(bocha_keys))
+            self._providers.append(BochaSearchProvider(
+                bocha_keys, monthly_quota=config.bocha_monthly_quota, **http_options
+            ))
             logger.info(f"已配置 Bocha 搜索，共 {len(bocha_keys)} 个 API Key")
         
         # 2. Tavily（免费额度更多，每月 1000 次）
         if tavily_keys:
-            self._providers.append(TavilySearchProvider(tavily_keys))
+            self._providers.append(TavilySearchProvider(
+                tavily_keys, monthly_quota=config.tavily_monthly_quota, **http_options
+            ))
             logger.info(f"已配置 Tavily 搜索，共 {len(tavily_keys)} 个 API Key")
         
         # 3. SerpAPI 作为备选（每月 100 次）
         if serpapi_keys:
-            self._providers.append(SerpAPISearchProvider(serpapi_keys))
+            self._providers.append(SerpAPISearchProvider(
+                serpapi_keys, monthly_quota=config.serpapi_monthly_quota, **http_options
+            ))
             logger.info(f"已配置 SerpAPI 搜索，共 {len(serpapi_keys)} 个 API Key")
         
         if not self._providers:
@@ -580,6 +670,154 @@ class SearchService:
         """检查是否有可用的搜索引擎"""
         return any(p.is_available for p in self._providers)
     
+    def close(self) -> None:
+        """关闭各搜索引擎的 HTTP 会话"""
+        for provider in self._providers:
+            provider.close()
+    
+    def forecast_quota(self, stock_count: int, market_review: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        预估本轮分析各搜索引擎的额度消耗（分析开始前调用）
+        
+        按当前路由排名模拟：每只股票 3 个维度的搜索都由排名第一的搜索引擎承担，
+        其额度耗尽后依次改用后面的搜索引擎；大盘复盘的相同查询合并后计 1 次。
+        未计入缓存命中与对冲请求。
+        
+        Args:
+            stock_count: 待分析股票数
+            market_review: 本轮是否包含大盘复盘
+            
+        Returns:
+            {搜索引擎: {'available_keys': 可用 Key 数, 'remaining': 剩余额度（None 不限）, 'planned': 预计请求数,
+                       'exhausted': 本轮是否会用尽（其后的搜索改用其他搜索引擎）}}，
+            另含 '_total': {'planned': 总请求数, 'uncovered': 额度不足无法搜索的请求数}
+        """
+        demand = stock_count * 3 + (1 if market_review else 0)
+        planned: Dict[str, int] = {}
+        for provider in self._ranked_providers():
+            remaining = provider.quota.remaining()
+            planned[provider.name] = demand if remaining is None else min(demand, remaining)
+            demand -= planned[provider.name]
+        uncovered = demand
+        
+        forecast: Dict[str, Dict[str, Any]] = {}
+        for provider in self._providers:
+            remaining = provider.quota.remaining()
+            count = planned.get(provider.name, 0)
+            forecast[provider.name] = {
+                'available_keys': provider.quota.get_stats()['available_keys'],
+                'remaining': remaining,
+                'planned': count,
+                'exhausted': remaining is not None and count >= remaining,
+            }
+        forecast['_total'] = {'planned': sum(planned.values()) + uncovered, 'uncovered': uncovered}
+        return forecast
+    
+    def get_provider_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各搜索引擎的 EWMA 耗时、错误率与对冲统计（按当前排名排序）"""
+        return self._router.get_stats()
+    
+    def _ranked_providers(self) -> List[BaseSearchProvider]:
+        """可用的搜索引擎，按期望耗时从快到慢排序"""
+        providers = {p.name: p for p in self._providers if p.is_available}
+        return [providers[name] for name in self._router.rank(list(providers))]
+    
+    def _timed_search(self, provider: BaseSearchProvider, query: str, max_results: int) -> SearchResponse:
+        """调用单个搜索引擎，并将耗时与成败计入路由统计"""
+        response = provider.search(query, max_results)
+        self._router.record(provider.name, response.search_time, response.success)
+        return response
+    
+    def _hedged_search(
+        self,
+        primary: BaseSearchProvider,
+        backup: Optional[BaseSearchProvider],
+        query: str,
+        max_results: int,
+        accept: Callable[[SearchResponse], bool]
+    ) -> Tuple[SearchResponse, bool]:
+        """
+        请求首选搜索引擎，超过对冲等待时间未返回时并行请求 backup，先得到可用结果的一方胜出
+        
+        落败的请求无法中断，在后台完成后只计入路由统计。
+        
+        Returns:
+            (响应, 是否已请求 backup)
+        """
+        if backup is None:
+            return self._timed_search(primary, query, max_results), False
+        
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='search_hedge')
+        try:
+            first = executor.submit(self._timed_search, primary, query, max_results)
+            deadline = self._router.deadline(primary.name)
+            done, _ = wait([first], timeout=deadline)
+            if done:
+                return first.result(), False
+            
+            logger.info(f"[搜索路由] {primary.name} {deadline:.1f}s 未返回，并行请求 {backup.name}")
+            second = executor.submit(self._timed_search, backup, query, max_results)
+            pending = {first: primary.name, second: backup.name}
+            fallback: Optional[SearchResponse] = None
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    response = future.result()
+                    if accept(response):
+                        self._router.record_hedge(primary.name, name)
+                        logger.info(f"[搜索路由] {name} 先返回结果")
+                        return response, True
+                    fallback = fallback or response
+            self._router.record_hedge(primary.name, None)
+            return fallback, True
+        finally:
+            executor.shutdown(wait=False)
+    
+    def _search_with_failover(
+        self,
+        query: str,
+        max_results: int,
+        accept: Callable[[SearchResponse], bool],
+        error_message: str = "所有搜索引擎都不可用或搜索失败"
+    ) -> SearchResponse:
+        """
+        按路由排名依次尝试各搜索引擎，直到得到可用结果
+        
+        开启 SEARCH_HEDGE 时，首选超时未返回会并行请求排名第二的搜索引擎
+        """
+        ranked = self._ranked_providers()
+        while ranked:
+            provider = ranked.pop(0)
+            backup = ranked[0] if self._hedge and ranked else None
+            response, backup_used = self._hedged_search(provider, backup, query, max_results, accept)
+            if backup_used:
+                ranked.pop(0)
+            if accept(response):
+                logger.info(f"使用 {response.provider} 搜索成功")
+                return response
+            logger.warning(f"{response.provider} 搜索失败: {response.error_message}，尝试下一个引擎")
+        
+        return SearchResponse(
+            query=query,
+            results=[],
+            provider="None",
+            success=False,
+            error_message=error_message
+        )
+    
+    def _cached_search(
+        self,
+        query: str,
+        max_results: int,
+        dimension: str,
+        fetch: Callable[[], SearchResponse]
+    ) -> SearchResponse:
+        """经由搜索缓存执行搜索（未启用缓存时直接调用 fetch）"""
+        if self._cache is None:
+            return fetch()
+        return self._cache.get_or_fetch(query, max_results, dimension, fetch)
+    
     def search_stock_news(
         self,
         stock_code: str,
@@ -615,27 +853,11 @@ class SearchService:
         
         logger.info(f"搜索股票新闻: {stock_name}({stock_code})")
         
-        # 依次尝试各个搜索引擎
-        for provider in self._providers:
-            if not provider.is_available:
-                continue
-            
-            response = provider.search(query, max_results)
-            
-            if response.success and response.results:
-                logger.info(f"使用 {provider.name} 搜索成功")
-                return response
-            else:
-                logger.warning(f"{provider.name} 搜索失败: {response.error_message}，尝试下一个引擎")
+        def fetch() -> SearchResponse:
+            # 按路由排名依次尝试各个搜索引擎
+            return self._search_with_failover(query, max_results, lambda r: r.success and bool(r.results))
         
-        # 所有引擎都失败
-        return SearchResponse(
-            query=query,
-            results=[],
-            provider="None",
-            success=False,
-            error_message="所有搜索引擎都不可用或搜索失败"
-        )
+        return self._cached_search(query, max_results, DIMENSION_NEWS, fetch)
     
     def search_stock_events(
         self,
@@ -665,23 +887,11 @@ class SearchService:
         
         logger.info(f"搜索股票事件: {stock_name}({stock_code}) - {event_types}")
         
-        # 依次尝试各个搜索引擎
-        for provider in self._providers:
-            if not provider.is_available:
-                continue
-            
-            response = provider.search(query, max_results=5)
-            
-            if response.success:
-                return response
+        def fetch() -> SearchResponse:
+            # 按路由排名依次尝试各个搜索引擎
+            return self._search_with_failover(query, 5, lambda r: r.success, error_message="事件搜索失败")
         
-        return SearchResponse(
-            query=query,
-            results=[],
-            provider="None",
-            success=False,
-            error_message="事件搜索失败"
-        )
+        return self._cached_search(query, 5, DIMENSION_NEWS, fetch)
     
     def search_comprehensive_intel(
         self,
@@ -711,17 +921,17 @@ class SearchService:
         # 定义搜索维度
         search_dimensions = [
             {
-                'name': 'latest_news',
+                'name': DIMENSION_LATEST,
                 'query': f"{stock_name} {stock_code} 最新 新闻 2026年1月",
                 'desc': '最新消息'
             },
             {
-                'name': 'risk_check', 
+                'name': DIMENSION_RISK,
                 'query': f"{stock_name} 减持 处罚 利空 风险",
                 'desc': '风险排查'
             },
             {
-                'name': 'earnings',
+                'name': DIMENSION_EARNINGS,
                 'query': f"{stock_name} 年报预告 业绩预告 业绩快报 2025年报",
                 'desc': '业绩预期'
             },
@@ -729,34 +939,29 @@ class SearchService:
         
         logger.info(f"开始多维度情报搜索: {stock_name}({stock_code})")
         
-        # 轮流使用不同的搜索引擎
-        provider_index = 0
-        
         for dim in search_dimensions:
             if search_count >= max_searches:
                 break
             
-            # 选择搜索引擎（轮流使用）
-            available_providers = [p for p in self._providers if p.is_available]
-            if not available_providers:
+            if not self.is_available:
                 break
             
-            provider = available_providers[provider_index % len(available_providers)]
-            provider_index += 1
-            
-            logger.info(f"[情报搜索] {dim['desc']}: 使用 {provider.name}")
-            
-            response = provider.search(dim['query'], max_results=3)
+            # 选择搜索引擎：当前最快的优先，超时对冲，失败时故障转移
+            response = self._cached_search(
+                dim['query'], 3, dim['name'],
+                lambda: self._search_with_failover(dim['query'], 3, lambda r: r.success)
+            )
             results[dim['name']] = response
             search_count += 1
             
             if response.success:
-                logger.info(f"[情报搜索] {dim['desc']}: 获取 {len(response.results)} 条结果")
+                logger.info(f"[情报搜索] {dim['desc']}: {response.provider} 获取 {len(response.results)} 条结果")
             else:
                 logger.warning(f"[情报搜索] {dim['desc']}: 搜索失败 - {response.error_message}")
             
-            # 短暂延迟避免请求过快
-            time.sleep(0.5)
+            # 短暂延迟避免请求过快（命中缓存时未调用搜索引擎，无需等待）
+            if not response.from_cache:
+                time.sleep(0.5)
         
         return results
     
@@ -865,6 +1070,8 @@ def get_search_service() -> SearchService:
 def reset_search_service() -> None:
     """重置搜索服务（用于测试）"""
     global _search_service
+    if _search_service is not None:
+        _search_service.close()
     _search_service = None
 
 
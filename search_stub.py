@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+===================================
+本地搜索替身服务 - Bocha / Tavily / SerpAPI 接口，用于离线对比连接复用效果
+===================================
+
+职责：
+1. 提供三种搜索接口的最小实现，返回占位新闻结果：
+   - Bocha:   POST /v1/web-search
+   - Tavily:  POST /search
+   - SerpAPI: GET  /search.json
+2. 每个新建 TCP 连接额外等待 connect_delay 秒，模拟公网 DNS + TCP + TLS 握手的往返耗时
+   （keep-alive 复用的连接不再等待）
+3. GET /stats 查看请求数与新建连接数
+
+使用方式：
+    # 启动替身服务，让搜索引擎指向它
+    python search_stub.py --port 8910 --connect-delay 0.15
+
+    # 内置对比：每个搜索引擎分别用"每次新建连接"（改造前）与"连接池会话"（改造后）并发搜索 N 次
+    python search_stub.py --bench 60 --workers 3 --connect-delay 0.15
+
+说明：
+- 仅依赖标准库（http.server）与 requests，不访问任何外部服务
+"""
+
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List, Type
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from search_service import (
+    BaseSearchProvider,
+    BochaSearchProvider,
+    CONNECT_TIMEOUT,
+    SerpAPISearchProvider,
+    TavilySearchProvider,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _items(query: str, count: int) -> List[Dict[str, str]]:
+    """占位搜索结果"""
+    today = time.strftime('%Y-%m-%d')
+    return [
+        {
+            'title': f"{query} 相关新闻 {i + 1}",
+            'snippet': f"替身服务返回的第 {i + 1} 条模拟摘要：{query}",
+            'url': f"https://news.example.com/{i + 1}",
+            'date': today,
+        }
+        for i in range(count)
+    ]
+
+
+class SearchStubState:
+    """替身服务的行为参数与统计（各处理线程共享）"""
+
+    def __init__(self, latency: float = 0.05, connect_delay: float = 0.15):
+        """
+        Args:
+            latency: 每次搜索的处理耗时（秒）
+            connect_delay: 每个新连接的握手耗时（秒）
+        """
+        self.latency = latency
+        self.connect_delay = connect_delay
+        self._requests = 0
+        self._connections = 0
+        self._lock = threading.Lock()
+
+    def on_connect(self) -> None:
+        with self._lock:
+            self._connections += 1
+        if self.connect_delay > 0:
+            time.sleep(self.connect_delay)
+
+    def on_request(self) -> None:
+        with self._lock:
+            self._requests += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'requests': self._requests, 'connections': self._connections}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._requests = 0
+            self._connections = 0
+
+
+class SearchStubRequestHandler(BaseHTTPRequestHandler):
+    """三种搜索接口的请求处理器（HTTP/1.1 keep-alive）"""
+
+    state: SearchStubState = None  # type: ignore
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # 头部与正文分两次写出，避免 keep-alive 连接上的延迟确认等待
+
+    def setup(self) -> None:
+        """每个 TCP 连接调用一次：模拟握手耗时"""
+        super().setup()
+        self.state.on_connect()
+
+    def do_GET(self) -> None:
+        """GET /search.json（SerpAPI）；GET /stats 统计"""
+        parsed = urlparse(self.path)
+        if parsed.path == '/stats':
+            self._send_json(200, self.state.get_stats())
+            return
+        if parsed.path != '/search.json':
+            self._send_json(404, {'error': 'not found'})
+            return
+        self.state.on_request()
+        query = parse_qs(parsed.query).get('q', [''])[0]
+        self._send_json(200, {'organic_results': [
+            {'title': i['title'], 'snippet': i['snippet'], 'link': i['url'], 'date': i['date']}
+            for i in _items(query, 10)
+        ]})
+
+    def do_POST(self) -> None:
+        """POST /v1/web-search（Bocha）；POST /search（Tavily）"""
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'message': 'invalid JSON body'})
+            return
+        query = body.get('query', '')
+        path = urlparse(self.path).path
+
+        if path == '/v1/web-search':
+            self.state.on_request()
+            items = _items(query, min(int(body.get('count', 10)), 50))
+            self._send_json(200, {'code': 200, 'data': {'webPages': {'value': [
+                {'name': i['title'], 'summary': i['snippet'], 'url': i['url'], 'siteName': 'example',
+                 'datePublished': i['date']}
+                for i in items
+            ]}}})
+        elif path == '/search':
+            self.state.on_request()
+            items = _items(query, int(body.get('max_results', 5)))
+            self._send_json(200, {'query': query, 'results': [
+                {'title': i['title'], 'content': i['snippet'], 'url': i['url'], 'published_date': i['date']}
+                for i in items
+            ]})
+        else:
+            self._send_json(404, {'message': 'not found'})
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt: str, *args) -> None:
+        """使用 logging 输出访问日志"""
+        logger.debug(f"[搜索替身] {self.address_string()} - {fmt % args}")
+
+
+class SearchStubServer:
+    """
+    搜索替身服务
+
+    使用方式：
+        server = SearchStubServer(SearchStubState(connect_delay=0.1), port=0)
+        server.start_background()
+        provider = BochaSearchProvider(['key'], base_url=server.base_url)
+        server.stop()
+    """
+
+    def __init__(self, state: SearchStubState, host: str = '127.0.0.1', port: int = 8910):
+        handler = type('BoundSearchStubRequestHandler', (SearchStubRequestHandler,), {'state': state})
+        self.state = state
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """搜索引擎的 base_url"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def run(self) -> None:
+        """前台运行（阻塞）"""
+        logger.info(f"[搜索替身] 服务已启动: {self.base_url}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def start_background(self) -> None:
+        """后台线程运行"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='search_stub', daemon=True)
+        self._thread.start()
+        logger.info(f"[搜索替身] 服务已在后台启动: {self.base_url}")
+
+    def stop(self) -> None:
+        """停止服务"""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _unpooled(provider_cls: Type[BaseSearchProvider]) -> Type[BaseSearchProvider]:
+    """改造前的行为：每次搜索使用模块级 requests 函数（不复用连接）"""
+
+    class UnpooledProvider(provider_cls):
+        def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+            kwargs.setdefault('timeout', (CONNECT_TIMEOUT, self.timeout))
+            return requests.request(method, f"{self.base_url}{path}", **kwargs)
+
+    return UnpooledProvider
+
+
+def run_benchmark(server: SearchStubServer, count: int, workers: int) -> None:
+    """每个搜索引擎分别以改造前 / 改造后的方式并发搜索 count 次，输出耗时与新建连接数"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    print(f"\n每次新建连接的握手耗时 {server.state.connect_delay:.3f}s，搜索处理耗时 {server.state.latency:.3f}s，"
+          f"{count} 次搜索 / {workers} 线程")
+    print(f"{'搜索引擎':<10}{'方式':<8}{'总耗时':>8}{'平均':>8}{'P50':>8}{'P95':>8}{'新建连接':>10}")
+    for provider_cls in (BochaSearchProvider, TavilySearchProvider, SerpAPISearchProvider):
+        for label, cls in (('改造前', _unpooled(provider_cls)), ('连接池', provider_cls)):
+            provider = cls(['stub-key'], base_url=server.base_url, pool_size=workers)
+            server.state.reset_stats()
+            start = time.monotonic()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                responses = list(executor.map(lambda i: provider.search(f"模拟{i}", max_results=5), range(count)))
+            elapsed = time.monotonic() - start
+            provider.close()
+
+            failed = sum(1 for r in responses if not r.success)
+            latencies = sorted(r.search_time for r in responses)
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+            mean = sum(latencies) / len(latencies)
+            print(f"{provider.name:<12}{label:<8}{elapsed:>8.2f}{mean:>8.3f}{p50:>8.3f}{p95:>8.3f}"
+                  f"{server.state.get_stats()['connections']:>10}" + (f"  失败 {failed}" if failed else ''))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='本地搜索替身服务（Bocha / Tavily / SerpAPI）')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8910, help='监听端口（0 表示随机）')
+    parser.add_argument('--latency', type=float, default=0.05, help='每次搜索的处理耗时（秒）')
+    parser.add_argument('--connect-delay', type=float, default=0.15, help='每个新连接的模拟握手耗时（秒）')
+    parser.add_argument('--bench', type=int, metavar='N', help='对比改造前后各搜索 N 次')
+    parser.add_argument('--workers', type=int, default=3, help='压测并发线程数（默认与 MAX_WORKERS 一致）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING if args.bench else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    stub = SearchStubServer(
+        SearchStubState(latency=args.latency, connect_delay=args.connect_delay),
+        host=args.host,
+        port=0 if args.bench and args.port == 8910 else args.port,
+    )
+    if args.bench:
+        stub.start_background()
+        try:
+            run_benchmark(stub, args.bench, args.workers)
+        finally:
+            stub.stop()
+    else:
+        stub.run()
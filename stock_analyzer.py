@@ -17,6 +17,9 @@
 """
 
 import logging
+import math
+import warnings
+from collections import deque
 from dataclasses import dataclass, field
 from typing import Optional, Dict, Any, List, Tuple
 from enum import Enum
@@ -24,6 +27,9 @@ from enum import Enum
 import pandas as pd
 import numpy as np
 
+from indicators import panel_to_matrix
+from rolling import MA_WINDOWS, ma_column, moving_averages, add_moving_averages, rolling_apply
+
 logger = logging.getLogger(__name__)
 
 
@@ -122,6 +128,201 @@ class TrendAnalysisResult:
         }
 
 
+class TrendState:
+    """
+    单只股票的增量趋势状态
+    
+    只保留趋势分析所需的最短窗口（最近 60 根 K 线），
+    新增一根 K 线时以 O(1) 更新滚动和，无需重新加载历史：
+    - MA5/10/20/60：滚动求和
+    - 5 日均量：前 5 日成交量窗口
+    - 20 日最高/最低价：固定长度窗口
+    - 5 个交易日前的 MA5/MA20：均线历史窗口（判断间距扩大）
+    
+    同一日期重复推送（盘中轮询）时替换最后一根 K 线，而非追加。
+    状态可通过 to_dict()/from_dict() 持久化。
+    """
+    
+    MA_WINDOWS = MA_WINDOWS
+    HIGH_LOW_WINDOW = 20
+    VOLUME_WINDOW = 5
+    SPREAD_LOOKBACK = 5
+    
+    # 冷启动所需的最少历史 K 线数（MA60 + 5 日前 MA20 的回看）
+    SEED_BARS = 64
+    
+    def __init__(self, code: str):
+        self.code = code
+        self.last_date: Optional[str] = None
+        self.prev_date: Optional[str] = None  # 上一根已收盘 K 线的日期（校验历史是否被改写）
+        self.bar_count = 0
+        self.closes: deque = deque(maxlen=max(self.MA_WINDOWS))
+        self.highs: deque = deque(maxlen=self.HIGH_LOW_WINDOW)
+        self.lows: deque = deque(maxlen=self.HIGH_LOW_WINDOW)
+        self.volumes: deque = deque(maxlen=self.VOLUME_WINDOW + 1)
+        self.ma_history: deque = deque(maxlen=self.SPREAD_LOOKBACK)
+        self._sums: Dict[int, float] = {w: 0.0 for w in self.MA_WINDOWS}
+    
+    @classmethod
+    def from_history(cls, df: pd.DataFrame, code: str) -> 'TrendState':
+        """
+        由历史 K 线冷启动
+        
+        Args:
+            df: 包含 date, close, high, low, volume 列的 DataFrame
+            code: 股票代码
+        """
+        state = cls(code)
+        if df is None or df.empty:
+            return state
+        df = df.sort_values('date').tail(cls.SEED_BARS)
+        for row in df.itertuples(index=False):
+            state.update(row.date, row.close, row.high, row.low, row.volume)
+        return state
+    
+    def update(self, bar_date: Any, close: float, high: float, low: float, volume: float) -> bool:
+        """
+        推送一根 K 线（O(1)）
+        
+        Args:
+            bar_date: K 线日期（date / datetime / 'YYYY-MM-DD'）
+            close, high, low, volume: K 线数据
+        
+        Returns:
+            是否生效（早于最新日期的 K 线会被忽略）
+        """
+        bar_date = pd.Timestamp(bar_date).date().isoformat()
+        close, high, low, volume = (
+            float('nan') if value is None else float(value) for value in (close, high, low, volume)
+        )
+        
+        if self.last_date is not None and bar_date < self.last_date:
+            return False
+        
+        if bar_date == self.last_date:
+            # 盘中更新：替换最后一根 K 线
+            old_close = self.closes[-1]
+            for window in self.MA_WINDOWS:
+                self._sums[window] += close - old_close
+            self.closes[-1] = close
+            for window in self.MA_WINDOWS:
+                if not math.isfinite(self._sums[window]):
+                    self._sums[window] = math.fsum(list(self.closes)[-window:])
+            self.highs[-1] = high
+            self.lows[-1] = low
+            self.volumes[-1] = volume
+            self.ma_history[-1] = (self.ma(5), self.ma(20))
+            return True
+        
+        for window in self.MA_WINDOWS:
+            if len(self.closes) >= window:
+                self._sums[window] -= self.closes[-window]
+            self._sums[window] += close
+        self.closes.append(close)
+        for window in self.MA_WINDOWS:
+            if not math.isfinite(self._sums[window]):
+                # 缺失值移出窗口后恢复（与 rolling 行为一致）
+                self._sums[window] = math.fsum(list(self.closes)[-window:])
+        self.highs.append(high)
+        self.lows.append(low)
+        self.volumes.append(volume)
+        self.bar_count += 1
+        self.prev_date = self.last_date
+        self.last_date = bar_date
+        self.ma_history.append((self.ma(5), self.ma(20)))
+        return True
+    
+    def matches(self, bar_date: Any, close: float) -> bool:
+        """
+        校验上一根已收盘 K 线是否仍与数据库一致
+        
+        除权除息后前复权价格会整体改写历史 K 线，滚动和随之失效，此时调用方应丢弃状态并冷启动。
+        最新一根 K 线盘中会被轮询覆盖（由 update() 同日替换），不参与校验。
+        
+        Args:
+            bar_date: 数据库中 prev_date 当日的 K 线日期
+            close: 该 K 线的收盘价
+        """
+        if self.prev_date is None or pd.Timestamp(bar_date).date().isoformat() != self.prev_date:
+            return False
+        close = float('nan') if close is None else float(close)
+        if math.isnan(close) or math.isnan(self.prev_close):
+            return math.isnan(close) and math.isnan(self.prev_close)
+        return math.isclose(close, self.prev_close, rel_tol=1e-9, abs_tol=1e-9)
+    
+    def ma(self, window: int) -> float:
+        """当前均线值（数据不足时为 NaN）"""
+        if min(self.bar_count, len(self.closes)) < window:
+            return float('nan')
+        return self._sums[window] / window
+    
+    @property
+    def close(self) -> float:
+        return self.closes[-1] if self.closes else float('nan')
+    
+    @property
+    def prev_close(self) -> float:
+        return self.closes[-2] if len(self.closes) >= 2 else float('nan')
+    
+    @property
+    def volume(self) -> float:
+        return self.volumes[-1] if self.volumes else float('nan')
+    
+    @property
+    def volume_avg(self) -> float:
+        """前 5 个交易日平均成交量（不含当日）"""
+        prev = [v for v in list(self.volumes)[:-1] if v == v]
+        return sum(prev) / len(prev) if prev else float('nan')
+    
+    @property
+    def high_20(self) -> float:
+        """近 20 个交易日最高价"""
+        valid = [v for v in self.highs if v == v]
+        return max(valid) if valid else float('nan')
+    
+    @property
+    def low_20(self) -> float:
+        """近 20 个交易日最低价"""
+        valid = [v for v in self.lows if v == v]
+        return min(valid) if valid else float('nan')
+    
+    @property
+    def prev_mas(self) -> Tuple[float, float]:
+        """5 个交易日前的 (MA5, MA20)"""
+        return self.ma_history[0] if self.ma_history else (float('nan'), float('nan'))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化（用于持久化）"""
+        return {
+            'code': self.code,
+            'last_date': self.last_date,
+            'prev_date': self.prev_date,
+            'bar_count': self.bar_count,
+            'closes': list(self.closes),
+            'highs': list(self.highs),
+            'lows': list(self.lows),
+            'volumes': list(self.volumes),
+            'ma_history': [list(item) for item in self.ma_history],
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TrendState':
+        """反序列化（滚动和按窗口重新精确求和，消除累积误差）"""
+        state = cls(data['code'])
+        state.last_date = data.get('last_date')
+        state.prev_date = data.get('prev_date')
+        state.bar_count = int(data.get('bar_count', 0))
+        state.closes.extend(data.get('closes', []))
+        state.highs.extend(data.get('highs', []))
+        state.lows.extend(data.get('lows', []))
+        state.volumes.extend(data.get('volumes', []))
+        state.ma_history.extend(tuple(item) for item in data.get('ma_history', []))
+        closes = list(state.closes)
+        for window in cls.MA_WINDOWS:
+            state._sums[window] = math.fsum(closes[-window:])
+        return state
+
+
 class StockTrendAnalyzer:
     """
     股票趋势分析器
@@ -139,6 +340,63 @@ class StockTrendAnalyzer:
     VOLUME_HEAVY_RATIO = 1.5    # 放量判断阈值
     MA_SUPPORT_TOLERANCE = 0.02  # MA 支撑判断容忍度（2%）
     
+    # 评分表
+    TREND_SCORES = {
+        TrendStatus.STRONG_BULL: 40,
+        TrendStatus.BULL: 35,
+        TrendStatus.WEAK_BULL: 25,
+        TrendStatus.CONSOLIDATION: 15,
+        TrendStatus.WEAK_BEAR: 10,
+        TrendStatus.BEAR: 5,
+        TrendStatus.STRONG_BEAR: 0,
+    }
+    VOLUME_SCORES = {
+        VolumeStatus.SHRINK_VOLUME_DOWN: 20,  # 缩量回调最佳
+        VolumeStatus.HEAVY_VOLUME_UP: 15,     # 放量上涨次之
+        VolumeStatus.NORMAL: 12,
+        VolumeStatus.SHRINK_VOLUME_UP: 8,     # 无量上涨较差
+        VolumeStatus.HEAVY_VOLUME_DOWN: 0,    # 放量下跌最差
+    }
+    
+    # 趋势状态 -> (均线排列描述, 趋势强度)
+    TREND_PROFILES = {
+        TrendStatus.STRONG_BULL: ("强势多头排列，均线发散上行", 90),
+        TrendStatus.BULL: ("多头排列 MA5>MA10>MA20", 75),
+        TrendStatus.WEAK_BULL: ("弱势多头，MA5>MA10 但 MA10≤MA20", 55),
+        TrendStatus.CONSOLIDATION: ("均线缠绕，趋势不明", 50),
+        TrendStatus.WEAK_BEAR: ("弱势空头，MA5<MA10 但 MA10≥MA20", 40),
+        TrendStatus.BEAR: ("空头排列 MA5<MA10<MA20", 25),
+        TrendStatus.STRONG_BEAR: ("强势空头排列，均线发散下行", 10),
+    }
+    
+    # 量能状态 -> 量能趋势描述
+    VOLUME_TRENDS = {
+        VolumeStatus.HEAVY_VOLUME_UP: "放量上涨，多头力量强劲",
+        VolumeStatus.HEAVY_VOLUME_DOWN: "放量下跌，注意风险",
+        VolumeStatus.SHRINK_VOLUME_UP: "缩量上涨，上攻动能不足",
+        VolumeStatus.SHRINK_VOLUME_DOWN: "缩量回调，洗盘特征明显（好）",
+        VolumeStatus.NORMAL: "量能正常",
+    }
+    
+    # 向量化计算中状态下标 -> 枚举（evaluate_matrix 的 *_idx 输出）
+    TREND_ORDER = [
+        TrendStatus.STRONG_BULL, TrendStatus.BULL, TrendStatus.WEAK_BULL,
+        TrendStatus.STRONG_BEAR, TrendStatus.BEAR, TrendStatus.WEAK_BEAR,
+        TrendStatus.CONSOLIDATION,
+    ]
+    VOLUME_ORDER = [
+        VolumeStatus.HEAVY_VOLUME_UP, VolumeStatus.HEAVY_VOLUME_DOWN,
+        VolumeStatus.SHRINK_VOLUME_UP, VolumeStatus.SHRINK_VOLUME_DOWN,
+        VolumeStatus.NORMAL,
+    ]
+    SIGNAL_ORDER = [
+        BuySignal.STRONG_BUY, BuySignal.BUY, BuySignal.HOLD,
+        BuySignal.WAIT, BuySignal.STRONG_SELL, BuySignal.SELL,
+    ]
+    
+    # 批量分析所需的最长回看窗口（MA60）
+    BATCH_WINDOW = 60
+    
     def __init__(self):
         """初始化分析器"""
         pass
@@ -164,98 +422,340 @@ class StockTrendAnalyzer:
         # 确保数据按日期排序
         df = df.sort_values('date').reset_index(drop=True)
         
-        # 计算均线
+        # 计算均线（由 close 全精度重算）
         df = self._calculate_mas(df)
         
         # 获取最新数据
         latest = df.iloc[-1]
         result.current_price = float(latest['close'])
-        result.ma5 = float(latest['MA5'])
-        result.ma10 = float(latest['MA10'])
-        result.ma20 = float(latest['MA20'])
-        result.ma60 = float(latest.get('MA60', 0))
+        result.ma5 = float(latest['ma5'])
+        result.ma10 = float(latest['ma10'])
+        result.ma20 = float(latest['ma20'])
+        result.ma60 = float(latest['ma60'])
         
-        # 1. 趋势判断
-        self._analyze_trend(df, result)
+        # 1. 趋势判断（对比 5 个交易日前的均线间距）
+        prev = df.iloc[-5] if len(df) >= 5 else df.iloc[-1]
+        self._analyze_trend(result, prev['ma5'], prev['ma20'])
         
         # 2. 乖离率计算
         self._calculate_bias(result)
         
         # 3. 量能分析
-        self._analyze_volume(df, result)
+        self._analyze_volume(
+            result,
+            volume=latest['volume'],
+            vol_5d_avg=df['volume'].iloc[-6:-1].mean(),
+            prev_close=df.iloc[-2]['close'],
+        )
         
         # 4. 支撑压力分析
-        self._analyze_support_resistance(df, result)
+        self._analyze_support_resistance(result, recent_high=df['high'].iloc[-20:].max())
         
         # 5. 生成买入信号
         self._generate_signal(result)
         
         return result
     
+    def analyze_many(self, panel: pd.DataFrame) -> Dict[str, TrendAnalysisResult]:
+        """
+        批量分析多只股票趋势（向量化）
+        
+        将各股最近 BATCH_WINDOW 个交易日右对齐为 (股票数 × 窗口) 矩阵，
+        经 evaluate_matrix() 一次性计算后取最后一列，
+        结果与逐只调用 analyze() 一致。
+        
+        Args:
+            panel: 多股票长表，至少包含 code, date, close, high, volume 列
+        
+        Returns:
+            {股票代码: TrendAnalysisResult}
+        """
+        results: Dict[str, TrendAnalysisResult] = {}
+        if panel is None or panel.empty:
+            return results
+        
+        window = self.BATCH_WINDOW
+        # 均线由 close 全精度重算（数据库中的均线列已四舍五入，见 _calculate_mas）
+        codes, counts, mats = panel_to_matrix(panel, ['close', 'high', 'volume'], window=window)
+        
+        # 数据不足的股票单独处理
+        valid = counts >= 20
+        for code in codes[~valid]:
+            result = TrendAnalysisResult(code=code)
+            result.risk_factors.append("数据不足，无法完成分析")
+            results[code] = result
+        if (~valid).any():
+            logger.warning(f"{int((~valid).sum())} 只股票数据不足，无法进行趋势分析")
+        if not valid.any():
+            return results
+        
+        codes, counts = codes[valid], counts[valid]
+        bar_count = counts[:, None] - (window - 1 - np.arange(window))[None, :]
+        ev = self.evaluate_matrix(mats['close'][valid], mats['high'][valid], mats['volume'][valid], bar_count)
+        last = {key: value[:, -1] for key, value in ev.items()}
+        
+        # 组装结果（仅剩文本生成为逐只操作）
+        for i, code in enumerate(codes):
+            result = TrendAnalysisResult(
+                code=code,
+                ma5=float(last['ma5'][i]),
+                ma10=float(last['ma10'][i]),
+                ma20=float(last['ma20'][i]),
+                ma60=float(last['ma60'][i]),
+                current_price=float(last['price'][i]),
+                bias_ma5=float(last['bias_ma5'][i]),
+                bias_ma10=float(last['bias_ma10'][i]),
+                bias_ma20=float(last['bias_ma20'][i]),
+                volume_status=self.VOLUME_ORDER[last['volume_idx'][i]],
+                volume_ratio_5d=float(last['volume_ratio'][i]),
+                support_ma5=bool(last['support_ma5'][i]),
+                support_ma10=bool(last['support_ma10'][i]),
+                buy_signal=self.SIGNAL_ORDER[last['signal_idx'][i]],
+                signal_score=int(last['score'][i]),
+            )
+            self._set_trend(result, self.TREND_ORDER[last['trend_idx'][i]])
+            result.volume_trend = self.VOLUME_TRENDS[result.volume_status]
+            
+            if last['support_ma5'][i]:
+                result.support_levels.append(result.ma5)
+            if last['support_ma10'][i] and result.ma10 not in result.support_levels:
+                result.support_levels.append(result.ma10)
+            if last['support_ma20'][i]:
+                result.support_levels.append(result.ma20)
+            if last['recent_high'][i] > last['price'][i]:
+                result.resistance_levels.append(float(last['recent_high'][i]))
+            
+            result.signal_reasons, result.risk_factors = self._signal_texts(result)
+            results[code] = result
+        
+        return results
+    
+    def evaluate_matrix(
+        self,
+        close: np.ndarray,
+        high: np.ndarray,
+        volume: np.ndarray,
+        bar_count: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        """
+        在右对齐矩阵的每一列上执行完整的趋势规则（向量化）
+        
+        第 t 列的结果等价于对截至第 t 个交易日的历史调用 analyze()，
+        供 analyze_many()（取最后一列）与回测（使用全部列）共用。
+        
+        Args:
+            close, high, volume: (股票数 × 交易日) 矩阵，左侧 NaN 填充
+            bar_count: 同形状矩阵，截至该列的 K 线根数（判断数据是否充足、MA60 是否可用）
+            
+        Returns:
+            同形状数组字典：price, ma5/10/20/60, bias_ma5/10/20, volume_ratio,
+            trend_idx, volume_idx, signal_idx（对应 TREND_ORDER/VOLUME_ORDER/SIGNAL_ORDER 的下标）,
+            support_ma5/10/20, recent_high, score, valid
+        """
+        def shift(mat: np.ndarray, periods: int) -> np.ndarray:
+            return np.concatenate([np.full((mat.shape[0], periods), np.nan), mat[:, :-periods]], axis=1)
+        
+        with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            
+            # 1. 均线（由 close 全精度计算）
+            price = close
+            ma = moving_averages(close, MA_WINDOWS)
+            ma5, ma10, ma20 = ma[5], ma[10], ma[20]
+            ma60 = np.where(bar_count >= 60, ma[60], ma20)
+            prev_ma5 = shift(ma5, 4)
+            prev_ma20 = shift(ma20, 4)
+            
+            # 2. 趋势判断（顺序与 TREND_ORDER 一致）
+            bull = (ma5 > ma10) & (ma10 > ma20)
+            bear = (ma5 < ma10) & (ma10 < ma20)
+            bull_prev = np.where(prev_ma20 > 0, (prev_ma5 - prev_ma20) / prev_ma20 * 100, 0)
+            bull_curr = np.where(ma20 > 0, (ma5 - ma20) / ma20 * 100, 0)
+            bear_prev = np.where(prev_ma5 > 0, (prev_ma20 - prev_ma5) / prev_ma5 * 100, 0)
+            bear_curr = np.where(ma5 > 0, (ma20 - ma5) / ma5 * 100, 0)
+            trend_idx = np.select(
+                [
+                    bull & (bull_curr > bull_prev) & (bull_curr > 5),
+                    bull,
+                    (ma5 > ma10) & (ma10 <= ma20),
+                    bear & (bear_curr > bear_prev) & (bear_curr > 5),
+                    bear,
+                    (ma5 < ma10) & (ma10 >= ma20),
+                ],
+                [0, 1, 2, 3, 4, 5],
+                default=6,
+            )
+            
+            # 3. 乖离率
+            bias5 = np.where(ma5 > 0, (price - ma5) / ma5 * 100, 0.0)
+            bias10 = np.where(ma10 > 0, (price - ma10) / ma10 * 100, 0.0)
+            bias20 = np.where(ma20 > 0, (price - ma20) / ma20 * 100, 0.0)
+            
+            # 4. 量能（前 5 日均量不含当日，顺序与 VOLUME_ORDER 一致）
+            vol_5d_avg = rolling_apply(shift(volume, 1), 5, np.nanmean, min_periods=1)
+            vol_ratio = np.where(vol_5d_avg > 0, volume / vol_5d_avg, 0.0)
+            prev_close = shift(close, 1)
+            price_up = (price - prev_close) / prev_close * 100 > 0
+            vol_idx = np.select(
+                [
+                    (vol_ratio >= self.VOLUME_HEAVY_RATIO) & price_up,
+                    vol_ratio >= self.VOLUME_HEAVY_RATIO,
+                    (vol_ratio <= self.VOLUME_SHRINK_RATIO) & price_up,
+                    vol_ratio <= self.VOLUME_SHRINK_RATIO,
+                ],
+                [0, 1, 2, 3],
+                default=4,
+            )
+            
+            # 5. 支撑压力
+            tol = self.MA_SUPPORT_TOLERANCE
+            support5 = (ma5 > 0) & (np.abs(price - ma5) / ma5 <= tol) & (price >= ma5)
+            support10 = (ma10 > 0) & (np.abs(price - ma10) / ma10 <= tol) & (price >= ma10)
+            support20 = (ma20 > 0) & (price >= ma20)
+            recent_high = rolling_apply(high, 20, np.nanmax, min_periods=1)
+        
+        # 6. 评分
+        trend_scores = np.array([self.TREND_SCORES[t] for t in self.TREND_ORDER])[trend_idx]
+        bias_scores = np.select(
+            [bias5 < 0, bias5 < 2, bias5 < self.BIAS_THRESHOLD],
+            [np.select([bias5 > -3, bias5 > -5], [30, 25], default=10), 28, 20],
+            default=5,
+        )
+        vol_scores = np.array([self.VOLUME_SCORES[v] for v in self.VOLUME_ORDER])[vol_idx]
+        scores = trend_scores + bias_scores + vol_scores + 5 * support5 + 5 * support10
+        
+        # 7. 买入信号（顺序与 SIGNAL_ORDER 一致）
+        signal_idx = np.select(
+            [
+                (scores >= 80) & (trend_idx <= 1),
+                (scores >= 65) & (trend_idx <= 2),
+                scores >= 50,
+                scores >= 35,
+                (trend_idx == 3) | (trend_idx == 4),
+            ],
+            [0, 1, 2, 3, 4],
+            default=5,
+        )
+        
+        return {
+            'price': price,
+            'ma5': ma5,
+            'ma10': ma10,
+            'ma20': ma20,
+            'ma60': ma60,
+            'bias_ma5': bias5,
+            'bias_ma10': bias10,
+            'bias_ma20': bias20,
+            'volume_ratio': vol_ratio,
+            'trend_idx': trend_idx,
+            'volume_idx': vol_idx,
+            'signal_idx': signal_idx,
+            'support_ma5': support5,
+            'support_ma10': support10,
+            'support_ma20': support20,
+            'recent_high': recent_high,
+            'score': scores,
+            'valid': bar_count >= 20,
+        }
+    
+    def analyze_state(self, state: TrendState) -> TrendAnalysisResult:
+        """
+        基于增量状态分析趋势（O(1)，无需加载历史）
+        
+        结果与对同一段历史调用 analyze() 一致。
+        
+        Args:
+            state: 已推送最新 K 线的 TrendState
+            
+        Returns:
+            TrendAnalysisResult 分析结果
+        """
+        result = TrendAnalysisResult(code=state.code)
+        
+        if state.bar_count < 20:
+            logger.warning(f"{state.code} 数据不足，无法进行趋势分析")
+            result.risk_factors.append("数据不足，无法完成分析")
+            return result
+        
+        result.current_price = state.close
+        result.ma5 = state.ma(5)
+        result.ma10 = state.ma(10)
+        result.ma20 = state.ma(20)
+        result.ma60 = state.ma(60) if state.bar_count >= 60 else result.ma20
+        
+        prev_ma5, prev_ma20 = state.prev_mas
+        self._analyze_trend(result, prev_ma5, prev_ma20)
+        self._calculate_bias(result)
+        self._analyze_volume(
+            result,
+            volume=state.volume,
+            vol_5d_avg=state.volume_avg,
+            prev_close=state.prev_close,
+        )
+        self._analyze_support_resistance(result, recent_high=state.high_20)
+        self._generate_signal(result)
+        
+        return result
+    
     def _calculate_mas(self, df: pd.DataFrame) -> pd.DataFrame:
-        """计算均线"""
-        df = df.copy()
-        df['MA5'] = df['close'].rolling(window=5).mean()
-        df['MA10'] = df['close'].rolling(window=10).mean()
-        df['MA20'] = df['close'].rolling(window=20).mean()
-        if len(df) >= 60:
-            df['MA60'] = df['close'].rolling(window=60).mean()
-        else:
-            df['MA60'] = df['MA20']  # 数据不足时使用 MA20 替代
+        """
+        计算均线（ma5/ma10/ma20/ma60）
+        
+        始终由 close 全精度重算：数据库中的均线列保留 2 位小数，旧数据还可能是窗口未满的部分均值，
+        直接复用会改变乖离率与均线排列在阈值附近的判断
+        """
+        df = df.drop(columns=[ma_column(w) for w in MA_WINDOWS], errors='ignore')
+        df = add_moving_averages(df, MA_WINDOWS)
+        if len(df) < 60:
+            df['ma60'] = df['ma20']  # 数据不足时使用 MA20 替代
         return df
     
-    def _analyze_trend(self, df: pd.DataFrame, result: TrendAnalysisResult) -> None:
+    def _analyze_trend(self, result: TrendAnalysisResult, prev_ma5: float, prev_ma20: float) -> None:
         """
         分析趋势状态
         
         核心逻辑：判断均线排列和趋势强度
+        
+        Args:
+            result: 分析结果（需已填充 ma5/ma10/ma20）
+            prev_ma5: 5 个交易日前的 MA5（数据不足时为 NaN）
+            prev_ma20: 5 个交易日前的 MA20（数据不足时为 NaN）
         """
         ma5, ma10, ma20 = result.ma5, result.ma10, result.ma20
         
         # 判断均线排列
         if ma5 > ma10 > ma20:
             # 检查间距是否在扩大（强势）
-            prev = df.iloc[-5] if len(df) >= 5 else df.iloc[-1]
-            prev_spread = (prev['MA5'] - prev['MA20']) / prev['MA20'] * 100 if prev['MA20'] > 0 else 0
+            prev_spread = (prev_ma5 - prev_ma20) / prev_ma20 * 100 if prev_ma20 > 0 else 0
             curr_spread = (ma5 - ma20) / ma20 * 100 if ma20 > 0 else 0
             
             if curr_spread > prev_spread and curr_spread > 5:
-                result.trend_status = TrendStatus.STRONG_BULL
-                result.ma_alignment = "强势多头排列，均线发散上行"
-                result.trend_strength = 90
+                self._set_trend(result, TrendStatus.STRONG_BULL)
             else:
-                result.trend_status = TrendStatus.BULL
-                result.ma_alignment = "多头排列 MA5>MA10>MA20"
-                result.trend_strength = 75
+                self._set_trend(result, TrendStatus.BULL)
                 
         elif ma5 > ma10 and ma10 <= ma20:
-            result.trend_status = TrendStatus.WEAK_BULL
-            result.ma_alignment = "弱势多头，MA5>MA10 但 MA10≤MA20"
-            result.trend_strength = 55
+            self._set_trend(result, TrendStatus.WEAK_BULL)
             
         elif ma5 < ma10 < ma20:
-            prev = df.iloc[-5] if len(df) >= 5 else df.iloc[-1]
-            prev_spread = (prev['MA20'] - prev['MA5']) / prev['MA5'] * 100 if prev['MA5'] > 0 else 0
+            prev_spread = (prev_ma20 - prev_ma5) / prev_ma5 * 100 if prev_ma5 > 0 else 0
             curr_spread = (ma20 - ma5) / ma5 * 100 if ma5 > 0 else 0
             
             if curr_spread > prev_spread and curr_spread > 5:
-                result.trend_status = TrendStatus.STRONG_BEAR
-                result.ma_alignment = "强势空头排列，均线发散下行"
-                result.trend_strength = 10
+                self._set_trend(result, TrendStatus.STRONG_BEAR)
             else:
-                result.trend_status = TrendStatus.BEAR
-                result.ma_alignment = "空头排列 MA5<MA10<MA20"
-                result.trend_strength = 25
+                self._set_trend(result, TrendStatus.BEAR)
                 
         elif ma5 < ma10 and ma10 >= ma20:
-            result.trend_status = TrendStatus.WEAK_BEAR
-            result.ma_alignment = "弱势空头，MA5<MA10 但 MA10≥MA20"
-            result.trend_strength = 40
+            self._set_trend(result, TrendStatus.WEAK_BEAR)
             
         else:
-            result.trend_status = TrendStatus.CONSOLIDATION
-            result.ma_alignment = "均线缠绕，趋势不明"
-            result.trend_strength = 50
+            self._set_trend(result, TrendStatus.CONSOLIDATION)
+    
+    def _set_trend(self, result: TrendAnalysisResult, status: TrendStatus) -> None:
+        """设置趋势状态及对应的排列描述、强度"""
+        result.trend_status = status
+        result.ma_alignment, result.trend_strength = self.TREND_PROFILES[status]
     
     def _calculate_bias(self, result: TrendAnalysisResult) -> None:
         """
@@ -274,49 +774,54 @@ class StockTrendAnalyzer:
         if result.ma20 > 0:
             result.bias_ma20 = (price - result.ma20) / result.ma20 * 100
     
-    def _analyze_volume(self, df: pd.DataFrame, result: TrendAnalysisResult) -> None:
+    def _analyze_volume(
+        self,
+        result: TrendAnalysisResult,
+        volume: float,
+        vol_5d_avg: float,
+        prev_close: float
+    ) -> None:
         """
         分析量能
         
         偏好：缩量回调 > 放量上涨 > 缩量上涨 > 放量下跌
-        """
-        if len(df) < 5:
-            return
-        
-        latest = df.iloc[-1]
-        vol_5d_avg = df['volume'].iloc[-6:-1].mean()
         
+        Args:
+            result: 分析结果（需已填充 current_price）
+            volume: 当日成交量
+            vol_5d_avg: 前 5 个交易日平均成交量（不含当日）
+            prev_close: 前一交易日收盘价
+        """
         if vol_5d_avg > 0:
-            result.volume_ratio_5d = float(latest['volume']) / vol_5d_avg
+            result.volume_ratio_5d = float(volume) / vol_5d_avg
         
         # 判断价格变化
-        prev_close = df.iloc[-2]['close']
-        price_change = (latest['close'] - prev_close) / prev_close * 100
+        price_change = (result.current_price - prev_close) / prev_close * 100 if prev_close else 0
         
         # 量能状态判断
         if result.volume_ratio_5d >= self.VOLUME_HEAVY_RATIO:
             if price_change > 0:
                 result.volume_status = VolumeStatus.HEAVY_VOLUME_UP
-                result.volume_trend = "放量上涨，多头力量强劲"
             else:
                 result.volume_status = VolumeStatus.HEAVY_VOLUME_DOWN
-                result.volume_trend = "放量下跌，注意风险"
         elif result.volume_ratio_5d <= self.VOLUME_SHRINK_RATIO:
             if price_change > 0:
                 result.volume_status = VolumeStatus.SHRINK_VOLUME_UP
-                result.volume_trend = "缩量上涨，上攻动能不足"
             else:
                 result.volume_status = VolumeStatus.SHRINK_VOLUME_DOWN
-                result.volume_trend = "缩量回调，洗盘特征明显（好）"
         else:
             result.volume_status = VolumeStatus.NORMAL
-            result.volume_trend = "量能正常"
+        result.volume_trend = self.VOLUME_TRENDS[result.volume_status]
     
-    def _analyze_support_resistance(self, df: pd.DataFrame, result: TrendAnalysisResult) -> None:
+    def _analyze_support_resistance(self, result: TrendAnalysisResult, recent_high: float) -> None:
         """
         分析支撑压力位
         
         买点偏好：回踩 MA5/MA10 获得支撑
+        
+        Args:
+            result: 分析结果（需已填充均线与 current_price）
+            recent_high: 近 20 个交易日最高价
         """
         price = result.current_price
         
@@ -340,10 +845,8 @@ class StockTrendAnalyzer:
             result.support_levels.append(result.ma20)
         
         # 近期高点作为压力
-        if len(df) >= 20:
-            recent_high = df['high'].iloc[-20:].max()
-            if recent_high > price:
-                result.resistance_levels.append(recent_high)
+        if recent_high > price:
+            result.resistance_levels.append(float(recent_high))
     
     def _generate_signal(self, result: TrendAnalysisResult) -> None:
         """
@@ -356,26 +859,9 @@ class StockTrendAnalyzer:
         - 支撑（10分）：获得均线支撑得分高
         """
         score = 0
-        reasons = []
-        risks = []
         
         # === 趋势评分（40分）===
-        trend_scores = {
-            TrendStatus.STRONG_BULL: 40,
-            TrendStatus.BULL: 35,
-            TrendStatus.WEAK_BULL: 25,
-            TrendStatus.CONSOLIDATION: 15,
-            TrendStatus.WEAK_BEAR: 10,
-            TrendStatus.BEAR: 5,
-            TrendStatus.STRONG_BEAR: 0,
-        }
-        trend_score = trend_scores.get(result.trend_status, 15)
-        score += trend_score
-        
-        if result.trend_status in [TrendStatus.STRONG_BULL, TrendStatus.BULL]:
-            reasons.append(f"✅ {result.trend_status.value}，顺势做多")
-        elif result.trend_status in [TrendStatus.BEAR, TrendStatus.STRONG_BEAR]:
-            risks.append(f"⚠️ {result.trend_status.value}，不宜做多")
+        score += self.TREND_SCORES.get(result.trend_status, 15)
         
         # === 乖离率评分（30分）===
         bias = result.bias_ma5
@@ -383,51 +869,29 @@ class StockTrendAnalyzer:
             # 价格在 MA5 下方（回调中）
             if bias > -3:
                 score += 30
-                reasons.append(f"✅ 价格略低于MA5({bias:.1f}%)，回踩买点")
             elif bias > -5:
                 score += 25
-                reasons.append(f"✅ 价格回踩MA5({bias:.1f}%)，观察支撑")
             else:
                 score += 10
-                risks.append(f"⚠️ 乖离率过大({bias:.1f}%)，可能破位")
         elif bias < 2:
             score += 28
-            reasons.append(f"✅ 价格贴近MA5({bias:.1f}%)，介入好时机")
         elif bias < self.BIAS_THRESHOLD:
             score += 20
-            reasons.append(f"⚡ 价格略高于MA5({bias:.1f}%)，可小仓介入")
         else:
             score += 5
-            risks.append(f"❌ 乖离率过高({bias:.1f}%>5%)，严禁追高！")
         
         # === 量能评分（20分）===
-        volume_scores = {
-            VolumeStatus.SHRINK_VOLUME_DOWN: 20,  # 缩量回调最佳
-            VolumeStatus.HEAVY_VOLUME_UP: 15,     # 放量上涨次之
-            VolumeStatus.NORMAL: 12,
-            VolumeStatus.SHRINK_VOLUME_UP: 8,     # 无量上涨较差
-            VolumeStatus.HEAVY_VOLUME_DOWN: 0,    # 放量下跌最差
-        }
-        vol_score = volume_scores.get(result.volume_status, 10)
-        score += vol_score
-        
-        if result.volume_status == VolumeStatus.SHRINK_VOLUME_DOWN:
-            reasons.append("✅ 缩量回调，主力洗盘")
-        elif result.volume_status == VolumeStatus.HEAVY_VOLUME_DOWN:
-            risks.append("⚠️ 放量下跌，注意风险")
+        score += self.VOLUME_SCORES.get(result.volume_status, 10)
         
         # === 支撑评分（10分）===
         if result.support_ma5:
             score += 5
-            reasons.append("✅ MA5支撑有效")
         if result.support_ma10:
             score += 5
-            reasons.append("✅ MA10支撑有效")
         
         # === 综合判断 ===
         result.signal_score = score
-        result.signal_reasons = reasons
-        result.risk_factors = risks
+        result.signal_reasons, result.risk_factors = self._signal_texts(result)
         
         # 生成买入信号
         if score >= 80 and result.trend_status in [TrendStatus.STRONG_BULL, TrendStatus.BULL]:
@@ -443,6 +907,48 @@ class StockTrendAnalyzer:
         else:
             result.buy_signal = BuySignal.SELL
     
+    def _signal_texts(self, result: TrendAnalysisResult) -> Tuple[List[str], List[str]]:
+        """
+        生成买入理由与风险因素文本（与 _generate_signal 的评分分支一一对应）
+        
+        Returns:
+            (买入理由列表, 风险因素列表)
+        """
+        reasons = []
+        risks = []
+        
+        if result.trend_status in [TrendStatus.STRONG_BULL, TrendStatus.BULL]:
+            reasons.append(f"✅ {result.trend_status.value}，顺势做多")
+        elif result.trend_status in [TrendStatus.BEAR, TrendStatus.STRONG_BEAR]:
+            risks.append(f"⚠️ {result.trend_status.value}，不宜做多")
+        
+        bias = result.bias_ma5
+        if bias < 0:
+            if bias > -3:
+                reasons.append(f"✅ 价格略低于MA5({bias:.1f}%)，回踩买点")
+            elif bias > -5:
+                reasons.append(f"✅ 价格回踩MA5({bias:.1f}%)，观察支撑")
+            else:
+                risks.append(f"⚠️ 乖离率过大({bias:.1f}%)，可能破位")
+        elif bias < 2:
+            reasons.append(f"✅ 价格贴近MA5({bias:.1f}%)，介入好时机")
+        elif bias < self.BIAS_THRESHOLD:
+            reasons.append(f"⚡ 价格略高于MA5({bias:.1f}%)，可小仓介入")
+        else:
+            risks.append(f"❌ 乖离率过高({bias:.1f}%>5%)，严禁追高！")
+        
+        if result.volume_status == VolumeStatus.SHRINK_VOLUME_DOWN:
+            reasons.append("✅ 缩量回调，主力洗盘")
+        elif result.volume_status == VolumeStatus.HEAVY_VOLUME_DOWN:
+            risks.append("⚠️ 放量下跌，注意风险")
+        
+        if result.support_ma5:
+            reasons.append("✅ MA5支撑有效")
+        if result.support_ma10:
+            reasons.append("✅ MA10支撑有效")
+        
+        return reasons, risks
+    
     def format_analysis(self, result: TrendAnalysisResult) -> str:
         """
         格式化分析结果为文本
@@ -504,10 +1010,146 @@ def analyze_stock(df: pd.DataFrame, code: str) -> TrendAnalysisResult:
     return analyzer.analyze(df, code)
 
 
+def make_synthetic_panel(num_codes: int = 1000, num_days: int = 120, seed: int = 42) -> pd.DataFrame:
+    """
+    生成多股票模拟行情长表（用于批量分析的一致性校验与基准测试）
+    
+    各股票历史长度在 [10, num_days] 间随机，覆盖数据不足、不足 MA60 等边界情况
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(num_codes):
+        length = int(rng.integers(10, num_days + 1))
+        drift = rng.normal(0, 0.004)
+        closes = 10 * np.cumprod(1 + rng.normal(drift, 0.02, length))
+        frames.append(pd.DataFrame({
+            'code': f"{600000 + i:06d}",
+            'date': pd.bdate_range(end='2025-06-30', periods=length),
+            'close': closes,
+            'high': closes * (1 + rng.uniform(0, 0.02, length)),
+            'low': closes * (1 - rng.uniform(0, 0.02, length)),
+            'volume': rng.integers(1_000_000, 5_000_000, length).astype(float),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _diff_results(
+    expected: TrendAnalysisResult,
+    actual: TrendAnalysisResult,
+    tolerance: float
+) -> List[str]:
+    """比较两个分析结果，返回不一致项描述"""
+    mismatches = []
+    left = dict(expected.to_dict(), support_levels=expected.support_levels,
+                resistance_levels=expected.resistance_levels)
+    right = dict(actual.to_dict(), support_levels=actual.support_levels,
+                 resistance_levels=actual.resistance_levels)
+    for key, value in left.items():
+        other = right[key]
+        if isinstance(value, list) and value and isinstance(value[0], float):
+            same = len(value) == len(other) and np.allclose(value, other, rtol=tolerance)
+        elif isinstance(value, float):
+            same = np.isclose(value, other, rtol=tolerance)
+        else:
+            same = value == other
+        if not same:
+            mismatches.append(f"{expected.code}.{key}: {value!r} != {other!r}")
+    return mismatches
+
+
+def check_batch_parity(panel: pd.DataFrame, tolerance: float = 1e-9) -> List[str]:
+    """
+    校验 analyze_many 与逐只 analyze 的结果一致性
+    
+    Returns:
+        不一致项描述列表（为空表示完全一致）
+    """
+    analyzer = StockTrendAnalyzer()
+    batch = analyzer.analyze_many(panel)
+    mismatches = []
+    
+    for code, group in panel.groupby('code'):
+        mismatches.extend(_diff_results(analyzer.analyze(group, code), batch[code], tolerance))
+    
+    return mismatches
+
+
+def check_state_parity(panel: pd.DataFrame, tolerance: float = 1e-9) -> List[str]:
+    """
+    校验增量状态 analyze_state 与全量 analyze 的结果一致性
+    
+    逐根推送 K 线，中途序列化/反序列化一次（模拟重启），
+    并在最后一根 K 线前先推送一次盘中临时值（模拟同日替换）
+    
+    Returns:
+        不一致项描述列表（为空表示完全一致）
+    """
+    analyzer = StockTrendAnalyzer()
+    mismatches = []
+    
+    for code, group in panel.groupby('code'):
+        group = group.sort_values('date')
+        bars = list(group.itertuples(index=False))
+        state = TrendState(code)
+        for i, bar in enumerate(bars):
+            if i == len(bars) // 2:
+                state = TrendState.from_dict(state.to_dict())
+            if i == len(bars) - 1:
+                state.update(bar.date, bar.close * 1.05, bar.high * 1.05, bar.low, bar.volume / 2)
+            state.update(bar.date, bar.close, bar.high, bar.low, bar.volume)
+        mismatches.extend(_diff_results(analyzer.analyze(group, code), analyzer.analyze_state(state), tolerance))
+    
+    return mismatches
+
+
 if __name__ == "__main__":
+    import argparse
+    import time
+    
+    parser = argparse.ArgumentParser(description='趋势分析器测试')
+    parser.add_argument('--benchmark', action='store_true', help='批量分析一致性校验与基准测试')
+    parser.add_argument('--codes', type=int, default=1000, help='基准测试股票数')
+    args = parser.parse_args()
+    
     # 测试代码
     logging.basicConfig(level=logging.INFO)
     
+    if args.benchmark:
+        logging.getLogger(__name__).setLevel(logging.ERROR)
+        panel = make_synthetic_panel(num_codes=args.codes)
+        
+        mismatches = check_batch_parity(panel)
+        print(f"批量一致性校验: {'通过' if not mismatches else f'{len(mismatches)} 处不一致'}")
+        state_mismatches = check_state_parity(panel)
+        print(f"增量一致性校验: {'通过' if not state_mismatches else f'{len(state_mismatches)} 处不一致'}")
+        mismatches += state_mismatches
+        for item in mismatches[:10]:
+            print(f"  {item}")
+        
+        analyzer = StockTrendAnalyzer()
+        start = time.perf_counter()
+        for code, group in panel.groupby('code'):
+            analyzer.analyze(group, code)
+        scalar_seconds = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        analyzer.analyze_many(panel)
+        batch_seconds = time.perf_counter() - start
+        
+        print(f"{args.codes} 只股票 / {len(panel)} 行")
+        print(f"逐只 analyze:  {scalar_seconds:.3f}s")
+        print(f"analyze_many: {batch_seconds:.3f}s")
+        
+        states = {code: TrendState.from_history(group, code) for code, group in panel.groupby('code')}
+        last_bars = panel.sort_values('date').groupby('code').tail(1)
+        start = time.perf_counter()
+        for bar in last_bars.itertuples(index=False):
+            states[bar.code].update(bar.date, bar.close * 1.01, bar.high, bar.low, bar.volume)
+            analyzer.analyze_state(states[bar.code])
+        state_seconds = time.perf_counter() - start
+        print(f"增量更新+analyze_state（盘中一轮）: {state_seconds:.3f}s")
+        raise SystemExit(1 if mismatches else 0)
+    
     # 模拟数据测试
     import numpy as np
     
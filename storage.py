@@ -11,9 +11,14 @@ A股自选股智能分析系统 - 存储层
 4. 实现智能更新逻辑（断点续传）
 """
 
+import json
 import logging
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, date, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Type, Tuple
 from pathlib import Path
 
 import pandas as pd
@@ -25,11 +30,18 @@ from sqlalchemy import (
     Date,
     DateTime,
     Integer,
+    Boolean,
+    Text,
     Index,
     UniqueConstraint,
     select,
+    delete,
+    func,
+    case,
     and_,
     desc,
+    inspect,
+    text,
 )
 from sqlalchemy.orm import (
     declarative_base,
@@ -37,35 +49,57 @@ from sqlalchemy.orm import (
     Session,
 )
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.types import TypeDecorator
 
 from config import get_config
+from rolling import STORED_MA_WINDOWS, ma_column, add_moving_averages, volume_ratios
 
 logger = logging.getLogger(__name__)
 
+# 由行情推导、入库保存的列（均线与量比）
+DERIVED_COLUMNS = [ma_column(w) for w in STORED_MA_WINDOWS] + ['volume_ratio']
+
 # SQLAlchemy ORM 基类
 Base = declarative_base()
 
 
 # === 数据模型定义 ===
 
-class StockDaily(Base):
+class IntDate(TypeDecorator):
     """
-    股票日线数据模型
-    
-    存储每日行情数据和计算的技术指标
-    支持多股票、多日期的唯一约束
+    整数编码日期类型
+
+    以 YYYYMMDD 整数存储日期（如 20260118），读取时还原为 date 对象。
+    相比 SQLite 默认的 'YYYY-MM-DD' 文本存储，每行节省约 6 字节，
+    且整数比较比字符串比较更快。
     """
-    __tablename__ = 'stock_daily'
-    
-    # 主键
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    
-    # 股票代码（如 600519, 000001）
-    code = Column(String(10), nullable=False, index=True)
-    
-    # 交易日期
-    date = Column(Date, nullable=False, index=True)
-    
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str):
+            value = datetime.strptime(value, '%Y-%m-%d').date()
+        return value.year * 10000 + value.month * 100 + value.day
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        value = int(value)
+        return date(value // 10000, value // 100 % 100, value % 100)
+
+
+class StockDailyMixin:
+    """
+    日线数据公共字段
+
+    行情与技术指标字段在标准表与紧凑表之间共享，
+    保证两种表结构返回的对象接口一致
+    """
+
     # OHLC 数据
     open = Column(Float)
     high = Column(Float)
@@ -87,17 +121,10 @@ class StockDaily(Base):
     data_source = Column(String(50))  # 记录数据来源（如 AkshareFetcher）
     
     # 更新时间
-    created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
-    # 唯一约束：同一股票同一日期只能有一条数据
-    __table_args__ = (
-        UniqueConstraint('code', 'date', name='uix_code_date'),
-        Index('ix_code_date', 'code', 'date'),
-    )
-    
     def __repr__(self):
-        return f"<StockDaily(code={self.code}, date={self.date}, close={self.close})>"
+        return f"<{type(self).__name__}(code={self.code}, date={self.date}, close={self.close})>"
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -119,6 +146,177 @@ class StockDaily(Base):
         }
 
 
+class StockDaily(StockDailyMixin, Base):
+    """
+    股票日线数据模型
+    
+    存储每日行情数据和计算的技术指标
+    支持多股票、多日期的唯一约束
+    """
+    __tablename__ = 'stock_daily'
+    
+    # 主键
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    
+    # 股票代码（如 600519, 000001）
+    code = Column(String(10), nullable=False, index=True)
+    
+    # 交易日期
+    date = Column(Date, nullable=False, index=True)
+    
+    # 创建时间
+    created_at = Column(DateTime, default=datetime.now)
+    
+    # 唯一约束：同一股票同一日期只能有一条数据
+    __table_args__ = (
+        UniqueConstraint('code', 'date', name='uix_code_date'),
+        Index('ix_code_date', 'code', 'date'),
+    )
+
+
+class StockDailyCompact(StockDailyMixin, Base):
+    """
+    股票日线数据模型（紧凑版）
+    
+    设计说明：
+    - WITHOUT ROWID 表，按 (code, date) 聚簇存储
+    - 复合主键即唯一的覆盖索引，无自增 id、无额外二级索引
+    - 日期以 YYYYMMDD 整数编码
+    
+    同一股票的时间序列在 B-tree 中物理相邻，按代码读取最近 N 天
+    只需一次范围扫描；每次写入只维护一棵 B-tree（标准表需要四棵）
+    """
+    __tablename__ = 'stock_daily_compact'
+    
+    code = Column(String(10), primary_key=True)
+    date = Column(IntDate, primary_key=True)
+    
+    __table_args__ = {'sqlite_with_rowid': False}
+
+
+class StockTrendState(Base):
+    """
+    增量趋势状态
+    
+    保存每只股票最近窗口的收盘价、最高/最低价、成交量及均线历史（JSON），
+    重启后无需重新加载历史即可继续 O(1) 增量更新
+    """
+    __tablename__ = 'stock_trend_state'
+    
+    code = Column(String(10), primary_key=True)
+    last_date = Column(Date, nullable=False)  # 状态包含的最新 K 线日期
+    state = Column(Text, nullable=False)  # TrendState.to_dict() 的 JSON
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def __repr__(self):
+        return f"<StockTrendState(code={self.code}, last_date={self.last_date})>"
+
+
+class AnalysisSnapshot(Base):
+    """
+    上次 AI 分析的输入指纹与结论
+    
+    变更门控（change_gate.ChangeGate）据此判断输入是否有实质变化，无变化时复用结论
+    """
+    __tablename__ = 'analysis_snapshot'
+    
+    code = Column(String(10), primary_key=True)
+    analyzed_at = Column(DateTime, nullable=False)  # 上次调用 AI 分析的时间
+    fingerprint = Column(Text, nullable=False)  # 输入指纹 JSON
+    result = Column(Text, nullable=False)  # AnalysisResult.to_dict() 的 JSON
+    
+    def __repr__(self):
+        return f"<AnalysisSnapshot(code={self.code}, analyzed_at={self.analyzed_at})>"
+
+
+class LLMUsageDaily(Base):
+    """
+    LLM 每日调用量（按模型）
+    
+    配额管理（llm_quota.QuotaManager）据此在重启后继续执行每日请求数 / Token 上限
+    """
+    __tablename__ = 'llm_usage_daily'
+    
+    date = Column(Date, primary_key=True)
+    model = Column(String(100), primary_key=True)
+    requests = Column(Integer, nullable=False, default=0)
+    tokens = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def __repr__(self):
+        return f"<LLMUsageDaily(date={self.date}, model={self.model}, requests={self.requests}, tokens={self.tokens})>"
+
+
+class SearchCacheEntry(Base):
+    """
+    搜索结果缓存
+    
+    由 search_cache.SearchCache 读写，键为规范化查询 + 结果条数的哈希，按搜索维度设置有效期
+    """
+    __tablename__ = 'search_cache'
+    
+    key = Column(String(40), primary_key=True)
+    query = Column(String(500), nullable=False)  # 规范化后的查询
+    dimension = Column(String(20), nullable=False)  # 搜索维度（latest_news / risk_check / earnings / news）
+    response = Column(Text, nullable=False)  # SearchResponse 的 JSON
+    created_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<SearchCacheEntry(query={self.query}, expires_at={self.expires_at})>"
+
+
+class SearchKeyUsage(Base):
+    """
+    搜索引擎 API Key 用量（按月）
+    
+    由 search_quota.SearchKeyQuota 读写，只保存 Key 的哈希；重启后仍按已用量选择 Key、跳过已用尽的 Key
+    """
+    __tablename__ = 'search_key_usage'
+    
+    provider = Column(String(20), primary_key=True)
+    key_hash = Column(String(16), primary_key=True)
+    period = Column(String(7), primary_key=True)  # 额度周期（自然月，如 2026-01）
+    requests = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    exhausted_until = Column(DateTime)  # 服务端返回额度用尽后，到该时间前不再使用
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def __repr__(self):
+        return f"<SearchKeyUsage(provider={self.provider}, key={self.key_hash}, period={self.period}, requests={self.requests})>"
+
+
+class LLMCallLog(Base):
+    """
+    LLM 调用明细（每次逻辑调用一条，批量调用按股票拆分）
+    
+    由 llm_accounting.LLMAccounting 写入，用于按股票、轮次、模型统计 Token 与耗时
+    """
+    __tablename__ = 'llm_call_log'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String(40), nullable=False, default='', index=True)  # 轮次 ID（Web 等临时请求为空）
+    code = Column(String(10), nullable=False, index=True)  # 股票代码（大盘复盘为 market）
+    kind = Column(String(10), nullable=False)  # single / batch / market
+    provider = Column(String(20))
+    model = Column(String(100))
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    tokens_estimated = Column(Boolean, nullable=False, default=False)  # 响应无 usage 时按文本估算
+    latency = Column(Float, nullable=False, default=0.0)  # 含重试的总耗时（秒）
+    attempts = Column(Integer, nullable=False, default=1)
+    fallbacks = Column(Integer, nullable=False, default=0)
+    parse_outcome = Column(String(10))  # direct / extracted / repaired / failed
+    success = Column(Boolean, nullable=False, default=True)
+    error = Column(String(200))
+    created_at = Column(DateTime, default=datetime.now, index=True)
+    
+    def __repr__(self):
+        return (f"<LLMCallLog(code={self.code}, model={self.model}, "
+                f"tokens={self.input_tokens}+{self.output_tokens}, latency={self.latency:.1f})>")
+
+
 class DatabaseManager:
     """
     数据库管理器 - 单例模式
@@ -131,6 +329,9 @@ class DatabaseManager:
     
     _instance: Optional['DatabaseManager'] = None
     
+    # 近期数据缓存：每只股票缓存的最近交易日数（一次读取满足上下文、趋势分析等多次请求）
+    RECENT_CACHE_WINDOW = 60
+    
     def __new__(cls, *args, **kwargs):
         """单例模式实现"""
         if cls._instance is None:
@@ -138,19 +339,25 @@ class DatabaseManager:
             cls._instance._initialized = False
         return cls._instance
     
-    def __init__(self, db_url: Optional[str] = None):
+    def __init__(self, db_url: Optional[str] = None, compact_schema: Optional[bool] = None):
         """
         初始化数据库管理器
         
         Args:
             db_url: 数据库连接 URL（可选，默认从配置读取）
+            compact_schema: 是否使用紧凑日线表（可选，默认从配置读取）
         """
         if self._initialized:
             return
         
+        config = get_config()
         if db_url is None:
-            config = get_config()
             db_url = config.get_db_url()
+        if compact_schema is None:
+            compact_schema = config.database_compact_schema
+        
+        # 日线表模型：标准表 or 紧凑表（WITHOUT ROWID）
+        self._daily_model: Type[StockDailyMixin] = StockDailyCompact if compact_schema else StockDaily
         
         # 创建数据库引擎
         self._engine = create_engine(
@@ -166,11 +373,27 @@ class DatabaseManager:
             autoflush=False,
         )
         
-        # 创建所有表
-        Base.metadata.create_all(self._engine)
+        # 创建所有表（未启用的日线表结构不创建）
+        unused_daily = StockDaily if compact_schema else StockDailyCompact
+        Base.metadata.create_all(
+            self._engine,
+            tables=[t for t in Base.metadata.sorted_tables if t is not unused_daily.__table__],
+        )
+        
+        # 近期数据 LRU 缓存：code -> (按日期降序的记录, 是否已包含全部历史)
+        self._recent_cache: 'OrderedDict[str, Tuple[List[StockDailyMixin], bool]]' = OrderedDict()
+        self._recent_cache_size = config.db_cache_size
+        self._cache_lock = threading.Lock()
+        self._cache_versions: Dict[str, int] = {}  # 写入版本号，防止并发读取把旧数据放回缓存
+        self._cache_generation = 0  # 全部失效的代数（覆盖尚无版本号的股票）
+        self._cache_hits = 0
+        self._cache_misses = 0
         
         self._initialized = True
-        logger.info(f"数据库初始化完成: {db_url}")
+        logger.info(f"数据库初始化完成: {db_url} (日线表: {self._daily_model.__tablename__})")
+        
+        if compact_schema:
+            self._check_pending_migration()
     
     @classmethod
     def get_instance(cls) -> 'DatabaseManager':
@@ -218,12 +441,17 @@ class DatabaseManager:
         if target_date is None:
             target_date = date.today()
         
+        cached = self._cache_lookup_date(code, target_date)
+        if cached is not None:
+            return cached
+        
+        model = self._daily_model
         with self.get_session() as session:
             result = session.execute(
-                select(StockDaily).where(
+                select(model).where(
                     and_(
-                        StockDaily.code == code,
-                        StockDaily.date == target_date
+                        model.code == code,
+                        model.date == target_date
                     )
                 )
             ).scalar_one_or_none()
@@ -240,6 +468,9 @@ class DatabaseManager:
         
         用于计算"相比昨日"的变化
         
+        优先命中近期数据缓存；未命中时一次读取 max(days, RECENT_CACHE_WINDOW)
+        条记录放入缓存，后续同一股票的上下文/趋势读取不再访问 SQLite
+        
         Args:
             code: 股票代码
             days: 获取天数
@@ -247,15 +478,93 @@ class DatabaseManager:
         Returns:
             StockDaily 对象列表（按日期降序）
         """
+        with self._cache_lock:
+            entry = self._recent_cache.get(code)
+            if entry is not None:
+                rows, complete = entry
+                if complete or len(rows) >= days:
+                    self._recent_cache.move_to_end(code)
+                    self._cache_hits += 1
+                    return rows[:days]
+            self._cache_misses += 1
+            version = (self._cache_generation, self._cache_versions.get(code, 0))
+        
+        window = max(days, self.RECENT_CACHE_WINDOW)
+        model = self._daily_model
         with self.get_session() as session:
-            results = session.execute(
-                select(StockDaily)
-                .where(StockDaily.code == code)
-                .order_by(desc(StockDaily.date))
-                .limit(days)
-            ).scalars().all()
-            
-            return list(results)
+            results = list(session.execute(
+                select(model)
+                .where(model.code == code)
+                .order_by(desc(model.date))
+                .limit(window)
+            ).scalars().all())
+        
+        self._cache_store(code, results, complete=len(results) < window, version=version)
+        return results[:days]
+    
+    def _cache_store(
+        self,
+        code: str,
+        rows: List[StockDailyMixin],
+        complete: bool,
+        version: Tuple[int, int]
+    ) -> None:
+        """写入近期数据缓存（读取期间若发生写入则放弃，避免缓存旧数据）"""
+        if self._recent_cache_size <= 0:
+            return
+        with self._cache_lock:
+            if (self._cache_generation, self._cache_versions.get(code, 0)) != version:
+                return
+            self._recent_cache[code] = (rows, complete)
+            self._recent_cache.move_to_end(code)
+            while len(self._recent_cache) > self._recent_cache_size:
+                self._recent_cache.popitem(last=False)
+    
+    def _cache_lookup_date(self, code: str, target_date: date) -> Optional[bool]:
+        """
+        用缓存判断某日数据是否存在
+        
+        Returns:
+            True/False 表示缓存可以确定结果；None 表示需要查询数据库
+        """
+        with self._cache_lock:
+            entry = self._recent_cache.get(code)
+            if entry is None:
+                return None
+            rows, complete = entry
+            # 缓存的是最近 N 条：目标日期不早于最旧一条（或已缓存全部历史）时结论可信
+            if complete or (rows and target_date >= rows[-1].date):
+                self._recent_cache.move_to_end(code)
+                self._cache_hits += 1
+                return any(row.date == target_date for row in rows)
+            return None
+    
+    def invalidate_cache(self, code: Optional[str] = None) -> None:
+        """
+        失效近期数据缓存
+        
+        Args:
+            code: 股票代码（为空时清空全部缓存）
+        """
+        with self._cache_lock:
+            if code is None:
+                self._recent_cache.clear()
+                self._cache_generation += 1
+                return
+            self._recent_cache.pop(code, None)
+            self._cache_versions[code] = self._cache_versions.get(code, 0) + 1
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取近期数据缓存命中统计"""
+        with self._cache_lock:
+            total = self._cache_hits + self._cache_misses
+            return {
+                'hits': self._cache_hits,
+                'misses': self._cache_misses,
+                'hit_rate': self._cache_hits / total if total else 0.0,
+                'size': len(self._recent_cache),
+                'capacity': self._recent_cache_size,
+            }
     
     def get_data_range(
         self, 
@@ -274,17 +583,18 @@ class DatabaseManager:
         Returns:
             StockDaily 对象列表
         """
+        model = self._daily_model
         with self.get_session() as session:
             results = session.execute(
-                select(StockDaily)
+                select(model)
                 .where(
                     and_(
-                        StockDaily.code == code,
-                        StockDaily.date >= start_date,
-                        StockDaily.date <= end_date
+                        model.code == code,
+                        model.date >= start_date,
+                        model.date <= end_date
                     )
                 )
-                .order_by(StockDaily.date)
+                .order_by(model.date)
             ).scalars().all()
             
             return list(results)
@@ -315,9 +625,11 @@ class DatabaseManager:
             return 0
         
         saved_count = 0
+        model = self._daily_model
         
         with self.get_session() as session:
             try:
+                df = self._warm_up_derived_columns(session, df, code)
                 for _, row in df.iterrows():
                     # 解析日期
                     row_date = row.get('date')
@@ -330,16 +642,16 @@ class DatabaseManager:
                     
                     # 检查是否已存在
                     existing = session.execute(
-                        select(StockDaily).where(
+                        select(model).where(
                             and_(
-                                StockDaily.code == code,
-                                StockDaily.date == row_date
+                                model.code == code,
+                                model.date == row_date
                             )
                         )
                     ).scalar_one_or_none()
                     
                     if existing:
-                        # 更新现有记录
+                        # 更新现有记录（仍未预热的均线/量比保留库中已有值，不以空值覆盖）
                         existing.open = row.get('open')
                         existing.high = row.get('high')
                         existing.low = row.get('low')
@@ -347,15 +659,15 @@ class DatabaseManager:
                         existing.volume = row.get('volume')
                         existing.amount = row.get('amount')
                         existing.pct_chg = row.get('pct_chg')
-                        existing.ma5 = row.get('ma5')
-                        existing.ma10 = row.get('ma10')
-                        existing.ma20 = row.get('ma20')
-                        existing.volume_ratio = row.get('volume_ratio')
+                        for column in DERIVED_COLUMNS:
+                            value = row.get(column)
+                            if value is not None and not pd.isna(value):
+                                setattr(existing, column, value)
                         existing.data_source = data_source
                         existing.updated_at = datetime.now()
                     else:
                         # 创建新记录
-                        record = StockDaily(
+                        record = model(
                             code=code,
                             date=row_date,
                             open=row.get('open'),
@@ -368,7 +680,7 @@ class DatabaseManager:
                             ma5=row.get('ma5'),
                             ma10=row.get('ma10'),
                             ma20=row.get('ma20'),
-                            volume_ratio=row.get('volume_ratio'),
+                            volume_ratio=1.0 if pd.isna(row.get('volume_ratio')) else row.get('volume_ratio'),
                             data_source=data_source,
                         )
                         session.add(record)
@@ -381,9 +693,55 @@ class DatabaseManager:
                 session.rollback()
                 logger.error(f"保存 {code} 数据失败: {e}")
                 raise
+            finally:
+                # 无论成功与否都失效缓存（部分写入/回滚后以数据库为准）
+                self.invalidate_cache(code)
         
         return saved_count
     
+    def _warm_up_derived_columns(self, session: Session, df: pd.DataFrame, code: str) -> pd.DataFrame:
+        """
+        用库中更早的 K 线补齐均线与量比的预热
+        
+        数据源每次只拉取最近几十根 K 线，前 N-1 根的 ma{N} 与前 5 根的量比因窗口未满为空；
+        拼接库中此前的收盘价与成交量后，仅补算这些空值位置，再截取本次数据
+        
+        Returns:
+            按日期升序、补齐后的 DataFrame（不含库中历史行）
+        """
+        if not all(column in df.columns for column in ('date', 'close', 'volume')):
+            return df
+        
+        df = df.assign(date=pd.to_datetime(df['date']).dt.date).sort_values('date').reset_index(drop=True)
+        model = self._daily_model
+        prior = session.execute(
+            select(model.close, model.volume)
+            .where(and_(model.code == code, model.date < df['date'].iloc[0]))
+            .order_by(model.date.desc())
+            .limit(max(STORED_MA_WINDOWS) - 1)
+        ).all()
+        if not prior:
+            return df
+        
+        prior = prior[::-1]
+        n = len(prior)
+        merged = pd.DataFrame({
+            'close': [row.close for row in prior] + df['close'].tolist(),
+            'volume': [row.volume for row in prior] + df['volume'].tolist(),
+        })
+        for column in DERIVED_COLUMNS:
+            if column in df.columns:
+                merged[column] = [float('nan')] * n + df[column].tolist()
+        
+        merged = add_moving_averages(merged, STORED_MA_WINDOWS)
+        ratios = pd.Series(volume_ratios(merged['volume'].to_numpy(dtype=float), 5))
+        merged['volume_ratio'] = merged['volume_ratio'].fillna(ratios) if 'volume_ratio' in merged else ratios
+        
+        df = df.copy()
+        for column in DERIVED_COLUMNS:
+            df[column] = merged[column].iloc[n:].round(2).to_numpy()
+        return df
+    
     def get_analysis_context(
         self, 
         code: str,
@@ -439,7 +797,541 @@ class DatabaseManager:
         
         return context
     
-    def _analyze_ma_status(self, data: StockDaily) -> str:
+    def get_trend_state(self, code: str) -> Optional[Dict[str, Any]]:
+        """
+        读取持久化的增量趋势状态
+        
+        Args:
+            code: 股票代码
+            
+        Returns:
+            TrendState.to_dict() 格式的字典，不存在则返回 None
+        """
+        with self.get_session() as session:
+            record = session.get(StockTrendState, code)
+            if record is None:
+                return None
+            try:
+                return json.loads(record.state)
+            except ValueError as e:
+                logger.warning(f"{code} 趋势状态损坏，将重新冷启动: {e}")
+                return None
+    
+    def save_trend_state(self, code: str, last_date: date, state: Dict[str, Any]) -> None:
+        """
+        保存增量趋势状态（存在则覆盖）
+        
+        Args:
+            code: 股票代码
+            last_date: 状态包含的最新 K 线日期
+            state: TrendState.to_dict() 返回的字典
+        """
+        with self.get_session() as session:
+            try:
+                session.merge(StockTrendState(
+                    code=code,
+                    last_date=last_date,
+                    state=json.dumps(state),
+                    updated_at=datetime.now(),
+                ))
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"保存 {code} 趋势状态失败: {e}")
+                raise
+    
+    def get_analysis_snapshot(self, code: str) -> Optional[Dict[str, Any]]:
+        """
+        读取上次 AI 分析的快照
+        
+        Returns:
+            {'analyzed_at': datetime, 'fingerprint': dict, 'result': dict}，不存在或损坏返回 None
+        """
+        with self.get_session() as session:
+            record = session.get(AnalysisSnapshot, code)
+            if record is None:
+                return None
+            try:
+                return {
+                    'analyzed_at': record.analyzed_at,
+                    'fingerprint': json.loads(record.fingerprint),
+                    'result': json.loads(record.result),
+                }
+            except ValueError as e:
+                logger.warning(f"{code} 分析快照损坏，将重新分析: {e}")
+                return None
+    
+    def save_analysis_snapshot(
+        self,
+        code: str,
+        fingerprint: Dict[str, Any],
+        result: Dict[str, Any],
+        analyzed_at: Optional[datetime] = None
+    ) -> None:
+        """
+        保存 AI 分析快照（存在则覆盖）
+        
+        Args:
+            code: 股票代码
+            fingerprint: 输入指纹
+            result: AnalysisResult.to_dict() 返回的字典
+            analyzed_at: 分析时间（默认当前时间）
+        """
+        with self.get_session() as session:
+            try:
+                session.merge(AnalysisSnapshot(
+                    code=code,
+                    analyzed_at=analyzed_at or datetime.now(),
+                    fingerprint=json.dumps(fingerprint, ensure_ascii=False),
+                    result=json.dumps(result, ensure_ascii=False, default=str),
+                ))
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"保存 {code} 分析快照失败: {e}")
+                raise
+    
+    def get_search_cache(self, key: str) -> Optional[Tuple[Dict[str, Any], datetime]]:
+        """
+        读取未过期的搜索缓存
+        
+        Returns:
+            (SearchResponse 字典, 过期时间)，不存在、已过期或损坏时返回 None
+        """
+        with self.get_session() as session:
+            record = session.get(SearchCacheEntry, key)
+            if record is None or record.expires_at <= datetime.now():
+                return None
+            try:
+                return json.loads(record.response), record.expires_at
+            except ValueError as e:
+                logger.warning(f"搜索缓存损坏，将重新搜索: {e}")
+                return None
+    
+    def save_search_cache(
+        self,
+        key: str,
+        query: str,
+        dimension: str,
+        response: Dict[str, Any],
+        expires_at: datetime
+    ) -> None:
+        """保存搜索缓存（存在则覆盖）"""
+        with self.get_session() as session:
+            try:
+                session.merge(SearchCacheEntry(
+                    key=key,
+                    query=query[:500],
+                    dimension=dimension,
+                    response=json.dumps(response, ensure_ascii=False),
+                    created_at=datetime.now(),
+                    expires_at=expires_at,
+                ))
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"保存搜索缓存失败: {e}")
+                raise
+    
+    def purge_search_cache(self) -> int:
+        """删除已过期的搜索缓存，返回删除条数"""
+        with self.get_session() as session:
+            try:
+                result = session.execute(
+                    delete(SearchCacheEntry).where(SearchCacheEntry.expires_at <= datetime.now())
+                )
+                session.commit()
+                return result.rowcount
+            except Exception as e:
+                session.rollback()
+                logger.error(f"清理搜索缓存失败: {e}")
+                raise
+    
+    def get_search_key_usage(self, provider: str, period: str) -> Dict[str, Dict[str, Any]]:
+        """
+        读取搜索引擎各 Key 在某周期的用量
+        
+        Returns:
+            {Key 哈希: {'requests': 请求数, 'errors': 错误数, 'exhausted_until': 用尽标记到期时间}}
+        """
+        with self.get_session() as session:
+            records = session.execute(
+                select(SearchKeyUsage).where(
+                    and_(SearchKeyUsage.provider == provider, SearchKeyUsage.period == period)
+                )
+            ).scalars().all()
+            return {
+                record.key_hash: {
+                    'requests': record.requests,
+                    'errors': record.errors,
+                    'exhausted_until': record.exhausted_until,
+                }
+                for record in records
+            }
+    
+    def add_search_key_usage(
+        self,
+        provider: str,
+        key_hash: str,
+        period: str,
+        requests: int = 0,
+        errors: int = 0,
+        exhausted_until: Optional[datetime] = None
+    ) -> None:
+        """
+        累加搜索引擎 Key 的用量（无记录时创建）；exhausted_until 非空时更新用尽标记
+        
+        在数据库中原子累加（UPSERT），Web 服务与命令行 / 定时任务多进程并发写入时不丢失计数
+        """
+        timestamp_format = '%Y-%m-%d %H:%M:%S.%f'
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(text(f"""
+                    INSERT INTO {SearchKeyUsage.__tablename__}
+                        (provider, key_hash, period, requests, errors, exhausted_until, updated_at)
+                    VALUES (:provider, :key_hash, :period, :requests, :errors, :exhausted_until, :updated_at)
+                    ON CONFLICT(provider, key_hash, period) DO UPDATE SET
+                        requests = requests + excluded.requests,
+                        errors = errors + excluded.errors,
+                        exhausted_until = COALESCE(excluded.exhausted_until, exhausted_until),
+                        updated_at = excluded.updated_at
+                """), {
+                    'provider': provider,
+                    'key_hash': key_hash,
+                    'period': period,
+                    'requests': requests,
+                    'errors': errors,
+                    'exhausted_until': exhausted_until.strftime(timestamp_format) if exhausted_until else None,
+                    'updated_at': datetime.now().strftime(timestamp_format),
+                })
+        except Exception as e:
+            logger.error(f"保存搜索 Key 用量失败: {e}")
+            raise
+    
+    def reserve_search_key_usage(
+        self,
+        provider: str,
+        key_hash: str,
+        period: str,
+        max_requests: int = 0
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        在月度额度内占用搜索引擎 Key 的一次请求
+        
+        额度判断与累加在同一条 UPSERT 中完成：Web 服务与命令行 / 定时任务多进程共用同一行用量，
+        合计不会超出额度；其他进程标记的用尽同样生效
+        
+        Args:
+            max_requests: 每个 Key 的月度请求上限（0 不限制）
+            
+        Returns:
+            (是否占用成功, {'requests': 请求数, 'errors': 错误数, 'exhausted_until': 用尽标记到期时间})
+        """
+        timestamp_format = '%Y-%m-%d %H:%M:%S.%f'
+        now = datetime.now().strftime(timestamp_format)
+        try:
+            with self._engine.begin() as conn:
+                result = conn.execute(text(f"""
+                    INSERT INTO {SearchKeyUsage.__tablename__}
+                        (provider, key_hash, period, requests, errors, updated_at)
+                    VALUES (:provider, :key_hash, :period, 1, 0, :now)
+                    ON CONFLICT(provider, key_hash, period) DO UPDATE SET
+                        requests = requests + excluded.requests,
+                        updated_at = excluded.updated_at
+                    WHERE (:max_requests <= 0 OR requests < :max_requests)
+                      AND (exhausted_until IS NULL OR exhausted_until <= :now)
+                """), {
+                    'provider': provider,
+                    'key_hash': key_hash,
+                    'period': period,
+                    'max_requests': max_requests,
+                    'now': now,
+                })
+                record = conn.execute(
+                    select(SearchKeyUsage.requests, SearchKeyUsage.errors, SearchKeyUsage.exhausted_until).where(
+                        and_(
+                            SearchKeyUsage.provider == provider,
+                            SearchKeyUsage.key_hash == key_hash,
+                            SearchKeyUsage.period == period,
+                        )
+                    )
+                ).one()
+        except Exception as e:
+            logger.error(f"占用搜索 Key 额度失败: {e}")
+            raise
+        return result.rowcount > 0, {
+            'requests': record.requests,
+            'errors': record.errors,
+            'exhausted_until': record.exhausted_until,
+        }
+    
+    def get_llm_usage(self, usage_date: date, model: str) -> Tuple[int, int]:
+        """
+        读取模型某日的 LLM 调用量
+        
+        Returns:
+            (请求数, Token 数)，无记录时为 (0, 0)
+        """
+        with self.get_session() as session:
+            record = session.get(LLMUsageDaily, (usage_date, model))
+            if record is None:
+                return 0, 0
+            return record.requests, record.tokens
+    
+    def add_llm_usage(self, usage_date: date, model: str, requests: int = 0, tokens: int = 0) -> None:
+        """
+        累加模型某日的 LLM 调用量（无记录时创建）
+        
+        在数据库中原子累加（UPSERT），Web 服务与命令行 / 定时任务多进程并发写入时不丢失计数
+        """
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(text(f"""
+                    INSERT INTO {LLMUsageDaily.__tablename__} (date, model, requests, tokens, updated_at)
+                    VALUES (:date, :model, :requests, :tokens, :updated_at)
+                    ON CONFLICT(date, model) DO UPDATE SET
+                        requests = requests + excluded.requests,
+                        tokens = tokens + excluded.tokens,
+                        updated_at = excluded.updated_at
+                """), {
+                    'date': usage_date.isoformat(),
+                    'model': model,
+                    'requests': requests,
+                    'tokens': tokens,
+                    'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'),
+                })
+        except Exception as e:
+            logger.error(f"保存 LLM 调用量失败: {e}")
+            raise
+    
+    def reserve_llm_usage(
+        self,
+        usage_date: date,
+        model: str,
+        tokens: int = 0,
+        max_requests: int = 0,
+        max_tokens: int = 0
+    ) -> Tuple[bool, int, int]:
+        """
+        在每日上限内占用一次 LLM 调用（计入 1 次请求与 tokens）
+        
+        上限判断与累加在同一条 UPSERT 中完成：Web 服务与命令行 / 定时任务多进程共用同一行当日用量，
+        合计不会超出上限。Token 上限与 QuotaManager 一致：当日尚无 Token 时首个请求总是放行
+        
+        Args:
+            max_requests: 每日请求数上限（0 不限制）
+            max_tokens: 每日 Token 上限（0 不限制）
+            
+        Returns:
+            (是否占用成功, 当日请求数, 当日 Token 数)
+        """
+        try:
+            with self._engine.begin() as conn:
+                result = conn.execute(text(f"""
+                    INSERT INTO {LLMUsageDaily.__tablename__} (date, model, requests, tokens, updated_at)
+                    VALUES (:date, :model, 1, :tokens, :updated_at)
+                    ON CONFLICT(date, model) DO UPDATE SET
+                        requests = requests + excluded.requests,
+                        tokens = tokens + excluded.tokens,
+                        updated_at = excluded.updated_at
+                    WHERE (:max_requests <= 0 OR requests < :max_requests)
+                      AND (:max_tokens <= 0 OR tokens = 0 OR tokens + excluded.tokens <= :max_tokens)
+                """), {
+                    'date': usage_date.isoformat(),
+                    'model': model,
+                    'tokens': tokens,
+                    'max_requests': max_requests,
+                    'max_tokens': max_tokens,
+                    'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'),
+                })
+                requests_used, tokens_used = conn.execute(
+                    select(LLMUsageDaily.requests, LLMUsageDaily.tokens).where(
+                        and_(LLMUsageDaily.date == usage_date, LLMUsageDaily.model == model)
+                    )
+                ).one()
+        except Exception as e:
+            logger.error(f"占用 LLM 当日额度失败: {e}")
+            raise
+        return result.rowcount > 0, requests_used, tokens_used
+    
+    def save_llm_calls(self, calls: List[Dict[str, Any]]) -> None:
+        """批量写入 LLM 调用明细（字段与 LLMCallLog 一致）"""
+        with self.get_session() as session:
+            try:
+                session.add_all([LLMCallLog(**call) for call in calls])
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"保存 LLM 调用明细失败: {e}")
+                raise
+    
+    def get_llm_call_stats(
+        self,
+        group_by: str = 'code',
+        days: int = 30,
+        run_id: Optional[str] = None,
+        limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        按股票 / 轮次 / 模型汇总 LLM 调用（按总 Token 降序）
+        
+        Args:
+            group_by: code / run_id / model
+            days: 统计最近多少天
+            run_id: 只统计指定轮次
+            limit: 返回条数
+        """
+        if group_by not in ('code', 'run_id', 'model'):
+            raise ValueError(f"不支持的分组字段: {group_by}")
+        key = getattr(LLMCallLog, group_by)
+        total_tokens = func.sum(LLMCallLog.input_tokens + LLMCallLog.output_tokens)
+        conditions = [LLMCallLog.created_at >= datetime.now() - timedelta(days=days)]
+        if run_id is not None:
+            conditions.append(LLMCallLog.run_id == run_id)
+        
+        with self.get_session() as session:
+            rows = session.execute(
+                select(
+                    key,
+                    func.count(LLMCallLog.id),
+                    func.sum(LLMCallLog.input_tokens),
+                    func.sum(LLMCallLog.output_tokens),
+                    func.sum(LLMCallLog.latency),
+                    func.sum(LLMCallLog.attempts - 1),
+                    func.sum(LLMCallLog.fallbacks),
+                    func.sum(case((LLMCallLog.parse_outcome == 'failed', 1), else_=0)),
+                )
+                .where(and_(*conditions))
+                .group_by(key)
+                .order_by(desc(total_tokens))
+                .limit(limit)
+            ).all()
+        
+        return [
+            {
+                group_by: row[0],
+                'calls': row[1],
+                'input_tokens': int(row[2] or 0),
+                'output_tokens': int(row[3] or 0),
+                'latency': float(row[4] or 0.0),
+                'retries': int(row[5] or 0),
+                'fallbacks': int(row[6] or 0),
+                'parse_failures': int(row[7] or 0),
+            }
+            for row in rows
+        ]
+    
+    @property
+    def daily_model(self) -> Type[StockDailyMixin]:
+        """当前使用的日线表模型（StockDaily 或 StockDailyCompact）"""
+        return self._daily_model
+    
+    @property
+    def compact_schema(self) -> bool:
+        """是否使用紧凑日线表"""
+        return self._daily_model is StockDailyCompact
+    
+    def _count_rows(self, table_name: str) -> int:
+        """统计表行数（表不存在时返回 0）"""
+        if not inspect(self._engine).has_table(table_name):
+            return 0
+        with self._engine.connect() as conn:
+            return conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar() or 0
+    
+    def _check_pending_migration(self) -> None:
+        """紧凑模式下检查旧表是否仍有未迁移的数据"""
+        legacy_count = self._count_rows(StockDaily.__tablename__)
+        compact_count = self._count_rows(StockDailyCompact.__tablename__)
+        if legacy_count > compact_count:
+            logger.warning(
+                f"检测到旧日线表 {StockDaily.__tablename__} 有 {legacy_count} 条数据，"
+                f"紧凑表仅 {compact_count} 条，请运行 python storage.py --migrate-compact 迁移"
+            )
+    
+    def migrate_to_compact_schema(self, batch_size: int = 5000, drop_legacy: bool = False) -> int:
+        """
+        在线迁移：stock_daily -> stock_daily_compact
+        
+        策略：
+        1. 按自增 id 分批复制，每批一个短事务，迁移期间读写不被长时间阻塞
+        2. 冲突时以 updated_at 较新者为准（UPSERT），可重复执行
+        3. 复制完成后补偿迁移期间新增/更新的行，直到两表一致
+        4. 可选删除旧表（需随后 VACUUM 回收空间）
+        
+        Args:
+            batch_size: 每批复制的行数
+            drop_legacy: 迁移完成后是否删除旧表
+            
+        Returns:
+            复制（插入或更新）的行数
+        """
+        legacy = StockDaily.__tablename__
+        compact = StockDailyCompact.__tablename__
+        
+        if not inspect(self._engine).has_table(legacy):
+            logger.info(f"未找到旧日线表 {legacy}，无需迁移")
+            return 0
+        
+        StockDailyCompact.__table__.create(self._engine, checkfirst=True)
+        
+        value_cols = [
+            'open', 'high', 'low', 'close', 'volume', 'amount', 'pct_chg',
+            'ma5', 'ma10', 'ma20', 'volume_ratio', 'data_source',
+        ]
+        upsert_template = f"""
+            INSERT INTO {compact} (code, date, {', '.join(value_cols)}, updated_at)
+            SELECT code, CAST(REPLACE(date, '-', '') AS INTEGER), {', '.join(value_cols)},
+                   COALESCE(updated_at, created_at)
+            FROM {legacy}
+            WHERE {{where}}
+            ON CONFLICT(code, date) DO UPDATE SET
+                {', '.join(f'{c} = excluded.{c}' for c in value_cols)},
+                updated_at = excluded.updated_at
+            WHERE excluded.updated_at > COALESCE({compact}.updated_at, '')
+        """
+        
+        def run_batch(where: str, params: Dict[str, Any]) -> int:
+            with self._engine.begin() as conn:
+                return conn.execute(text(upsert_template.format(where=where)), params).rowcount or 0
+        
+        migrated = 0
+        started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+        last_id = 0
+        start_time = time.time()
+        
+        # 阶段 1：按 id 分批复制（循环直到追上迁移期间新插入的行）
+        while True:
+            with self._engine.connect() as conn:
+                max_id = conn.execute(text(f"SELECT MAX(id) FROM {legacy}")).scalar() or 0
+            if max_id <= last_id:
+                break
+            while last_id < max_id:
+                upper = min(last_id + batch_size, max_id)
+                migrated += run_batch("id > :lo AND id <= :hi", {'lo': last_id, 'hi': upper})
+                last_id = upper
+            logger.info(f"[迁移] 已复制至 id={last_id}，累计 {migrated} 行")
+        
+        # 阶段 2：补偿迁移期间被更新的旧行
+        migrated += run_batch("updated_at >= :since", {'since': started_at})
+        
+        legacy_count = self._count_rows(legacy)
+        compact_count = self._count_rows(compact)
+        logger.info(
+            f"[迁移] 完成，耗时 {time.time() - start_time:.2f}s，"
+            f"旧表 {legacy_count} 行，紧凑表 {compact_count} 行"
+        )
+        
+        if drop_legacy:
+            if compact_count >= legacy_count:
+                with self._engine.begin() as conn:
+                    conn.execute(text(f"DROP TABLE {legacy}"))
+                logger.info(f"[迁移] 已删除旧表 {legacy}，可执行 VACUUM 回收磁盘空间")
+            else:
+                logger.warning("[迁移] 紧凑表行数少于旧表，保留旧表")
+        
+        return migrated
+    
+    def _analyze_ma_status(self, data: StockDailyMixin) -> str:
         """
         分析均线形态
         
@@ -471,9 +1363,131 @@ def get_db() -> DatabaseManager:
     return DatabaseManager.get_instance()
 
 
+def make_benchmark_rows(num_codes: int = 200, num_days: int = 500, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    生成基准测试用的模拟日线数据（按日期交错，模拟每日批量入库的真实顺序）
+    
+    Args:
+        num_codes: 模拟股票数量
+        num_days: 每只股票的交易日数
+        seed: 随机种子
+        
+    Returns:
+        可直接批量插入日线表的字典列表
+    """
+    import numpy as np
+    from rolling import moving_averages, rolling_mean
+    
+    rng = np.random.default_rng(seed)
+    start = date(2020, 1, 1)
+    dates = [start + timedelta(days=i) for i in range(num_days)]
+    codes = [f"{600000 + i:06d}" for i in range(num_codes)]
+    
+    rows = []
+    for code in codes:
+        closes = 10 * np.cumprod(1 + rng.normal(0.0005, 0.02, num_days))
+        volumes = rng.integers(1_000_000, 5_000_000, num_days).astype(float)
+        mas = moving_averages(closes, STORED_MA_WINDOWS)
+        vol_avg5 = np.r_[np.nan, rolling_mean(volumes, 5)[:-1]]
+        for i, d in enumerate(dates):
+            close = float(closes[i])
+            volume_ratio = volumes[i] / vol_avg5[i] if not np.isnan(vol_avg5[i]) else 1.0
+            rows.append({
+                'code': code, 'date': d,
+                'open': close, 'high': close * 1.01, 'low': close * 0.99, 'close': close,
+                'volume': float(volumes[i]), 'amount': float(volumes[i]) * close, 'pct_chg': 0.0,
+                'ma5': float(mas[5][i]), 'ma10': float(mas[10][i]), 'ma20': float(mas[20][i]),
+                'volume_ratio': round(float(volume_ratio), 2),
+                'data_source': 'Benchmark',
+            })
+    rows.sort(key=lambda r: (r['date'], r['code']))
+    return rows
+
+
+def benchmark_schemas(num_codes: int = 200, num_days: int = 500, scan_days: int = 60) -> List[Dict[str, Any]]:
+    """
+    对比标准表与紧凑表的存储、写入与扫描性能
+    
+    在临时目录中为每种表结构各建一个 SQLite 文件，写入相同的模拟数据，
+    统计文件大小、批量写入耗时和"按代码读取最近 N 天"的扫描耗时
+    
+    Args:
+        num_codes: 模拟股票数量
+        num_days: 每只股票的交易日数
+        scan_days: 扫描时每只股票读取的天数
+        
+    Returns:
+        每种表结构的统计结果列表
+    """
+    rows = make_benchmark_rows(num_codes, num_days)
+    codes = sorted({r['code'] for r in rows})
+    
+    stats = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for model in (StockDaily, StockDailyCompact):
+            db_file = Path(tmp_dir) / f"{model.__tablename__}.db"
+            engine = create_engine(f"sqlite:///{db_file}")
+            model.__table__.create(engine)
+            
+            t0 = time.perf_counter()
+            with engine.begin() as conn:
+                conn.execute(model.__table__.insert(), rows)
+            insert_seconds = time.perf_counter() - t0
+            
+            with engine.connect() as conn:
+                conn.exec_driver_sql("VACUUM")
+            
+            t0 = time.perf_counter()
+            SessionLocal = sessionmaker(bind=engine)
+            with SessionLocal() as session:
+                for code in codes:
+                    session.execute(
+                        select(model)
+                        .where(model.code == code)
+                        .order_by(desc(model.date))
+                        .limit(scan_days)
+                    ).scalars().all()
+            scan_seconds = time.perf_counter() - t0
+            engine.dispose()
+            
+            stats.append({
+                'table': model.__tablename__,
+                'rows': len(rows),
+                'size_mb': db_file.stat().st_size / 1024 / 1024,
+                'insert_seconds': insert_seconds,
+                'scan_seconds': scan_seconds,
+            })
+    
+    return stats
+
+
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='存储层工具')
+    parser.add_argument('--migrate-compact', action='store_true', help='将 stock_daily 在线迁移到紧凑表')
+    parser.add_argument('--drop-legacy', action='store_true', help='迁移完成后删除旧表')
+    parser.add_argument('--benchmark', action='store_true', help='对比标准表与紧凑表的存储/写入/扫描性能')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    
+    if args.benchmark:
+        print("=== 日线表结构基准测试 ===")
+        print(f"{'表':<22} {'行数':>8} {'大小(MB)':>10} {'写入(s)':>9} {'扫描(s)':>9}")
+        for item in benchmark_schemas():
+            print(f"{item['table']:<22} {item['rows']:>8} {item['size_mb']:>10.2f} "
+                  f"{item['insert_seconds']:>9.3f} {item['scan_seconds']:>9.3f}")
+        raise SystemExit(0)
+    
+    if args.migrate_compact:
+        db = DatabaseManager(compact_schema=True)
+        count = db.migrate_to_compact_schema(drop_legacy=args.drop_legacy)
+        print(f"迁移完成，复制 {count} 行")
+        raise SystemExit(0)
+    
     # 测试代码
-    logging.basicConfig(level=logging.DEBUG)
+    logging.getLogger().setLevel(logging.DEBUG)
     
     db = get_db()
     
@@ -215,6 +215,20 @@ class AnalysisService:
         tasks.sort(key=lambda x: x.get('start_time', ''), reverse=True)
         return tasks[:limit]
     
+    def _update_partial(self, task_id: str, fields: Dict[str, Any]) -> None:
+        """流式分析中途更新任务状态：核心结论字段到达后即可通过 /task 查询"""
+        partial = {
+            key: fields[key]
+            for key in ("sentiment_score", "operation_advice", "trend_prediction", "analysis_summary")
+            if key in fields
+        }
+        if not partial:
+            return
+        with self._tasks_lock:
+            task = self._tasks.get(task_id)
+            if task is not None and task.get("status") == "running":
+                task["partial_result"] = partial
+    
     def _run_analysis(
         self, 
         code: str, 
@@ -246,13 +260,20 @@ class AnalysisService:
         try:
             # 延迟导入避免循环依赖
             from config import get_config
+            from llm_quota import PRIORITY_INTERACTIVE
             from main import StockAnalysisPipeline
             
             logger.info(f"[AnalysisService] 开始分析股票: {code}")
             
-            # 创建分析管道
+            # 创建分析管道（流式模式下评分与操作建议先行写入任务状态）
             config = get_config()
-            pipeline = StockAnalysisPipeline(config=config, max_workers=1)
+            pipeline = StockAnalysisPipeline(
+                config=config,
+                max_workers=1,
+                on_partial=lambda _code, fields: self._update_partial(task_id, fields)
+            )
+            # Web 临时请求在配额排队中让位于定时任务
+            pipeline.analyzer.quota_priority = PRIORITY_INTERACTIVE
             
             # 执行单只股票分析（启用单股推送）
             result = pipeline.process_single_stock(
@@ -270,6 +291,8 @@ class AnalysisService:
                     "operation_advice": result.operation_advice,
                     "trend_prediction": result.trend_prediction,
                     "analysis_summary": result.analysis_summary,
+                    "latency": result.latency,
+                    "first_verdict_latency": result.first_verdict_latency,
                 }
                 
                 with self._tasks_lock: